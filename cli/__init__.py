@@ -0,0 +1,23 @@
+"""Commands that run without the GUI.
+
+`video-dl <command> ...` runs one of them instead of opening a window. main.py
+hands over before it touches the GUI, the updater or sys_vars, all of which import
+flet: nothing reached from here does, so these run on machines without a display.
+"""
+
+from __future__ import annotations
+
+COMMANDS = ("batch", "serve")
+
+
+def run(command: str, argv: list[str]) -> int:
+    """Run `command` with its own arguments, and return the process's exit code."""
+    if command == "batch":
+        from cli import batch
+
+        return batch.main(argv)
+    if command == "serve":
+        from cli import serve
+
+        return serve.main(argv)
+    raise ValueError(f"unknown command {command!r}")
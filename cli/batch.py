@@ -0,0 +1,275 @@
+"""`video-dl batch`: download a list of URLs without the GUI.
+
+URLs come from the command line, from a file given with --input (`-` for stdin),
+or from stdin when neither gives any and it is not a terminal. Blank lines and
+lines starting with `#` are skipped. Every URL is one job, and --jobs of them run
+at once, each on a YoutubeDL of its own, in a worker process of its own with
+--processes (core/process_pool.py). A job whose turn has come still waits while
+the machine has no room for it (core/admission.py), unless --no-admission.
+
+Progress goes to stdout as JSON, one object per line, for another program to read:
+
+    {"event": "job", "job_id": "1", "label": "https://...", "stage": "downloading",
+     "done_bytes": 1048576, "total_bytes": 5242880, "speed": 2097152.0, "eta": 2.0, "error": null}
+    {"event": "status", "job_id": "1", "message": "Fetching video info"}
+    {"event": "summary", "jobs": 3, "done": 2, "failed": 1, "cancelled": 0}
+
+A job's line is written when it has moved, at most every --interval seconds: the
+latest state of each job that changed, never a backlog of stale ones. The last line
+of every job carries the stage it finished in, and its error if it failed. Logs go
+to stderr, so stdout holds nothing but the JSON.
+
+The exit code is 0 when every job is done, 1 when any failed, 130 after an
+interrupt. SIGINT or SIGTERM cancel the jobs in flight and skip the ones queued,
+which are then reported cancelled.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import signal
+import sys
+import threading
+from collections.abc import Iterable
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import IO
+
+from cli.options import (
+    ACODECS,
+    FRAMERATES,
+    VCODECS,
+    JobOptions,
+    Tools,
+    add_tool_arguments,
+    parse_timecode,
+    tools_from_args,
+)
+from cli.runner import EventCancelToken, log_to_stderr, run_job
+from core.admission import AdmissionController
+from core.hwaccel import SPEED_TIERS
+from core.jobs import CANCELLED, DONE, FAILED, ProgressModel, Totals
+from core.process_pool import ProcessPool
+
+EXIT_OK = 0
+EXIT_FAILED = 1
+EXIT_INTERRUPTED = 130
+
+
+def read_urls(urls: Iterable[str], input_file: str | None, stdin: IO[str]) -> list[str]:
+    """The URLs to download, in order: those given, then those of `input_file`.
+
+    With neither, stdin is read when something is piped into it.
+    """
+    lines = list(urls)
+    if input_file == "-" or (input_file is None and not lines and not stdin.isatty()):
+        lines.extend(stdin)
+    elif input_file is not None:
+        with open(input_file, encoding="utf-8") as f:
+            lines.extend(f)
+    return [line.strip() for line in lines if line.strip() and not line.lstrip().startswith("#")]
+
+
+class _JobStatusCallback:
+    """Writes a job's status messages out, each once in a row."""
+
+    def __init__(self, runner: BatchRunner, job_id: str):
+        self._runner = runner
+        self._job_id = job_id
+        self._last: str | None = None
+
+    def on_status(self, message: str) -> None:
+        if message != self._last:
+            self._last = message
+            self._runner.emit({"event": "status", "job_id": self._job_id, "message": message})
+
+
+class BatchRunner:
+    """Runs a list of URLs, `jobs` at a time, and writes their progress to `out`."""
+
+    def __init__(
+        self,
+        urls: list[str],
+        options: JobOptions,
+        tools: Tools,
+        *,
+        jobs: int = 1,
+        out: IO[str] = sys.stdout,
+        interval: float = 0.5,
+        pool: ProcessPool | None = None,
+        admission: AdmissionController | None = None,
+    ):
+        self.model = ProgressModel()
+        self._urls = urls
+        self._options = options
+        self._tools = tools
+        self._jobs = max(1, jobs)
+        self._out = out
+        self._interval = interval
+        self._pool = pool
+        self._admission = admission
+        self._out_lock = threading.Lock()
+        self._cancel = threading.Event()
+
+    def cancel(self) -> None:
+        """Stop the jobs in flight and skip the rest. Safe from a signal handler."""
+        self._cancel.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancel.is_set()
+
+    def emit(self, event: dict) -> None:
+        line = json.dumps(event, ensure_ascii=False)
+        with self._out_lock:
+            self._out.write(line + "\n")
+            self._out.flush()
+
+    def run(self) -> Totals:
+        """Run every job to its end, and return the totals they finished on."""
+        job_ids = [self.model.add(url).job_id for url in self._urls]
+        with ThreadPoolExecutor(max_workers=self._jobs, thread_name_prefix="videodl-job") as pool:
+            pending: set[Future] = {
+                pool.submit(self._run_job, job_id, url) for job_id, url in zip(job_ids, self._urls, strict=True)
+            }
+            while pending:
+                _, pending = wait(pending, timeout=self._interval, return_when=FIRST_COMPLETED)
+                self._flush()
+        self._flush()
+        totals = self.model.totals()
+        self.emit(
+            {
+                "event": "summary",
+                "jobs": totals.jobs,
+                **{stage: totals.stages[stage] for stage in (DONE, FAILED, CANCELLED)},
+            }
+        )
+        return totals
+
+    def _flush(self) -> None:
+        for job in self.model.changed():
+            self.emit({"event": "job", **job.as_dict()})
+
+    def _run_job(self, job_id: str, url: str) -> None:
+        run_job(
+            self.model,
+            job_id,
+            url,
+            self._options,
+            self._tools,
+            EventCancelToken(self._cancel),
+            _JobStatusCallback(self, job_id),
+            self._pool,
+            self._admission,
+        )
+
+
+def exit_code(totals: Totals, interrupted: bool) -> int:
+    if interrupted:
+        return EXIT_INTERRUPTED
+    if totals.stages[FAILED] or totals.stages[CANCELLED]:
+        return EXIT_FAILED
+    return EXIT_OK
+
+
+def _timecode(value: str) -> str:
+    try:
+        return parse_timecode(value)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e)) from None
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="video-dl batch",
+        description="Download URLs without the GUI, writing progress to stdout as JSON lines.",
+    )
+    parser.add_argument("urls", nargs="*", metavar="URL", help="URLs to download")
+    parser.add_argument("-i", "--input", metavar="FILE", help="read URLs from FILE, one per line ('-' for stdin)")
+    parser.add_argument("-o", "--output", default=".", metavar="DIR", help="where to save files (default: .)")
+    parser.add_argument("-j", "--jobs", type=int, default=1, metavar="N", help="downloads to run at once (default: 1)")
+    parser.add_argument(
+        "--interval", type=float, default=0.5, metavar="SECONDS", help="least time between two progress lines of a job"
+    )
+    parser.add_argument("--processes", action="store_true", help="run each download in a worker process")
+    parser.add_argument(
+        "--no-admission", action="store_true", help="start jobs whatever the load of the machine (core/admission.py)"
+    )
+
+    media = parser.add_argument_group("media")
+    media.add_argument("--audio-only", action="store_true", help="download the audio only")
+    media.add_argument("--acodec", choices=ACODECS, default="Auto", help="audio codec, with --audio-only")
+    media.add_argument("--vcodec", choices=VCODECS, default="Best", help="video codec to encode to (default: Best)")
+    media.add_argument("--quality", default="1080p", help="preferred height, like 720p (default: 1080p)")
+    media.add_argument("--framerate", choices=FRAMERATES, default="60", help="preferred frame rate (default: 60)")
+    media.add_argument("--speed-tier", choices=SPEED_TIERS, default="balanced", help="encoder speed against size")
+    media.add_argument("--start", type=_timecode, metavar="HH:MM:SS", help="trim everything before")
+    media.add_argument("--end", type=_timecode, metavar="HH:MM:SS", help="trim everything after")
+    media.add_argument("--subtitles", action="store_true", help="download every subtitle track")
+    media.add_argument("--sponsor-block", action="store_true", help="cut sponsored segments out")
+
+    source = parser.add_argument_group("source")
+    source.add_argument("--playlist", action="store_true", help="download whole playlists, not just the video")
+    source.add_argument("--playlist-items", metavar="ITEMS", help="which playlist entries, like 1,3,5-7")
+    source.add_argument("--cookies-from", metavar="BROWSER", help="use the cookies of BROWSER")
+    source.add_argument("--cookies-file", metavar="FILE", help="cookies.txt to use with --cookies-from chrome")
+    source.add_argument("--proxy", metavar="URL", help="proxy for every request")
+
+    add_tool_arguments(parser)
+    parser.add_argument("--debug", action="store_true", help="log video-dl's debug messages to stderr")
+    return parser
+
+
+def options_from_args(args: argparse.Namespace) -> JobOptions:
+    return JobOptions(
+        dest_folder=args.output,
+        audio_only=args.audio_only,
+        acodec=args.acodec,
+        quality=args.quality,
+        framerate=args.framerate,
+        vcodec=args.vcodec,
+        playlist=args.playlist,
+        playlist_items=args.playlist_items,
+        start=args.start,
+        end=args.end,
+        subtitles=args.subtitles,
+        cookies=args.cookies_from,
+        cookies_file=args.cookies_file,
+        proxy=args.proxy,
+        sponsor_block=args.sponsor_block,
+        speed_tier=args.speed_tier,
+    )
+
+
+def main(argv: list[str]) -> int:
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.jobs < 1:
+        parser.error("--jobs must be at least 1")
+    log_to_stderr(args.debug)
+    try:
+        urls = read_urls(args.urls, args.input, sys.stdin)
+    except OSError as e:
+        parser.error(f"cannot read {args.input}: {e}")
+    if not urls:
+        parser.error("no URL given")
+
+    pool = ProcessPool(args.jobs) if args.processes else None
+    runner = BatchRunner(
+        urls,
+        options_from_args(args),
+        tools_from_args(args),
+        jobs=args.jobs,
+        interval=args.interval,
+        pool=pool,
+        admission=None if args.no_admission else AdmissionController(),
+    )
+    previous = {sig: signal.signal(sig, lambda *_: runner.cancel()) for sig in (signal.SIGINT, signal.SIGTERM)}
+    try:
+        totals = runner.run()
+    finally:
+        for sig, handler in previous.items():
+            signal.signal(sig, handler)
+        if pool is not None:
+            pool.close()
+    return exit_code(totals, runner.cancelled)
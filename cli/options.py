@@ -0,0 +1,228 @@
+"""What a headless job is asked to do, and the yt-dlp options that do it.
+
+The GUI builds its yt-dlp options from its controls, through the builders in
+core/ydl_opts.py. A job started from the command line has no controls: JobOptions
+holds the same choices as plain values, and `build_config` turns them into a
+DownloadConfig through the same builders, so a URL comes out the same whichever
+way it went in.
+
+The binaries are looked up on PATH unless given. sys_vars.init_paths() is not an
+option here: it installs what is missing through a window.
+"""
+
+from __future__ import annotations
+
+import argparse
+import dataclasses
+import re
+import shutil
+from collections.abc import Callable, Mapping
+from dataclasses import dataclass
+from typing import Any
+
+from yt_dlp.utils import DownloadCancelled as YtdlpDownloadCancelled
+
+from core.callbacks import CancelToken, ProgressCallback
+from core.config_types import DownloadConfig
+from core.hwaccel import SPEED_TIERS
+from core.ydl_opts import (
+    build_aria2c_opts,
+    build_av_opts,
+    build_browser_opts,
+    build_ffmpeg_opts,
+    build_file_opts,
+    build_sponsor_block_opts,
+    build_subtitles_opts,
+)
+from utils.sponsor_block_dict import CATEGORIES
+
+# The GUI's codec choices, with "Auto" spelled out: "Best" keeps what the site
+# serves, "NLE" reencodes only what an editor cannot open.
+VCODECS = ("Best", "NLE", "x264", "x265", "ProRes", "AV1")
+ACODECS = ("Auto", "AAC", "ALAC", "FLAC", "OPUS", "MP3", "VORBIS", "WAV")
+FRAMERATES = ("30", "60")
+
+_TIMECODE = re.compile(r"^\d{1,2}:\d{2}:\d{2}$")
+
+
+@dataclass(frozen=True, slots=True)
+class Tools:
+    """Where the binaries a job runs are."""
+
+    ff_path: dict[str, str]
+    aria2c: str | None = None
+    qjs: str | None = None
+
+
+def find_tools(
+    *,
+    ffmpeg: str | None = None,
+    ffprobe: str | None = None,
+    aria2c: str | None = None,
+    qjs: str | None = None,
+) -> Tools:
+    """The binaries given, and the others found on PATH.
+
+    ffmpeg and ffprobe fall back to their bare names, which core/ reads as "on
+    PATH". aria2c and qjs are optional: without them yt-dlp downloads on its own,
+    and solves what JS challenges it can without QuickJS.
+    """
+    return Tools(
+        ff_path={
+            "ffmpeg": ffmpeg or shutil.which("ffmpeg") or "ffmpeg",
+            "ffprobe": ffprobe or shutil.which("ffprobe") or "ffprobe",
+        },
+        aria2c=aria2c or shutil.which("aria2c"),
+        qjs=qjs or shutil.which("qjs"),
+    )
+
+
+@dataclass(frozen=True, slots=True)
+class JobOptions:
+    """The choices the GUI's controls make, as values."""
+
+    dest_folder: str = "."
+    audio_only: bool = False
+    acodec: str = "Auto"
+    quality: str = "1080p"
+    framerate: str = "60"
+    vcodec: str = "Best"
+    playlist: bool = False
+    playlist_items: str | None = None  # yt-dlp's syntax: "1,3,5-7"
+    start: str | None = None  # "HH:MM:SS", from the beginning when None
+    end: str | None = None  # "HH:MM:SS", to the end when None
+    subtitles: bool = False
+    cookies: str | None = None  # a browser to take cookies from
+    cookies_file: str | None = None
+    proxy: str | None = None
+    sponsor_block: bool = False
+    speed_tier: str = "balanced"
+
+
+_FIELDS = frozenset(field.name for field in dataclasses.fields(JobOptions))
+# The fields None means something for: the others always hold a value.
+_OPTIONAL = frozenset(("playlist_items", "start", "end", "cookies", "cookies_file", "proxy"))
+_CHOICES = {"vcodec": VCODECS, "acodec": ACODECS, "framerate": FRAMERATES, "speed_tier": SPEED_TIERS}
+
+
+def parse_timecode(value: str) -> str:
+    """`value` as HH:MM:SS, the form core/ydl_opts.py reads. ValueError when it is not one."""
+    if not _TIMECODE.match(value):
+        raise ValueError(f"expected HH:MM:SS, got {value!r}")
+    hours, minutes, seconds = value.split(":")
+    return f"{int(hours):02d}:{minutes}:{seconds}"
+
+
+def options_from_dict(data: Mapping[str, Any], defaults: JobOptions) -> JobOptions:
+    """`defaults`, with the fields `data` names, as a client sends them in JSON.
+
+    Raises ValueError naming the first field that is unknown or does not hold a
+    value of its kind: a job is refused whole rather than run with half its options.
+    """
+    changes: dict[str, Any] = {}
+    for name, value in data.items():
+        if name not in _FIELDS:
+            raise ValueError(f"unknown option {name!r}")
+        default = getattr(defaults, name)
+        if isinstance(default, bool):
+            if not isinstance(value, bool):
+                raise ValueError(f"{name} must be true or false")
+        elif value is not None and not isinstance(value, str):
+            raise ValueError(f"{name} must be a string")
+        elif value is None and name not in _OPTIONAL:
+            raise ValueError(f"{name} cannot be null")
+        if name in _CHOICES and value not in _CHOICES[name]:
+            raise ValueError(f"{name} must be one of {', '.join(_CHOICES[name])}")
+        if name in ("start", "end") and value is not None:
+            value = parse_timecode(value)
+        changes[name] = value
+    return dataclasses.replace(defaults, **changes)
+
+
+def add_tool_arguments(parser: argparse.ArgumentParser) -> None:
+    tools = parser.add_argument_group("tools", "Looked up on PATH when not given.")
+    tools.add_argument("--ffmpeg", metavar="PATH")
+    tools.add_argument("--ffprobe", metavar="PATH")
+    tools.add_argument("--aria2c", metavar="PATH")
+    tools.add_argument("--qjs", metavar="PATH")
+
+
+def tools_from_args(args: argparse.Namespace) -> Tools:
+    return find_tools(ffmpeg=args.ffmpeg, ffprobe=args.ffprobe, aria2c=args.aria2c, qjs=args.qjs)
+
+
+def build_ydl_opts(
+    url: str,
+    options: JobOptions,
+    tools: Tools,
+    progress_hook: Callable[[dict], Any],
+    postprocessor_hook: Callable[[dict], Any],
+) -> dict[str, Any]:
+    """The yt-dlp options for `url`, built the way the GUI builds its own."""
+    # See gui/app.py _gen_ydl_opts for why 4 fragments at a time.
+    opts: dict[str, Any] = {"verbose": True, "concurrent_fragment_downloads": 4}
+    if tools.qjs:
+        opts["js_runtimes"] = {"quickjs": {"path": tools.qjs}}
+    opts.update(
+        build_file_opts(
+            playlist=options.playlist,
+            dest_folder=options.dest_folder,
+            indices_enabled=options.playlist_items is not None,
+            indices_value=options.playlist_items,
+            ff_path=tools.ff_path,
+            progress_hook=progress_hook,
+            postprocessor_hook=postprocessor_hook,
+        )
+    )
+    opts.update(
+        build_av_opts(
+            audio_only=options.audio_only,
+            acodec=options.acodec,
+            quality=options.quality,
+            framerate=options.framerate,
+        )
+    )
+    opts.update(
+        build_ffmpeg_opts(
+            start_enabled=options.start is not None,
+            start_timecode=options.start or "",
+            end_enabled=options.end is not None,
+            end_timecode=options.end or "",
+        )
+    )
+    opts.update(build_subtitles_opts(options.subtitles))
+    opts.update(build_browser_opts(options.cookies, "none", options.cookies_file))
+    if options.proxy:
+        opts["proxy"] = options.proxy
+    sb_opts = build_sponsor_block_opts(options.sponsor_block, CATEGORIES.keys())
+    if "postprocessors" in sb_opts:
+        opts.setdefault("postprocessors", []).extend(sb_opts["postprocessors"])
+    opts.update(build_aria2c_opts(tools.aria2c, [url], opts))
+    return opts
+
+
+def build_config(
+    url: str,
+    options: JobOptions,
+    tools: Tools,
+    progress_cb: ProgressCallback,
+    cancel: CancelToken,
+) -> DownloadConfig:
+    """A DownloadConfig for `url`, reporting to `progress_cb`, stopping on `cancel`."""
+
+    def progress_hook(d: dict) -> None:
+        # As in the GUI: raising from the hook is how yt-dlp's own download stops.
+        # core/_finish_download's "finished" signal carries no bytes, and still counts once cancelled.
+        if cancel.is_cancelled() and not (d.get("status") == "finished" and "downloaded_bytes" not in d):
+            raise YtdlpDownloadCancelled
+        progress_cb.on_download_progress(d)
+
+    return DownloadConfig(
+        url=url,
+        audio_only=options.audio_only,
+        target_vcodec=options.vcodec,
+        ff_path=tools.ff_path,
+        ydl_opts=build_ydl_opts(url, options, tools, progress_hook, progress_cb.on_process_progress),
+        stream_encode=True,
+        speed_tier=options.speed_tier,
+    )
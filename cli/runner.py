@@ -0,0 +1,99 @@
+"""Run one headless job, from its URL to the stage it finishes in.
+
+`video-dl batch` and `video-dl serve` both run jobs the same way: options built
+through cli/options.py, a YoutubeDL of the job's own, core.download, and the
+outcome recorded in a ProgressModel. Neither raises out of a job: whatever goes
+wrong ends up as the job's error, and the next job runs regardless. With an
+AdmissionController (core/admission.py), a job stays queued until the machine has
+room for it.
+"""
+
+from __future__ import annotations
+
+import logging
+import sys
+import threading
+
+from cli.options import JobOptions, Tools, build_config
+from core.admission import AdmissionController, admitted, job_admission
+from core.callbacks import CancelToken, StatusCallback
+from core.download import create_ydl, download
+from core.error_report import build_error_report
+from core.jobs import CANCELLED, DONE, FAILED, ProgressModel
+from core.process_pool import ProcessPool
+from core.resources import DOWNLOAD
+from i18n.lang import GuiField as GF
+from i18n.lang import get_text as gt
+from utils.parse_util import validate_url
+
+logger = logging.getLogger("videodl")
+
+# create_ydl installs the yt-dlp patches on first use, and they are not meant to be
+# installed by two threads at once.
+_create_lock = threading.Lock()
+
+
+class EventCancelToken:
+    """Wraps a threading.Event as a CancelToken for core/ functions."""
+
+    def __init__(self, event: threading.Event):
+        self._event = event
+
+    def is_cancelled(self) -> bool:
+        return self._event.is_set()
+
+
+def run_job(
+    model: ProgressModel,
+    job_id: str,
+    url: str,
+    options: JobOptions,
+    tools: Tools,
+    cancel: CancelToken,
+    status_cb: StatusCallback,
+    pool: ProcessPool | None = None,
+    admission: AdmissionController | None = None,
+) -> None:
+    """Download `url` as job `job_id` of `model`, blocking until it has finished.
+
+    The job runs in a worker process of `pool` when one is given, on this thread
+    otherwise. With `admission`, it waits for it first, and so does its encode
+    when it runs on this thread.
+    """
+    if cancel.is_cancelled():
+        model.finish(job_id, CANCELLED)
+        return
+    if not validate_url(url):
+        model.finish(job_id, FAILED, gt(GF.unsupported_url))
+        return
+    progress_cb = model.callback(job_id)
+    try:
+        config = build_config(url, options, tools, progress_cb, cancel)
+        with job_admission(admission), admitted(DOWNLOAD, cancel, options.dest_folder):
+            if pool is not None:
+                pool.download(config, cancel, progress_cb, status_cb)
+            else:
+                with _create_lock:
+                    ydl = create_ydl(config.ydl_opts, status_cb, config.ff_path)
+                try:
+                    download(ydl, config, cancel, progress_cb)
+                finally:
+                    ydl.close()
+    except Exception as e:
+        report = build_error_report(e)
+        logger.error(f"{url}: {report.short_message}")
+        if report.detail:
+            logger.debug(report.detail)
+        model.finish(job_id, CANCELLED if cancel.is_cancelled() else FAILED, report.short_message)
+    else:
+        model.finish(job_id, DONE)
+
+
+def log_to_stderr(debug: bool) -> None:
+    """Send video-dl's logs to stderr, stdout being the commands' own."""
+    handler = logging.StreamHandler(sys.stderr)
+    handler.setFormatter(logging.Formatter(fmt="%(asctime)s - %(levelname)s - %(message)s"))
+    app_logger = logging.getLogger("videodl")
+    app_logger.addHandler(handler)
+    app_logger.setLevel(logging.DEBUG if debug else logging.WARNING)
+    app_logger.propagate = False
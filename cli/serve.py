@@ -0,0 +1,466 @@
+"""`video-dl serve`: a job server for other programs on the same machine.
+
+It listens on localhost, or on a Unix socket with --socket, and speaks JSON over
+HTTP/1.1, one request per connection:
+
+    POST   /jobs               {"url": "...", "options": {...}}   201 {"job_ids": ["1"]}
+                               {"urls": [...], "options": {...}}  201 {"job_ids": ["1", "2"]}
+    GET    /jobs               200 {"jobs": [...], "totals": {...}}
+    GET    /jobs/<id>          200 the job
+    POST   /jobs/<id>/cancel   202 the job
+    DELETE /jobs/<id>          204, once the job has finished
+    GET    /events             server-sent events, for every job
+    GET    /jobs/<id>/events   server-sent events, for one job, until it finishes
+
+`options` are JobOptions' fields (cli/options.py), over the server's defaults:
+{"audio_only": true, "acodec": "MP3"}. A job is the JobProgress of core/jobs.py as
+a dict, the same object `video-dl batch` writes. An event stream starts with every
+job as it stands, then sends `job` events as they move, at most every --interval
+seconds each, and `status` events with what yt-dlp is doing.
+
+The server is one asyncio loop. Connections, the queue and the event streams all
+live on it, so hundreds of queued jobs and watching clients cost no threads. Only
+the downloads themselves take one each, from a pool of --jobs threads, and a cancel
+sets the job's CancelToken, which the download checks as it goes. With --processes
+each of those threads hands its download to a worker process (core/process_pool.py).
+A job whose turn has come still waits, queued, while the machine has no room for it
+(core/admission.py), unless --no-admission.
+
+Whoever can reach the server can download to any folder its user can write to. It
+binds to 127.0.0.1, refuses a Host header that is not a loopback name, which stops
+a web page from reaching it through DNS rebinding, and takes only JSON bodies,
+which a page cannot send it without a CORS preflight the server never answers.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import contextlib
+import dataclasses
+import json
+import logging
+import os
+import signal
+import socket
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+from urllib.parse import urlsplit
+
+from cli.options import JobOptions, Tools, add_tool_arguments, options_from_dict, tools_from_args
+from cli.runner import EventCancelToken, log_to_stderr, run_job
+from core.admission import AdmissionController
+from core.jobs import CANCELLED, FINISHED_STAGES, QUEUED, JobProgress, ProgressModel
+from core.process_pool import ProcessPool
+
+logger = logging.getLogger("videodl")
+
+DEFAULT_PORT = 8765
+
+_MAX_BODY = 1 << 20
+_MAX_HEADERS = 100
+# A client gets this long to send its request, and an event stream a comment this
+# often, which is how a client that went away is noticed.
+_REQUEST_TIMEOUT = 10
+_KEEPALIVE = 15
+_LOOPBACK_HOSTS = frozenset(("localhost", "127.0.0.1", "::1"))
+
+
+class HttpError(Exception):
+    def __init__(self, status: HTTPStatus, message: str | None = None):
+        super().__init__(message or status.phrase)
+        self.status = status
+        self.message = message or status.phrase
+
+
+@dataclasses.dataclass(slots=True)
+class Request:
+    method: str
+    path: str
+    headers: dict[str, str]
+    body: bytes
+
+
+class _Subscriber:
+    """One event stream's events not yet sent.
+
+    Only the latest of each kind is kept for a job: a client slower than the jobs
+    skips states, and holds at most a few events per job however far behind it is.
+    """
+
+    def __init__(self, job_id: str | None):
+        self.job_id = job_id
+        self._pending: dict[tuple[str, str], dict] = {}
+        self._ready = asyncio.Event()
+
+    def push(self, event: dict) -> None:
+        if self.job_id is not None and event["job_id"] != self.job_id:
+            return
+        self._pending[(event["event"], event["job_id"])] = event
+        self._ready.set()
+
+    async def take(self, timeout: float) -> list[dict]:
+        """What is pending, once there is some or `timeout` seconds have passed."""
+        with contextlib.suppress(TimeoutError):
+            await asyncio.wait_for(self._ready.wait(), timeout)
+        self._ready.clear()
+        events, self._pending = list(self._pending.values()), {}
+        return events
+
+
+class _StatusCallback:
+    """Passes a job's status messages, from its download thread, to the loop."""
+
+    def __init__(self, server: JobServer, job_id: str):
+        self._server = server
+        self._job_id = job_id
+        self._last: str | None = None
+
+    def on_status(self, message: str) -> None:
+        if message != self._last:
+            self._last = message
+            event = {"event": "status", "job_id": self._job_id, "message": message}
+            self._server.loop.call_soon_threadsafe(self._server.publish, event)
+
+
+def _job_event(job: JobProgress) -> dict:
+    return {"event": "job", **job.as_dict()}
+
+
+class JobServer:
+    """A queue of jobs run `jobs` at a time, and the HTTP API around it."""
+
+    def __init__(
+        self,
+        tools: Tools,
+        *,
+        defaults: JobOptions | None = None,
+        jobs: int = 2,
+        interval: float = 0.5,
+        pool: ProcessPool | None = None,
+        admission: AdmissionController | None = None,
+    ):
+        self.model = ProgressModel()
+        self._tools = tools
+        self._defaults = defaults or JobOptions()
+        self._jobs = max(1, jobs)
+        self._interval = interval
+        self._pool = pool
+        self._admission = admission
+        self._executor = ThreadPoolExecutor(max_workers=self._jobs, thread_name_prefix="videodl-job")
+        self._queue: asyncio.Queue[tuple[str, str, JobOptions]] = asyncio.Queue()
+        self._cancels: dict[str, threading.Event] = {}
+        self._subscribers: set[_Subscriber] = set()
+        self._tasks: list[asyncio.Task] = []
+        self._server: asyncio.Server | None = None
+        self._socket_path: str | None = None
+        self.loop: asyncio.AbstractEventLoop
+
+    async def start(self, host: str = "127.0.0.1", port: int = DEFAULT_PORT, socket_path: str | None = None) -> None:
+        self.loop = asyncio.get_running_loop()
+        self._socket_path = socket_path
+        if socket_path is not None:
+            self._server = await asyncio.start_unix_server(self._handle, path=socket_path)
+        else:
+            self._server = await asyncio.start_server(self._handle, host, port)
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self._jobs)]
+        self._tasks.append(asyncio.create_task(self._publish_changes()))
+
+    @property
+    def address(self) -> str:
+        assert self._server is not None
+        name = self._server.sockets[0].getsockname()
+        return name if isinstance(name, str) else f"http://{name[0]}:{name[1]}"
+
+    async def close(self) -> None:
+        """Stop listening, cancel every job, and wait for the downloads to let go."""
+        if self._server is not None:
+            self._server.close()
+        if self._socket_path is not None:
+            with contextlib.suppress(OSError):
+                os.unlink(self._socket_path)
+        for job_id in list(self._cancels):
+            self.cancel(job_id)
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        await asyncio.to_thread(self._executor.shutdown, wait=True)
+
+    def submit(self, url: str, options: JobOptions) -> str:
+        job_id = self.model.add(url).job_id
+        self._cancels[job_id] = threading.Event()
+        self._queue.put_nowait((job_id, url, options))
+        return job_id
+
+    def cancel(self, job_id: str) -> bool:
+        """Cancel a job. False if there is no such job, or it has already finished."""
+        job = self.model.get(job_id)
+        if job is None or job.stage in FINISHED_STAGES:
+            return False
+        self._cancels[job_id].set()
+        if job.stage == QUEUED:
+            # Nothing is running it to notice: it is done with now, and skipped once its turn comes.
+            self.model.finish(job_id, CANCELLED)
+        return True
+
+    def publish(self, event: dict) -> None:
+        for subscriber in self._subscribers:
+            subscriber.push(event)
+
+    async def _worker(self) -> None:
+        while True:
+            job_id, url, options = await self._queue.get()
+            try:
+                event = self._cancels.get(job_id)
+                if event is None:
+                    # Cancelled and removed while it was queued.
+                    continue
+                cancel = EventCancelToken(event)
+                status_cb = _StatusCallback(self, job_id)
+                await self.loop.run_in_executor(
+                    self._executor,
+                    run_job,
+                    self.model,
+                    job_id,
+                    url,
+                    options,
+                    self._tools,
+                    cancel,
+                    status_cb,
+                    self._pool,
+                    self._admission,
+                )
+            except Exception:
+                logger.exception(f"job {job_id} failed outside of its download")
+            finally:
+                self._queue.task_done()
+
+    async def _publish_changes(self) -> None:
+        while True:
+            for job in self.model.changed():
+                self.publish(_job_event(job))
+            await asyncio.sleep(self._interval)
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            try:
+                request = await asyncio.wait_for(_read_request(reader), _REQUEST_TIMEOUT)
+                self._check_origin(request, writer)
+                await self._route(request, writer)
+            except HttpError as e:
+                _respond(writer, e.status, {"error": e.message})
+            except (TimeoutError, asyncio.IncompleteReadError):
+                return
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+            with contextlib.suppress(ConnectionError):
+                await writer.wait_closed()
+
+    def _check_origin(self, request: Request, writer: asyncio.StreamWriter) -> None:
+        sock = writer.get_extra_info("socket")
+        if sock is not None and sock.family == getattr(socket, "AF_UNIX", None):
+            return
+        hostname = urlsplit(f"//{request.headers.get('host', '')}").hostname
+        if hostname is not None and hostname not in _LOOPBACK_HOSTS:
+            raise HttpError(HTTPStatus.FORBIDDEN, f"not serving host {hostname}")
+
+    async def _route(self, request: Request, writer: asyncio.StreamWriter) -> None:
+        parts = [part for part in request.path.split("/") if part]
+        method = request.method
+        if parts == ["events"]:
+            _allow(method, "GET")
+            await self._stream(writer, None)
+        elif parts == ["jobs"]:
+            if method == "POST":
+                _respond(writer, HTTPStatus.CREATED, {"job_ids": self._submit(request)})
+            else:
+                _allow(method, "GET")
+                jobs = [job.as_dict() for job in self.model]
+                _respond(writer, HTTPStatus.OK, {"jobs": jobs, "totals": _totals(self.model)})
+        elif len(parts) >= 2 and parts[0] == "jobs":
+            job = self.model.get(parts[1])
+            if job is None:
+                raise HttpError(HTTPStatus.NOT_FOUND, f"no job {parts[1]}")
+            if len(parts) == 2 and method == "DELETE":
+                if job.stage not in FINISHED_STAGES:
+                    raise HttpError(HTTPStatus.CONFLICT, "the job has not finished, cancel it first")
+                self.model.remove(job.job_id)
+                self._cancels.pop(job.job_id, None)
+                _respond(writer, HTTPStatus.NO_CONTENT, None)
+            elif len(parts) == 2:
+                _allow(method, "GET", "DELETE")
+                _respond(writer, HTTPStatus.OK, job.as_dict())
+            elif parts[2:] == ["cancel"]:
+                _allow(method, "POST")
+                self.cancel(job.job_id)
+                _respond(writer, HTTPStatus.ACCEPTED, job.as_dict())
+            elif parts[2:] == ["events"]:
+                _allow(method, "GET")
+                await self._stream(writer, job.job_id)
+            else:
+                raise HttpError(HTTPStatus.NOT_FOUND)
+        else:
+            raise HttpError(HTTPStatus.NOT_FOUND)
+
+    def _submit(self, request: Request) -> list[str]:
+        if request.headers.get("content-type", "").split(";")[0].strip() != "application/json":
+            raise HttpError(HTTPStatus.UNSUPPORTED_MEDIA_TYPE, "send the job as application/json")
+        try:
+            data = json.loads(request.body)
+        except ValueError as e:
+            raise HttpError(HTTPStatus.BAD_REQUEST, f"invalid JSON: {e}") from None
+        if not isinstance(data, dict):
+            raise HttpError(HTTPStatus.BAD_REQUEST, "expected a JSON object")
+        urls = data.get("urls", [data["url"]] if "url" in data else [])
+        if not urls or not isinstance(urls, list) or not all(isinstance(url, str) for url in urls):
+            raise HttpError(HTTPStatus.BAD_REQUEST, "give a url, or a list of urls")
+        options = data.get("options") or {}
+        if not isinstance(options, dict):
+            raise HttpError(HTTPStatus.BAD_REQUEST, "options must be an object")
+        try:
+            job_options = options_from_dict(options, self._defaults)
+        except ValueError as e:
+            raise HttpError(HTTPStatus.BAD_REQUEST, str(e)) from None
+        return [self.submit(url, job_options) for url in urls]
+
+    async def _stream(self, writer: asyncio.StreamWriter, job_id: str | None) -> None:
+        writer.write(
+            b"HTTP/1.1 200 OK\r\n"
+            b"Content-Type: text/event-stream\r\n"
+            b"Cache-Control: no-cache\r\n"
+            b"Connection: close\r\n\r\n"
+        )
+        subscriber = _Subscriber(job_id)
+        for job in self.model:
+            subscriber.push(_job_event(job))
+        self._subscribers.add(subscriber)
+        try:
+            while True:
+                events = await subscriber.take(_KEEPALIVE)
+                if not events:
+                    writer.write(b": keepalive\n\n")
+                for event in events:
+                    data = json.dumps(event, ensure_ascii=False)
+                    writer.write(f"event: {event['event']}\ndata: {data}\n\n".encode())
+                await writer.drain()
+                if job_id is not None and any(
+                    event["event"] == "job" and event["stage"] in FINISHED_STAGES for event in events
+                ):
+                    return
+        finally:
+            self._subscribers.discard(subscriber)
+
+
+async def _read_request(reader: asyncio.StreamReader) -> Request:
+    request_line = (await reader.readline()).decode("latin-1").rstrip("\r\n")
+    try:
+        method, target, _version = request_line.split(" ", 2)
+    except ValueError:
+        raise HttpError(HTTPStatus.BAD_REQUEST, "malformed request line") from None
+    headers: dict[str, str] = {}
+    while True:
+        line = (await reader.readline()).decode("latin-1").rstrip("\r\n")
+        if not line:
+            break
+        if len(headers) >= _MAX_HEADERS:
+            raise HttpError(HTTPStatus.REQUEST_HEADER_FIELDS_TOO_LARGE)
+        name, _, value = line.partition(":")
+        headers[name.strip().lower()] = value.strip()
+    try:
+        length = int(headers.get("content-length", "0"))
+    except ValueError:
+        raise HttpError(HTTPStatus.BAD_REQUEST, "invalid Content-Length") from None
+    if length > _MAX_BODY:
+        raise HttpError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE)
+    body = await reader.readexactly(length) if length > 0 else b""
+    return Request(method.upper(), urlsplit(target).path, headers, body)
+
+
+def _allow(method: str, *allowed: str) -> None:
+    if method not in allowed:
+        raise HttpError(HTTPStatus.METHOD_NOT_ALLOWED)
+
+
+def _respond(writer: asyncio.StreamWriter, status: HTTPStatus, body: dict | None) -> None:
+    payload = b"" if body is None else json.dumps(body, ensure_ascii=False).encode()
+    head = f"HTTP/1.1 {status.value} {status.phrase}\r\nContent-Length: {len(payload)}\r\nConnection: close\r\n"
+    if body is not None:
+        head += "Content-Type: application/json\r\n"
+    writer.write(head.encode("latin-1") + b"\r\n" + payload)
+
+
+def _totals(model: ProgressModel) -> dict:
+    totals = model.totals()
+    return {**dataclasses.asdict(totals), "finished": totals.finished, "active": totals.active}
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="video-dl serve",
+        description="Run downloads for other programs, over a local HTTP and JSON API.",
+    )
+    parser.add_argument("--host", default="127.0.0.1", help="address to listen on (default: 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help=f"port to listen on (default: {DEFAULT_PORT})")
+    if hasattr(asyncio, "start_unix_server"):
+        parser.add_argument("--socket", metavar="PATH", help="listen on a Unix socket instead")
+    parser.add_argument("-o", "--output", default=".", metavar="DIR", help="where jobs save files by default")
+    parser.add_argument("-j", "--jobs", type=int, default=2, metavar="N", help="downloads to run at once (default: 2)")
+    parser.add_argument(
+        "--interval", type=float, default=0.5, metavar="SECONDS", help="least time between two events of a job"
+    )
+    parser.add_argument("--processes", action="store_true", help="run each download in a worker process")
+    parser.add_argument(
+        "--no-admission", action="store_true", help="start jobs whatever the load of the machine (core/admission.py)"
+    )
+    add_tool_arguments(parser)
+    parser.add_argument("--debug", action="store_true", help="log video-dl's debug messages to stderr")
+    return parser
+
+
+async def serve(server: JobServer, host: str, port: int, socket_path: str | None) -> None:
+    """Run `server` until SIGINT or SIGTERM."""
+    await server.start(host, port, socket_path)
+    print(f"video-dl serving on {server.address}", file=sys.stderr, flush=True)
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except NotImplementedError:
+            # Windows: the handler runs between two bytecodes of the loop's thread.
+            signal.signal(sig, lambda *_: loop.call_soon_threadsafe(stop.set))
+    try:
+        await stop.wait()
+    finally:
+        await server.close()
+
+
+def main(argv: list[str]) -> int:
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.jobs < 1:
+        parser.error("--jobs must be at least 1")
+    log_to_stderr(args.debug)
+    pool = ProcessPool(args.jobs) if args.processes else None
+    server = JobServer(
+        tools_from_args(args),
+        defaults=JobOptions(dest_folder=args.output),
+        jobs=args.jobs,
+        interval=args.interval,
+        pool=pool,
+        admission=None if args.no_admission else AdmissionController(),
+    )
+    try:
+        asyncio.run(serve(server, args.host, args.port, getattr(args, "socket", None)))
+    except OSError as e:
+        logger.error(f"cannot listen: {e}")
+        return 1
+    finally:
+        if pool is not None:
+            pool.close()
+    return 0
@@ -0,0 +1,232 @@
+"""Start a job, or its encode, only when the machine has room for it.
+
+--jobs says how many jobs may run at once, whatever they turn out to be. Five
+libsvtav1 encodes and a few 16-connection aria2c downloads fit in that on a
+workstation. On an 8 GB laptop they swap it to a standstill, and every job then
+finishes later than if they had taken turns.
+
+An AdmissionController holds each new job, and each encode within a job, until the
+machine has headroom for it:
+
+  - CPU: the one minute load average, per CPU, under `Limits.max_cpu_load`. Only
+    encodes wait on it: downloads need little of it.
+  - memory: the share of the last ten seconds some task spent waiting on memory
+    (Linux's PSI, /proc/pressure/memory), or on kernels without PSI the memory
+    available, from /proc/meminfo.
+  - disk I/O: the same share, of time spent waiting on I/O (/proc/pressure/io).
+  - disk space: free space where the job writes.
+
+A figure this platform cannot give holds nothing back. Neither does a machine that
+is busy on its own: the first job, and the first encode, always go, or a machine
+loaded by something else would never run any.
+
+Load averages and pressure lag behind what has just started. After admitting one,
+the controller waits `SETTLE` seconds before it lets another through, so that a
+dozen queued jobs are not let in on the same quiet second.
+
+cli/runner.py asks before it starts a job, which stays queued until then. A job
+running in this process asks again before each encode, through the controller
+set for it with `job_admission`. A job in a worker process of core/process_pool.py
+is only admitted as a whole: workers cannot see each other's encodes. Neither can
+the tasks of core/aio.py, whose callers admit their own.
+"""
+
+from __future__ import annotations
+
+import contextlib
+import contextvars
+import logging
+import os
+import shutil
+import threading
+import time
+from collections import Counter
+from collections.abc import Callable, Iterator
+from dataclasses import dataclass
+
+from core.callbacks import CancelToken
+from core.exceptions import DownloadCancelled
+from core.resources import ENCODE
+
+logger = logging.getLogger("videodl")
+
+# How often a held job looks at the load again.
+CHECK_INTERVAL = 2
+# How long after admitting one the controller waits before admitting another.
+SETTLE = 10
+
+_PRESSURE = "/proc/pressure"
+_MEMINFO = "/proc/meminfo"
+
+
+@dataclass(frozen=True, slots=True)
+class Limits:
+    """Past these, new work waits."""
+
+    # One minute load average, per CPU.
+    max_cpu_load: float = 1.0
+    # Percent of the last ten seconds some task was stalled, as PSI "some avg10".
+    max_memory_pressure: float = 10.0
+    max_io_pressure: float = 40.0
+    # Bytes, when there is no PSI to go by.
+    min_available_memory: int = 1 << 30
+    # Bytes, where the job writes.
+    min_free_disk: int = 2 << 30
+
+
+@dataclass(frozen=True, slots=True)
+class Load:
+    """The machine's load at one moment. None is what this platform cannot tell."""
+
+    cpu_load: float | None
+    memory_pressure: float | None
+    available_memory: int | None
+    io_pressure: float | None
+    free_disk: int | None
+
+
+def read_load(path: str) -> Load:
+    """The load now, with the free space of the disk holding `path`."""
+    cpu_load = None
+    if hasattr(os, "getloadavg"):
+        with contextlib.suppress(OSError):
+            cpu_load = os.getloadavg()[0] / (os.cpu_count() or 1)
+    free_disk = None
+    with contextlib.suppress(OSError):
+        free_disk = shutil.disk_usage(_existing(path)).free
+    return Load(
+        cpu_load=cpu_load,
+        memory_pressure=_pressure("memory"),
+        available_memory=_available_memory(),
+        io_pressure=_pressure("io"),
+        free_disk=free_disk,
+    )
+
+
+def shortage(load: Load, limits: Limits, stage: str) -> str | None:
+    """What `stage` would lack under `load`, None if it can start."""
+    if stage == ENCODE and load.cpu_load is not None and load.cpu_load > limits.max_cpu_load:
+        return f"CPU load is {load.cpu_load:.2f} per CPU"
+    if load.memory_pressure is not None:
+        if load.memory_pressure > limits.max_memory_pressure:
+            return f"memory pressure is {load.memory_pressure:.0f}%"
+    elif load.available_memory is not None and load.available_memory < limits.min_available_memory:
+        return f"only {load.available_memory >> 20} MiB of memory is available"
+    if load.io_pressure is not None and load.io_pressure > limits.max_io_pressure:
+        return f"I/O pressure is {load.io_pressure:.0f}%"
+    if load.free_disk is not None and load.free_disk < limits.min_free_disk:
+        return f"only {load.free_disk >> 20} MiB of disk is free"
+    return None
+
+
+class AdmissionController:
+    """Admits jobs and encodes while the machine has room for them. Thread safe."""
+
+    def __init__(
+        self,
+        limits: Limits | None = None,
+        *,
+        read: Callable[[str], Load] = read_load,
+        settle: float = SETTLE,
+        interval: float = CHECK_INTERVAL,
+    ):
+        self._limits = limits or Limits()
+        self._read = read
+        self._settle = settle
+        self._interval = interval
+        self._lock = threading.Lock()
+        self._active: Counter[str] = Counter()
+        self._last_admitted = float("-inf")
+
+    @contextlib.contextmanager
+    def admitted(self, stage: str, cancel: CancelToken, path: str = ".") -> Iterator[None]:
+        """Run the block once `stage` has room, writing under `path`.
+
+        Raises:
+            DownloadCancelled: When `cancel` is set while it waits
+        """
+        waiting_on = None
+        while not self._try_admit(stage, path):
+            reason = self._why_not(stage, path)
+            if reason != waiting_on:
+                waiting_on = reason
+                logger.info(f"Holding a new {stage}: {reason}")
+            if cancel.is_cancelled():
+                raise DownloadCancelled
+            time.sleep(self._interval)
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._active[stage] -= 1
+
+    def _try_admit(self, stage: str, path: str) -> bool:
+        with self._lock:
+            # With nothing of its kind running, waiting would not make room.
+            if self._active[stage]:
+                if time.monotonic() - self._last_admitted < self._settle:
+                    return False
+                if shortage(self._read(path), self._limits, stage) is not None:
+                    return False
+            self._active[stage] += 1
+            self._last_admitted = time.monotonic()
+            return True
+
+    def _why_not(self, stage: str, path: str) -> str:
+        return shortage(self._read(path), self._limits, stage) or "the last one admitted is still settling"
+
+
+_current: contextvars.ContextVar[AdmissionController | None] = contextvars.ContextVar("admission", default=None)
+
+
+@contextlib.contextmanager
+def job_admission(controller: AdmissionController | None) -> Iterator[None]:
+    """Admit the encodes of the job the block runs through `controller`, if there is one."""
+    token = _current.set(controller)
+    try:
+        yield
+    finally:
+        _current.reset(token)
+
+
+@contextlib.contextmanager
+def admitted(stage: str, cancel: CancelToken, path: str = ".") -> Iterator[None]:
+    """AdmissionController.admitted, through the current job's controller. Runs the block at once without one."""
+    controller = _current.get()
+    if controller is None:
+        yield
+        return
+    with controller.admitted(stage, cancel, path):
+        yield
+
+
+def _pressure(resource: str) -> float | None:
+    """PSI's "some avg10" for `resource`, None without PSI."""
+    try:
+        with open(f"{_PRESSURE}/{resource}") as f:
+            for line in f:
+                if line.startswith("some "):
+                    fields = dict(field.split("=", 1) for field in line.split()[1:])
+                    return float(fields["avg10"])
+    except (OSError, ValueError, KeyError):
+        pass
+    return None
+
+
+def _available_memory() -> int | None:
+    try:
+        with open(_MEMINFO) as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+
+def _existing(path: str) -> str:
+    """`path`, or the nearest of its parents that exists: the folder may not be made yet."""
+    path = os.path.abspath(path)
+    while not os.path.exists(path) and os.path.dirname(path) != path:
+        path = os.path.dirname(path)
+    return path
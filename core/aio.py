@@ -0,0 +1,358 @@
+"""A whole job, download then encode, as coroutines of one event loop.
+
+core.download.download blocks its caller, so the server runs each job on a thread
+of its own. Inside, extraction runs on a second thread, which the first polls
+every few seconds for a cancel or a stall, sleeping through the backoff between
+attempts. Then the encode blocks it again, on ffmpeg, with the reactor reading
+ffmpeg's pipes. Two threads a job, nearly always asleep, cap how many jobs one
+process can keep in flight.
+
+Here a job is a task. `await download(...)` does what core.download.download does:
+
+  - extraction, and the download yt-dlp runs within it, is the one part left on a
+    thread: yt-dlp has no asynchronous API, and its network I/O blocks. It gets a
+    thread from the loop's executor for as long as it runs, and that is all. The
+    watch for stalls and the backoff between attempts are the task's own awaits.
+  - the encode awaits ffmpeg and ffprobe as asyncio subprocesses. The loop reads
+    their pipes. Only the encodes that decide what to run next from how the last
+    run ended (a hardware encoder failing over, a checkpointed encode, the audio
+    encoded on the side) still go to a thread, as core.encode runs them.
+
+Cancel the task to cancel the job. The extraction thread sees it as yt-dlp sees any
+cancel, from the progress hooks. The processes the job started are stopped, ffmpeg
+asked to quit first, and what the encode had started writing is removed. The
+CancelledError then goes on up: the job raises nothing else for it. A cancel raised
+by the caller's own progress hooks is a DownloadCancelled, as it is from
+core.download.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import os
+import threading
+from collections.abc import Mapping, Sequence
+
+from yt_dlp import YoutubeDL
+from yt_dlp.utils import DownloadCancelled as YtdlpDownloadCancelled
+
+from core import resources, retry, supervisor
+from core.callbacks import ProgressCallback
+from core.config_types import DownloadConfig, OutputTarget
+from core.download import _log_to_stall
+from core.encode import EncodePlan, _ffmpeg_video, commit_outputs, discard_outputs, plan_encode, single_pass
+from core.exceptions import DownloadTimeout, PlaylistNotFound
+from core.ffmpeg_progress import FFmpegProgressTracker
+from core.stall import StallDetector
+from core.stream_encode import StreamingEncoder
+
+logger = logging.getLogger("videodl")
+
+# How often the task looks at an extraction still running, for a stall.
+_WATCH_INTERVAL = 1
+# How long a cancelled extraction thread gets to notice it before it is left behind.
+_THREAD_GRACE = 10
+
+
+class _TaskCancel:
+    """The CancelToken of a task: set once the task is cancelled, read from any thread."""
+
+    def __init__(self) -> None:
+        self._event = threading.Event()
+
+    def set(self) -> None:
+        self._event.set()
+
+    def is_cancelled(self) -> bool:
+        return self._event.is_set()
+
+
+async def download(
+    ydl: YoutubeDL,
+    config: DownloadConfig,
+    progress_cb: ProgressCallback,
+    *,
+    stall_budgets: Mapping[str, float] | None = None,
+) -> None:
+    """core.download.download, as a coroutine. Cancel the task running it to cancel the job.
+
+    `stall_budgets` override core.stall.BUDGETS, per stage.
+    """
+    with resources.job_resources(config.resources), supervisor.job_processes() as processes:
+        try:
+            await _download(ydl, config, _TaskCancel(), progress_cb, stall_budgets, processes)
+        finally:
+            progress_cb.on_usage(processes.usage())
+
+
+async def _download(
+    ydl: YoutubeDL,
+    config: DownloadConfig,
+    cancel: _TaskCancel,
+    progress_cb: ProgressCallback,
+    stall_budgets: Mapping[str, float] | None,
+    processes: supervisor.JobProcesses,
+) -> None:
+    stall = StallDetector(stall_budgets, processes)
+
+    def progress_hook(d: dict) -> None:
+        stall.on_progress(d)
+        # The task is cancelled: stop yt-dlp the way the GUI's hook does. Its
+        # "finished" signal carries no bytes, and has nothing left to stop.
+        if cancel.is_cancelled() and not (d.get("status") == "finished" and "downloaded_bytes" not in d):
+            raise YtdlpDownloadCancelled
+
+    ydl.add_progress_hook(progress_hook)
+    ydl.add_postprocessor_hook(stall.on_postprocess)
+
+    _log_to_stall(ydl, stall)
+
+    streamer = None
+    if config.stream_encode and not config.audio_only and config.target_vcodec != "Best" and not config.outputs:
+        streamer = StreamingEncoder(
+            ydl, config.target_vcodec, cancel, progress_cb, config.ff_path, speed_tier=config.speed_tier
+        )
+        ydl.add_progress_hook(streamer.hook)
+
+    try:
+        infos_ydl = await _extract_with_retries(ydl, config, cancel, stall, processes)
+        await _finish_download(ydl, infos_ydl, config, progress_cb, streamer)
+    except asyncio.CancelledError:
+        cancel.set()
+        raise
+    finally:
+        ydl._progress_hooks.remove(progress_hook)
+        ydl._postprocessor_hooks.remove(stall.on_postprocess)
+        if streamer is not None:
+            ydl._progress_hooks.remove(streamer.hook)
+            await asyncio.to_thread(streamer.close)
+
+
+async def _extract_with_retries(
+    ydl: YoutubeDL,
+    config: DownloadConfig,
+    cancel: _TaskCancel,
+    stall: StallDetector,
+    processes: supervisor.JobProcesses,
+) -> dict | None:
+    """Run the extraction and download, resuming from the stage that failed when it stalls or may pass."""
+    resume = retry.Resume(config.url)
+    ydl.add_progress_hook(resume.hook)
+    try:
+        return await _attempts(ydl, config, cancel, stall, processes, resume)
+    finally:
+        ydl._progress_hooks.remove(resume.hook)
+
+
+async def _attempts(
+    ydl: YoutubeDL,
+    config: DownloadConfig,
+    cancel: _TaskCancel,
+    stall: StallDetector,
+    processes: supervisor.JobProcesses,
+    resume: retry.Resume,
+) -> dict | None:
+    # The last attempt to fail raises: retry.after_attempt gives up on it.
+    attempt = 0
+    while True:
+        stall.restart(resume.stage)
+        extraction = asyncio.ensure_future(asyncio.to_thread(resume.run, ydl))
+        try:
+            while not extraction.done():
+                await asyncio.wait([extraction], timeout=_WATCH_INTERVAL)
+                if not extraction.done() and stall.is_stalled():
+                    logger.warning(
+                        "No activity for %ds in the %s of %s - stopping its processes",
+                        stall.budget,
+                        stall.stage,
+                        config.url,
+                    )
+                    resume.abandon()
+                    await asyncio.to_thread(processes.stop)
+                    await asyncio.wait([extraction], timeout=_THREAD_GRACE)
+                    break
+        except asyncio.CancelledError:
+            cancel.set()
+            resume.abandon()
+            await asyncio.to_thread(processes.stop)
+            await asyncio.wait([extraction], timeout=_THREAD_GRACE)
+            raise
+
+        error = extraction.exception() if extraction.done() else None
+        if extraction.done() and error is None:
+            return extraction.result()
+        await asyncio.sleep(retry.after_attempt(resume, stall, attempt, config.url, error, not extraction.done()))
+        # The next attempt would be stopped with the one given up on: it waits for it to stop.
+        await asyncio.wait([extraction], timeout=stall.budget)
+        if not extraction.done():
+            raise DownloadTimeout(config.url)
+        attempt += 1
+
+
+async def _finish_download(
+    ydl: YoutubeDL,
+    infos_ydl: dict | None,
+    config: DownloadConfig,
+    progress_cb: ProgressCallback,
+    streamer: StreamingEncoder | None = None,
+) -> None:
+    if infos_ydl is None:
+        raise PlaylistNotFound
+    if config.audio_only:
+        return
+    progress_cb.on_download_progress({"status": "finished", "progress_float": 1.0})
+    entries = infos_ydl["entries"] if infos_ydl.get("_type") == "playlist" else [infos_ydl]
+    for entry in entries:
+        await post_download(
+            config.target_vcodec,
+            ydl,
+            entry,
+            progress_cb,
+            config.ff_path,
+            streamer,
+            config.outputs,
+            config.speed_tier,
+        )
+
+
+async def post_download(
+    target_vcodec: str,
+    ydl: YoutubeDL,
+    infos_ydl: dict,
+    progress_cb: ProgressCallback,
+    ff_path: dict[str, str],
+    streamer: StreamingEncoder | None = None,
+    outputs: Sequence[OutputTarget] = (),
+    speed_tier: str = "balanced",
+) -> None:
+    """core.download.post_download, as a coroutine."""
+    ext = infos_ydl["ext"]
+    media_filename_formated = ydl.prepare_filename(infos_ydl)
+    full_path = f"{os.path.splitext(media_filename_formated)[0]}.{ext}"
+    if streamer is not None and await asyncio.to_thread(streamer.finish, full_path):
+        return
+    await post_process(full_path, target_vcodec, progress_cb, ff_path, outputs, speed_tier)
+
+
+async def post_process(
+    full_name: str,
+    target_vcodec: str,
+    progress_cb: ProgressCallback,
+    ff_path: dict[str, str],
+    outputs: Sequence[OutputTarget] = (),
+    speed_tier: str = "balanced",
+) -> None:
+    """
+    core.encode.post_process_dl, as a coroutine: remux or reencode the downloaded file.
+
+    Args:
+        full_name: Full path of the file downloaded
+        target_vcodec: Video codec target ("Best", "NLE", "x264", etc.)
+        progress_cb: Progress callback
+        ff_path: FFmpeg/FFprobe paths
+        outputs: Extra renditions, made from the same decode as the main file
+        speed_tier: Encoder speed tier, see core.hwaccel.SPEED_TIERS
+
+    Raises:
+        ValueError: If ffprobe or ffmpeg fails
+        FileNotFoundError: If an output file doesn't exist because ffmpeg failed
+    """
+    if target_vcodec == "Best" and not outputs:
+        return
+    plan = plan_encode(await ffprobe(full_name, ff_path.get("ffprobe", "ffprobe")), target_vcodec)
+    run = single_pass(full_name, plan, ff_path, outputs, speed_tier)
+    if run is None:
+        await _encode_in_thread(full_name, plan, progress_cb, ff_path, outputs, speed_tier)
+        return
+
+    command, action, written = run
+
+    def hook(status: dict) -> None:
+        status["action"] = action
+        progress_cb.on_process_progress(status)
+
+    tracker = FFmpegProgressTracker(
+        command,
+        hook,
+        duration=plan.duration,
+        total_bytes=os.path.getsize(full_name),
+        filename=command[-1],
+        policy=resources.policy_for(resources.ENCODE),
+    )
+    try:
+        _, stderr, retcode = await tracker.run_async()
+    except asyncio.CancelledError:
+        discard_outputs(written)
+        raise
+    if retcode != 0:
+        discard_outputs(written)
+        raise ValueError(f"FFmpeg failed with return code {retcode}: {stderr}")
+    commit_outputs(full_name, written, plan.keep_source, command)
+
+
+async def _encode_in_thread(
+    full_name: str,
+    plan: EncodePlan,
+    progress_cb: ProgressCallback,
+    ff_path: dict[str, str],
+    outputs: Sequence[OutputTarget],
+    speed_tier: str,
+) -> None:
+    """Run core.encode's own encode on a thread, with a cancel token set when this task is cancelled."""
+    cancel = _TaskCancel()
+    encode = asyncio.ensure_future(
+        asyncio.to_thread(
+            _ffmpeg_video,
+            full_name,
+            plan.acodec_nle_friendly,
+            plan.vcodec_is_target,
+            plan.min_dimension,
+            plan.target_vcodec,
+            cancel,
+            progress_cb,
+            plan.duration,
+            ff_path,
+            outputs=outputs,
+            keep_source=plan.keep_source,
+            speed_tier=speed_tier,
+        )
+    )
+    try:
+        await asyncio.shield(encode)
+    except asyncio.CancelledError:
+        # It asks ffmpeg to quit on its next progress report, and cleans up after itself.
+        cancel.set()
+        await asyncio.wait([encode])
+        raise
+
+
+async def ffprobe(filename: str, cmd: str = "ffprobe") -> dict:
+    """
+    core.encode.ffprobe, as a coroutine.
+
+    Raises:
+        ValueError: When the command errors out
+    """
+    proc = await asyncio.create_subprocess_exec(
+        cmd,
+        "-show_format",
+        "-show_streams",
+        "-of",
+        "json",
+        filename,
+        stdin=asyncio.subprocess.DEVNULL,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+    )
+    supervisor.account(proc, resources.ENCODE)
+    try:
+        out, err = await proc.communicate()
+    except asyncio.CancelledError:
+        proc.kill()
+        await proc.wait()
+        raise
+    if proc.returncode != 0:
+        raise ValueError("ffprobe", out, err)
+    return json.loads(out.decode("utf-8"))
@@ -28,6 +28,8 @@ import subprocess
 import time
 import uuid
 
+from core import capture, resources
+
 logger = logging.getLogger("videodl")
 
 _installed = False
@@ -37,6 +39,8 @@ _installed = False
 _RPC_STARTUP_ATTEMPTS = 20
 _RPC_POLL_INTERVAL = 0.1
 _IDLE_TIMEOUT = 10
+# How long to wait, after aria2c exits, for the end of its stderr.
+_PIPE_CLOSE_TIMEOUT = 5
 
 
 def install() -> bool:
@@ -172,10 +176,18 @@ def _download_with_progress(downloader, cmd, info_dict, popen_class, traverse_ob
         values = tuple(float(v) for v in traverse_obj(sources, (..., ..., key)) if v is not None) or (0,)
         return sum(values) / (len(values) if average else 1)
 
-    with popen_class(cmd, text=True, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE) as process:
+    policy = resources.policy_for(resources.DOWNLOAD)
+    popen_kwargs = resources.popen_kwargs(policy)
+    with popen_class(
+        resources.command(cmd, policy), text=True, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, **popen_kwargs
+    ) as process:
+        resources.apply(process.pid, policy)
+        # Read as it comes, only its end kept. Left in the pipe until aria2c exits,
+        # a chatty run could fill it and block aria2c on its next write.
+        stderr = capture.drain(process.stderr)
         if not _wait_for_rpc(downloader, call, process):
-            _, stderr = process.communicate()
-            return "", stderr, process.returncode
+            process.wait()
+            return "", stderr.wait(_PIPE_CLOSE_TIMEOUT), process.returncode
 
         try:
             downloader._hook_progress(status, info_dict)
@@ -190,8 +202,8 @@ def _download_with_progress(downloader, cmd, info_dict, popen_class, traverse_ob
                 except ConnectionError:
                     # The download itself is still going. Let it finish, just blind.
                     downloader.to_screen("[aria2c] RPC connection lost, waiting for the download to finish")
-                    _, stderr = process.communicate()
-                    return "", stderr, process.returncode
+                    process.wait()
+                    return "", stderr.wait(_PIPE_CLOSE_TIMEOUT), process.returncode
 
                 downloaded = stat("totalLength", done) + stat("completedLength", active)
                 speed = stat("downloadSpeed", active)
@@ -236,10 +248,10 @@ def _download_with_progress(downloader, cmd, info_dict, popen_class, traverse_ob
             # Including the cancel path: never leave an orphan aria2c behind.
             process.kill()
             process.wait()
+            stderr.wait(_PIPE_CLOSE_TIMEOUT)
             raise
 
-        _, stderr = process.communicate()
-        return "", stderr, returncode
+        return "", stderr.wait(_PIPE_CLOSE_TIMEOUT), returncode
 
 
 def _wait_for_rpc(downloader, call, process) -> bool:
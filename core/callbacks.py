@@ -8,6 +8,8 @@ class ProgressCallback(Protocol):
 
     def on_download_progress(self, status: dict) -> None: ...
     def on_process_progress(self, status: dict) -> None: ...
+    # Once the job is over, failed or not: what its processes cost, see core/usage.py.
+    def on_usage(self, usage: dict[str, dict]) -> None: ...
 
 
 class CancelToken(Protocol):
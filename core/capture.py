@@ -0,0 +1,109 @@
+"""Keep the end of what a child process writes, and let go of the rest.
+
+ffmpeg writes a line of log every few frames and a progress block twice a second,
+aria2c a summary every few seconds: hundreds of thousands of lines over a long
+encode. They used to be kept whole, in strings grown a line at a time (each line
+copying everything before it) or in communicate()'s buffers, only ever to quote the
+last few lines of a run that failed.
+
+A TailBuffer keeps the last `max_lines` complete lines, in a deque that forgets the
+oldest as it goes. Every line, as it completes, can also be handed to `spill`, a
+debug log say, which keeps the whole of it without holding any of it in memory.
+The buffer lives as long as the run: once its caller has the tail, nothing of the
+output is left behind.
+
+`drain` reads a pipe into a TailBuffer until the other end closes it, from the
+shared reactor (core/reactor.py) where pipes can be watched, from a thread of its
+own where they cannot.
+"""
+
+from __future__ import annotations
+
+import codecs
+import contextlib
+import threading
+from collections import deque
+from collections.abc import Callable
+from typing import IO
+
+from core import reactor
+
+# Enough for ffmpeg's closing error and the context above it.
+TAIL_LINES = 200
+
+
+class TailBuffer:
+    """The last `max_lines` lines written to it."""
+
+    def __init__(self, max_lines: int = TAIL_LINES, spill: Callable[[str], None] | None = None) -> None:
+        self._lines: deque[str] = deque(maxlen=max_lines)
+        self._partial = ""
+        self._spill = spill
+        # How many lines were forgotten to stay within `max_lines`.
+        self.dropped = 0
+
+    def write(self, text: str) -> None:
+        """Add `text`, which need not end on a line boundary."""
+        *lines, self._partial = (self._partial + text).split("\n")
+        for line in lines:
+            self._add(line.rstrip())
+
+    def close(self) -> None:
+        """Take whatever the stream ended on without a newline as a last line."""
+        if self._partial.strip():
+            self._add(self._partial.rstrip())
+        self._partial = ""
+
+    def text(self) -> str:
+        """The lines kept, each ending in a newline."""
+        return "".join(f"{line}\n" for line in self._lines)
+
+    def _add(self, line: str) -> None:
+        if self._spill is not None and line.strip():
+            self._spill(line)
+        if len(self._lines) == self._lines.maxlen:
+            self.dropped += 1
+        self._lines.append(line)
+
+
+class Drain:
+    """A pipe being read into a TailBuffer. `wait` for its end to have the tail."""
+
+    def __init__(self, stream: IO, tail: TailBuffer) -> None:
+        self.tail = tail
+        self._stream = stream
+        self._done = threading.Event()
+        if reactor.can_watch_pipes:
+            decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+            reactor.get_reactor().watch(stream.fileno(), lambda data: tail.write(decoder.decode(data)), self._end)
+        else:
+            threading.Thread(target=self._read, daemon=True).start()
+
+    def wait(self, timeout: float) -> str:
+        """The tail, once the pipe has ended or `timeout` seconds have passed.
+
+        Only a process left behind, still holding the pipe open, runs out the
+        timeout. The pipe is then let go of, and closed, with what was read so far.
+        """
+        if not self._done.wait(timeout=timeout) and reactor.can_watch_pipes:
+            reactor.get_reactor().unwatch(self._stream.fileno(), self._end)
+            self._done.wait(timeout=timeout)
+        self.tail.close()
+        return self.tail.text()
+
+    def _read(self) -> None:
+        with contextlib.suppress(OSError, ValueError):
+            for line in iter(self._stream.readline, ""):
+                self.tail.write(line if isinstance(line, str) else line.decode("utf-8", errors="replace"))
+        self._end()
+
+    def _end(self) -> None:
+        if not self._done.is_set():
+            with contextlib.suppress(OSError):
+                self._stream.close()
+            self._done.set()
+
+
+def drain(stream: IO, tail: TailBuffer | None = None) -> Drain:
+    """Start reading `stream` to its end, keeping its last lines."""
+    return Drain(stream, tail or TailBuffer())
@@ -3,6 +3,29 @@ from __future__ import annotations
 from dataclasses import dataclass, field
 
 
+@dataclass(frozen=True, slots=True)
+class OutputTarget:
+    """One more file to make from the same download, next to the main one.
+
+    A video rendition when `audio_codec` is None, an audio-only one otherwise.
+    """
+
+    suffix: str  # appended to the file name: "title - proxy.mp4"
+    target_vcodec: str = "x264"  # "x264", "x265", "ProRes", "AV1"
+    max_height: int | None = None  # scaled down to this, never up
+    audio_codec: str | None = None  # "mp3", "aac", "flac", "wav"
+
+
+@dataclass(frozen=True, slots=True)
+class ResourcePolicy:
+    """How the processes of one stage of a job run (core/resources.py)."""
+
+    nice: int = 0  # niceness, 0 to 19; on Windows, above 0 lowers the priority class
+    io_priority: int | None = None  # best-effort I/O level, 0 (high) to 7 (low), Linux only
+    cpus: tuple[int, ...] = ()  # CPUs the process may run on, all when empty, Linux only
+    threads: int = 0  # encoder threads, 0 to let ffmpeg decide
+
+
 @dataclass(frozen=True, slots=True)
 class DownloadConfig:
     """All user options needed by the download/encode pipeline.
@@ -15,3 +38,11 @@ class DownloadConfig:
     target_vcodec: str  # "Best", "NLE", "Original", "x264", etc.
     ff_path: dict[str, str] = field(default_factory=dict)
     ydl_opts: dict = field(default_factory=dict)
+    # Encode a progressive download while it downloads (core/stream_encode.py).
+    stream_encode: bool = False
+    # Extra renditions, made in the same ffmpeg run as the main file.
+    outputs: tuple[OutputTarget, ...] = ()
+    # "fastest", "balanced" or "archival" (core/hwaccel.py SPEED_TIERS).
+    speed_tier: str = "balanced"
+    # Per stage ("encode", "download"), over core/resources.py's defaults.
+    resources: dict[str, ResourcePolicy] = field(default_factory=dict)
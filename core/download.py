@@ -1,34 +1,46 @@
 from __future__ import annotations
 
+import contextlib
 import contextvars
 import logging
+import math
 import os
 import re
-import signal
-import subprocess
 import threading
 import time
+from collections.abc import Sequence
 
 from yt_dlp import YoutubeDL
 from yt_dlp.downloader.external import FFmpegFD
 from yt_dlp.postprocessor import FFmpegPostProcessor
-from yt_dlp.utils import DownloadCancelled as YtdlpDownloadCancelled
 
 import runtime
-from core import aria2c_progress, ffmpegfd_progress, vk_extractor, ytdlp_patch
+from core import (
+    admission,
+    aria2c_progress,
+    ffmpegfd_progress,
+    parallel_formats,
+    resources,
+    retry,
+    section_fragments,
+    supervisor,
+    vk_extractor,
+    ytdlp_patch,
+)
 from core.callbacks import CancelToken, ProgressCallback, StatusCallback
-from core.config_types import DownloadConfig
+from core.config_types import DownloadConfig, OutputTarget
 from core.encode import post_process_dl
 from core.exceptions import DownloadCancelled, DownloadTimeout, PlaylistNotFound
+from core.stall import StallDetector
+from core.stream_encode import StreamingEncoder
 from i18n.lang import GuiField as GF
 from i18n.lang import get_text as gt
 
 logger = logging.getLogger("videodl")
 
+# How often the wait between attempts looks for a cancel, in seconds.
+_WAIT_STEP = 0.5
 
-STALL_TIMEOUT = 120  # seconds without any progress before considered hung
-MAX_RETRIES = 3
-BASE_BACKOFF = 5  # seconds, doubles each retry
 
 _STATUS_PATTERNS = [
     (re.compile(r"Extracting cookies from", re.IGNORECASE), GF.extracting_cookies),
@@ -74,7 +86,11 @@ def create_ydl(
     logger.debug("ydl options %s", ydl_opts)
     ytdlp_patch.install()
     ffmpegfd_progress.install()
+    # Wraps what ffmpegfd_progress installed, so it comes after it.
+    section_fragments.install()
     aria2c_progress.install()
+    parallel_formats.install()
+    supervisor.install()
     ydl_opts["logger"] = _YdlUiLogger(status_cb)
     ffmpeg_path = ff_path.get("ffmpeg", "ffmpeg")
     if ffmpeg_path != "ffmpeg":
@@ -93,88 +109,111 @@ def create_ydl(
     return ydl
 
 
-def _get_child_pids() -> set[int]:
-    """Return PIDs of direct child processes (works on macOS/Linux)."""
-    pid = os.getpid()
-    try:
-        out = subprocess.check_output(["pgrep", "-P", str(pid)], text=True, timeout=5)
-        return {int(p) for p in out.split() if p.strip()}
-    except (subprocess.CalledProcessError, FileNotFoundError, subprocess.TimeoutExpired):
-        return set()
-
-
-def _kill_new_children(before: set[int]) -> None:
-    """Kill child processes that were spawned after *before* snapshot."""
-    after = _get_child_pids()
-    new = after - before
-    for pid in new:
+def download(
+    ydl: YoutubeDL,
+    config: DownloadConfig,
+    cancel: CancelToken,
+    progress_cb: ProgressCallback,
+) -> None:
+    # Every process the job starts, down to yt-dlp's, runs under its policies,
+    # and is the job's own to stop and to account for.
+    with resources.job_resources(config.resources), supervisor.job_processes() as processes:
         try:
-            logger.debug("Killing stuck child process %d", pid)
-            os.kill(pid, signal.SIGTERM)
-        except OSError:
-            pass
-
-
-class _StallDetector:
-    """Tracks whether yt-dlp is making progress via its progress hooks."""
+            _download(ydl, config, cancel, progress_cb, processes)
+        finally:
+            progress_cb.on_usage(processes.usage())
 
-    def __init__(self, stall_timeout: int = STALL_TIMEOUT):
-        self._stall_timeout = stall_timeout
-        self._last_activity = time.monotonic()
-        self._lock = threading.Lock()
 
-    def tick(self):
-        """Called by yt-dlp progress/log hooks to signal activity."""
-        with self._lock:
-            self._last_activity = time.monotonic()
-
-    def is_stalled(self) -> bool:
-        with self._lock:
-            return (time.monotonic() - self._last_activity) > self._stall_timeout
-
-
-def download(
+def _download(
     ydl: YoutubeDL,
     config: DownloadConfig,
     cancel: CancelToken,
     progress_cb: ProgressCallback,
+    processes: supervisor.JobProcesses,
 ) -> None:
-    stall = _StallDetector()
+    stall = StallDetector(processes=processes)
+    ydl.add_progress_hook(stall.on_progress)
+    ydl.add_postprocessor_hook(stall.on_postprocess)
 
-    # Wrap existing progress hooks to also tick the stall detector
-    original_hooks = list(ydl.params.get("progress_hooks", []))
+    _log_to_stall(ydl, stall)
 
-    def progress_hook_with_stall(d):
-        stall.tick()
-        for hook in original_hooks:
-            hook(d)
+    streamer = None
+    if config.stream_encode and not config.audio_only and config.target_vcodec != "Best" and not config.outputs:
+        streamer = StreamingEncoder(
+            ydl, config.target_vcodec, cancel, progress_cb, config.ff_path, speed_tier=config.speed_tier
+        )
+        ydl.add_progress_hook(streamer.hook)
+
+    try:
+        infos_ydl = _extract_with_retries(ydl, config, cancel, stall, processes)
+        if cancel.is_cancelled():
+            raise DownloadCancelled
+        _finish_download(ydl, infos_ydl, config, cancel, progress_cb, streamer)
+    finally:
+        _remove_stall_hooks(ydl, stall)
+        if streamer is not None:
+            ydl._progress_hooks.remove(streamer.hook)
+            streamer.close()
 
-    ydl.params["progress_hooks"] = [progress_hook_with_stall]
 
-    # Also tick on logger activity (covers extraction phase before download)
+def _log_to_stall(ydl: YoutubeDL, stall: StallDetector) -> None:
+    """Show the stall detector yt-dlp's log: it is what extraction shows of itself, before any hook runs."""
     ydl_logger = ydl.params.get("logger")
     if ydl_logger and isinstance(ydl_logger, _YdlUiLogger):
         original_debug = ydl_logger.debug
 
         def debug_with_stall(msg):
-            stall.tick()
+            stall.on_log(msg)
             original_debug(msg)
 
         ydl_logger.debug = debug_with_stall
 
-    last_exc: BaseException | None = None
-    for attempt in range(MAX_RETRIES):
+
+def _remove_stall_hooks(ydl: YoutubeDL, stall: StallDetector) -> None:
+    with contextlib.suppress(ValueError):
+        ydl._progress_hooks.remove(stall.on_progress)
+    with contextlib.suppress(ValueError):
+        ydl._postprocessor_hooks.remove(stall.on_postprocess)
+
+
+def _extract_with_retries(
+    ydl: YoutubeDL,
+    config: DownloadConfig,
+    cancel: CancelToken,
+    stall: StallDetector,
+    processes: supervisor.JobProcesses,
+) -> dict | None:
+    """Run the extraction and download, resuming from the stage that failed when it stalls or may pass."""
+    resume = retry.Resume(config.url)
+    ydl.add_progress_hook(resume.hook)
+    try:
+        return _attempts(ydl, config, cancel, stall, processes, resume)
+    finally:
+        with contextlib.suppress(ValueError):
+            ydl._progress_hooks.remove(resume.hook)
+
+
+def _attempts(
+    ydl: YoutubeDL,
+    config: DownloadConfig,
+    cancel: CancelToken,
+    stall: StallDetector,
+    processes: supervisor.JobProcesses,
+    resume: retry.Resume,
+) -> dict | None:
+    # The last attempt to fail raises: after_attempt gives up on it.
+    attempt = 0
+    while True:
         if cancel.is_cancelled():
             raise DownloadCancelled
-        stall.tick()  # reset before each attempt
-        children_before = _get_child_pids()
+        stall.restart(resume.stage)
 
         result: list = []
         error: list = []
 
         def target():
             try:
-                result.append(ydl.extract_info(config.url))  # noqa: B023
+                result.append(resume.run(ydl))  # noqa: B023
             except BaseException as e:
                 error.append(e)  # noqa: B023
 
@@ -188,42 +227,47 @@ def download(
             if not t.is_alive():
                 break
             if cancel.is_cancelled():
-                _kill_new_children(children_before)
+                resume.abandon()
+                processes.stop()
                 t.join(timeout=10)
                 raise DownloadCancelled
             if stall.is_stalled():
-                logger.warning("No progress for %ds on %s - killing child processes", STALL_TIMEOUT, config.url)
-                _kill_new_children(children_before)
+                logger.warning(
+                    "No activity for %ds in the %s of %s - stopping its processes",
+                    stall.budget,
+                    stall.stage,
+                    config.url,
+                )
+                resume.abandon()
+                processes.stop()
                 t.join(timeout=10)
                 break
 
-        if t.is_alive() or (error and stall.is_stalled()):
-            # Stall timeout - retry
-            last_exc = error[0] if error else TimeoutError(f"stalled for {STALL_TIMEOUT}s on {config.url}")
-            backoff = BASE_BACKOFF * (2**attempt)
-            logger.warning(
-                "Attempt %d/%d stalled for %s, retrying in %ds", attempt + 1, MAX_RETRIES, config.url, backoff
-            )
-            time.sleep(backoff)
-            continue
+        if not t.is_alive() and not error:
+            return result[0] if result else None
+        wait = retry.after_attempt(resume, stall, attempt, config.url, error[0] if error else None, t.is_alive())
+        _backoff(wait, cancel, resume, stall, config.url)
+        attempt += 1
 
-        if error:
-            exc = error[0]
-            if isinstance(exc, YtdlpDownloadCancelled):
-                raise DownloadCancelled from None
-            raise exc
 
-        infos_ydl = result[0] if result else None
-        break
-    else:
-        raise DownloadTimeout(config.url) from last_exc
+def _backoff(wait: float, cancel: CancelToken, resume: retry.Resume, stall: StallDetector, url: str) -> None:
+    """Wait `wait` seconds, then for the attempt given up on to stop, for at most its stall budget.
 
-    # Restore original hooks
-    ydl.params["progress_hooks"] = original_hooks
-
-    if cancel.is_cancelled():
-        raise DownloadCancelled
-    _finish_download(ydl, infos_ydl, config, cancel, progress_cb)
+    Raises DownloadCancelled as soon as the job is cancelled, and DownloadTimeout when
+    the attempt given up on is still running: the next one would be stopped with it.
+    """
+    while wait > 0:
+        if cancel.is_cancelled():
+            raise DownloadCancelled
+        step = min(_WAIT_STEP, wait)
+        time.sleep(step)
+        wait -= step
+    for _ in range(max(1, math.ceil(stall.budget / _WAIT_STEP))):
+        if cancel.is_cancelled():
+            raise DownloadCancelled
+        if resume.wait(_WAIT_STEP):
+            return
+    raise DownloadTimeout(url)
 
 
 def _finish_download(
@@ -232,6 +276,7 @@ def _finish_download(
     config: DownloadConfig,
     cancel: CancelToken,
     progress_cb: ProgressCallback,
+    streamer: StreamingEncoder | None = None,
 ) -> None:
     if infos_ydl is None:
         raise PlaylistNotFound
@@ -249,9 +294,22 @@ def _finish_download(
                 cancel,
                 progress_cb,
                 config.ff_path,
+                streamer,
+                config.outputs,
+                config.speed_tier,
             )
     else:
-        post_download(config.target_vcodec, ydl, infos_ydl, cancel, progress_cb, config.ff_path)
+        post_download(
+            config.target_vcodec,
+            ydl,
+            infos_ydl,
+            cancel,
+            progress_cb,
+            config.ff_path,
+            streamer,
+            config.outputs,
+            config.speed_tier,
+        )
     if cancel.is_cancelled():
         raise DownloadCancelled
 
@@ -263,6 +321,9 @@ def post_download(
     cancel: CancelToken,
     progress_cb: ProgressCallback,
     ff_path: dict[str, str] | None = None,
+    streamer: StreamingEncoder | None = None,
+    outputs: Sequence[OutputTarget] = (),
+    speed_tier: str = "balanced",
 ) -> None:
     """
     Execute all needed processes after a youtube video download.
@@ -274,8 +335,17 @@ def post_download(
         cancel: Cancellation token
         progress_cb: Progress callback
         ff_path: FFmpeg/FFprobe paths
+        streamer: Encoder that may already have encoded the file as it downloaded
+        outputs: Extra renditions to make from the download
+        speed_tier: Encoder speed tier, see core.hwaccel.SPEED_TIERS
     """
     ext = infos_ydl["ext"]
     media_filename_formated = ydl.prepare_filename(infos_ydl)
     full_path = f"{os.path.splitext(media_filename_formated)[0]}.{ext}"
-    post_process_dl(full_path, target_vcodec, cancel, progress_cb, ff_path)
+    if streamer is not None and streamer.finish(full_path):
+        return
+    if target_vcodec == "Best" and not outputs:
+        return
+    # Held until the machine has room for another encode, see core/admission.py.
+    with admission.admitted(resources.ENCODE, cancel, os.path.dirname(full_path) or "."):
+        post_process_dl(full_path, target_vcodec, cancel, progress_cb, ff_path, outputs, speed_tier)
@@ -1,18 +1,29 @@
 from __future__ import annotations
 
+import csv
 import json
+import logging
 import os
+import re
+import shutil
 import subprocess
+import tempfile
+from collections.abc import Sequence
+from dataclasses import dataclass
 from typing import TYPE_CHECKING
 
+from core import resources, supervisor
 from core.ffmpeg_progress import FFmpegProgressTracker
-from core.hwaccel import fastest_encoder
+from core.hwaccel import fastest_encoder, is_software_encoder, mark_encoder_degraded
 from i18n.lang import GuiField, get_text
 
 if TYPE_CHECKING:
     from core.callbacks import CancelToken, ProgressCallback
+    from core.config_types import OutputTarget
     from runtime.base import ProcessRunner
 
+logger = logging.getLogger("videodl")
+
 NLE_COMPATIBLE_VCODECS = {"avc1", "h264", "hevc", "h265", "prores"}
 NLE_COMPATIBLE_ACODECS = {"aac", "mp3", "mp4a", "pcm_s16le", "pcm_s24le"}
 
@@ -23,8 +34,35 @@ _VCODEC_NAME_TO_TARGET = {
     "h265": "x265",
     "prores": "ProRes",
 }
+# Audio renditions: codec → (extension, encoder options)
+_AUDIO_RENDITIONS = {
+    "mp3": (".mp3", ["-c:a", "libmp3lame", "-q:a", "2"]),
+    "aac": (".m4a", ["-c:a", "aac", "-b:a", "192k"]),
+    "flac": (".flac", ["-c:a", "flac"]),
+    "wav": (".wav", ["-c:a", "pcm_s16le"]),
+}
 # Inverse mapping: target codec → canonical ffprobe name (first match wins)
 _TARGET_TO_VCODEC_NAME = {"x264": "avc1", "x265": "hevc", "ProRes": "prores", "AV1": "av1"}
+# From this long on, a file whose video and audio both need encoding gets its audio
+# transcoded by an ffmpeg of its own, next to the video encode, then the two are
+# muxed. In one process the audio encode shares the video's thread budget, and a
+# hardware video encoder waits on it. Below this the extra mux costs more than it saves.
+_SEPARATE_AUDIO_MIN_DURATION = 600
+# From this long on, a reencode is written as segments of _CHECKPOINT_SEGMENT_SECONDS,
+# listed as they complete, so that an encode the process crashed in resumes from the last one.
+_CHECKPOINT_MIN_DURATION = 1800
+_CHECKPOINT_SEGMENT_SECONDS = 60
+
+# What ffmpeg writes when the encoder itself, or the device under it, fails: only
+# these hand the encode to the next encoder. Bad input, a full disk or a broken
+# filter would fail on any encoder.
+_ENCODER_FAILURE = re.compile(
+    r"Error while opening encoder|Could not open encoder|Error initializing output stream"
+    r"|Error submitting (?:a )?(?:video )?frame to the encoder|Device creation failed"
+    r"|Failed to (?:create|initiali[sz]e|open)\b[^\n]*\b(?:device|session|encoder|context|connection)"
+    r"|No (?:NVENC )?capable devices found|OpenEncodeSessionEx failed|CUDA_ERROR_\w+|MFX_ERR_\w+",
+    re.IGNORECASE,
+)
 
 
 def _adapt_crf(quality_options: list[str], min_dimension: int) -> list[str]:
@@ -63,6 +101,8 @@ def post_process_dl(
     cancel: CancelToken,
     progress_cb: ProgressCallback,
     ff_path: dict[str, str] | None = None,
+    outputs: Sequence[OutputTarget] = (),
+    speed_tier: str = "balanced",
 ) -> None:
     """
     Remux to ensure compatibility with NLEs or reencode to the target video
@@ -74,8 +114,10 @@ def post_process_dl(
         cancel: Cancellation token
         progress_cb: Progress callback
         ff_path: FFmpeg/FFprobe paths (lazy-loaded from sys_vars if None)
+        outputs: Extra renditions, made from the same decode as the main file
+        speed_tier: Encoder speed tier, see core.hwaccel.SPEED_TIERS
     """
-    if target_vcodec == "Best":
+    if target_vcodec == "Best" and not outputs:
         return
 
     if ff_path is None:
@@ -83,50 +125,77 @@ def post_process_dl(
 
         ff_path = FF_PATH
 
-    probe_data = ffprobe(full_name, cmd=ff_path.get("ffprobe"))  # type: ignore[arg-type]
-    file_infos = probe_data["streams"]
+    plan = plan_encode(ffprobe(full_name, cmd=ff_path.get("ffprobe")), target_vcodec)  # type: ignore[arg-type]
+    _ffmpeg_video(
+        full_name,
+        plan.acodec_nle_friendly,
+        plan.vcodec_is_target,
+        plan.min_dimension,
+        plan.target_vcodec,
+        cancel,
+        progress_cb,
+        plan.duration,
+        ff_path,
+        outputs=outputs,
+        keep_source=plan.keep_source,
+        speed_tier=speed_tier,
+    )
+
+
+@dataclass(frozen=True, slots=True)
+class EncodePlan:
+    """What post-processing does to a download, decided from its ffprobe."""
+
+    acodec_nle_friendly: bool
+    vcodec_is_target: bool
+    # Smallest dimension (width or height) of the video
+    min_dimension: int
+    # Resolved to a concrete codec
+    target_vcodec: str
+    duration: int
+    # "Best": the download stays as it is, only the renditions are made from it
+    keep_source: bool
+
+
+def plan_encode(probe_data: dict, target_vcodec: str) -> EncodePlan:
+    """Read a download's ffprobe output, and decide what to do with each of its streams."""
     duration = int(float(probe_data["format"]["duration"]))
     acodec, vcodec = "na", "na"
     min_dimension = 0
-    for stream in file_infos:
+    for stream in probe_data["streams"]:
         if stream["codec_type"] == "audio":
             acodec = stream["codec_name"]
         elif stream["codec_type"] == "video":
             vcodec = stream["codec_name"]
             min_dimension = min(stream["width"], stream["height"])
 
+    keep_source = target_vcodec == "Best"
+    if keep_source:
+        acodec_nle_friendly, vcodec_is_target = acodec.lower() in NLE_COMPATIBLE_ACODECS, True
+        target_vcodec = _VCODEC_NAME_TO_TARGET.get(vcodec.lower(), "x264")
+    else:
+        acodec_nle_friendly, vcodec_is_target, target_vcodec = resolve_target(target_vcodec, vcodec, acodec)
+    return EncodePlan(acodec_nle_friendly, vcodec_is_target, min_dimension, target_vcodec, duration, keep_source)
+
+
+def resolve_target(target_vcodec: str, vcodec: str, acodec: str) -> tuple[bool, bool, str]:
+    """Decide what to do with each stream, for a source with these codecs.
+
+    Returns (acodec_nle_friendly, vcodec_is_target, target_vcodec), with
+    `target_vcodec` resolved to a concrete codec for "Original" and "NLE".
+    """
     if target_vcodec == "Original":
         # Remux only - copy both streams into mp4 container
-        acodec_nle_friendly = True
-        vcodec_is_target = True
-        target_vcodec = _VCODEC_NAME_TO_TARGET.get(vcodec.lower(), "x264")
-    elif target_vcodec == "NLE":
+        return True, True, _VCODEC_NAME_TO_TARGET.get(vcodec.lower(), "x264")
+    if target_vcodec == "NLE":
         v_needs, a_needs = needs_reencode(vcodec, acodec)
-        resolved = _VCODEC_NAME_TO_TARGET.get(vcodec.lower(), "x264")
-        acodec_nle_friendly = not a_needs
         if not v_needs:
             # Video already NLE-compatible - remux (copy video)
-            vcodec_is_target = True
-            target_vcodec = resolved
-        else:
-            # Video incompatible - re-encode to x264
-            vcodec_is_target = False
-            target_vcodec = "x264"
-    else:
-        acodec_nle_friendly = acodec.lower() in NLE_COMPATIBLE_ACODECS
-        vcodec_is_target = _TARGET_TO_VCODEC_NAME.get(target_vcodec) == vcodec
-
-    _ffmpeg_video(
-        full_name,
-        acodec_nle_friendly,
-        vcodec_is_target,
-        min_dimension,
-        target_vcodec,
-        cancel,
-        progress_cb,
-        duration,
-        ff_path,
-    )
+            return not a_needs, True, _VCODEC_NAME_TO_TARGET.get(vcodec.lower(), "x264")
+        # Video incompatible - re-encode to x264
+        return not a_needs, False, "x264"
+    acodec_nle_friendly = acodec.lower() in NLE_COMPATIBLE_ACODECS
+    return acodec_nle_friendly, _TARGET_TO_VCODEC_NAME.get(target_vcodec) == vcodec, target_vcodec
 
 
 def ffprobe(
@@ -157,7 +226,7 @@ def ffprobe(
             raise ValueError("ffprobe", result.stdout, result.stderr)
         return json.loads(result.stdout)
 
-    p = subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    p = supervisor.popen(args, stage=resources.ENCODE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
     out, err = p.communicate()
     if p.returncode != 0:
         raise ValueError("ffprobe", out, err)
@@ -174,6 +243,9 @@ def _ffmpeg_video(
     progress_cb: ProgressCallback,
     duration: int,
     ff_path: dict[str, str] | None = None,
+    outputs: Sequence[OutputTarget] = (),
+    keep_source: bool = False,
+    speed_tier: str = "balanced",
 ) -> None:
     """
     Generate the ffmpeg command arguments and run it.
@@ -188,6 +260,9 @@ def _ffmpeg_video(
         progress_cb: Progress callback
         duration: File duration in seconds (from ffprobe)
         ff_path: FFmpeg/FFprobe paths
+        outputs: Extra renditions to write alongside the main file
+        keep_source: Leave the downloaded file as it is, and only write `outputs`
+        speed_tier: Encoder speed tier, see core.hwaccel.SPEED_TIERS
 
     Raises:
         FileNotFoundError: If the output file doesn't exist because ffmpeg failed
@@ -197,54 +272,726 @@ def _ffmpeg_video(
 
         ff_path = FF_PATH
 
+    tmp_path, written, renditions = _output_files(path, target_vcodec, outputs, keep_source)
+    if _separate_audio(tmp_path, outputs, acodec_nle_friendly, vcodec_is_target, duration):
+        assert tmp_path is not None
+        ffmpeg_command = _encode_audio_separately(
+            path, tmp_path, min_dimension, target_vcodec, cancel, progress_cb, duration, ff_path, speed_tier
+        )
+    elif tmp_path is not None and not vcodec_is_target and not outputs:
+        ffmpeg_command = _encode_video(
+            path,
+            tmp_path,
+            acodec_nle_friendly,
+            min_dimension,
+            target_vcodec,
+            cancel,
+            progress_cb,
+            duration,
+            ff_path,
+            speed_tier,
+        )
+    else:
+        ffmpeg_command = ffmpeg_video_command(
+            path,
+            tmp_path,
+            acodec_nle_friendly,
+            vcodec_is_target,
+            min_dimension,
+            target_vcodec,
+            ff_path,
+            renditions=renditions,
+            speed_tier=speed_tier,
+        )
+        action = _action(acodec_nle_friendly, vcodec_is_target, outputs)
+        _progress_ffmpeg(ffmpeg_command, action, path, cancel, progress_cb, duration)
+    if cancel.is_cancelled():
+        discard_outputs(written)
+        return
+    commit_outputs(path, written, keep_source, ffmpeg_command)
+
+
+def single_pass(
+    path: str,
+    plan: EncodePlan,
+    ff_path: dict[str, str],
+    outputs: Sequence[OutputTarget] = (),
+    speed_tier: str = "balanced",
+) -> tuple[list, str, list[tuple[str, str]]] | None:
+    """
+    The one ffmpeg command that post-processes `path` the way _ffmpeg_video would.
+
+    None when that takes more than one run: the audio encoded on the side, a
+    checkpointed encode, or a hardware encoder, which can fail over to the next
+    one partway through.
+
+    Returns:
+        The command, its display label, and the (tmp, final) path of every file it writes
+    """
+    tmp_path, written, renditions = _output_files(path, plan.target_vcodec, outputs, plan.keep_source)
+    if tmp_path is not None and not plan.vcodec_is_target and not outputs:
+        if _separate_audio(tmp_path, outputs, plan.acodec_nle_friendly, False, plan.duration):
+            return None
+        if plan.duration >= _CHECKPOINT_MIN_DURATION:
+            return None
+        if not is_software_encoder(fastest_encoder(plan.target_vcodec, speed_tier, ff_path)[0]):
+            return None
+    command = ffmpeg_video_command(
+        path,
+        tmp_path,
+        plan.acodec_nle_friendly,
+        plan.vcodec_is_target,
+        plan.min_dimension,
+        plan.target_vcodec,
+        ff_path,
+        renditions=renditions,
+        speed_tier=speed_tier,
+    )
+    return command, _action(plan.acodec_nle_friendly, plan.vcodec_is_target, outputs), written
+
+
+def _output_files(
+    path: str, target_vcodec: str, outputs: Sequence[OutputTarget], keep_source: bool
+) -> tuple[str | None, list[tuple[str, str]], list[tuple[OutputTarget, str]]]:
+    """Where ffmpeg writes.
+
+    Returns the main file's tmp path (None when the source is kept), the (tmp, final)
+    path of every file written, and the (rendition, tmp path) of every rendition.
+    """
+    new_ext = output_ext(target_vcodec)
+    tmp_path = None if keep_source else f"{os.path.splitext(path)[0]}.tmp{new_ext}"
+    written = [] if tmp_path is None else [(tmp_path, os.path.splitext(path)[0] + new_ext)]
+    renditions = []
+    for output in outputs:
+        final = rendition_path(path, output)
+        root, ext = os.path.splitext(final)
+        renditions.append((output, f"{root}.tmp{ext}"))
+        written.append((f"{root}.tmp{ext}", final))
+    return tmp_path, written, renditions
+
+
+def _separate_audio(
+    tmp_path: str | None,
+    outputs: Sequence[OutputTarget],
+    acodec_nle_friendly: bool,
+    vcodec_is_target: bool,
+    duration: int,
+) -> bool:
+    return (
+        tmp_path is not None
+        and not outputs
+        and not acodec_nle_friendly
+        and not vcodec_is_target
+        and duration >= _SEPARATE_AUDIO_MIN_DURATION
+    )
+
+
+def _action(acodec_nle_friendly: bool, vcodec_is_target: bool, outputs: Sequence[OutputTarget]) -> str:
+    remux_only = acodec_nle_friendly and vcodec_is_target and not outputs
+    return get_text(GuiField.ff_remux) if remux_only else get_text(GuiField.ff_reencode)
+
+
+def discard_outputs(written: Sequence[tuple[str, str]]) -> None:
+    """Remove what a cancelled encode had started writing."""
+    for tmp, _ in written:
+        if os.path.isfile(tmp):
+            os.remove(tmp)
+
+
+def commit_outputs(path: str, written: Sequence[tuple[str, str]], keep_source: bool, command: list) -> None:
+    """
+    Put what the encode wrote in place of the download.
+
+    Raises:
+        FileNotFoundError: If a file is missing because ffmpeg failed
+    """
+    if not all(os.path.isfile(tmp) for tmp, _ in written):
+        raise FileNotFoundError(command)
+    if not keep_source:
+        os.remove(path)
+    for tmp, final in written:
+        os.rename(src=tmp, dst=final)
+
+
+def _encode_audio_separately(
+    path: str,
+    output: str,
+    min_dimension: int,
+    target_vcodec: str,
+    cancel: CancelToken,
+    progress_cb: ProgressCallback,
+    duration: int,
+    ff_path: dict[str, str],
+    speed_tier: str,
+) -> list:
+    """
+    Reencode `path` into `output` with its audio transcoded by a second ffmpeg,
+    running while the first encodes the video, then copy both streams into `output`.
+
+    Progress follows the video encode, the audio one being much the shorter.
+
+    Returns:
+        The last command run, for the caller's error report
+
+    Raises:
+        ValueError: If either encode or the mux fails
+    """
+    root = os.path.splitext(output)[0]
+    video_path = f"{root}.video{output_ext(target_vcodec)}"
+    audio_path = f"{root}.audio.m4a"
+    audio_command = [ff_path.get("ffmpeg"), "-hide_banner", "-i", path, "-map", "0:a:0", "-vn", "-c:a", "aac"]
+    audio_command.extend(["-y", audio_path])
+    # stderr goes to a file: a pipe nobody reads until the end could fill up and stall it.
+    with tempfile.TemporaryFile(mode="w+") as audio_log:
+        audio = supervisor.popen(
+            audio_command,
+            stage=resources.ENCODE,
+            policy=resources.policy_for(resources.ENCODE),
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL,
+            stderr=audio_log,
+        )
+        try:
+            video_command = _encode_video(
+                path,
+                video_path,
+                False,
+                min_dimension,
+                target_vcodec,
+                cancel,
+                progress_cb,
+                duration,
+                ff_path,
+                speed_tier,
+                audio=False,
+            )
+            if cancel.is_cancelled():
+                return video_command
+            if audio.wait() != 0:
+                audio_log.seek(0)
+                raise ValueError(f"FFmpeg failed with return code {audio.returncode}: {audio_log.read()}")
+
+            mux_command = [ff_path.get("ffmpeg"), "-hide_banner", "-i", video_path, "-i", audio_path]
+            mux_command.extend(["-map", "0:v:0", "-map", "1:a:0", "-c", "copy", "-metadata", "creation_time=now"])
+            if output_ext(target_vcodec) == ".mp4":
+                mux_command.extend(["-movflags", "+faststart"])
+            mux_command.extend(["-progress", "pipe:1", "-y", output])
+            _progress_ffmpeg(mux_command, get_text(GuiField.ff_remux), video_path, cancel, progress_cb, duration)
+            return mux_command
+        finally:
+            if audio.poll() is None:
+                audio.kill()
+                audio.wait()
+            for intermediate in (video_path, audio_path):
+                if os.path.isfile(intermediate):
+                    os.remove(intermediate)
+
+
+def _encode_video(
+    path: str,
+    output: str,
+    acodec_nle_friendly: bool,
+    min_dimension: int,
+    target_vcodec: str,
+    cancel: CancelToken,
+    progress_cb: ProgressCallback,
+    duration: int,
+    ff_path: dict[str, str],
+    speed_tier: str,
+    audio: bool = True,
+) -> list:
+    """
+    Reencode the video of `path` into `output`, failing over to the next encoder
+    when a hardware one dies partway through.
+
+    Long sources are encoded in checkpointed segments instead, see
+    _encode_checkpointed, which fail over the same way.
+
+    A hardware encoder writes fragmented parts, readable up to wherever it stopped.
+    When it fails, it is marked degraded, and the next encoder picks up from the
+    last keyframe the part holds. The parts are then joined, without reencoding,
+    into `output`. That join is one more pass over the file, which a software
+    encoder, with nothing to fail over to, does without.
+
+    Returns:
+        The last command run, for the caller's error report
+
+    Raises:
+        ValueError: If an encode fails with no encoder left to take over, or the join fails
+    """
+    if duration >= _CHECKPOINT_MIN_DURATION:
+        return _encode_checkpointed(
+            path,
+            output,
+            acodec_nle_friendly,
+            min_dimension,
+            target_vcodec,
+            cancel,
+            progress_cb,
+            duration,
+            ff_path,
+            speed_tier,
+            audio,
+        )
+
+    reencode = get_text(GuiField.ff_reencode)
+    encoder, _ = fastest_encoder(target_vcodec, speed_tier, ff_path)
+    if is_software_encoder(encoder):
+        command = ffmpeg_video_command(
+            path,
+            output,
+            acodec_nle_friendly,
+            False,
+            min_dimension,
+            target_vcodec,
+            ff_path,
+            speed_tier=speed_tier,
+            audio=audio,
+        )
+        _progress_ffmpeg(command, reencode, path, cancel, progress_cb, duration)
+        return command
+
+    root, ext = os.path.splitext(output)
+    # (part, where to stop reading it: None for all of it)
+    parts: list[tuple[str, float | None]] = []
+    attempted: list[str] = []
+    start = 0.0
+    try:
+        while True:
+            part = f"{root}.part{len(attempted)}{ext}"
+            attempted.append(part)
+            command = ffmpeg_video_command(
+                path,
+                part,
+                acodec_nle_friendly,
+                False,
+                min_dimension,
+                target_vcodec,
+                ff_path,
+                speed_tier=speed_tier,
+                audio=audio,
+                start=start,
+                fragmented=True,
+            )
+            try:
+                _progress_ffmpeg(command, reencode, path, cancel, progress_cb, duration)
+            except ValueError as e:
+                if is_software_encoder(encoder) or not _encoder_failed(e):
+                    raise
+                mark_encoder_degraded(encoder)
+                reached = _last_keyframe(part, ff_path.get("ffprobe", "ffprobe"))
+                if reached > 0:
+                    parts.append((part, reached))
+                    start += reached
+                encoder, _ = fastest_encoder(target_vcodec, speed_tier, ff_path)
+                logger.warning(f"Resuming the encode of {path} at {start:.3f}s with {encoder}")
+                continue
+            if cancel.is_cancelled():
+                return command
+            parts.append((part, None))
+            break
+        return _join_parts(parts, output, path, target_vcodec, cancel, progress_cb, duration, ff_path)
+    finally:
+        for part in [*attempted, f"{root}.parts.txt"]:
+            if os.path.isfile(part):
+                os.remove(part)
+
+
+def _encode_checkpointed(
+    path: str,
+    output: str,
+    acodec_nle_friendly: bool,
+    min_dimension: int,
+    target_vcodec: str,
+    cancel: CancelToken,
+    progress_cb: ProgressCallback,
+    duration: int,
+    ff_path: dict[str, str],
+    speed_tier: str,
+    audio: bool = True,
+) -> list:
+    """
+    Reencode `path` into `output` as fixed-length segments, resuming from the last
+    complete one if an earlier run was interrupted.
+
+    The segments go in a `.segments` directory next to `output`. ffmpeg lists each
+    segment in a csv once it is complete, one csv per run, and those lists are the
+    manifest: a crash or a sleep loses at most the segment in progress. A
+    run that resumes seeks the source to where the listed segments end, and numbers
+    its segments on from theirs. Keyframes are forced on the segment boundaries,
+    so every segment starts on one. Once every segment is there, they are joined
+    without reencoding into `output`, and the directory goes.
+
+    It goes too when the encode is cancelled or fails: nothing would come back for
+    it, and it holds up to a whole encode. Only a crash, the process going down
+    with the job, leaves it for the next run of the job to resume from. It is
+    started over when the job asks for something else than what it holds.
+
+    Returns:
+        The last command run, for the caller's error report
+
+    Raises:
+        ValueError: If an encode fails with no encoder left to take over, or the join fails
+    """
+    workdir = f"{os.path.splitext(output)[0]}.segments"
+    settings = {
+        "source_size": os.path.getsize(path),
+        "target_vcodec": target_vcodec,
+        "speed_tier": speed_tier,
+        "acodec_nle_friendly": acodec_nle_friendly,
+        "audio": audio,
+        "segment_seconds": _CHECKPOINT_SEGMENT_SECONDS,
+    }
+    _open_checkpoint(workdir, settings)
+    try:
+        command = _encode_segments(
+            path,
+            workdir,
+            acodec_nle_friendly,
+            min_dimension,
+            target_vcodec,
+            cancel,
+            progress_cb,
+            duration,
+            ff_path,
+            speed_tier,
+            audio,
+        )
+        if not cancel.is_cancelled():
+            parts = [(os.path.join(workdir, name), None) for name, _ in checkpointed_segments(workdir)]
+            command = _join_parts(parts, output, path, target_vcodec, cancel, progress_cb, duration, ff_path)
+    except Exception:
+        shutil.rmtree(workdir, ignore_errors=True)
+        raise
+    shutil.rmtree(workdir, ignore_errors=True)
+    return command
+
+
+def _encode_segments(
+    path: str,
+    workdir: str,
+    acodec_nle_friendly: bool,
+    min_dimension: int,
+    target_vcodec: str,
+    cancel: CancelToken,
+    progress_cb: ProgressCallback,
+    duration: int,
+    ff_path: dict[str, str],
+    speed_tier: str,
+    audio: bool,
+) -> list:
+    """Encode the segments `workdir` lacks, failing over as _encode_video does. Returns the last command run."""
+    ext = output_ext(target_vcodec)
+    finished = os.path.join(workdir, "finished")
+    reencode = get_text(GuiField.ff_reencode)
+    command: list = []
+
+    while not os.path.isfile(finished):
+        segments = checkpointed_segments(workdir)
+        start = sum(seconds for _, seconds in segments)
+        if start:
+            logger.info(f"Resuming the encode of {path} at {start:.3f}s, {len(segments)} segments in")
+        encoder, _ = fastest_encoder(target_vcodec, speed_tier, ff_path)
+        command = ffmpeg_video_command(
+            path,
+            os.path.join(workdir, f"seg%05d{ext}"),
+            acodec_nle_friendly,
+            False,
+            min_dimension,
+            target_vcodec,
+            ff_path,
+            speed_tier=speed_tier,
+            audio=audio,
+            start=start,
+            segment_args=_segment_args(workdir, len(segments), ext),
+        )
+        try:
+            _progress_ffmpeg(command, reencode, path, cancel, progress_cb, duration, resumed_from=start)
+        except ValueError as e:
+            if is_software_encoder(encoder) or not _encoder_failed(e):
+                raise
+            mark_encoder_degraded(encoder)
+            continue
+        if cancel.is_cancelled():
+            return command
+        with open(finished, "w"):
+            pass
+    return command
+
+
+def _open_checkpoint(workdir: str, settings: dict) -> None:
+    """Make `workdir` hold segments made with `settings`, starting it over if it holds others."""
+    settings_path = os.path.join(workdir, "settings.json")
+    try:
+        with open(settings_path, encoding="utf-8") as f:
+            if json.load(f) == settings:
+                return
+        logger.info(f"{workdir} holds segments of another encode, starting over")
+    except FileNotFoundError:
+        pass
+    except (OSError, ValueError) as e:
+        logger.debug(f"Could not read {settings_path}, starting over: {e}")
+    shutil.rmtree(workdir, ignore_errors=True)
+    os.makedirs(workdir)
+    with open(settings_path, "w", encoding="utf-8") as f:
+        json.dump(settings, f)
+
+
+def checkpointed_segments(workdir: str) -> list[tuple[str, float]]:
+    """The complete segments in `workdir`, in order, as (file name, seconds) pairs.
+
+    Only the unbroken run from the first segment counts: past a gap, nothing can
+    be joined, and that is where the encode resumes.
+    """
+    listed: dict[str, float] = {}
+    for name in sorted(os.listdir(workdir)):
+        if not (name.startswith("list") and name.endswith(".csv")):
+            continue
+        with open(os.path.join(workdir, name), newline="", encoding="utf-8") as f:
+            for row in csv.reader(f):
+                try:
+                    segment, start, end = os.path.basename(row[0]), float(row[1]), float(row[2])
+                except (IndexError, ValueError):
+                    continue
+                listed[segment] = end - start
+    segments = []
+    for number, segment in enumerate(sorted(listed)):
+        if not segment.startswith(f"seg{number:05d}.") or not os.path.isfile(os.path.join(workdir, segment)):
+            break
+        segments.append((segment, listed[segment]))
+    return segments
+
+
+def _segment_args(workdir: str, first: int, ext: str) -> list[str]:
+    """Segment muxer options numbering segments from `first`, and listing them in a csv of their own."""
+    seconds = _CHECKPOINT_SEGMENT_SECONDS
+    return [
+        "-force_key_frames",
+        f"expr:gte(t,n_forced*{seconds})",
+        "-f",
+        "segment",
+        "-segment_format",
+        ext.lstrip("."),
+        "-segment_time",
+        str(seconds),
+        "-segment_start_number",
+        str(first),
+        "-segment_list",
+        os.path.join(workdir, f"list{first:05d}.csv"),
+        "-segment_list_type",
+        "csv",
+        "-reset_timestamps",
+        "1",
+    ]
+
+
+def _encoder_failed(error: ValueError) -> bool:
+    """Whether ffmpeg's `error` was the encoder's or its device's, not the job's."""
+    return _ENCODER_FAILURE.search(str(error)) is not None
+
+
+def _last_keyframe(path: str, ffprobe_cmd: str) -> float:
+    """Timestamp of the last video keyframe in a partly written file, 0 if none can be read."""
+    if not os.path.isfile(path):
+        return 0.0
+    args = [ffprobe_cmd, "-v", "error", "-select_streams", "v:0"]
+    args.extend(["-show_entries", "packet=pts_time,flags", "-of", "csv=p=0", path])
+    try:
+        packets = subprocess.run(args, capture_output=True, text=True, timeout=300).stdout
+    except (OSError, subprocess.SubprocessError) as e:
+        logger.debug(f"Could not read what {path} holds: {e}")
+        return 0.0
+    last = 0.0
+    for line in packets.splitlines():
+        pts, _, flags = line.partition(",")
+        if "K" in flags:
+            try:
+                last = float(pts)
+            except ValueError:
+                continue
+    return last
+
+
+def _join_parts(
+    parts: Sequence[tuple[str, float | None]],
+    output: str,
+    source: str,
+    target_vcodec: str,
+    cancel: CancelToken,
+    progress_cb: ProgressCallback,
+    duration: int,
+    ff_path: dict[str, str],
+) -> list:
+    """Copy `parts`, each cut at its keyframe, one after the other into `output`."""
+    listing = f"{os.path.splitext(output)[0]}.parts.txt"
+    with open(listing, "w", encoding="utf-8") as f:
+        for part, outpoint in parts:
+            escaped = os.path.abspath(part).replace("'", "'\\''")
+            f.write(f"file '{escaped}'\n")
+            if outpoint is not None:
+                f.write(f"outpoint {outpoint:.6f}\n")
+    command = [ff_path.get("ffmpeg"), "-hide_banner", "-f", "concat", "-safe", "0", "-i", listing]
+    command.extend(["-map", "0", "-c", "copy", "-metadata", "creation_time=now"])
+    if output_ext(target_vcodec) == ".mp4":
+        command.extend(["-movflags", "+faststart"])
+    command.extend(["-progress", "pipe:1", "-y", output])
+    _progress_ffmpeg(command, get_text(GuiField.ff_remux), source, cancel, progress_cb, duration)
+    return command
+
+
+def output_ext(target_vcodec: str) -> str:
+    """The container a target codec is written to."""
+    return ".mov" if target_vcodec == "ProRes" else ".mp4"
+
+
+def rendition_path(path: str, output: OutputTarget) -> str:
+    """Where a rendition of the downloaded `path` is written."""
+    if output.audio_codec is not None:
+        ext = _AUDIO_RENDITIONS[output.audio_codec][0]
+    else:
+        ext = output_ext(output.target_vcodec)
+    return f"{os.path.splitext(path)[0]} - {output.suffix}{ext}"
+
+
+def ffmpeg_video_command(
+    source: str,
+    output: str | None,
+    acodec_nle_friendly: bool,
+    vcodec_is_target: bool,
+    min_dimension: int,
+    target_vcodec: str,
+    ff_path: dict[str, str],
+    renditions: Sequence[tuple[OutputTarget, str]] = (),
+    speed_tier: str = "balanced",
+    audio: bool = True,
+    start: float = 0.0,
+    fragmented: bool = False,
+    segment_args: Sequence[str] = (),
+) -> list:
+    """
+    Build the ffmpeg command that remuxes or reencodes `source` into `output`.
+
+    Every rendition is one more output of the same command. The ones with video
+    share a single decode: a `split` filter hands the frames to each of them, and to
+    the main output too when it reencodes.
+
+    Args:
+        source: What ffmpeg reads: a path, or "pipe:0" for stdin
+        output: Where ffmpeg writes the main file, None to write renditions only
+        acodec_nle_friendly: Whether the audio codec is NLE friendly
+        vcodec_is_target: Whether the video codec matches the target
+        min_dimension: Smallest dimension (width or height) of the video
+        target_vcodec: The video codec to convert to (if necessary)
+        ff_path: FFmpeg/FFprobe paths
+        renditions: (rendition, path ffmpeg writes it to) pairs
+        speed_tier: Encoder speed tier, see core.hwaccel.SPEED_TIERS
+        audio: Whether the main output carries the audio, or only the video
+        start: Where in `source` to start, in seconds
+        fragmented: Write the main output in fragments, readable even if ffmpeg dies
+        segment_args: Segment muxer options, `output` then being the segments' pattern
+
+    Returns:
+        The command, with progress reported on stdout
+    """
     ffmpeg_acodec = "aac" if not acodec_nle_friendly else "copy"
-    new_ext = ".mov" if target_vcodec == "ProRes" else ".mp4"
     if vcodec_is_target:
         ffmpeg_vcodec, quality_options = "copy", []
     else:
-        ffmpeg_vcodec, quality_options = fastest_encoder(target_vcodec)
+        ffmpeg_vcodec, quality_options = fastest_encoder(target_vcodec, speed_tier, ff_path)
         quality_options = _adapt_crf(quality_options, min_dimension)
-    tmp_path = f"{os.path.splitext(path)[0]}.tmp{new_ext}"
-    use_mediacodec_hwaccel = ffmpeg_vcodec.endswith("_mediacodec")
+    video_renditions = [(target, path) for target, path in renditions if target.audio_codec is None]
+    main_decodes = output is not None and not vcodec_is_target
+    # Frames decoded on the device cannot go through software filters.
+    use_mediacodec_hwaccel = ffmpeg_vcodec.endswith("_mediacodec") and not video_renditions
     ffmpeg_command = [
         ff_path.get("ffmpeg"),
         "-hide_banner",
     ]
     if use_mediacodec_hwaccel:
         ffmpeg_command.extend(["-hwaccel", "mediacodec", "-hwaccel_output_format", "mediacodec"])
-    ffmpeg_command.extend(
-        [
-            "-i",
-            path,
-            "-map",
-            "0:v:0",
-            "-map",
-            "0:a:0",
-            "-c:a",
-            ffmpeg_acodec,
-            "-c:v",
-            ffmpeg_vcodec,
-            "-metadata",
-            "creation_time=now",
-        ]
-    )
-    if not vcodec_is_target:
-        ffmpeg_command.extend(quality_options)
-    elif target_vcodec == "ProRes":
-        ffmpeg_command.extend(["-profile:v", "0", "-qscale:v", "9"])
-    if new_ext == ".mp4":
-        ffmpeg_command.extend(["-movflags", "+faststart"])
-    ffmpeg_command.extend(["-progress", "pipe:1", "-y", tmp_path])
-    action = get_text(GuiField.ff_remux) if acodec_nle_friendly and vcodec_is_target else get_text(GuiField.ff_reencode)
-    _progress_ffmpeg(ffmpeg_command, action, path, cancel, progress_cb, duration)
-    if cancel.is_cancelled():
-        if os.path.isfile(tmp_path):
-            os.remove(tmp_path)
-        return
-    if not os.path.isfile(tmp_path):
-        raise FileNotFoundError(ffmpeg_command)
-    os.remove(path)
-    os.rename(src=tmp_path, dst=os.path.splitext(path)[0] + new_ext)
+    if start:
+        ffmpeg_command.extend(["-ss", f"{start:.3f}"])
+    ffmpeg_command.extend(["-i", source])
+
+    main_video = "0:v:0"
+    rendition_videos: list[str] = []
+    if video_renditions:
+        graph, labels = _split_graph([target for target, _ in video_renditions], include_main=main_decodes)
+        ffmpeg_command.extend(["-filter_complex", graph])
+        if main_decodes:
+            main_video = labels.pop(0)
+        rendition_videos = labels
+
+    if output is not None:
+        ffmpeg_command.extend(["-map", main_video])
+        ffmpeg_command.extend(["-map", "0:a:0", "-c:a", ffmpeg_acodec] if audio else ["-an"])
+        ffmpeg_command.extend(["-c:v", ffmpeg_vcodec, "-metadata", "creation_time=now"])
+        if not vcodec_is_target:
+            ffmpeg_command.extend(quality_options)
+            ffmpeg_command.extend(resources.encoder_thread_args(resources.policy_for(resources.ENCODE), ffmpeg_vcodec))
+        elif target_vcodec == "ProRes":
+            ffmpeg_command.extend(["-profile:v", "0", "-qscale:v", "9"])
+        if segment_args:
+            ffmpeg_command.extend(segment_args)
+        elif fragmented:
+            ffmpeg_command.extend(["-movflags", "+frag_keyframe+empty_moov"])
+        elif output_ext(target_vcodec) == ".mp4":
+            ffmpeg_command.extend(["-movflags", "+faststart"])
+    ffmpeg_command.extend(["-progress", "pipe:1", "-y"])
+    if output is not None:
+        ffmpeg_command.append(output)
+
+    labels_left = iter(rendition_videos)
+    for target, path in renditions:
+        if target.audio_codec is None:
+            ffmpeg_command.extend(
+                _video_rendition_args(target, next(labels_left), ffmpeg_acodec, min_dimension, speed_tier, ff_path)
+            )
+        else:
+            ffmpeg_command.extend(["-map", "0:a:0", "-vn", *_AUDIO_RENDITIONS[target.audio_codec][1]])
+        ffmpeg_command.append(path)
+    return ffmpeg_command
+
+
+def _split_graph(targets: Sequence[OutputTarget], *, include_main: bool) -> tuple[str, list[str]]:
+    """A filter graph decoding the video once for every output that encodes it.
+
+    Returns the graph and its output labels: the main output's first, when it is
+    included, then one per rendition, scaled down to its `max_height`.
+    """
+    count = len(targets) + int(include_main)
+    branches = [f"[s{i}]" for i in range(count)]
+    chains = [f"[0:v:0]split={count}{''.join(branches)}"]
+    labels = []
+    if include_main:
+        labels.append(branches.pop(0))
+    for i, (target, branch) in enumerate(zip(targets, branches, strict=True)):
+        if target.max_height:
+            # -2 keeps the width even, which most encoders require.
+            chains.append(f"{branch}scale=-2:'min({target.max_height},ih)'[r{i}]")
+            labels.append(f"[r{i}]")
+        else:
+            labels.append(branch)
+    return ";".join(chains), labels
+
+
+def _video_rendition_args(
+    target: OutputTarget,
+    video: str,
+    ffmpeg_acodec: str,
+    min_dimension: int,
+    speed_tier: str,
+    ff_path: dict[str, str],
+) -> list[str]:
+    """Output options of one video rendition, fed from the `video` filter label."""
+    encoder, quality_options = fastest_encoder(target.target_vcodec, speed_tier, ff_path)
+    height = min(target.max_height, min_dimension) if target.max_height and min_dimension else min_dimension
+    args = ["-map", video, "-map", "0:a:0?", "-c:a", ffmpeg_acodec, "-c:v", encoder]
+    args.extend(_adapt_crf(quality_options, height))
+    args.extend(resources.encoder_thread_args(resources.policy_for(resources.ENCODE), encoder))
+    if output_ext(target.target_vcodec) == ".mp4":
+        args.extend(["-movflags", "+faststart"])
+    return args
 
 
 def _progress_ffmpeg(
@@ -254,6 +1001,7 @@ def _progress_ffmpeg(
     cancel: CancelToken,
     progress_cb: ProgressCallback,
     duration: int,
+    resumed_from: float = 0,
 ) -> None:
     """
     Run ffmpeg with progress tracking.
@@ -265,6 +1013,7 @@ def _progress_ffmpeg(
         cancel: Cancellation token
         progress_cb: Progress callback
         duration: File duration in seconds (already probed)
+        resumed_from: Seconds of the file earlier runs already processed
     """
 
     def hook(status: dict) -> None:
@@ -290,6 +1039,8 @@ def _progress_ffmpeg(
         total_bytes=os.path.getsize(filepath),
         filename=cmd[-1],
         stdin=subprocess.PIPE,
+        resumed_from=resumed_from,
+        policy=resources.policy_for(resources.ENCODE),
     )
     _, stderr, retcode = tracker.run()
     if cancel.is_cancelled():
@@ -17,8 +17,18 @@ class DownloadTimeout(Exception):
         self.url = url
         super().__init__(f"Download timed out for {url}")
 
+    def __reduce__(self):
+        # Rebuilt from its url, not from the message: it crosses from worker processes.
+        return (type(self), (self.url,))
+
 
 class PlaylistNotFound(Exception):
     "Raised when the playlist doesn't seem to exist"
 
     pass
+
+
+class JobProcessError(Exception):
+    "Raised when a job's worker process dies, or fails in a way it cannot send back"
+
+    pass
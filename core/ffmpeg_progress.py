@@ -16,39 +16,34 @@ that teaches yt-dlp's own postprocessors to report through it.
 
 from __future__ import annotations
 
+import asyncio
+import codecs
+import contextlib
 import logging
 import re
 import subprocess
 import sys
+import threading
 import time
 from collections.abc import Callable
+from dataclasses import dataclass
 from queue import Empty, Queue
 from threading import Thread
+from typing import TYPE_CHECKING
+
+from core import reactor, resources, supervisor
+from core.capture import TailBuffer
+
+if TYPE_CHECKING:
+    from core.config_types import ResourcePolicy
 
 logger = logging.getLogger("videodl")
 
 ProgressHook = Callable[[dict], None]
 
-# One report block, as written by `-progress pipe:1`. The frame/fps/quality lines
-# only appear when a video stream is being encoded.
-_PROGRESS_BLOCK = re.compile(
-    r"""(?x)
-    (?:
-        frame=\s*(?P<frame>\S+)\n
-        fps=\s*(?P<fps>\S+)\n
-        (?:stream_\d+_\d+_q=\s*\S+\n)+
-    )?
-    bitrate=\s*(?P<bitrate>\S+)\n
-    total_size=\s*(?P<total_size>\S+)\n
-    out_time_us=\s*(?P<out_time_us>\S+)\n
-    out_time_ms=\s*(?P<out_time_ms>\S+)\n
-    out_time=\s*(?P<out_time>\S+)\n
-    dup_frames=\s*(?P<dup_frames>\S+)\n
-    drop_frames=\s*(?P<drop_frames>\S+)\n
-    speed=\s*(?P<speed>\S+)\n
-    progress=\s*(?P<progress>\S+)
-    """
-)
+# The fields of a `-progress` block read into a ProgressReport. ffmpeg writes others
+# (frame, fps, one quality per stream, and whatever newer versions add), skipped.
+_REPORT_FIELDS = frozenset(("bitrate", "total_size", "out_time_us", "speed"))
 
 _TIME_WITH_UNIT = re.compile(r"(?P<value>\d+)(?P<unit>[mu]?s)")
 # [[HH:]MM:]SS, so `1:30` is a minute and a half, not an hour and thirty seconds.
@@ -58,6 +53,18 @@ _BITRATE = re.compile(r"(?P<value>\d+)(\.(?P<fraction>\d+))?(?P<prefix>[gmk])?bi
 
 _SEEK_FLAGS = ("-ss", "-sseof", "-to", "-t")
 
+# How often `elapsed` is refreshed while ffmpeg has nothing new to say.
+_TICK_INTERVAL = 0.5
+# How long to wait, after ffmpeg exits, for the end of its pipes. Only a process
+# it left behind, still holding them open, makes this run out.
+_PIPE_CLOSE_TIMEOUT = 5
+# How long a cancelled `run_async` gives ffmpeg to quit before killing it.
+_QUIT_TIMEOUT = 10
+_READ_SIZE = 65536
+# stdout carries the progress blocks, which have been reported by the time anyone
+# reads it back: a little of it is plenty.
+_STDOUT_TAIL_LINES = 50
+
 
 def ffmpeg_time_to_seconds(value: str) -> float:
     """Parse any of the time formats ffmpeg accepts: `12`, `1:02:03.5`, `500ms`, `900us`."""
@@ -150,6 +157,66 @@ def duration_to_process(args: list[str], duration: float) -> float:
     return processed if processed >= 0 else 0.0
 
 
+def speed_to_float(value: str | None) -> float | None:
+    """Read ffmpeg's `speed=` field, a multiple of realtime like `2.5x`. None for `N/A`."""
+    try:
+        return float(value.rstrip("x"))  # type: ignore[union-attr]
+    except (AttributeError, ValueError):
+        return None
+
+
+@dataclass(frozen=True, slots=True)
+class ProgressReport:
+    """One block of ffmpeg's `-progress` output, read."""
+
+    # Seconds of output written so far, 0 while ffmpeg still says N/A.
+    out_time: int
+    # Bytes of output written so far.
+    total_size: int
+    # Bits per second, 0 while ffmpeg still says N/A.
+    bitrate: float
+    # A multiple of realtime, None while ffmpeg still says N/A.
+    speed: float | None
+    # The last block of the run.
+    end: bool
+
+
+class ProgressParser:
+    """Read ffmpeg's `-progress` stream one line at a time, in whatever chunks it comes.
+
+    Each line is looked at once, as it completes, and each `progress=` line closes a
+    block into a ProgressReport. Rescanning everything buffered since the last block,
+    for every chunk, made a long verbose encode cost more the further it got.
+    """
+
+    def __init__(self) -> None:
+        self._partial = ""
+        self._fields: dict[str, str] = {}
+
+    def feed(self, text: str) -> list[ProgressReport]:
+        """The reports completed by `text`, oldest first."""
+        *lines, self._partial = (self._partial + text).split("\n")
+        reports = []
+        for line in lines:
+            key, _, value = line.partition("=")
+            key = key.strip()
+            if key == "progress":
+                reports.append(self._report(value.strip()))
+            elif key in _REPORT_FIELDS:
+                self._fields[key] = value.strip()
+        return reports
+
+    def _report(self, progress: str) -> ProgressReport:
+        fields, self._fields = self._fields, {}
+        return ProgressReport(
+            out_time=microseconds_to_seconds(fields.get("out_time_us")),
+            total_size=to_int(fields.get("total_size")),
+            bitrate=bitrate_to_bits_per_second(fields.get("bitrate", "")),
+            speed=speed_to_float(fields.get("speed")),
+            end=progress == "end",
+        )
+
+
 class FFmpegProgressReporter:
     """Turn ffmpeg's progress reports into status dicts, wherever they come from.
 
@@ -166,6 +233,10 @@ class FFmpegProgressReporter:
     The byte count goes out under `bytes_key`, because the GUI reads a different key
     depending on which bar it is filling: `downloaded_bytes` while ffmpeg is doing
     the downloading, `processed_bytes` while it is doing the encoding.
+
+    `resumed_from` is for an encode picking up where an earlier run stopped, at that
+    many seconds in: what the earlier runs did counts as done, so the bar resumes
+    where it was instead of starting over.
     """
 
     def __init__(
@@ -179,21 +250,25 @@ class FFmpegProgressReporter:
         bytes_key: str = "processed_bytes",
         status: str = "processing",
         bytes_from_output: bool = False,
+        resumed_from: float = 0,
     ) -> None:
         self._on_progress = on_progress
         self._bytes_key = bytes_key
         self._bytes_from_output = bytes_from_output
-        self._block = ""
+        self._parser = ProgressParser()
         self._started_at = time.time()
 
         self._duration = duration_to_process(args, duration)
-        # The output covers only the part of the input being processed.
-        self._total_bytes = int(total_bytes * self._duration / duration) if duration else 0
+        self._resumed_from = resumed_from
+        # The output covers only the part of the input being processed, and
+        # whatever earlier runs already processed of it.
+        self._covered = self._duration + resumed_from
+        self._total_bytes = int(total_bytes * self._covered / duration) if duration else 0
         self._status: dict = {
             "filename": filename,
             "status": status,
             "elapsed": 0,
-            bytes_key: 0,
+            bytes_key: self._done_bytes(0),
             "total_bytes": self._total_bytes,
         }
 
@@ -204,53 +279,49 @@ class FFmpegProgressReporter:
 
     def feed(self, text: str) -> None:
         """Hand it more of ffmpeg's progress output."""
-        self._block += text
-        while True:
-            report = _PROGRESS_BLOCK.match(self._block)
-            if not report:
-                return
-            self._block = self._block[report.end() :].lstrip("\n")
+        for report in self._parser.feed(text):
             self._emit(report)
 
     def tick(self) -> None:
         """Refresh `elapsed` even when ffmpeg has said nothing new."""
-        self._status["elapsed"] = time.time() - self._started_at
-        self._on_progress(self._status.copy())
+        self._status = {**self._status, "elapsed": time.time() - self._started_at}
+        self._on_progress(self._status)
 
-    def _emit(self, report: re.Match) -> None:
-        out_time = microseconds_to_seconds(report.group("out_time_us"))
+    def _emit(self, report: ProgressReport) -> None:
+        out_time = report.out_time
 
+        # ffmpeg is encoding, and then total_size is the size of a file that is
+        # still being written: it can overshoot and push the bar past 100%. How
+        # far into the media it has got is the honest measure.
+        done = self._done_bytes(out_time)
         if self._bytes_from_output:
             # ffmpeg is downloading, so the bytes it has written are the bytes that
             # came down the wire. That is a real count, and it needs no duration:
             # a direct file often has none, and the bar would sit at zero.
-            done = to_int(report.group("total_size"))
-        else:
-            # ffmpeg is encoding, and then total_size is the size of a file that is
-            # still being written: it can overshoot and push the bar past 100%. How
-            # far into the media it has got is the honest measure.
-            done = int(out_time / self._duration * self._total_bytes) if self._duration else 0
-
-        self._status.update(
-            {
-                self._bytes_key: done,
-                "total_bytes": self._total_bytes or None,
-                "speed": bitrate_to_bits_per_second(report.group("bitrate")) or None,
-                "eta": self._eta(report.group("speed"), out_time),
-                "elapsed": time.time() - self._started_at,
-            }
-        )
-        self._on_progress(self._status.copy())
+            done = report.total_size
+
+        # A new dict for every report, built once and handed over as is: a callback
+        # may keep it, the next report will not change it under it.
+        self._status = {
+            **self._status,
+            self._bytes_key: done,
+            "total_bytes": self._total_bytes or None,
+            "speed": report.bitrate or None,
+            "eta": self._eta(report.speed, out_time),
+            "elapsed": time.time() - self._started_at,
+        }
+        self._on_progress(self._status)
 
-    def _eta(self, speed_field: str, out_time: int) -> float | None:
-        """`speed=` is a multiple of realtime, e.g. `2.5x`, so the remaining media time over it."""
-        if not self._duration:
-            return None
-        try:
-            speed = float(speed_field.rstrip("x"))
-            return (self._duration - out_time) / speed
-        except (TypeError, ValueError, ZeroDivisionError):
+    def _done_bytes(self, out_time: float) -> int:
+        if not self._covered:
+            return 0
+        return int((self._resumed_from + out_time) / self._covered * self._total_bytes)
+
+    def _eta(self, speed: float | None, out_time: int) -> float | None:
+        """`speed` is a multiple of realtime, so the remaining media time over it."""
+        if not self._duration or not speed:
             return None
+        return (self._duration - out_time) / speed
 
 
 class FFmpegProgressTracker:
@@ -259,6 +330,12 @@ class FFmpegProgressTracker:
     `duration` and `total_bytes` describe the *input*: the media duration in
     seconds and its size on disk. Without a duration ffmpeg's output cannot be
     turned into a ratio, so the command still runs, it just reports no progress.
+
+    `bytes_key`, `status` and `resumed_from` are the reporter's: which bar the
+    progress is for, and how much of it earlier runs already did.
+
+    `policy` is the ResourcePolicy ffmpeg runs under, see core/resources.py, and
+    `stage` the stage of the job its cost is accounted to, see core/supervisor.py.
     """
 
     def __init__(
@@ -271,6 +348,11 @@ class FFmpegProgressTracker:
         filename: str = "",
         stdin: int | None = None,
         env: dict[str, str] | None = None,
+        bytes_key: str = "processed_bytes",
+        status: str = "processing",
+        resumed_from: float = 0,
+        policy: ResourcePolicy | None = None,
+        stage: str = resources.ENCODE,
     ) -> None:
         # Without this ffmpeg reports nothing on stdout and the bar never moves,
         # which is too easy for a caller to forget. Guarantee it here.
@@ -278,6 +360,8 @@ class FFmpegProgressTracker:
         self._on_progress = on_progress
         self._stdin = stdin
         self._env = env
+        self._policy = policy
+        self._stage = stage
 
         self._duration = duration_to_process(args, duration)
         # The output covers only the part of the input being processed.
@@ -289,17 +373,26 @@ class FFmpegProgressTracker:
             duration=duration,
             total_bytes=total_bytes,
             filename=filename,
+            bytes_key=bytes_key,
+            status=status,
+            resumed_from=resumed_from,
         )
         self._stdout_queue: Queue[str] = Queue()
         self._stderr_queue: Queue[str] = Queue()
-        self._stdout = ""
-        self._stderr = ""
+        # Only the end of each is kept, for whoever has to explain a failed run. The
+        # whole of stderr still goes to the debug log, a line at a time.
+        self._stdout = TailBuffer(_STDOUT_TAIL_LINES)
+        self._stderr = TailBuffer(spill=_log_stderr_line)
         self.proc: subprocess.Popen | None = None
+        # The first exception a callback raised off the caller's thread, for run() to raise.
+        self._failure: Exception | None = None
 
     def run(self) -> tuple[str, str, int]:
         """Run ffmpeg to completion. Returns (stdout, stderr, returncode)."""
-        self.proc = subprocess.Popen(
+        self.proc = supervisor.popen(
             self._args,
+            stage=self._stage,
+            policy=self._policy,
             text=True,
             encoding="utf8",
             errors="replace",
@@ -310,6 +403,142 @@ class FFmpegProgressTracker:
         )
         self._started_at = time.time()
 
+        returncode = self._run_on_reactor() if reactor.can_watch_pipes else self._run_on_threads()
+
+        if sys.platform == "win32":
+            # Give Windows a moment to release the handles on the output file,
+            # which the caller is about to rename.
+            time.sleep(0.5)
+
+        self._stdout.close()
+        self._stderr.close()
+        if self._failure is not None:
+            raise self._failure
+        return self._stdout.text(), self._stderr.text(), returncode
+
+    async def run_async(self) -> tuple[str, str, int]:
+        """`run`, for an event loop: the loop reads ffmpeg's pipes and waits for it.
+
+        No thread is involved, not even the reactor's. ffmpeg's stdin is a pipe
+        whatever `stdin` says, for the cancel: cancelling the awaiting task asks
+        ffmpeg to quit, which leaves a readable file behind, and kills it if it has
+        not `_QUIT_TIMEOUT` seconds later. The cancel then goes on up.
+        """
+        proc = await asyncio.create_subprocess_exec(
+            *resources.command(self._args, self._policy),
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            env=self._env,
+            **(resources.popen_kwargs(self._policy) if self._policy else {}),
+        )
+        if self._policy:
+            resources.apply(proc.pid, self._policy)
+        supervisor.account(proc, self._stage)
+        assert proc.stdout is not None and proc.stderr is not None
+
+        async def tick() -> None:
+            while True:
+                await asyncio.sleep(_TICK_INTERVAL)
+                self._stopping_on_error(self._reporter.tick, proc.kill)()
+
+        stdout_decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        stderr_decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+
+        def on_stdout(data: bytes) -> None:
+            text = stdout_decoder.decode(data)
+            self._stdout.write(text)
+            self._reporter.feed(text)
+
+        def on_stderr(data: bytes) -> None:
+            self._stderr.write(stderr_decoder.decode(data))
+
+        readers = [
+            asyncio.ensure_future(_pump(proc.stdout, self._stopping_on_error(on_stdout, proc.kill))),
+            asyncio.ensure_future(_pump(proc.stderr, on_stderr)),
+        ]
+        ticker = asyncio.ensure_future(tick())
+        try:
+            returncode = await proc.wait()
+            await asyncio.wait(readers, timeout=_PIPE_CLOSE_TIMEOUT)
+        except asyncio.CancelledError:
+            await _quit(proc)
+            raise
+        finally:
+            ticker.cancel()
+            for reader in readers:
+                reader.cancel()
+
+        if sys.platform == "win32":
+            # As in `run`: the caller is about to rename the output file.
+            await asyncio.sleep(0.5)
+
+        self._stdout.close()
+        self._stderr.close()
+        if self._failure is not None:
+            raise self._failure
+        return self._stdout.text(), self._stderr.text(), returncode
+
+    def _run_on_reactor(self) -> int:
+        """Hand both pipes to the shared reactor, and wait for ffmpeg on this thread.
+
+        The reactor parses progress as it arrives, so this thread only sleeps in
+        `wait`, and the reporter, only ever called from the reactor, needs no lock.
+        The reactor would log what `on_progress` raises and carry on. Instead, the
+        first exception kills ffmpeg, and `run` raises it on the caller's thread,
+        as it would if it had called `on_progress` itself.
+        """
+        proc = self.proc
+        assert proc is not None and proc.stdout is not None and proc.stderr is not None
+        loop = reactor.get_reactor()
+        stdout_decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        stderr_decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+
+        def on_stdout(data: bytes) -> None:
+            text = stdout_decoder.decode(data)
+            self._stdout.write(text)
+            self._reporter.feed(text)
+
+        def on_stderr(data: bytes) -> None:
+            self._stderr.write(stderr_decoder.decode(data))
+
+        pipes = [(proc.stdout, self._stopping_on_error(on_stdout, proc.kill)), (proc.stderr, on_stderr)]
+        closed = []
+        for stream, on_data in pipes:
+            done = threading.Event()
+            closed.append(done)
+            loop.watch(stream.fileno(), on_data, done.set)
+        ticker = loop.call_every(_TICK_INTERVAL, self._stopping_on_error(self._reporter.tick, proc.kill))
+        try:
+            returncode = proc.wait()
+            deadline = time.monotonic() + _PIPE_CLOSE_TIMEOUT
+            for (stream, _), done in zip(pipes, closed, strict=True):
+                if done.wait(timeout=max(0.0, deadline - time.monotonic())):
+                    stream.close()
+                else:
+                    loop.unwatch(stream.fileno(), stream.close)
+        finally:
+            ticker.cancel()
+        return returncode
+
+    def _stopping_on_error(self, callback: Callable[..., None], kill: Callable[[], None]) -> Callable[..., None]:
+        """`callback`, keeping the first exception it raises for `run` and killing ffmpeg on it."""
+
+        def call(*args) -> None:
+            if self._failure is not None:
+                return
+            try:
+                callback(*args)
+            except Exception as e:
+                self._failure = e
+                with contextlib.suppress(OSError):
+                    kill()
+
+        return call
+
+    def _run_on_threads(self) -> int:
+        """Where pipes cannot be selected on: a reader thread per pipe, and a polling wait."""
+        assert self.proc is not None
         readers = [
             Thread(target=self._drain, args=(self.proc.stdout, self._stdout_queue), daemon=True),
             Thread(target=self._drain, args=(self.proc.stderr, self._stderr_queue), daemon=True),
@@ -320,15 +549,9 @@ class FFmpegProgressTracker:
         returncode = self._wait()
 
         for reader in readers:
-            reader.join(timeout=5)
+            reader.join(timeout=_PIPE_CLOSE_TIMEOUT)
         self._consume_queues()
-
-        if sys.platform == "win32":
-            # Give Windows a moment to release the handles on the output file,
-            # which the caller is about to rename.
-            time.sleep(0.5)
-
-        return self._stdout, self._stderr, returncode
+        return returncode
 
     @staticmethod
     def _drain(stream, queue: Queue[str]) -> None:
@@ -358,7 +581,7 @@ class FFmpegProgressTracker:
                 line = self._stdout_queue.get_nowait() + "\n"
             except Empty:
                 break
-            self._stdout += line
+            self._stdout.write(line)
             self._reporter.feed(line)
 
         while True:
@@ -366,6 +589,29 @@ class FFmpegProgressTracker:
                 line = self._stderr_queue.get_nowait()
             except Empty:
                 break
-            self._stderr += line + "\n"
-            if line.strip():
-                logger.debug(f"ffmpeg: {line}")
+            self._stderr.write(line + "\n")
+
+
+async def _pump(stream: asyncio.StreamReader, on_data: Callable[[bytes], None]) -> None:
+    while data := await stream.read(_READ_SIZE):
+        on_data(data)
+
+
+async def _quit(proc: asyncio.subprocess.Process) -> None:
+    """Ask ffmpeg to quit, and kill it if it will not listen."""
+    if proc.returncode is not None:
+        return
+    with contextlib.suppress(OSError):
+        assert proc.stdin is not None
+        proc.stdin.write(b"q")
+        await proc.stdin.drain()
+    try:
+        await asyncio.wait_for(proc.wait(), _QUIT_TIMEOUT)
+    except TimeoutError:
+        with contextlib.suppress(ProcessLookupError):
+            proc.kill()
+        await proc.wait()
+
+
+def _log_stderr_line(line: str) -> None:
+    logger.debug(f"ffmpeg: {line}")
@@ -10,9 +10,12 @@ The seam is `FFmpegFD._call_downloader`, which builds its own ffmpeg command and
 runs it through the `Popen` in its module. We do not rebuild that command: a Popen
 that stands in for yt-dlp's appends `-progress` to whatever it was given.
 
-It writes to a file rather than to `pipe:1`, unlike everywhere else we do this.
-FFmpegFD's stdout is not ours to take: it is where ffmpeg writes the media itself
-when yt-dlp asks for output on stdout. A file touches nothing.
+It does not write to `pipe:1`, unlike everywhere else we do this. FFmpegFD's
+stdout is not ours to take: it is where ffmpeg writes the media itself when yt-dlp
+asks for output on stdout. On POSIX, ffmpeg gets a pipe of its own instead, passed
+down as one more file descriptor (`-progress pipe:N`), which the shared reactor
+(core/reactor.py) reads as each block arrives. Where the reactor cannot watch a
+pipe, ffmpeg writes to a temporary file, reread every `_POLL_INTERVAL`.
 
 Guarded like the rest: a moved seam costs the bar, never the download.
 tests/test_ffmpegfd_progress.py checks the seams against the installed yt-dlp.
@@ -20,14 +23,16 @@ tests/test_ffmpegfd_progress.py checks the seams against the installed yt-dlp.
 
 from __future__ import annotations
 
+import codecs
 import contextlib
 import logging
 import os
 import tempfile
 import threading
-import time
+from collections.abc import Callable
 from typing import Any, cast
 
+from core import reactor, resources
 from core.ffmpeg_progress import FFmpegProgressReporter
 
 logger = logging.getLogger("videodl")
@@ -52,10 +57,25 @@ class _Context:
         self.duration = float(info_dict.get("duration") or 0)
         self.total_bytes = int(info_dict.get("filesize") or info_dict.get("filesize_approx") or 0)
         self.filename = info_dict.get("_filename") or ""
-        # The threads reading ffmpeg's progress. They have to be waited on: ffmpeg's
-        # last report, the one that fills the bar, lands after it has exited, and
+        # ffmpeg's progress being read. They have to be waited on: ffmpeg's last
+        # report, the one that fills the bar, lands after it has exited, and
         # _call_downloader returning is what tells the app the download is done.
-        self.followers: list[threading.Thread] = []
+        self.followers: list[_Follower] = []
+
+
+class _Follower:
+    """ffmpeg's progress, read into its reporter from the shared reactor."""
+
+    def __init__(self) -> None:
+        # Set once the progress has been read to the end.
+        self.done = threading.Event()
+        # Stops reading early, for when the end never comes.
+        self.stop: Callable[[], None] | None = None
+
+    def wait(self, timeout: float) -> None:
+        if not self.done.wait(timeout=timeout) and self.stop is not None:
+            logger.debug("ffmpeg download progress never ended, no longer reading it")
+            self.stop()
 
 
 def install() -> bool:
@@ -86,28 +106,37 @@ def install() -> bool:
         finally:
             _current.context = None
             for follower in context.followers:
-                follower.join(timeout=_FOLLOWER_TIMEOUT)
+                follower.wait(_FOLLOWER_TIMEOUT)
 
     class _ProgressPopen(popen_class):  # type: ignore[misc, valid-type]
         """Stands in for yt-dlp's Popen inside the external downloader module.
 
         Only adds `-progress`, and only while an FFmpegFD download is in flight on
         this thread. Every other external downloader that goes through this class,
-        aria2c and wget and curl, is untouched.
+        aria2c and wget and curl, is untouched, but for the download stage's
+        ResourcePolicy (core/resources.py), which every one of them runs under.
         """
 
         def __init__(self, args, *pargs, **kwargs):
             context = getattr(_current, "context", None)
-            reporter, path = _prepare(context, args)
-            if path:
-                args = [*args, "-progress", path]
-
-            super().__init__(args, *pargs, **kwargs)
-
-            if reporter and path and context:
-                follower = threading.Thread(target=_follow, args=(self, reporter, path), daemon=True)
-                context.followers.append(follower)
-                follower.start()
+            reporter, channel = _prepare(context, args)
+            if channel is not None:
+                args = [*args, "-progress", channel.target]
+                kwargs = {**kwargs, **channel.popen_kwargs(kwargs)}
+
+            policy = resources.policy_for(resources.DOWNLOAD)
+            try:
+                super().__init__(
+                    resources.command(args, policy), *pargs, **{**resources.popen_kwargs(policy), **kwargs}
+                )
+            except BaseException:
+                if channel is not None:
+                    channel.discard()
+                raise
+            resources.apply(self.pid, policy)
+
+            if reporter and channel is not None and context:
+                context.followers.append(channel.follow(self, reporter))
 
     fd_class._call_downloader = _call_downloader
     external_fd.Popen = _ProgressPopen
@@ -117,8 +146,8 @@ def install() -> bool:
     return True
 
 
-def _prepare(context: _Context | None, args) -> tuple[FFmpegProgressReporter | None, str | None]:
-    """A reporter and a file for ffmpeg to write its progress to, if this is a run we follow."""
+def _prepare(context: _Context | None, args) -> tuple[FFmpegProgressReporter | None, _Channel | None]:
+    """A reporter and a channel for ffmpeg to write its progress to, if this is a run we follow."""
     if context is None:
         return None, None
 
@@ -140,24 +169,105 @@ def _prepare(context: _Context | None, args) -> tuple[FFmpegProgressReporter | N
         # No duration means no ratio to report, so do not even ask ffmpeg for it.
         return None, None
 
-    handle, path = tempfile.mkstemp(prefix="video-dl-progress-")
-    os.close(handle)
-    return reporter, path
+    try:
+        channel = _PipeChannel() if reactor.can_watch_pipes else _FileChannel()
+    except OSError as e:
+        logger.debug(f"ffmpeg download progress unavailable: {e}")
+        return None, None
+    return reporter, channel
+
+
+class _PipeChannel:
+    """A pipe ffmpeg inherits, its progress read by the reactor as it is written."""
+
+    def __init__(self) -> None:
+        self._read_fd, self._write_fd = os.pipe()
+        self.target = f"pipe:{self._write_fd}"
+
+    def popen_kwargs(self, kwargs: dict) -> dict:
+        # Passed fds keep their number in the child, so pipe:N means the same there.
+        return {"pass_fds": (*kwargs.get("pass_fds", ()), self._write_fd)}
+
+    def discard(self) -> None:
+        os.close(self._read_fd)
+        os.close(self._write_fd)
+
+    def follow(self, process, reporter: FFmpegProgressReporter) -> _Follower:
+        # ffmpeg holds its own copy now. Ours would keep the pipe from ever ending.
+        os.close(self._write_fd)
+        return _follow_pipe(self._read_fd, reporter)
+
+
+class _FileChannel:
+    """A temporary file ffmpeg writes its progress to, for where pipes cannot be watched."""
 
+    def __init__(self) -> None:
+        handle, self.target = tempfile.mkstemp(prefix="video-dl-progress-")
+        os.close(handle)
 
-def _follow(process, reporter: FFmpegProgressReporter, path: str) -> None:
-    """Tail the progress file until ffmpeg is done, then clean it up."""
+    def popen_kwargs(self, kwargs: dict) -> dict:
+        return {}
+
+    def discard(self) -> None:
+        with contextlib.suppress(OSError):
+            os.remove(self.target)
+
+    def follow(self, process, reporter: FFmpegProgressReporter) -> _Follower:
+        return _follow(process, reporter, self.target)
+
+
+_Channel = _PipeChannel | _FileChannel
+
+
+def _follow_pipe(fd: int, reporter: FFmpegProgressReporter) -> _Follower:
+    """Feed the reporter each block as ffmpeg writes it, until ffmpeg closes its end."""
+    follower = _Follower()
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    loop = reactor.get_reactor()
+
+    def on_data(data: bytes) -> None:
+        reporter.feed(decoder.decode(data))
+
+    def on_close() -> None:
+        # Runs on the reactor, either at the end of the pipe or from `stop`, once.
+        if not follower.done.is_set():
+            os.close(fd)
+            follower.done.set()
+
+    # Whatever still holds the write end (a process ffmpeg started, say) cannot hold
+    # the download open: the reactor lets go of the pipe and closes it.
+    follower.stop = lambda: loop.unwatch(fd, on_close)
+    loop.watch(fd, on_data, on_close)
+    return follower
+
+
+def _follow(process, reporter: FFmpegProgressReporter, path: str) -> _Follower:
+    """Tail the progress file from the shared reactor until ffmpeg is done, then clean it up."""
+    follower = _Follower()
     try:
-        with open(path, encoding="utf-8", errors="replace") as progress:
-            while True:
-                finished = process.poll() is not None
-                reporter.feed(progress.read())
-                if finished:
-                    return
-                time.sleep(_POLL_INTERVAL)
-    except Exception as e:
-        # A progress bar is never worth taking a download down with it.
+        progress = open(path, encoding="utf-8", errors="replace")  # noqa: SIM115 - closed by finish
+    except OSError as e:
         logger.debug(f"ffmpeg download progress stopped: {e}")
-    finally:
+        follower.done.set()
+        return follower
+
+    def finish() -> None:
+        timer.cancel()
+        progress.close()
         with contextlib.suppress(OSError):
             os.remove(path)
+        follower.done.set()
+
+    def poll() -> None:
+        try:
+            finished = process.poll() is not None
+            reporter.feed(progress.read())
+        except Exception as e:
+            # A progress bar is never worth taking a download down with it.
+            logger.debug(f"ffmpeg download progress stopped: {e}")
+            finished = True
+        if finished:
+            finish()
+
+    timer = reactor.get_reactor().call_every(_POLL_INTERVAL, poll)
+    return follower
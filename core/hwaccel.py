@@ -12,7 +12,8 @@ if TYPE_CHECKING:
 
 logger = logging.getLogger("videodl")
 
-ENCODERS = {
+# Per target, per platform: the encoder, None where the platform has none, and its options.
+ENCODERS: dict[str, dict[str, tuple[str | None, list[str]]]] = {
     "x264": {
         "NVENC": (
             "h264_nvenc",
@@ -56,6 +57,116 @@ ENCODERS = {
     },
 }
 
+# How much time to spend per unit of quality. ENCODERS holds "balanced": the point
+# every encoder used before tiers existed. "fastest" is for intermediates that only
+# need to open in an editor, "archival" for files meant to be kept.
+SPEED_TIERS = ("fastest", "balanced", "archival")
+DEFAULT_SPEED_TIER = "balanced"
+
+# Per encoder, what the other tiers use in place of its ENCODERS options. Quality
+# stays expressed the way ENCODERS does (-crf for the software encoders), so that
+# _adapt_crf in core/encode.py still adjusts it for the resolution. Encoders with no
+# speed knob to turn (v4l2m2m) are missing here, and behave the same in every tier.
+TIER_OPTIONS: dict[str, dict[str, list[str]]] = {
+    "libx264": {
+        "fastest": ["-preset", "veryfast", "-crf", "23"],
+        "archival": ["-preset", "slow", "-crf", "20"],
+    },
+    "libx265": {
+        "fastest": ["-preset", "superfast", "-crf", "26"],
+        "archival": ["-preset", "slow", "-crf", "23"],
+    },
+    "libsvtav1": {
+        "fastest": ["-crf", "35", "-preset", "10"],
+        "archival": ["-crf", "28", "-preset", "4"],
+    },
+    "prores_ks": {
+        # Profile 0 is Proxy, already the cheapest; archival moves up to HQ.
+        "archival": ["-profile:v", "3", "-qscale:v", "9"],
+    },
+    "prores_videotoolbox": {
+        "archival": ["-profile:v", "3", "-qscale:v", "9"],
+    },
+    "h264_nvenc": {
+        "fastest": [
+            "-preset:v",
+            "p2",
+            "-tune:v",
+            "hq",
+            "-rc:v",
+            "vbr",
+            "-cq:v",
+            "23",
+            "-b:v",
+            "0",
+            "-profile:v",
+            "high",
+        ],
+        "archival": [
+            "-preset:v",
+            "p7",
+            "-tune:v",
+            "hq",
+            "-multipass",
+            "fullres",
+            "-rc:v",
+            "vbr",
+            "-cq:v",
+            "19",
+            "-b:v",
+            "0",
+            "-profile:v",
+            "high",
+        ],
+    },
+    "hevc_nvenc": {
+        "fastest": ["-preset:v", "p2", "-tune:v", "hq", "-rc:v", "vbr", "-cq:v", "26", "-b:v", "0"],
+        "archival": [
+            "-preset:v",
+            "p7",
+            "-tune:v",
+            "hq",
+            "-multipass",
+            "fullres",
+            "-rc:v",
+            "vbr",
+            "-cq:v",
+            "22",
+            "-b:v",
+            "0",
+        ],
+    },
+    "av1_nvenc": {
+        "fastest": ["-preset", "p2", "-cq:v", "37"],
+        "archival": ["-preset", "p7", "-cq:v", "30"],
+    },
+    "h264_amf": {"fastest": ["-quality", "speed"]},
+    "hevc_amf": {"fastest": ["-quality", "speed"]},
+    "h264_qsv": {
+        "fastest": ["-global_quality", "23", "-preset", "veryfast"],
+        "archival": ["-global_quality", "20", "-look_ahead", "1", "-preset", "veryslow"],
+    },
+    "hevc_qsv": {
+        "fastest": ["-global_quality", "26", "-preset", "veryfast"],
+        "archival": ["-global_quality", "23", "-look_ahead", "1", "-preset", "veryslow"],
+    },
+    "av1_qsv": {
+        "fastest": ["-preset", "veryfast", "-global_quality", "32"],
+        "archival": ["-preset", "veryslow", "-global_quality", "28"],
+    },
+    # VideoToolbox's -q:v runs the other way: higher is better.
+    "h264_videotoolbox": {
+        "fastest": ["-q:v", "35", "-prio_speed", "1"],
+        "archival": ["-q:v", "55"],
+    },
+    "hevc_videotoolbox": {
+        "fastest": ["-q:v", "40", "-prio_speed", "1"],
+        "archival": ["-q:v", "60"],
+    },
+    "h264_mediacodec": {"archival": ["-b:v", "16M"]},
+    "hevc_mediacodec": {"archival": ["-b:v", "12M"]},
+}
+
 # Cache: set of encoder names available in this ffmpeg build, populated once
 _available_encoders = None
 # Cache: set of encoder names that passed the functional test
@@ -143,7 +254,31 @@ def _test_encoder(encoder: str, ff_path: dict[str, str] | None = None) -> bool:
     return result
 
 
-def fastest_encoder(target_vcodec: str) -> tuple[str, list[str]]:
+def is_software_encoder(encoder: str) -> bool:
+    """Whether `encoder` is one of the CPU fallbacks, which nothing can take over from."""
+    return any(platforms["CPU"][0] == encoder for platforms in ENCODERS.values())
+
+
+def mark_encoder_degraded(encoder: str) -> None:
+    """Stop choosing `encoder` for the rest of the session, after it failed mid-encode.
+
+    A driver reset or an exhausted NVENC session does not heal by itself, and the
+    one-frame test would likely pass again. fastest_encoder moves on to the next one.
+    """
+    _working_encoders[encoder] = False
+    logger.warning(f"Encoder {encoder} failed mid-encode, no longer using it")
+
+
+def tier_options(encoder: str, quality_options: list[str], tier: str) -> list[str]:
+    """The options `encoder` runs with in `tier`, `quality_options` being its balanced ones."""
+    if tier not in SPEED_TIERS:
+        raise ValueError(f"Unknown speed tier: {tier}")
+    return list(TIER_OPTIONS.get(encoder, {}).get(tier, quality_options))
+
+
+def fastest_encoder(
+    target_vcodec: str, speed_tier: str = DEFAULT_SPEED_TIER, ff_path: dict[str, str] | None = None
+) -> tuple[str, list[str]]:
     """
     Determine the best hardware encoder for the target codec by checking
     which encoders are available in the current ffmpeg build.
@@ -151,8 +286,9 @@ def fastest_encoder(target_vcodec: str) -> tuple[str, list[str]]:
     Falls back to CPU (software) encoding if no hardware encoder is found.
 
     Args:
-        path: Path to the input file (unused, kept for API compat)
         target_vcodec: Target video codec ("x264", "x265", "ProRes", "AV1")
+        speed_tier: One of SPEED_TIERS, trading encode time for quality and size
+        ff_path: FFmpeg/FFprobe paths, sys_vars.FF_PATH when None
 
     Returns:
         Tuple of (encoder_name, quality_options)
@@ -160,14 +296,14 @@ def fastest_encoder(target_vcodec: str) -> tuple[str, list[str]]:
     Raises:
         FFmpegNoValidEncoderFound: If no encoder is available for the target
     """
-    available = _get_available_encoders()
+    available = _get_available_encoders(ff_path)
     skip_platforms = {"Raspberry"} if runtime.is_android() else set()
-    for platform_name, (vcodec, quality_options) in ENCODERS[target_vcodec].items():  # type: ignore[attr-defined]
+    for platform_name, (vcodec, quality_options) in ENCODERS[target_vcodec].items():
         if not vcodec:
             continue
         if platform_name in skip_platforms:
             continue
-        if vcodec in available and _test_encoder(vcodec):
-            logger.info(f"Selected encoder: {vcodec} ({platform_name}) for {target_vcodec}")
-            return vcodec, quality_options
+        if vcodec in available and _test_encoder(vcodec, ff_path):
+            logger.info(f"Selected encoder: {vcodec} ({platform_name}) for {target_vcodec}, {speed_tier} tier")
+            return vcodec, tier_options(vcodec, quality_options, speed_tier)
     raise FFmpegNoValidEncoderFound
@@ -0,0 +1,273 @@
+"""Progress of many jobs at once, and the totals across them.
+
+The GUI used to hold the progress of one job in a handful of its own attributes,
+and a "(2/5)" string for where it was in the queue. Nothing else could show more
+than one job, and nothing outside the GUI could show any.
+
+A ProgressModel holds one JobProgress per job, fed by the same status dicts the
+ProgressCallback protocol (core/callbacks.py) carries, and keeps the totals across
+them as it goes: bytes done and to do, combined speed, how many jobs are in each
+stage. Updating a job adjusts the totals by its own change, so neither an update
+nor reading the totals ever walks the jobs. `changed()` hands back the jobs that
+moved since it was last called, so a view of hundreds of jobs redraws only the
+rows that need it.
+
+Once a job is over, it also holds what the job's processes cost, per stage (see
+core/usage.py), which goes wherever the job does: the JSON of `video-dl batch` and
+`video-dl serve`, to size how many jobs to run at once and find the encodes that
+cost far more than they should.
+
+The model is thread safe: downloads report from their own threads, a view reads
+from its own. It formats nothing: that is up to the view, the desktop and mobile
+layouts alike, or a CLI printing JSON.
+"""
+
+from __future__ import annotations
+
+import itertools
+import threading
+from collections import Counter
+from collections.abc import Iterator
+from dataclasses import dataclass
+
+# Where a job is. A job goes from QUEUED through DOWNLOADING, and PROCESSING if it
+# is encoded, to one of the last three.
+QUEUED = "queued"
+DOWNLOADING = "downloading"
+PROCESSING = "processing"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+STAGES = (QUEUED, DOWNLOADING, PROCESSING, DONE, FAILED, CANCELLED)
+FINISHED_STAGES = frozenset((DONE, FAILED, CANCELLED))
+
+# Which byte count each stage reads from a status dict.
+_BYTES_KEYS = {DOWNLOADING: "downloaded_bytes", PROCESSING: "processed_bytes"}
+
+
+class JobProgress:
+    """Where one job stands. Written by the model only, read by anyone."""
+
+    __slots__ = ("done_bytes", "error", "eta", "job_id", "label", "speed", "stage", "total_bytes", "usage")
+
+    def __init__(self, job_id: str, label: str) -> None:
+        self.job_id = job_id
+        self.label = label
+        self.stage = QUEUED
+        # Of the current stage: the download's bytes, then the encode's.
+        self.done_bytes = 0
+        self.total_bytes = 0
+        self.speed = 0.0
+        self.eta: float | None = None
+        self.error: str | None = None
+        # Per stage, once the job has reported it, see core/usage.py.
+        self.usage: dict[str, dict] = {}
+
+    @property
+    def fraction(self) -> float:
+        """How far into the current stage, 0 to 1, 0 when its size is unknown."""
+        if not self.total_bytes:
+            return 1.0 if self.stage == DONE else 0.0
+        return min(self.done_bytes / self.total_bytes, 1.0)
+
+    def as_dict(self) -> dict:
+        return {slot: getattr(self, slot) for slot in self.__slots__}
+
+
+@dataclass(frozen=True, slots=True)
+class Totals:
+    """The model's running totals, at one moment."""
+
+    jobs: int
+    # How many jobs are in each stage, every stage present.
+    stages: dict[str, int]
+    # Of the jobs still downloading or processing.
+    done_bytes: int
+    total_bytes: int
+    speed: float
+    # Seconds until every active job is through its current stage, at the combined
+    # speed. Weighted by bytes, so a large slow job counts for what it is.
+    eta: float | None
+
+    @property
+    def finished(self) -> int:
+        return sum(self.stages[stage] for stage in FINISHED_STAGES)
+
+    @property
+    def active(self) -> int:
+        return self.stages[DOWNLOADING] + self.stages[PROCESSING]
+
+
+class ProgressModel:
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._jobs: dict[str, JobProgress] = {}
+        self._ids = itertools.count(1)
+        self._stages: Counter[str] = Counter({stage: 0 for stage in STAGES})
+        self._done_bytes = 0
+        self._total_bytes = 0
+        self._speed = 0.0
+        self._changed: dict[str, JobProgress] = {}
+
+    def add(self, label: str, job_id: str | None = None) -> JobProgress:
+        """A new job, queued. Its id is `job_id`, or the next free number."""
+        with self._lock:
+            job_id = job_id or str(next(self._ids))
+            if job_id in self._jobs:
+                raise ValueError(f"job {job_id} already exists")
+            job = JobProgress(job_id, label)
+            self._jobs[job_id] = job
+            self._stages[QUEUED] += 1
+            self._changed[job_id] = job
+            return job
+
+    def update(self, job_id: str, status: dict, stage: str = DOWNLOADING) -> None:
+        """Take a status dict, as a ProgressCallback receives it, for `stage` of the job.
+
+        A job that has already finished keeps its final state: a late report from
+        a thread that has not noticed the cancel yet does not bring it back.
+        """
+        bytes_key = _BYTES_KEYS[stage]
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job.stage in FINISHED_STAGES:
+                return
+            self._retract(job)
+            if job.stage != stage:
+                self._stages[job.stage] -= 1
+                self._stages[stage] += 1
+                job.stage = stage
+                job.done_bytes = job.total_bytes = 0
+            # A status may leave either count out, the closing "finished" of a
+            # download both: what is left out has not changed.
+            if bytes_key in status:
+                job.done_bytes = _to_int(status[bytes_key])
+            total = status.get("total_bytes") or status.get("total_bytes_estimate")
+            if total:
+                job.total_bytes = _to_int(total)
+            if status.get("status") == "finished":
+                job.done_bytes = max(job.done_bytes, job.total_bytes)
+            job.speed = _to_float(status.get("speed"))
+            eta = status.get("eta")
+            job.eta = float(eta) if isinstance(eta, int | float) else None
+            self._count(job)
+            self._changed[job_id] = job
+
+    def finish(self, job_id: str, stage: str = DONE, error: str | None = None) -> None:
+        """Move the job to DONE, FAILED or CANCELLED."""
+        if stage not in FINISHED_STAGES:
+            raise ValueError(f"{stage} is not a stage a job finishes in")
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job.stage in FINISHED_STAGES:
+                return
+            self._retract(job)
+            self._stages[job.stage] -= 1
+            self._stages[stage] += 1
+            job.stage = stage
+            job.error = error
+            job.speed = 0.0
+            job.eta = None
+            self._settle()
+            self._changed[job_id] = job
+
+    def set_usage(self, job_id: str, usage: dict[str, dict]) -> None:
+        """Record what the job's processes cost, see core/usage.py."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return
+            job.usage = usage
+            self._changed[job_id] = job
+
+    def remove(self, job_id: str) -> None:
+        with self._lock:
+            job = self._jobs.pop(job_id, None)
+            if job is None:
+                return
+            self._retract(job)
+            self._stages[job.stage] -= 1
+            self._settle()
+            self._changed.pop(job_id, None)
+
+    def get(self, job_id: str) -> JobProgress | None:
+        return self._jobs.get(job_id)
+
+    def __len__(self) -> int:
+        return len(self._jobs)
+
+    def __iter__(self) -> Iterator[JobProgress]:
+        with self._lock:
+            return iter(list(self._jobs.values()))
+
+    def totals(self) -> Totals:
+        with self._lock:
+            remaining = self._total_bytes - self._done_bytes
+            return Totals(
+                jobs=len(self._jobs),
+                stages=dict(self._stages),
+                done_bytes=self._done_bytes,
+                total_bytes=self._total_bytes,
+                speed=self._speed,
+                eta=remaining / self._speed if self._speed and remaining > 0 else None,
+            )
+
+    def changed(self) -> list[JobProgress]:
+        """The jobs that moved since the last call, each once."""
+        with self._lock:
+            changed, self._changed = self._changed, {}
+            return list(changed.values())
+
+    def callback(self, job_id: str) -> JobCallback:
+        """A ProgressCallback that reports into this job."""
+        return JobCallback(self, job_id)
+
+    def _count(self, job: JobProgress) -> None:
+        if job.stage in _BYTES_KEYS:
+            self._done_bytes += job.done_bytes
+            self._total_bytes += max(job.total_bytes, job.done_bytes)
+            self._speed += job.speed
+
+    def _settle(self) -> None:
+        # Speeds are floats, added and taken away many times over: with nothing left
+        # active, what they sum to is zero, not whatever rounding left behind.
+        if not self._stages[DOWNLOADING] and not self._stages[PROCESSING]:
+            self._done_bytes = self._total_bytes = 0
+            self._speed = 0.0
+
+    def _retract(self, job: JobProgress) -> None:
+        if job.stage in _BYTES_KEYS:
+            self._done_bytes -= job.done_bytes
+            self._total_bytes -= max(job.total_bytes, job.done_bytes)
+            self._speed -= job.speed
+
+
+class JobCallback:
+    """The ProgressCallback protocol, for one job of a ProgressModel."""
+
+    def __init__(self, model: ProgressModel, job_id: str) -> None:
+        self._model = model
+        self._job_id = job_id
+
+    def on_download_progress(self, status: dict) -> None:
+        self._model.update(self._job_id, status, DOWNLOADING)
+
+    def on_process_progress(self, status: dict) -> None:
+        self._model.update(self._job_id, status, PROCESSING)
+
+    def on_usage(self, usage: dict[str, dict]) -> None:
+        self._model.set_usage(self._job_id, usage)
+
+
+def _to_int(value) -> int:
+    try:
+        return int(value or 0)
+    except (TypeError, ValueError):
+        return 0
+
+
+def _to_float(value) -> float:
+    try:
+        return float(value or 0)
+    except (TypeError, ValueError):
+        return 0.0
@@ -0,0 +1,239 @@
+"""Download the video and audio streams of a merged format at the same time.
+
+Almost every download here asks for `bv+ba`: a video stream and an audio stream,
+fetched separately and merged by ffmpeg. yt-dlp fetches them one after the other,
+in `YoutubeDL.process_info`, so every download ends with a serial audio tail: the
+video is done, the bar says 100%, and then the audio starts from zero.
+
+This runs them side by side instead. process_info still calls `YoutubeDL.dl` once
+per requested format, in order. Every call but the last starts its download on a
+thread of its own and returns at once, the last runs on the caller's thread and
+then waits for the others, so by the time process_info moves on to merging, every
+file is there. An error on any stream is raised from that last call, where
+process_info already knows what to do with it.
+
+Two streams reporting to the same bar would make it jump between their
+percentages, so their progress is added up into one status, the same
+`downloaded_bytes`/`total_bytes` shape a single download reports. Each stream
+weighs in with its own size: a 30 MB audio track is a sliver of a 2 GB video.
+
+Downloads yt-dlp merges on the fly (ffmpeg reading both streams, or a trimmed
+download) call `dl` once with both formats, and are left alone.
+
+Like the other patches here it is guarded. tests/test_parallel_formats.py checks
+the seams against the installed yt-dlp.
+"""
+
+from __future__ import annotations
+
+import contextvars
+import logging
+import threading
+
+logger = logging.getLogger("videodl")
+
+_installed = False
+
+# The merged download in flight on this thread, if any. A context variable rather
+# than a thread local so the streams' own threads, started with a copy of the
+# context, still know which download they belong to.
+_current: contextvars.ContextVar[_Batch | None] = contextvars.ContextVar("parallel_formats", default=None)
+
+# Streams report progress from whatever thread their downloader uses, fragment
+# workers included, which are not started with our context. What they all do
+# report is the file they are writing, so that is what finds their batch.
+_batches_by_filename: dict[str, tuple[_Batch, str]] = {}
+_registry_lock = threading.Lock()
+
+
+class _Batch:
+    """The requested formats of one merged download, and their combined progress."""
+
+    def __init__(self, formats: list[dict]):
+        self._pending_ids = [str(f.get("format_id")) for f in formats]
+        self._lock = threading.Lock()
+        self._threads: list[threading.Thread] = []
+        self._results: list[tuple[bool, bool]] = []
+        self._errors: list[BaseException] = []
+        self._filenames: list[str] = []
+        # Per format: what its own downloader last reported. Until it reports, a
+        # stream still weighs what the format said it would.
+        self._streams: dict[str, dict] = {
+            str(f.get("format_id")): {"expected": f.get("filesize") or f.get("filesize_approx") or 0} for f in formats
+        }
+
+    @property
+    def has_pending(self) -> bool:
+        """Whether formats remain that process_info has not asked for yet."""
+        with self._lock:
+            return bool(self._pending_ids)
+
+    def claim(self, info: dict) -> bool:
+        """Whether this `dl` call is one of ours: a single format, not yet downloaded."""
+        if info.get("requested_formats"):
+            return False
+        format_id = str(info.get("format_id"))
+        with self._lock:
+            if format_id not in self._pending_ids:
+                return False
+            self._pending_ids.remove(format_id)
+            return True
+
+    def register(self, filename: str, format_id: str) -> None:
+        with self._lock:
+            self._filenames.append(filename)
+        with _registry_lock:
+            _batches_by_filename[filename] = (self, format_id)
+
+    def start(self, download) -> None:
+        """Run `download` on its own thread, keeping what it returns or raises."""
+
+        def run() -> None:
+            try:
+                result = download()
+            except BaseException as e:
+                with self._lock:
+                    self._errors.append(e)
+            else:
+                with self._lock:
+                    self._results.append(result)
+
+        thread = threading.Thread(target=contextvars.copy_context().run, args=(run,), daemon=True)
+        self._threads.append(thread)
+        thread.start()
+
+    def join(self) -> None:
+        for thread in self._threads:
+            thread.join()
+
+    def finish(self, last_result: tuple[bool, bool]) -> tuple[bool, bool]:
+        """Wait for every stream, then answer for all of them as process_info expects."""
+        self.join()
+        if self._errors:
+            raise self._errors[0]
+        success, real_download = last_result
+        for partial_success, partial_real in self._results:
+            success = success and partial_success
+            real_download = real_download or partial_real
+        return success, real_download
+
+    def release(self) -> None:
+        with _registry_lock:
+            for filename in self._filenames:
+                _batches_by_filename.pop(filename, None)
+
+    def combine(self, format_id: str, status: dict) -> dict:
+        """Fold one stream's status into a status for the whole download. Call under `lock`."""
+        stream = self._streams.setdefault(format_id, {"expected": 0})
+        stream.update(
+            {
+                "status": status.get("status"),
+                "downloaded": status.get("downloaded_bytes") or 0,
+                "total": status.get("total_bytes") or status.get("total_bytes_estimate") or 0,
+                "speed": status.get("speed") or 0,
+            }
+        )
+        if stream["status"] == "finished":
+            # A finished status may only carry the total, for a file that was already there.
+            stream["downloaded"] = stream["total"] = stream["total"] or stream["downloaded"]
+            stream["speed"] = 0
+
+        downloaded = sum(s.get("downloaded", 0) for s in self._streams.values())
+        # A stream that has not said anything yet still weighs what the format said it would.
+        total = sum(s.get("total") or s["expected"] for s in self._streams.values())
+        speed = sum(s.get("speed", 0) for s in self._streams.values())
+        everything_finished = all(s.get("status") == "finished" for s in self._streams.values())
+
+        combined = {key: value for key, value in status.items() if not key.startswith("fragment_")}
+        combined.pop("total_bytes_estimate", None)
+        combined.update(
+            {
+                "status": "finished" if everything_finished else "downloading",
+                "downloaded_bytes": downloaded,
+                "total_bytes": total or None,
+                "speed": speed or None,
+                "eta": (total - downloaded) / speed if speed and total > downloaded else None,
+            }
+        )
+        return combined
+
+    @property
+    def lock(self) -> threading.Lock:
+        return self._lock
+
+
+def install() -> bool:
+    """Make yt-dlp download the formats of a merged download concurrently. Idempotent."""
+    global _installed
+    if _installed:
+        return True
+
+    try:
+        from yt_dlp import YoutubeDL
+        from yt_dlp.downloader.common import FileDownloader
+    except ImportError as e:
+        logger.warning(f"yt-dlp has moved: merged formats will download one after the other ({e})")
+        return False
+
+    original_process_info = getattr(YoutubeDL, "process_info", None)
+    original_dl = getattr(YoutubeDL, "dl", None)
+    original_hook_progress = getattr(FileDownloader, "_hook_progress", None)
+    if not (original_process_info and original_dl and original_hook_progress):
+        logger.warning("yt-dlp has moved: merged formats will download one after the other")
+        return False
+
+    def process_info(self, info_dict):
+        formats = info_dict.get("requested_formats") or []
+        if len(formats) < 2 or _current.get() is not None:
+            return original_process_info(self, info_dict)
+        batch = _Batch(formats)
+        token = _current.set(batch)
+        try:
+            return original_process_info(self, info_dict)
+        finally:
+            _current.reset(token)
+            # process_info can bail out between two formats. Whatever was started
+            # still gets to finish before its files are left to the caller.
+            batch.join()
+            batch.release()
+
+    def dl(self, name, info, subtitle=False, test=False):
+        batch = _current.get()
+        if batch is None or subtitle or test or name == "-" or not batch.claim(info):
+            return original_dl(self, name, info, subtitle, test)
+        return download_format(batch, name, info, lambda: original_dl(self, name, info, subtitle, test))
+
+    def _hook_progress(self, status, info_dict):
+        with _registry_lock:
+            found = _batches_by_filename.get(status.get("filename") or "")
+        if found is None:
+            return original_hook_progress(self, status, info_dict)
+        batch, format_id = found
+        # One stream at a time: the hooks were written for a single download.
+        with batch.lock:
+            return original_hook_progress(self, batch.combine(format_id, status), info_dict)
+
+    YoutubeDL.process_info = process_info
+    YoutubeDL.dl = dl
+    FileDownloader._hook_progress = _hook_progress
+    _installed = True
+    logger.debug("concurrent format downloads installed")
+    return True
+
+
+def download_format(batch: _Batch, name: str, info: dict, download) -> tuple[bool, bool]:
+    """One of the formats of `batch`: started in the background, or the last one, awaited.
+
+    Returns as `YoutubeDL.dl` does. For a format left running in the background that
+    is an optimistic (True, True): the real answer comes with the last format's.
+    """
+    batch.register(name, str(info.get("format_id")))
+    if batch.has_pending:
+        batch.start(download)
+        return True, True
+    try:
+        result = download()
+    except BaseException:
+        batch.join()
+        raise
+    return batch.finish(result)
@@ -0,0 +1,365 @@
+"""Run jobs in worker processes instead of threads of this one.
+
+Every job used to run on a thread of the process that started it. Extraction,
+format selection and signature solving are Python, and hold the GIL while they
+work: jobs running side by side take turns at one core, and take it from the GUI.
+An extractor stuck in a loop, or a C extension that crashed, took the whole
+application with it.
+
+A ProcessPool keeps up to `size` worker processes, each running one job at a time.
+`ProcessPool.download` has the shape of core.download.download, and the same
+callbacks: the job runs in a worker, and what it reports comes back over a pipe to
+the calling thread, which calls `progress_cb` and `status_cb` as a job of its own
+would. It returns when the job is done, and raises what the job raised.
+
+What crosses the pipe:
+
+  - the DownloadConfig, without its yt-dlp hooks and logger, which are functions of
+    this process. The worker puts in its own, which report over the pipe.
+  - status dicts, stripped down to plain values. yt-dlp's carry the whole info dict,
+    and more than one object that cannot be pickled.
+  - what the job's processes cost, once it is over.
+  - log records, which are logged again here. The worker has no handler of its own.
+  - the exception a job ended on. One that cannot be pickled comes back as a
+    JobProcessError with its message.
+
+A cancel is sent to the worker, which stops the job the way a thread would. A
+worker that has not stopped `CANCEL_GRACE` seconds later is killed, along with
+every process it started: each worker leads its own process group. A worker that
+dies, for whatever reason, fails its job with a JobProcessError and is replaced
+by the next job that needs one.
+
+Workers are spawned, not forked: this process has threads (the reactor, Flet's),
+and a fork only copies the one that called it, with whatever locks the others held.
+"""
+
+from __future__ import annotations
+
+import contextlib
+import dataclasses
+import logging
+import multiprocessing
+import os
+import pickle
+import queue
+import signal
+import threading
+import time
+from collections.abc import Callable
+from multiprocessing.connection import Connection
+from multiprocessing.context import SpawnContext
+from typing import Any
+
+from yt_dlp.utils import DownloadCancelled as YtdlpDownloadCancelled
+
+from core.callbacks import CancelToken, ProgressCallback, StatusCallback
+from core.config_types import DownloadConfig
+from core.exceptions import DownloadCancelled, JobProcessError
+
+logger = logging.getLogger("videodl")
+
+# How long a worker has to stop a cancelled job before it is killed.
+CANCEL_GRACE = 10
+_POLL_INTERVAL = 0.1
+
+# The yt-dlp options that are functions of the calling process.
+_LOCAL_OPTS = ("progress_hooks", "postprocessor_hooks", "logger")
+# What status dicts keep of their info dict: what progress views read.
+_INFO_KEYS = ("id", "title", "playlist_autonumber", "n_entries")
+_PLAIN = (str, int, float, bool, type(None))
+
+JobRunner = Callable[[DownloadConfig, CancelToken, ProgressCallback, StatusCallback], None]
+
+
+def run_download(
+    config: DownloadConfig, cancel: CancelToken, progress_cb: ProgressCallback, status_cb: StatusCallback
+) -> None:
+    """A whole job, as a worker runs it: a YoutubeDL of its own, then core.download."""
+    from core.download import create_ydl, download
+
+    ydl = create_ydl(config.ydl_opts, status_cb, config.ff_path)
+    try:
+        download(ydl, config, cancel, progress_cb)
+    finally:
+        ydl.close()
+
+
+def portable_status(d: dict) -> dict:
+    """`d` with only what can be pickled and is worth sending."""
+    status: dict[str, Any] = {key: value for key, value in d.items() if isinstance(value, _PLAIN)}
+    info = d.get("info_dict")
+    if isinstance(info, dict):
+        status["info_dict"] = {key: info[key] for key in _INFO_KEYS if key in info and isinstance(info[key], _PLAIN)}
+    return status
+
+
+class ProcessPool:
+    """Up to `size` worker processes, started as jobs need them."""
+
+    def __init__(self, size: int, runner: JobRunner = run_download):
+        self._size = max(1, size)
+        self._runner = runner
+        self._context = multiprocessing.get_context("spawn")
+        self._slots = threading.Semaphore(self._size)
+        self._idle: list[_Worker] = []
+        self._workers: set[_Worker] = set()
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def download(
+        self,
+        config: DownloadConfig,
+        cancel: CancelToken,
+        progress_cb: ProgressCallback,
+        status_cb: StatusCallback,
+    ) -> None:
+        """Run the job in a worker. Blocks until it is over, like core.download.download."""
+        with self._slots:
+            worker = self._acquire()
+            try:
+                worker.run(config, cancel, progress_cb, status_cb)
+            finally:
+                self._release(worker)
+
+    def close(self) -> None:
+        """Stop every worker. Jobs still running are killed."""
+        with self._lock:
+            self._closed = True
+            workers, self._idle = list(self._workers), []
+            self._workers.clear()
+        for worker in workers:
+            worker.stop()
+
+    def _acquire(self) -> _Worker:
+        with self._lock:
+            if self._closed:
+                raise JobProcessError("the process pool is closed")
+            if self._idle:
+                return self._idle.pop()
+        worker = _Worker(self._context, self._runner)
+        with self._lock:
+            self._workers.add(worker)
+        return worker
+
+    def _release(self, worker: _Worker) -> None:
+        with self._lock:
+            if worker.alive and not self._closed:
+                self._idle.append(worker)
+                return
+            self._workers.discard(worker)
+        worker.stop()
+
+
+class _Worker:
+    """One worker process, and this end of its pipe."""
+
+    def __init__(self, context: SpawnContext, runner: JobRunner):
+        self._conn, child_conn = context.Pipe()
+        self._process = context.Process(
+            target=_worker_main,
+            args=(child_conn, logger.getEffectiveLevel(), runner),
+            name="videodl-worker",
+            daemon=True,
+        )
+        self._process.start()
+        child_conn.close()
+
+    @property
+    def alive(self) -> bool:
+        return self._process.is_alive()
+
+    def run(
+        self,
+        config: DownloadConfig,
+        cancel: CancelToken,
+        progress_cb: ProgressCallback,
+        status_cb: StatusCallback,
+    ) -> None:
+        local = {key: value for key, value in config.ydl_opts.items() if key not in _LOCAL_OPTS}
+        try:
+            self._conn.send(("job", dataclasses.replace(config, ydl_opts=local)))
+        except Exception as e:
+            raise JobProcessError(f"the job cannot be sent to a worker process: {e}") from e
+        try:
+            error = self._follow(cancel, progress_cb, status_cb)
+        except BaseException:
+            # Whatever the worker is still doing, nobody is listening to it any more.
+            self.stop()
+            raise
+        if error is not None:
+            raise error
+
+    def _follow(
+        self, cancel: CancelToken, progress_cb: ProgressCallback, status_cb: StatusCallback
+    ) -> Exception | None:
+        """Pass on what the worker reports until its job is over, and return what it failed on."""
+        deadline: float | None = None
+        while True:
+            try:
+                messages = self._receive()
+            except (EOFError, OSError):
+                # The pipe broke: the worker is gone, or going.
+                self._process.join(timeout=1)
+                if cancel.is_cancelled():
+                    raise DownloadCancelled from None
+                raise JobProcessError(f"the worker process exited with code {self._process.exitcode}") from None
+            for kind, *payload in messages:
+                if kind == "done":
+                    return None
+                if kind == "error":
+                    return payload[0]
+                _dispatch(kind, payload, progress_cb, status_cb)
+            if cancel.is_cancelled():
+                if deadline is None:
+                    deadline = time.monotonic() + CANCEL_GRACE
+                    with contextlib.suppress(OSError):
+                        self._conn.send(("cancel",))
+                elif time.monotonic() > deadline:
+                    logger.warning(f"worker {self._process.pid} did not stop its cancelled job, killing it")
+                    raise DownloadCancelled
+
+    def _receive(self) -> list[tuple]:
+        """What the worker sent, waiting at most `_POLL_INTERVAL` for the first of it."""
+        messages = []
+        ready = self._conn.poll(_POLL_INTERVAL)
+        while ready:
+            messages.append(self._conn.recv())
+            ready = self._conn.poll()
+        return messages
+
+    def stop(self) -> None:
+        """Kill the worker and everything it started, if it still runs."""
+        with contextlib.suppress(OSError):
+            self._conn.close()
+        pid = self._process.pid
+        if self._process.is_alive() and pid is not None:
+            if hasattr(os, "killpg"):
+                with contextlib.suppress(OSError):
+                    os.killpg(pid, signal.SIGKILL)
+            self._process.kill()
+        self._process.join(timeout=5)
+
+
+def _dispatch(kind: str, payload: list, progress_cb: ProgressCallback, status_cb: StatusCallback) -> None:
+    if kind == "download":
+        progress_cb.on_download_progress(payload[0])
+    elif kind == "process":
+        progress_cb.on_process_progress(payload[0])
+    elif kind == "usage":
+        progress_cb.on_usage(payload[0])
+    elif kind == "status":
+        status_cb.on_status(payload[0])
+    elif kind == "log":
+        logger.log(payload[0], payload[1])
+
+
+# What runs in the worker process.
+
+
+class _Channel:
+    """The worker's end of the pipe, written to from whichever thread reports."""
+
+    def __init__(self, conn: Connection):
+        self._conn = conn
+        self._lock = threading.Lock()
+
+    def send(self, message: tuple) -> None:
+        with self._lock, contextlib.suppress(OSError):
+            self._conn.send(message)
+
+
+class _ChannelLogHandler(logging.Handler):
+    def __init__(self, channel: _Channel):
+        super().__init__()
+        self._channel = channel
+
+    def emit(self, record: logging.LogRecord) -> None:
+        with contextlib.suppress(Exception):
+            self._channel.send(("log", record.levelno, f"[worker {os.getpid()}] {record.getMessage()}"))
+
+
+class _WorkerCallbacks:
+    """The callbacks a job gets in a worker: each sends what it is given down the pipe."""
+
+    def __init__(self, channel: _Channel, cancel: threading.Event):
+        self._channel = channel
+        self._cancel = cancel
+
+    def is_cancelled(self) -> bool:
+        return self._cancel.is_set()
+
+    def progress_hook(self, d: dict) -> None:
+        # As in the GUI: raising from the hook is how yt-dlp's own download stops.
+        # core/_finish_download's "finished" signal carries no bytes, and still counts once cancelled.
+        if self._cancel.is_set() and not (d.get("status") == "finished" and "downloaded_bytes" not in d):
+            raise YtdlpDownloadCancelled
+        self.on_download_progress(d)
+
+    def on_download_progress(self, status: dict) -> None:
+        self._channel.send(("download", portable_status(status)))
+
+    def on_process_progress(self, status: dict) -> None:
+        self._channel.send(("process", portable_status(status)))
+
+    def on_usage(self, usage: dict[str, dict]) -> None:
+        self._channel.send(("usage", usage))
+
+    def on_status(self, message: str) -> None:
+        self._channel.send(("status", message))
+
+
+def _portable_error(exc: Exception) -> Exception:
+    try:
+        return pickle.loads(pickle.dumps(exc))
+    except Exception:
+        return JobProcessError(f"{type(exc).__name__}: {exc}")
+
+
+def _worker_main(conn: Connection, log_level: int, runner: JobRunner) -> None:
+    if hasattr(os, "setsid"):
+        # Its own process group, so that killing it takes its ffmpeg and aria2c along.
+        os.setsid()
+    # The parent stops its workers itself. Its Ctrl-C, sent to the whole terminal's
+    # group, is not for them.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    channel = _Channel(conn)
+    app_logger = logging.getLogger("videodl")
+    app_logger.addHandler(_ChannelLogHandler(channel))
+    app_logger.setLevel(log_level)
+    app_logger.propagate = False
+
+    jobs: queue.Queue[DownloadConfig | None] = queue.Queue()
+    cancel = threading.Event()
+
+    def listen() -> None:
+        # The only reader of the pipe: jobs go to the main thread, cancels to the job.
+        while True:
+            try:
+                kind, *payload = conn.recv()
+            except (EOFError, OSError):
+                cancel.set()
+                jobs.put(None)
+                return
+            if kind == "cancel":
+                cancel.set()
+            elif kind == "job":
+                cancel.clear()
+                jobs.put(payload[0])
+
+    threading.Thread(target=listen, name="videodl-worker-pipe", daemon=True).start()
+    callbacks = _WorkerCallbacks(channel, cancel)
+    while (config := jobs.get()) is not None:
+        opts = {
+            **config.ydl_opts,
+            "progress_hooks": [callbacks.progress_hook],
+            "postprocessor_hooks": [callbacks.on_process_progress],
+        }
+        try:
+            runner(dataclasses.replace(config, ydl_opts=opts), callbacks, callbacks, callbacks)
+        except YtdlpDownloadCancelled:
+            # Raised by our own hook, wherever the runner let it through.
+            channel.send(("error", DownloadCancelled()))
+        except Exception as e:
+            channel.send(("error", _portable_error(e)))
+        else:
+            channel.send(("done",))
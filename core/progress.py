@@ -1,12 +1,78 @@
 from __future__ import annotations
 
+from dataclasses import dataclass
+
 from quantiphy import InvalidNumber, Quantity
 
 
-def parse_speed(d: dict, bytes_fieldname: str) -> str:
-    """Format download/process speed as a human-readable string."""
+@dataclass(frozen=True, slots=True)
+class ProgressSample:
+    """What one progress hook said, as the raw numbers it came with.
+
+    Nothing is parsed or formatted here: this is built on the worker thread, for
+    every hook call, and most samples are overwritten before anyone draws them.
+    """
+
+    # The status key `done` was read from: `downloaded_bytes` or `processed_bytes`.
+    bytes_fieldname: str
+    done: float | str | None
+    total: float | str | None
+    speed: float | None
+    progress_float: float | None
+    finished: bool
+    action: str | None = None
+    playlist_index: int | None = None
+    playlist_count: int | None = None
+
+    @classmethod
+    def from_status(cls, d: dict, bytes_fieldname: str) -> ProgressSample:
+        info = d.get("info_dict") or {}
+        return cls(
+            bytes_fieldname=bytes_fieldname,
+            done=d.get(bytes_fieldname),
+            total=d.get("total_bytes") or d.get("total_bytes_estimate"),
+            speed=d.get("speed"),
+            progress_float=d.get("progress_float"),
+            finished=d.get("status") == "finished",
+            action=d.get("action"),
+            playlist_index=info.get("playlist_autonumber") if isinstance(info, dict) else None,
+            playlist_count=info.get("n_entries") if isinstance(info, dict) else None,
+        )
+
+
+class ProgressSlot:
+    """The latest sample for one bar, left by a worker thread for the UI to draw.
+
+    `put` is one attribute store, and `take` starts with one load, so under the GIL
+    neither needs a lock. Samples the UI never got to are overwritten: only the
+    latest is worth drawing. `take` must only ever be called from the UI loop.
+    """
+
+    def __init__(self) -> None:
+        self._latest: ProgressSample | None = None
+        self._taken: ProgressSample | None = None
+
+    def put(self, sample: ProgressSample) -> None:
+        self._latest = sample
+
+    def take(self) -> ProgressSample | None:
+        """The latest sample, or None if it has already been taken."""
+        latest = self._latest
+        if latest is self._taken:
+            return None
+        self._taken = latest
+        return latest
+
+    def clear(self) -> None:
+        self._latest = self._taken = None
+
+
+def format_speed(raw_speed: float | None, bytes_fieldname: str) -> str:
+    """Format download/process speed as a human-readable string.
+
+    ffmpeg reports its speed in bits per second, downloaders in bytes.
+    """
     try:
-        raw_speed: float | None = d.get("speed")
         if not raw_speed:
             return "-"
         if bytes_fieldname == "downloaded_bytes":
@@ -16,6 +82,11 @@ def parse_speed(d: dict, bytes_fieldname: str) -> str:
         return "-"
 
 
+def parse_speed(d: dict, bytes_fieldname: str) -> str:
+    """Format download/process speed as a human-readable string."""
+    return format_speed(d.get("speed"), bytes_fieldname)
+
+
 def parse_quantity(value: float | str | None) -> Quantity | None:
     """Convert a raw byte value to a Quantity, or None if invalid."""
     if value is None:
@@ -0,0 +1,169 @@
+"""One thread for the pipes and timers of every child process.
+
+Each ffmpeg used to come with two threads blocked reading its stdout and stderr,
+and a loop waking every 50 ms to see what they had queued. Each FFmpegFD download
+added one more thread, waking every 100 ms to reread a progress file. Twenty jobs
+in flight made sixty threads, nearly all of them asleep.
+
+The reactor replaces them with one thread, started on first use, around a
+selector. A pipe is watched with `watch`: its bytes go to a callback as soon as
+they are there, and another callback runs once it is closed. Periodic work, like
+refreshing the elapsed time of a bar ffmpeg has not updated, is `call_every`.
+
+Callbacks run on the reactor thread, one at a time, so whatever state a watcher
+keeps needs no lock of its own. They must not block: everything else waits behind
+them. One that raises is logged and dropped, and the reactor carries on.
+
+Windows selectors only take sockets, not pipes. There `can_watch_pipes` is False,
+and pipes keep their reader threads (see core/ffmpeg_progress.py). Timers work
+everywhere: the reactor wakes itself through a socket pair.
+"""
+
+from __future__ import annotations
+
+import contextlib
+import heapq
+import itertools
+import logging
+import os
+import selectors
+import socket
+import sys
+import threading
+import time
+from collections.abc import Callable
+
+logger = logging.getLogger("videodl")
+
+_READ_SIZE = 65536
+
+can_watch_pipes = sys.platform != "win32"
+
+
+class Timer:
+    """A periodic call, stopped with `cancel`."""
+
+    def __init__(self, interval: float, callback: Callable[[], None]):
+        self.interval = interval
+        self.callback = callback
+        self.cancelled = False
+
+    def cancel(self) -> None:
+        self.cancelled = True
+
+
+class Reactor:
+    def __init__(self) -> None:
+        self._selector = selectors.DefaultSelector()
+        self._lock = threading.Lock()
+        # Registrations come from other threads. They are queued, and the reactor,
+        # woken through this socket pair, makes them itself between two selects.
+        self._wake_reader, self._wake_writer = socket.socketpair()
+        self._wake_reader.setblocking(False)
+        self._wake_writer.setblocking(False)
+        self._selector.register(self._wake_reader, selectors.EVENT_READ, None)
+        self._pending: list[Callable[[], object]] = []
+        self._timers: list[tuple[float, int, Timer]] = []
+        self._order = itertools.count()
+        self._thread: threading.Thread | None = None
+
+    def watch(self, fd: int, on_data: Callable[[bytes], None], on_close: Callable[[], None]) -> None:
+        """Call `on_data` with whatever `fd` yields, then `on_close` at end of file.
+
+        The reactor reads `fd` until the other end closes it, then unregisters it.
+        Closing `fd` is left to the caller, after `on_close`, or through `unwatch`
+        when it gives up waiting for the end.
+        """
+        if not can_watch_pipes:
+            raise OSError("pipes cannot be watched on this platform")
+        self._submit(lambda: self._selector.register(fd, selectors.EVENT_READ, (on_data, on_close)))
+
+    def unwatch(self, fd: int, then: Callable[[], None] | None = None) -> None:
+        """Stop watching `fd` if it still is, then call `then`, which may close it."""
+
+        def change() -> None:
+            with contextlib.suppress(KeyError, ValueError):
+                self._selector.unregister(fd)
+            if then is not None:
+                then()
+
+        self._submit(change)
+
+    def call_every(self, interval: float, callback: Callable[[], None]) -> Timer:
+        """Call `callback` every `interval` seconds, until the timer is cancelled."""
+        timer = Timer(interval, callback)
+        self._submit(lambda: self._schedule(timer))
+        return timer
+
+    def _schedule(self, timer: Timer) -> None:
+        heapq.heappush(self._timers, (time.monotonic() + timer.interval, next(self._order), timer))
+
+    def _submit(self, change: Callable[[], object]) -> None:
+        with self._lock:
+            self._pending.append(change)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="videodl-reactor", daemon=True)
+                self._thread.start()
+        with contextlib.suppress(BlockingIOError):
+            self._wake_writer.send(b"\0")
+
+    def _run(self) -> None:
+        while True:
+            with self._lock:
+                pending, self._pending = self._pending, []
+            for change in pending:
+                self._safely(change)
+
+            timeout = None
+            if self._timers:
+                timeout = max(0.0, self._timers[0][0] - time.monotonic())
+            for key, _ in self._selector.select(timeout):
+                if key.data is None:
+                    with contextlib.suppress(BlockingIOError):
+                        self._wake_reader.recv(4096)
+                    continue
+                self._read(key)
+            self._run_due_timers()
+
+    def _read(self, key: selectors.SelectorKey) -> None:
+        on_data, on_close = key.data
+        try:
+            data = os.read(key.fd, _READ_SIZE)
+        except OSError as e:
+            logger.debug(f"reactor: reading fd {key.fd} failed: {e}")
+            data = b""
+        if data:
+            self._safely(lambda: on_data(data))
+            return
+        self._selector.unregister(key.fd)
+        self._safely(on_close)
+
+    def _run_due_timers(self) -> None:
+        now = time.monotonic()
+        while self._timers and self._timers[0][0] <= now:
+            _, _, timer = heapq.heappop(self._timers)
+            if timer.cancelled:
+                continue
+            self._safely(timer.callback)
+            if not timer.cancelled:
+                self._schedule(timer)
+
+    @staticmethod
+    def _safely(callback: Callable[[], object]) -> None:
+        try:
+            callback()
+        except Exception:
+            logger.exception("reactor: a callback failed")
+
+
+_reactor: Reactor | None = None
+_reactor_lock = threading.Lock()
+
+
+def get_reactor() -> Reactor:
+    """The reactor every pipe and timer of the process shares."""
+    global _reactor
+    with _reactor_lock:
+        if _reactor is None:
+            _reactor = Reactor()
+        return _reactor
@@ -0,0 +1,144 @@
+"""How much of the machine each stage of a job may take.
+
+Every ffmpeg started here used to run at normal priority and pick its own thread
+count, which for libx265 is every core. One long encode was then enough to make the
+GUI stutter, and to starve the downloads running next to it of the CPU they need
+for TLS and for assembling fragments.
+
+A ResourcePolicy (core/config_types.py) says how a stage's processes run: how nice
+they are, at which I/O priority, on which CPUs, and with how many encoder threads.
+A job carries one per stage in DownloadConfig.resources, and whatever it leaves out
+gets the defaults below: encodes run niced and one core short of the machine,
+downloads run as before.
+
+core.download.download sets the job's policies for everything it runs, through a
+context variable, so that the code starting processes several calls down does not
+need them handed through every signature on the way. Threads started with a copy
+of the context (the extraction thread, parallel_formats' streams) see them too.
+
+Applying a policy is best effort. The I/O priority is set before the process
+runs: `command` has util-linux's ionice start it, which sets the priority and
+execs the command, so the process does no I/O at the wrong priority. The rest
+is set right after the process starts. A process that has already exited, or a
+platform without the knob, only costs a debug line: a job is never failed over
+its priority.
+"""
+
+from __future__ import annotations
+
+import contextlib
+import contextvars
+import functools
+import logging
+import os
+import shutil
+import subprocess
+import sys
+from collections.abc import Iterator, Mapping, Sequence
+
+from core.config_types import ResourcePolicy
+
+logger = logging.getLogger("videodl")
+
+ENCODE = "encode"
+DOWNLOAD = "download"
+STAGES = (ENCODE, DOWNLOAD)
+
+
+def default_policies() -> dict[str, ResourcePolicy]:
+    """What each stage gets when a job does not say otherwise."""
+    cpus = os.cpu_count() or 1
+    return {
+        # One core left to the GUI and the downloads, and the disk to whoever needs it first.
+        ENCODE: ResourcePolicy(nice=10, io_priority=7, threads=max(1, cpus - 1)),
+        DOWNLOAD: ResourcePolicy(),
+    }
+
+
+_policies: contextvars.ContextVar[Mapping[str, ResourcePolicy] | None] = contextvars.ContextVar(
+    "resource_policies", default=None
+)
+
+
+@contextlib.contextmanager
+def job_resources(policies: Mapping[str, ResourcePolicy] | None) -> Iterator[None]:
+    """Run what the block starts under `policies`, the defaults filling in missing stages."""
+    merged = {**default_policies(), **(policies or {})}
+    token = _policies.set(merged)
+    try:
+        yield
+    finally:
+        _policies.reset(token)
+
+
+def policy_for(stage: str) -> ResourcePolicy:
+    """The policy of `stage` for the job in progress, or the default outside of one."""
+    policies = _policies.get()
+    if policies is None:
+        policies = default_policies()
+    return policies.get(stage) or ResourcePolicy()
+
+
+def encoder_thread_args(policy: ResourcePolicy, encoder: str) -> list[str]:
+    """Output options holding `encoder` to the policy's thread budget."""
+    if not policy.threads:
+        return []
+    args = ["-threads", str(policy.threads)]
+    if encoder == "libx265":
+        # x265 sizes its own thread pools and ignores -threads for them.
+        args.extend(["-x265-params", f"pools={policy.threads}"])
+    elif encoder == "libsvtav1":
+        args.extend(["-svtav1-params", f"lp={policy.threads}"])
+    return args
+
+
+def popen_kwargs(policy: ResourcePolicy) -> dict:
+    """What Popen itself needs to start a process under `policy`.
+
+    Only Windows has anything to say here: its priority classes are set at creation.
+    Everywhere else the policy is applied once the process exists, by `apply`.
+    """
+    if sys.platform == "win32" and policy.nice > 0:
+        priority = subprocess.IDLE_PRIORITY_CLASS if policy.nice >= 15 else subprocess.BELOW_NORMAL_PRIORITY_CLASS
+        return {"creationflags": priority}
+    return {}
+
+
+def apply(pid: int, policy: ResourcePolicy) -> None:
+    """Put the running process `pid` under `policy`, as far as this platform allows, but for its I/O priority."""
+    if policy.nice and hasattr(os, "setpriority"):
+        try:
+            os.setpriority(os.PRIO_PROCESS, pid, policy.nice)
+        except OSError as e:
+            logger.debug(f"Could not renice {pid}: {e}")
+    if policy.cpus:
+        if hasattr(os, "sched_setaffinity"):
+            try:
+                os.sched_setaffinity(pid, policy.cpus)
+            except OSError as e:
+                logger.debug(f"Could not pin {pid} to CPUs {policy.cpus}: {e}")
+        else:
+            logger.debug(f"CPU affinity is not supported on {sys.platform}, {pid} runs anywhere")
+
+
+def command(args: Sequence, policy: ResourcePolicy | None) -> list:
+    """`args`, started under the I/O priority of `policy` where it has one to set.
+
+    The ioprio_set syscall has no wrapper in the standard library, and its number
+    differs between architectures. util-linux's ionice is everywhere that matters:
+    it sets the priority, ignoring a failure to, then execs `args` in its place.
+    """
+    if policy is None or policy.io_priority is None or not sys.platform.startswith("linux"):
+        return list(args)
+    ionice = _ionice()
+    if ionice is None:
+        return list(args)
+    return [ionice, "-c", "2", "-n", str(policy.io_priority), "-t", *args]
+
+
+@functools.cache
+def _ionice() -> str | None:
+    ionice = shutil.which("ionice")
+    if ionice is None:
+        logger.debug("ionice not found, processes keep their I/O priority")
+    return ionice
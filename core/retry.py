@@ -0,0 +1,253 @@
+"""Retry a job from where it failed, not from the start.
+
+A failed attempt used to be retried from scratch: `ydl.extract_info(url)` again,
+`BASE_BACKOFF * 2**attempt` seconds later. The webpage was fetched again, the JS
+challenges solved again, and a merge that had failed at the end downloaded its
+formats once more before it got to run again. Only stalls were retried: a 429 or a
+503, which a server sends to be retried, failed the job at once.
+
+An attempt is now two calls, and a Resume keeps what the first one got:
+
+  - extraction: `extract_info(url, download=False, process=False)`. Pages,
+    challenges, format URLs. Nothing is downloaded.
+  - processing: `process_ie_result(info, download=True)`. Picks the formats,
+    downloads them and runs the postprocessors.
+
+What the next attempt redoes follows the stage the last one failed in, as
+core/stall.py tells it:
+
+  - extract: everything.
+  - download: the extraction only when the format URLs have expired, or are
+    about to, or the server refused them (403, 410). Otherwise yt-dlp carries on
+    from the .part file, and a fragmented download from the fragments it has.
+  - postprocess: neither extraction nor download. yt-dlp finds the formats on
+    disk and runs the postprocessors over them again.
+
+A playlist is extracted again whatever the stage: its entries are read once, as
+they are downloaded. Those already downloaded are found on disk and skipped.
+
+Besides stalls, the errors a retry may fix are retried: a timeout, a dropped
+connection, HTTP 408, 425, 429 and 5xx, and a 403 or 410 refusing a download.
+Between attempts the job waits an exponential backoff with jitter, so that jobs
+failing together do not come back together, and at least the Retry-After the
+server sent. A Retry-After past MAX_RETRY_AFTER fails the job with its error.
+
+An attempt given up on while it still runs is told to stop by `Resume.hook`, at
+its next progress hook: the next attempt writes to the same .part. yt-dlp calls
+the hooks from threads of its own, fragment downloads among them, so no hook can
+tell which attempt it runs for. The next attempt starts once the one given up on
+has stopped, as `Resume.wait` tells, and until then every hook stops.
+
+core.download runs the attempts on a thread, core.aio as a task: both leave what
+follows a failed attempt to `after_attempt`.
+"""
+
+from __future__ import annotations
+
+import copy
+import email.utils
+import logging
+import random
+import re
+import threading
+import time
+
+from yt_dlp import YoutubeDL
+from yt_dlp.networking.exceptions import HTTPError, TransportError
+from yt_dlp.utils import DownloadCancelled as YtdlpDownloadCancelled
+
+from core.exceptions import DownloadCancelled, DownloadTimeout
+from core.stall import DOWNLOAD, EXTRACT, POSTPROCESS, StallDetector
+
+logger = logging.getLogger("videodl")
+
+MAX_RETRIES = 3
+BASE_BACKOFF = 5  # seconds, doubles each retry
+# Seconds a server may ask the job to wait before it is given up on.
+MAX_RETRY_AFTER = 300
+# Format URLs expiring within this many seconds are refreshed before a resume.
+EXPIRY_MARGIN = 60
+
+_TRANSIENT_STATUS = frozenset({408, 425, 429, 500, 502, 503, 504})
+_REFUSED_STATUS = frozenset({403, 410})
+# `expire=1700000000`, `Expires=...`, or `/expire/1700000000/` in a manifest's path.
+_EXPIRY = re.compile(r"[?&/]expires?[=/](\d{10})\b", re.IGNORECASE)
+
+
+class Resume:
+    """What a job's attempts have got so far, and what the next one should redo."""
+
+    def __init__(self, url: str):
+        self.url = url
+        # The stage the next attempt starts in.
+        self.stage = EXTRACT
+        self._info: dict | None = None
+        self._abandoned = threading.Event()
+        self._idle = threading.Event()
+        self._idle.set()
+
+    def run(self, ydl: YoutubeDL) -> dict | None:
+        """One attempt: extract if needed, then download and postprocess. The last one must have ended."""
+        self._abandoned.clear()
+        self._idle.clear()
+        try:
+            return self._run(ydl)
+        finally:
+            self._idle.set()
+
+    def _run(self, ydl: YoutubeDL) -> dict | None:
+        if self._info is None:
+            self._info = ydl.extract_info(self.url, download=False, process=False)
+        if self._info is None:
+            return None
+        if self._info.get("_type", "video") != "video":
+            info, self._info = self._info, None
+            return ydl.process_ie_result(info, download=True)
+        try:
+            # yt-dlp fills in what it processes: the next attempt starts from the extraction's.
+            info = copy.deepcopy(self._info)
+        except (TypeError, copy.Error):
+            info, self._info = self._info, None
+        return ydl.process_ie_result(info, download=True)
+
+    def abandon(self) -> None:
+        """Give up on the attempt running, which stops at its next progress hook."""
+        self._abandoned.set()
+
+    def wait(self, timeout: float) -> bool:
+        """Wait up to `timeout` seconds for the attempt running to end. Returns whether none runs."""
+        return self._idle.wait(timeout)
+
+    def hook(self, d: dict) -> None:
+        """A progress hook stopping the attempt given up on, on whichever thread yt-dlp calls it."""
+        if self._abandoned.is_set():
+            raise YtdlpDownloadCancelled
+
+    def prepare(self, stage: str, error: BaseException | None) -> str:
+        """Set what the next attempt redoes, after one that failed in `stage`. Returns what it does, for the log."""
+        if self._info is None or stage == EXTRACT:
+            self._info = None
+            self.stage = EXTRACT
+            return "extracting it again"
+        if stage == POSTPROCESS:
+            self.stage = POSTPROCESS
+            return "postprocessing what it downloaded again"
+        if _status(error) in _REFUSED_STATUS or expires(self._info) < time.time() + EXPIRY_MARGIN:
+            self._info = None
+            self.stage = EXTRACT
+            return "refreshing its format URLs"
+        self.stage = DOWNLOAD
+        return "resuming its download"
+
+
+def after_attempt(
+    resume: Resume, stall: StallDetector, attempt: int, url: str, error: BaseException | None, running: bool
+) -> float:
+    """The seconds to wait before the attempt after `attempt`, which failed with `error` or was left `running`.
+
+    Raises what ends the job instead: a DownloadCancelled for a cancel, the error
+    itself when a retry would not fix it or the server asks for too long a wait, and
+    once the last attempt has failed, its error, or a DownloadTimeout if it stalled.
+    """
+    stalled = running or (error is not None and stall.is_stalled())
+    if isinstance(error, YtdlpDownloadCancelled) and not stalled:
+        raise DownloadCancelled from None
+    if error is not None and not stalled and not retryable(error, stall.stage):
+        raise error
+    last_exc = error or TimeoutError(f"stalled for {stall.budget}s on {url}")
+    if attempt + 1 == MAX_RETRIES:
+        if stalled:
+            raise DownloadTimeout(url) from last_exc
+        raise last_exc
+    wait = delay(attempt, last_exc)
+    if wait is None:
+        raise last_exc
+    what = resume.prepare(stall.stage, last_exc)
+    logger.warning(
+        "Attempt %d/%d of %s failed in its %s (%s), %s in %.0fs",
+        attempt + 1,
+        MAX_RETRIES,
+        url,
+        stall.stage,
+        "stalled" if stalled else last_exc,
+        what,
+        wait,
+    )
+    return wait
+
+
+def retryable(error: BaseException, stage: str) -> bool:
+    """Whether a retry may fix `error`, raised in `stage`.
+
+    A timeout, a dropped connection, a server busy or failing may pass. So may a
+    download refused, once its format URLs are refreshed.
+    """
+    for exc in _causes(error):
+        if isinstance(exc, HTTPError):
+            return exc.status in _TRANSIENT_STATUS or (stage == DOWNLOAD and exc.status in _REFUSED_STATUS)
+        if isinstance(exc, TransportError | TimeoutError | ConnectionError):
+            return True
+    return False
+
+
+def delay(attempt: int, error: BaseException | None = None) -> float | None:
+    """Seconds to wait before the retry after `attempt`, None when the server asks for longer than is worth it."""
+    backoff = BASE_BACKOFF * (2**attempt)
+    # Equal jitter: at least half the backoff, spread over the other half.
+    wait = backoff / 2 + random.uniform(0, backoff / 2)
+    asked = retry_after(error) if error is not None else None
+    if asked is None:
+        return wait
+    if asked > MAX_RETRY_AFTER:
+        return None
+    return max(wait, asked)
+
+
+def retry_after(error: BaseException) -> float | None:
+    """The seconds a Retry-After header of the HTTP error behind `error` asks for."""
+    for exc in _causes(error):
+        if isinstance(exc, HTTPError):
+            value = exc.response.headers.get("Retry-After")
+            if value is None:
+                return None
+            value = value.strip()
+            if value.isdigit():
+                return float(value)
+            try:
+                when = email.utils.parsedate_to_datetime(value)
+            except (TypeError, ValueError):
+                return None
+            return max(0.0, when.timestamp() - time.time())
+    return None
+
+
+def expires(info: dict) -> float:
+    """When the first format URL of `info` expires, as a timestamp. Infinity when none says."""
+    urls = [info.get("url"), info.get("manifest_url")]
+    for fmt in info.get("formats") or ():
+        urls += [fmt.get("url"), fmt.get("manifest_url"), fmt.get("fragment_base_url")]
+    times = [int(m.group(1)) for url in urls if isinstance(url, str) for m in _EXPIRY.finditer(url)]
+    return min(times, default=float("inf"))
+
+
+def _status(error: BaseException | None) -> int | None:
+    for exc in _causes(error):
+        if isinstance(exc, HTTPError):
+            return exc.status
+    return None
+
+
+def _causes(error: BaseException | None):
+    """`error`, and what it wraps: yt-dlp keeps the original in `exc_info`, Python in __cause__ and __context__."""
+    seen: set[int] = set()
+    todo = [error]
+    while todo:
+        exc = todo.pop(0)
+        if exc is None or id(exc) in seen:
+            continue
+        seen.add(id(exc))
+        yield exc
+        exc_info = getattr(exc, "exc_info", None)
+        if isinstance(exc_info, tuple) and len(exc_info) > 1 and isinstance(exc_info[1], BaseException):
+            todo.append(exc_info[1])
+        todo += [exc.__cause__, exc.__context__]
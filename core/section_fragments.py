@@ -0,0 +1,368 @@
+"""Download only the segments a trim needs, in parallel, then cut.
+
+When the user trims a video (`core/ydl_opts.py` sets `download_ranges`), yt-dlp hands
+the whole download to ffmpeg through `FFmpegFD`. For an HLS or DASH format that means
+one ffmpeg reading the manifest segment after segment, on one connection, ignoring
+`concurrent_fragment_downloads` entirely. Ten minutes out of a four hour VOD then
+downloads at a fraction of the speed the same VOD does untrimmed.
+
+The manifest already says where every segment sits in time, so this does what ffmpeg
+cannot: it keeps the segments that overlap the requested range, hands them to
+yt-dlp's own fragment downloaders (HlsFD, DashSegmentsFD), which fetch them in
+parallel, and only then runs ffmpeg, on local files, to cut the range precisely.
+
+  HLS   the media playlist is fetched and trimmed to the segments in range, and HlsFD
+        is given the trimmed text through `hls_media_playlist_data`
+  DASH  the `fragments` list already carries a duration per segment, it is sliced
+
+Anything this cannot plan for (a live stream, a master playlist, a segment with no
+duration, ad markers, output to stdout) goes to ffmpeg exactly as before. The same
+goes for a manifest we fail to fetch: the fallback is the download that always worked.
+
+Like the other patches here it is guarded, and it has to be installed after
+core/ffmpegfd_progress.py, whose `_call_downloader` it wraps so that the ffmpeg runs
+it falls back to still report progress. tests/test_section_fragments.py checks the
+seams against the installed yt-dlp.
+"""
+
+from __future__ import annotations
+
+import contextlib
+import logging
+import os
+import re
+import subprocess
+from dataclasses import dataclass
+
+from core import resources
+from core.ffmpeg_progress import FFmpegProgressTracker
+
+logger = logging.getLogger("videodl")
+
+_installed = False
+
+_HLS_PROTOCOLS = ("m3u8", "m3u8_native")
+_DASH_PROTOCOLS = ("http_dash_segments",)
+
+# Tags that make a playlist something we would rather leave to ffmpeg: a master
+# playlist has no segments of its own, and ad markers make HlsFD skip segments, which
+# shifts every timestamp after them.
+_HLS_UNPLANNABLE = re.compile(r"#EXT-X-STREAM-INF|#ANVATO-SEGMENT-INFO|#UPLYNK-SEGMENT")
+_EXTINF = re.compile(r"#EXTINF:\s*(?P<duration>[\d.]+)")
+
+
+@dataclass(frozen=True, slots=True)
+class HlsSection:
+    """A media playlist trimmed to the segments overlapping a range."""
+
+    playlist: str
+    # Where the first kept segment starts in the original timeline, in seconds.
+    starts_at: float
+
+
+@dataclass(frozen=True, slots=True)
+class DashSection:
+    """A DASH fragment list sliced to the fragments overlapping a range."""
+
+    fragments: list
+    starts_at: float
+
+
+def _overlaps(seg_start: float, seg_end: float, start: float, end: float | None) -> bool:
+    return seg_end > start and (end is None or seg_start < end)
+
+
+def trim_hls_playlist(playlist: str, start: float, end: float | None) -> HlsSection | None:
+    """Keep only the media segments of `playlist` that overlap [start, end).
+
+    Every tag is kept as is, so keys, init segments and discontinuities still apply to
+    the segments that follow them. What changes: `#EXT-X-MEDIA-SEQUENCE` points at the
+    first kept segment (AES-128 derives its IV from it), and byte ranges are written
+    with an explicit offset, since the segment they were implicitly relative to may
+    be gone. Returns None when the playlist is not one we can plan a trim for.
+    """
+    if _HLS_UNPLANNABLE.search(playlist) or "#EXT-X-ENDLIST" not in playlist:
+        return None
+
+    lines = [line.strip() for line in playlist.splitlines() if line.strip()]
+
+    # First pass: where every segment sits in time and in the byte stream.
+    segments: list[tuple[float, float, str | None]] = []  # (start, end, explicit byte range)
+    media_sequence = 0
+    elapsed = 0.0
+    duration: float | None = None
+    byte_range: str | None = None
+    byte_offset = 0
+    for line in lines:
+        if line.startswith("#EXT-X-MEDIA-SEQUENCE:"):
+            media_sequence = int(line.partition(":")[2])
+        elif line.startswith("#EXTINF"):
+            match = _EXTINF.match(line)
+            if not match:
+                return None
+            duration = float(match.group("duration"))
+        elif line.startswith("#EXT-X-BYTERANGE:"):
+            length, _, offset = line.partition(":")[2].partition("@")
+            begin = int(offset) if offset else byte_offset
+            byte_range = f"#EXT-X-BYTERANGE:{length}@{begin}"
+            byte_offset = begin + int(length)
+        elif not line.startswith("#"):
+            if duration is None:
+                return None
+            segments.append((elapsed, elapsed + duration, byte_range))
+            elapsed += duration
+            duration, byte_range = None, None
+
+    kept = [i for i, (seg_start, seg_end, _) in enumerate(segments) if _overlaps(seg_start, seg_end, start, end)]
+    if not kept:
+        return None
+    first, last = kept[0], kept[-1]
+
+    # Second pass: write the trimmed playlist.
+    out: list[str] = []
+    index = 0
+    pending: list[str] = []
+    wrote_sequence = False
+    for line in lines:
+        if line.startswith("#EXT-X-MEDIA-SEQUENCE:"):
+            out.append(f"#EXT-X-MEDIA-SEQUENCE:{media_sequence + first}")
+            wrote_sequence = True
+        elif line.startswith(("#EXTINF", "#EXT-X-BYTERANGE:")):
+            # Belongs to the next segment: written with it, or dropped with it.
+            pending.append(line)
+        elif line.startswith("#"):
+            out.append(line)
+        else:
+            if first <= index <= last:
+                explicit = segments[index][2]
+                out.extend(explicit if p.startswith("#EXT-X-BYTERANGE:") and explicit else p for p in pending)
+                out.append(line)
+            pending = []
+            index += 1
+
+    if not wrote_sequence and first:
+        out.insert(1, f"#EXT-X-MEDIA-SEQUENCE:{media_sequence + first}")
+    return HlsSection(playlist="\n".join(out) + "\n", starts_at=segments[first][0])
+
+
+def slice_dash_fragments(fragments: object, start: float, end: float | None) -> DashSection | None:
+    """Keep the initialization fragments and the media fragments overlapping [start, end).
+
+    Initialization fragments lead the list and carry no duration. Any media fragment
+    without one means the timeline is unknown, and the slice cannot be planned.
+    """
+    if not isinstance(fragments, list):
+        # A generator, as for --live-from-start, cannot be measured up front.
+        return None
+
+    init: list = []
+    media: list = []
+    starts_at: float | None = None
+    elapsed = 0.0
+    for fragment in fragments:
+        duration = fragment.get("duration")
+        if duration is None:
+            if media or elapsed:
+                return None
+            init.append(fragment)
+            continue
+        if _overlaps(elapsed, elapsed + duration, start, end):
+            if starts_at is None:
+                starts_at = elapsed
+            media.append(fragment)
+        elapsed += duration
+
+    if starts_at is None:
+        return None
+    return DashSection(fragments=init + media, starts_at=starts_at)
+
+
+def install() -> bool:
+    """Make trimmed HLS/DASH downloads fetch only their segments, in parallel. Idempotent."""
+    global _installed
+    if _installed:
+        return True
+
+    try:
+        from yt_dlp.downloader import external as external_fd
+        from yt_dlp.downloader.dash import DashSegmentsFD
+        from yt_dlp.downloader.hls import HlsFD
+        from yt_dlp.postprocessor.ffmpeg import EXT_TO_OUT_FORMATS, FFmpegPostProcessor
+    except ImportError as e:
+        logger.warning(f"yt-dlp has moved: trimmed streams will download through ffmpeg alone ({e})")
+        return False
+
+    fd_class = getattr(external_fd, "FFmpegFD", None)
+    original_call = getattr(fd_class, "_call_downloader", None)
+    if not (
+        fd_class and original_call and hasattr(HlsFD, "real_download") and hasattr(DashSegmentsFD, "real_download")
+    ):
+        logger.warning("yt-dlp has moved: trimmed streams will download through ffmpeg alone")
+        return False
+
+    downloaders = {"hls": HlsFD, "dash": DashSegmentsFD}
+
+    def _call_downloader(self, tmpfilename, info_dict):
+        plan = _plan(self, tmpfilename, info_dict, HlsFD)
+        if plan is None:
+            return original_call(self, tmpfilename, info_dict)
+        return _download_sections(
+            self, tmpfilename, info_dict, plan, downloaders, EXT_TO_OUT_FORMATS, FFmpegPostProcessor
+        )
+
+    fd_class._call_downloader = _call_downloader
+    _installed = True
+    logger.debug("segment-aware trimmed downloads installed")
+    return True
+
+
+def _plan(downloader, tmpfilename: str, info_dict: dict, hls_class) -> list[tuple[str, dict, float]] | None:
+    """Per requested format: (fragment downloader kind, format info to hand it, where it starts).
+
+    None means leave the whole download to ffmpeg.
+    """
+    start = float(info_dict.get("section_start") or 0)
+    end = info_dict.get("section_end")
+    if (not start and end is None) or tmpfilename == "-" or info_dict.get("is_live"):
+        return None
+
+    formats = info_dict.get("requested_formats") or [info_dict]
+    plan = []
+    for fmt in formats:
+        fmt_info = {key: value for key, value in info_dict.items() if key != "requested_formats"}
+        fmt_info.update(fmt)
+        protocol = fmt_info.get("protocol")
+        if protocol in _HLS_PROTOCOLS and fmt_info.get("format_index") is None:
+            section = _fetch_hls_section(downloader, fmt_info, start, end, hls_class)
+            if section is None:
+                return None
+            fmt_info.update({"protocol": "m3u8_native", "hls_media_playlist_data": section.playlist})
+            plan.append(("hls", fmt_info, section.starts_at))
+        elif protocol in _DASH_PROTOCOLS:
+            dash = slice_dash_fragments(fmt_info.get("fragments"), start, end)
+            if dash is None:
+                return None
+            fmt_info["fragments"] = dash.fragments
+            plan.append(("dash", fmt_info, dash.starts_at))
+        else:
+            return None
+    return plan
+
+
+def _fetch_hls_section(downloader, fmt_info: dict, start: float, end: float | None, hls_class) -> HlsSection | None:
+    """Fetch a media playlist and trim it, or None to leave the format to ffmpeg."""
+    playlist = fmt_info.get("hls_media_playlist_data")
+    if not playlist:
+        try:
+            fetcher = hls_class(downloader.ydl, downloader.params)
+            with downloader.ydl.urlopen(fetcher._prepare_url(fmt_info, fmt_info["url"])) as response:
+                # Segments are relative to where the playlist really is, after redirects.
+                fmt_info["url"] = response.url
+                playlist = response.read().decode("utf-8", "ignore")
+        except Exception as e:
+            # ffmpeg will fetch it again on its own. Worst case is the old, slow path.
+            logger.debug(f"could not fetch the playlist to trim it, leaving it to ffmpeg: {e}")
+            return None
+    if hls_class._has_drm(playlist):
+        return None
+    return trim_hls_playlist(playlist, start, end)
+
+
+def section_cut_args(
+    ffmpeg: str,
+    inputs: list[tuple[str, float]],
+    length: float | None,
+    *,
+    reencode: bool,
+    out_format: str | None,
+) -> list[str]:
+    """The ffmpeg arguments that cut the downloaded segments down to the exact range.
+
+    Each input is (path, seconds to skip into it): formats with different segment
+    lengths start at different points before the range, so each gets its own seek.
+    Without `reencode` the cut is a stream copy and lands on a keyframe, exactly like
+    upstream's own ffmpeg path does when `force_keyframes_at_cuts` is off.
+    """
+    args = [ffmpeg, "-y", "-hide_banner"]
+    for path, offset in inputs:
+        if offset > 0:
+            args += ["-ss", f"{offset:.3f}"]
+        args += ["-i", path]
+    if length is not None:
+        args += ["-t", f"{length:.3f}"]
+    if not reencode:
+        args += ["-c", "copy"]
+    for i in range(len(inputs)):
+        # Optional maps: a video-only and an audio-only input each contribute what they have.
+        args += ["-map", f"{i}:v?", "-map", f"{i}:a?"]
+    if out_format:
+        args += ["-f", out_format]
+    return args
+
+
+def _download_sections(downloader, tmpfilename, info_dict, plan, downloaders, ext_to_out_formats, ffpp_class):
+    """Fetch each format's segments through yt-dlp's fragment downloaders, then cut."""
+    start = float(info_dict.get("section_start") or 0)
+    end = info_dict.get("section_end")
+    inputs: list[tuple[str, float]] = []
+    try:
+        for i, (kind, fmt_info, starts_at) in enumerate(plan):
+            part = f"{tmpfilename}.section{i}"
+            # Where the range starts, relative to where this format's first kept segment does.
+            inputs.append((part, start - starts_at))
+            fd = downloaders[kind](downloader.ydl, downloader.params)
+            for hook in downloader._progress_hooks:
+                fd.add_progress_hook(hook)
+            downloader.to_screen(f"[section] Downloading the segments in range of format {fmt_info.get('format_id')}")
+            if not fd.real_download(part, fmt_info):
+                return 1
+
+        ffpp = ffpp_class(downloader=downloader)
+        length = end - start if end is not None else None
+        args = section_cut_args(
+            ffpp.executable,
+            inputs,
+            length,
+            reencode=bool(downloader.params.get("force_keyframes_at_cuts")),
+            out_format=ext_to_out_formats.get(info_dict["ext"], info_dict["ext"]),
+        )
+        args.append(ffpp._ffmpeg_filename_argument(tmpfilename))
+        downloader._debug_cmd(args)
+        return _cut(downloader, args, info_dict, inputs, length)
+    finally:
+        for part, _ in inputs:
+            for leftover in (part, f"{part}.part", f"{part}.ytdl"):
+                with contextlib.suppress(OSError):
+                    os.remove(leftover)
+
+
+def _cut(downloader, args: list[str], info_dict: dict, inputs: list[tuple[str, float]], length: float | None) -> int:
+    """Run the cut, reporting on the download bar: to the user this is still the download."""
+
+    def on_progress(status: dict) -> None:
+        downloader._hook_progress(status, info_dict)
+
+    # What was downloaded runs from a little before the range to its end. The tracker
+    # reads the seek flags back out of `args` and measures progress against the range.
+    lead_in = inputs[-1][1]
+    if length is not None:
+        duration = lead_in + length
+    else:
+        duration = float(info_dict.get("duration") or 0) - float(info_dict.get("section_start") or 0) + lead_in
+    tracker = FFmpegProgressTracker(
+        args,
+        on_progress,
+        duration=max(duration, 0),
+        total_bytes=sum(os.path.getsize(part) for part, _ in inputs if os.path.isfile(part)),
+        filename=info_dict.get("_filename") or "",
+        stdin=subprocess.PIPE,
+        bytes_key="downloaded_bytes",
+        status="downloading",
+        policy=resources.policy_for(resources.DOWNLOAD),
+        stage=resources.DOWNLOAD,
+    )
+    _, stderr, returncode = tracker.run()
+    if returncode:
+        last_line = stderr.strip().splitlines()[-1:] or [""]
+        downloader.report_error(f"ffmpeg could not cut the downloaded segments: {last_line[0]}")
+    return returncode
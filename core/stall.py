@@ -0,0 +1,136 @@
+"""Tell a job that has stopped from one that is only quiet.
+
+The stall check used to give every attempt one budget, 120 seconds, reset by any
+progress hook and any debug line of yt-dlp's logger. Both ways round that was
+wrong. A merge of a long video into a container reports nothing until it is done,
+and reading cookies out of a large browser profile logs nothing while it works:
+healthy, and stopped. A download wedged on a dead connection keeps logging
+fragment retries: hung, and left alone.
+
+A StallDetector follows the stage an attempt is in, and gives each its own budget:
+
+  - extract: fetching pages, cookies, solving challenges. yt-dlp's log is all
+    there is to go by here, so every debug line counts, and the budget is long.
+  - download: from the first progress hook on. A hook counts only when it brings
+    bytes or a fragment the last one had not, and the log no longer counts.
+  - postprocess: from the first postprocessor hook on: merging, remuxing,
+    embedding. A hook counts when its status or its bytes move.
+
+Whatever the stage, what the job actually does counts too, read each time the
+detector is asked:
+
+  - the files the hooks name growing: the .part being downloaded, the file a
+    postprocessor writes.
+  - the bytes the job's processes move, read from /proc/<pid>/io by
+    core/supervisor.py: aria2c's sockets, ffmpeg's input and output.
+
+yt-dlp's own downloader reads its sockets in this process, whose bytes are every
+job's at once. Those show as hook bytes and as its .part growing.
+"""
+
+from __future__ import annotations
+
+import os
+import threading
+import time
+from collections.abc import Mapping
+
+from core.supervisor import JobProcesses
+
+EXTRACT = "extract"
+DOWNLOAD = "download"
+POSTPROCESS = "postprocess"
+
+# Seconds each stage may go without activity before the attempt is given up on.
+BUDGETS = {EXTRACT: 300, DOWNLOAD: 60, POSTPROCESS: 300}
+
+# Past this many, the oldest watched file is let go.
+_MAX_FILES = 8
+
+
+class StallDetector:
+    """Whether an attempt has gone longer than its stage's budget without activity. Thread safe."""
+
+    def __init__(self, budgets: Mapping[str, float] | None = None, processes: JobProcesses | None = None):
+        self._budgets = {**BUDGETS, **(budgets or {})}
+        self._processes = processes
+        self._lock = threading.Lock()
+        self._stage = EXTRACT
+        self._last_activity = time.monotonic()
+        # Path -> size last seen, and what the last hook said of each file.
+        self._files: dict[str, int] = {}
+        self._progress: dict[str, tuple] = {}
+        self._io_bytes = 0
+
+    @property
+    def stage(self) -> str:
+        return self._stage
+
+    @property
+    def budget(self) -> float:
+        return self._budgets[self._stage]
+
+    def restart(self, stage: str = EXTRACT) -> None:
+        """A new attempt, starting in `stage`, with a full budget."""
+        with self._lock:
+            self._stage = stage
+            self._files.clear()
+            self._progress.clear()
+            self._last_activity = time.monotonic()
+
+    def on_log(self, msg: str) -> None:
+        """A debug line of yt-dlp's logger."""
+        with self._lock:
+            if self._stage == EXTRACT:
+                self._last_activity = time.monotonic()
+
+    def on_progress(self, d: dict) -> None:
+        """A progress hook of yt-dlp's downloaders."""
+        self._on_hook(DOWNLOAD, d.get("tmpfilename") or d.get("filename"), d, "downloaded_bytes", "fragment_index")
+
+    def on_postprocess(self, d: dict) -> None:
+        """A postprocessor hook of yt-dlp's."""
+        info = d.get("info_dict")
+        path = info.get("filepath") if isinstance(info, dict) else None
+        self._on_hook(POSTPROCESS, path, d, "postprocessor", "processed_bytes")
+
+    def is_stalled(self) -> bool:
+        """Whether the stage has had no activity within its budget, looking at the job's I/O first."""
+        with self._lock:
+            if self._io_moved():
+                self._last_activity = time.monotonic()
+            return (time.monotonic() - self._last_activity) > self._budgets[self._stage]
+
+    def _on_hook(self, stage: str, path: str | None, d: dict, *keys: str) -> None:
+        progress = (d.get("status"), *(d.get(key) for key in keys))
+        key = path or ""
+        with self._lock:
+            self._stage = stage
+            if self._progress.get(key) != progress:
+                self._progress[key] = progress
+                self._last_activity = time.monotonic()
+            if path and path not in self._files:
+                if len(self._files) >= _MAX_FILES:
+                    del self._files[next(iter(self._files))]
+                self._files[path] = _size(path)
+
+    def _io_moved(self) -> bool:
+        moved = False
+        for path, size in self._files.items():
+            now = _size(path)
+            if now != size:
+                self._files[path] = now
+                moved = True
+        if self._processes is not None:
+            io_bytes = self._processes.io_bytes()
+            if io_bytes != self._io_bytes:
+                self._io_bytes = io_bytes
+                moved = True
+        return moved
+
+
+def _size(path: str) -> int:
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return -1
@@ -0,0 +1,309 @@
+"""Encode a progressive download while it is still downloading.
+
+Without this the encode waits for the download: the whole file lands on disk, and
+only then does ffmpeg open it. For a single progressive stream (one file, video and
+audio together, fetched over plain HTTP) there is no need to wait. yt-dlp writes it
+front to back, so ffmpeg can read it as it grows, and the encode finishes a moment
+after the download instead of a whole encode later.
+
+The encoder follows yt-dlp's progress hooks. On the first `downloading` status of a
+file worth encoding it starts ffmpeg reading stdin, and a thread that tails the
+`.part` file into it. yt-dlp renaming the file when it is done does not disturb the
+tail: the file is already open. post_download then asks `finish()` whether the
+streamed encode produced the file. Whenever it did not, for whatever reason, the
+file is still there, and the usual encode runs on it as if none of this happened.
+
+It only takes downloads it can follow byte for byte:
+
+  - one format, through yt-dlp's own HTTP downloader (aria2c preallocates the file,
+    and segmented formats are not written in order)
+  - no trim, no postprocessor that rewrites the file after the download
+  - a job that reencodes something: a plain remux is quick enough once the file is
+    there, and ffmpeg can remux only what it can seek in
+  - POSIX, where a file that is open can still be renamed
+
+An mp4 whose index sits at the end cannot be decoded from a pipe. ffmpeg then fails,
+and that download falls back like any other.
+"""
+
+from __future__ import annotations
+
+import contextlib
+import contextvars
+import io
+import logging
+import os
+import subprocess
+import threading
+import time
+from typing import TYPE_CHECKING, BinaryIO, cast
+
+from core import resources
+from core.encode import ffmpeg_video_command, output_ext, resolve_target
+from core.ffmpeg_progress import FFmpegProgressTracker
+from i18n.lang import GuiField, get_text
+
+if TYPE_CHECKING:
+    from yt_dlp import YoutubeDL
+
+    from core.callbacks import CancelToken, ProgressCallback
+
+logger = logging.getLogger("videodl")
+
+_CHUNK_SIZE = 1 << 20
+_TAIL_INTERVAL = 0.05
+# How long the tail waits for ffmpeg to start before it gives the encode up.
+_START_TIMEOUT = 30
+
+# yt-dlp reports codecs the way manifests name them, ffprobe the way ffmpeg does.
+_CODEC_TAG_TO_NAME = {"hvc1": "hevc", "hev1": "hevc", "vp09": "vp9", "av01": "av1"}
+
+
+def codec_name(codec: str | None) -> str:
+    """ffprobe's name for a codec as yt-dlp reports it: `avc1.64001F` is `avc1`."""
+    tag = (codec or "na").lower().split(".")[0]
+    return _CODEC_TAG_TO_NAME.get(tag, tag)
+
+
+class _Job:
+    """One file being encoded as it downloads."""
+
+    def __init__(self, filename: str, source: BinaryIO, output: str, tracker: FFmpegProgressTracker):
+        self.filename = filename
+        # Opened while yt-dlp is still writing it, so that renaming it later does not matter.
+        self.source = source
+        self.output = output
+        self.tracker = tracker
+        self.final_size: int | None = None
+        self.downloaded = 0
+        self.failed = threading.Event()
+        self.returncode: int | None = None
+        self.threads: list[threading.Thread] = []
+
+    def abort(self, reason: str) -> None:
+        if not self.failed.is_set():
+            logger.debug(f"streamed encode of {self.filename} abandoned: {reason}")
+        self.failed.set()
+        proc = self.tracker.proc
+        if proc and proc.poll() is None:
+            proc.kill()
+
+
+class StreamingEncoder:
+    """A yt-dlp progress hook that encodes progressive downloads as they arrive.
+
+    Register `hook` with the YoutubeDL, then call `finish()` with the downloaded
+    file's path: True means it has already been encoded in place.
+    """
+
+    def __init__(
+        self,
+        ydl: YoutubeDL,
+        target_vcodec: str,
+        cancel: CancelToken,
+        progress_cb: ProgressCallback,
+        ff_path: dict[str, str],
+        *,
+        speed_tier: str = "balanced",
+    ):
+        self._ydl = ydl
+        self._speed_tier = speed_tier
+        self._target_vcodec = target_vcodec
+        self._cancel = cancel
+        self._progress_cb = progress_cb
+        self._ff_path = ff_path
+        # Taken now, on the job's thread: the hook runs on yt-dlp's.
+        self._policy = resources.policy_for(resources.ENCODE)
+        self._jobs: dict[str, _Job] = {}
+        # Files already looked at and turned down, so each is only judged once.
+        self._declined: set[str] = set()
+        self._lock = threading.Lock()
+
+    def hook(self, d: dict) -> None:
+        filename = d.get("filename")
+        if not filename:
+            return
+        key = os.path.abspath(filename)
+        with self._lock:
+            job = self._jobs.get(key)
+            if job is None and key not in self._declined and d.get("status") == "downloading":
+                job = self._start(d)
+                if job is None:
+                    self._declined.add(key)
+                else:
+                    self._jobs[key] = job
+        if job is not None:
+            self._observe(job, d)
+
+    def finish(self, path: str) -> bool:
+        """Wait for the streamed encode of `path`. True if it replaced the file."""
+        with self._lock:
+            job = self._jobs.pop(os.path.abspath(path), None)
+        if job is None:
+            return False
+        if job.final_size is None:
+            job.abort("the download never finished")
+        for thread in job.threads:
+            thread.join()
+
+        if job.failed.is_set() or job.returncode != 0 or self._cancel.is_cancelled() or not os.path.isfile(path):
+            if os.path.isfile(job.output):
+                os.remove(job.output)
+            return False
+        os.remove(path)
+        os.rename(src=job.output, dst=os.path.splitext(path)[0] + os.path.splitext(job.output)[1])
+        return True
+
+    def close(self) -> None:
+        """Stop whatever encode nobody came to `finish()`, and remove what it wrote."""
+        with self._lock:
+            jobs = list(self._jobs.values())
+            self._jobs.clear()
+        for job in jobs:
+            job.abort("the download ended without it")
+            for thread in job.threads:
+                thread.join()
+            if os.path.isfile(job.output):
+                os.remove(job.output)
+
+    def _start(self, d: dict) -> _Job | None:
+        info = d.get("info_dict") or {}
+        part_path = d.get("tmpfilename")
+        if not part_path or not self._can_follow(info, part_path):
+            return None
+
+        vcodec, acodec = codec_name(info.get("vcodec")), codec_name(info.get("acodec"))
+        acodec_nle_friendly, vcodec_is_target, target_vcodec = resolve_target(self._target_vcodec, vcodec, acodec)
+        if acodec_nle_friendly and vcodec_is_target:
+            return None
+
+        filename = d["filename"]
+        output = f"{os.path.splitext(filename)[0]}.tmp{output_ext(target_vcodec)}"
+        min_dimension = min(info.get("width") or 0, info.get("height") or 0)
+        try:
+            cmd = ffmpeg_video_command(
+                "pipe:0",
+                output,
+                acodec_nle_friendly,
+                vcodec_is_target,
+                min_dimension,
+                target_vcodec,
+                self._ff_path,
+                speed_tier=self._speed_tier,
+            )
+        except Exception as e:
+            # This runs in yt-dlp's progress hook: raising would fail the download.
+            # The usual encode runs after it instead, and reports the error if it has it too.
+            logger.debug(f"cannot build the encode of {filename}, not streaming it: {e}")
+            return None
+        action = get_text(GuiField.ff_reencode)
+
+        def on_progress(status: dict) -> None:
+            if self._cancel.is_cancelled():
+                job.abort("cancelled")
+                return
+            status["action"] = action
+            self._progress_cb.on_process_progress(status)
+
+        tracker = FFmpegProgressTracker(
+            cmd,
+            on_progress,
+            duration=float(info.get("duration") or 0),
+            total_bytes=int(info.get("filesize") or info.get("filesize_approx") or 0),
+            filename=output,
+            stdin=subprocess.PIPE,
+            policy=self._policy,
+        )
+        try:
+            source = open(part_path, "rb")  # noqa: SIM115 - closed by the tail thread
+        except OSError as e:
+            logger.debug(f"cannot follow {part_path}, not streaming the encode: {e}")
+            return None
+        job = _Job(filename, source, output, tracker)
+        # On a copy of the hook's context each: ffmpeg is the job's, to stop and account for.
+        job.threads = [
+            threading.Thread(target=contextvars.copy_context().run, args=(self._encode, job), daemon=True),
+            threading.Thread(target=contextvars.copy_context().run, args=(self._tail, job), daemon=True),
+        ]
+        logger.debug(f"encoding {filename} as it downloads")
+        for thread in job.threads:
+            thread.start()
+        return job
+
+    def _can_follow(self, info: dict, part_path: str | None) -> bool:
+        if os.name == "nt" or not part_path or self._target_vcodec == "Best":
+            return False
+        if info.get("requested_formats") or info.get("section_start") or info.get("section_end"):
+            return False
+        if not info.get("duration") or self._ydl.params.get("postprocessors"):
+            return False
+        vcodec, acodec = codec_name(info.get("vcodec")), codec_name(info.get("acodec"))
+        if "none" in (vcodec, acodec) or "na" in (vcodec, acodec):
+            return False
+        try:
+            from yt_dlp.downloader import get_suitable_downloader
+            from yt_dlp.downloader.http import HttpFD
+
+            return get_suitable_downloader(info, self._ydl.params) is HttpFD
+        except Exception as e:
+            logger.debug(f"cannot tell which downloader yt-dlp uses, not streaming the encode: {e}")
+            return False
+
+    def _observe(self, job: _Job, d: dict) -> None:
+        status = d.get("status")
+        if status == "error":
+            job.abort("the download failed")
+        elif status == "finished":
+            job.final_size = int(d.get("total_bytes") or d.get("downloaded_bytes") or 0)
+        elif status == "downloading":
+            downloaded = int(d.get("downloaded_bytes") or 0)
+            if downloaded < job.downloaded:
+                # The downloader started over, and the bytes already fed are wrong.
+                job.abort("the download restarted")
+            job.downloaded = downloaded
+
+    def _encode(self, job: _Job) -> None:
+        try:
+            _, stderr, job.returncode = job.tracker.run()
+        except Exception as e:
+            job.abort(f"ffmpeg did not run: {e}")
+            return
+        if job.returncode and not job.failed.is_set():
+            job.abort(f"ffmpeg failed: {stderr.strip().splitlines()[-1:]}")
+
+    def _tail(self, job: _Job) -> None:
+        """Feed ffmpeg the file as it grows, until the download says it is complete."""
+        with job.source as source:
+            deadline = time.monotonic() + _START_TIMEOUT
+            while job.tracker.proc is None and not job.failed.is_set():
+                if time.monotonic() > deadline:
+                    job.abort(f"ffmpeg did not start within {_START_TIMEOUT}s")
+                    return
+                time.sleep(_TAIL_INTERVAL)
+            proc = job.tracker.proc
+            if proc is not None and proc.stdin is not None:
+                self._feed(job, source, proc)
+
+    @staticmethod
+    def _feed(job: _Job, source: BinaryIO, proc: subprocess.Popen) -> None:
+        assert proc.stdin is not None
+        # The tracker opens stdin as text, for the `q` that stops an encode. Here it
+        # carries the media, so write to the bytes underneath.
+        sink = cast(io.TextIOWrapper, proc.stdin).buffer
+        fed = 0
+        try:
+            while not job.failed.is_set():
+                chunk = source.read(_CHUNK_SIZE)
+                if chunk:
+                    sink.write(chunk)
+                    fed += len(chunk)
+                elif job.final_size is not None and fed >= job.final_size:
+                    break
+                else:
+                    time.sleep(_TAIL_INTERVAL)
+        except OSError as e:
+            job.abort(f"could not feed ffmpeg: {e}")
+        finally:
+            # End of input: ffmpeg finishes the encode and exits.
+            with contextlib.suppress(OSError, ValueError):
+                proc.stdin.close()
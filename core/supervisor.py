@@ -0,0 +1,239 @@
+"""Know which processes each job started, and stop exactly those.
+
+A stalled or cancelled download used to be cleaned up by asking `pgrep -P` for the
+children of this process, once before each attempt and once more when it gave up,
+then sending SIGTERM to every child that had not been there at the start. That cost
+a pgrep per attempt. Worse, "every child that appeared since" is every child of
+every job: two jobs running side by side, and a stall in one took the other's
+ffmpeg and aria2c down with it.
+
+Now a job has a JobProcesses, set for everything it runs through a context variable,
+the way core/resources.py hands it its policies. Every process the job starts is
+added to it as it starts:
+
+  - yt-dlp's, whichever of its modules starts them (ffmpeg, aria2c, the JS runtime
+    solving a challenge), through yt-dlp's Popen, which `install` wraps
+  - ours, started through `popen`, which also puts them under the stage's
+    ResourcePolicy
+
+`stop` then signals the processes the job has running, and none other: SIGTERM,
+then SIGKILL for whatever is still there `STOP_GRACE` seconds later. No process
+is looked up, so there is nothing to spawn and nothing to race.
+
+Processes are held by their Popen, which only signals a process it has not reaped
+yet: a pid that has been reused by then is never signalled. They stay in the
+process group they were born in, so that killing a worker process of
+core/process_pool.py still takes them along.
+
+Each process is also accounted to the stage it works for (core/usage.py): yt-dlp's
+to the download, ours to whichever stage `popen` is told. While a job has processes
+running, the reactor reads their counters every `SAMPLE_INTERVAL` seconds, and
+`usage` sums them up once the job is over. The asyncio subprocesses of core/aio.py
+are no Popen, and are only accounted, with `account`: their task stops them.
+
+Wrapping yt-dlp's Popen is guarded like the other patches: if it has moved,
+`install` logs and returns, and yt-dlp's processes are neither stopped nor
+accounted with their job.
+"""
+
+from __future__ import annotations
+
+import contextlib
+import contextvars
+import logging
+import subprocess
+import threading
+import time
+import weakref
+from collections.abc import Iterator
+from typing import TYPE_CHECKING, Any, Protocol
+
+from core import reactor, resources
+from core.usage import ProcessUsage, summarize
+
+if TYPE_CHECKING:
+    from core.config_types import ResourcePolicy
+
+logger = logging.getLogger("videodl")
+
+# How long a process gets to exit on SIGTERM before it is killed.
+STOP_GRACE = 5
+# How often the counters of a running process are read.
+SAMPLE_INTERVAL = 2
+
+_installed = False
+
+
+class _Process(Protocol):
+    """A Popen, or an asyncio subprocess: a pid, and a returncode once it is over."""
+
+    @property
+    def pid(self) -> int: ...
+
+    @property
+    def returncode(self) -> int | None: ...
+
+
+class JobProcesses:
+    """The processes one job has started, and what they cost."""
+
+    def __init__(self) -> None:
+        self._procs: list[subprocess.Popen] = []
+        self._accounts: list[tuple[_Process, ProcessUsage]] = []
+        self._lock = threading.Lock()
+
+    def add(self, proc: subprocess.Popen, stage: str) -> None:
+        with self._lock:
+            self._procs = [p for p in self._procs if p.returncode is None]
+            self._procs.append(proc)
+        self.account(proc, stage)
+
+    def account(self, proc: _Process, stage: str) -> None:
+        """Count what `proc` costs to `stage` of the job, without stopping it with the job."""
+        usage = ProcessUsage(proc.pid, stage)
+        usage.update()
+        with self._lock:
+            self._accounts.append((proc, usage))
+        _sample_while_running(self)
+
+    def sample(self) -> bool:
+        """Read the counters of the processes still running. Returns whether there were any."""
+        with self._lock:
+            running = False
+            for proc, usage in self._accounts:
+                if proc.returncode is None:
+                    usage.update()
+                    running = True
+                else:
+                    usage.finish()
+            return running
+
+    def io_bytes(self) -> int:
+        """Every byte the job's processes have read or written so far, read now."""
+        self.sample()
+        with self._lock:
+            return sum(usage.io_bytes for _, usage in self._accounts)
+
+    def usage(self) -> dict[str, dict]:
+        """What the job's processes have cost, per stage, see core/usage.py."""
+        self.sample()
+        with self._lock:
+            return summarize(usage for _, usage in self._accounts)
+
+    def running(self) -> list[subprocess.Popen]:
+        with self._lock:
+            procs = list(self._procs)
+        return [p for p in procs if p.poll() is None]
+
+    def stop(self, grace: float = STOP_GRACE) -> int:
+        """Stop every process the job still has running. Returns how many there were."""
+        procs = self.running()
+        for proc in procs:
+            logger.debug("Stopping process %d", proc.pid)
+            with contextlib.suppress(OSError):
+                proc.terminate()
+        deadline = time.monotonic() + grace
+        for proc in procs:
+            try:
+                proc.wait(timeout=max(0.0, deadline - time.monotonic()))
+            except subprocess.TimeoutExpired:
+                logger.debug("Process %d ignored SIGTERM, killing it", proc.pid)
+                with contextlib.suppress(OSError):
+                    proc.kill()
+        return len(procs)
+
+
+_current: contextvars.ContextVar[JobProcesses | None] = contextvars.ContextVar("job_processes", default=None)
+
+
+@contextlib.contextmanager
+def job_processes() -> Iterator[JobProcesses]:
+    """Add every process the block starts, on this thread or a copy of its context, to a new JobProcesses."""
+    processes = JobProcesses()
+    token = _current.set(processes)
+    try:
+        yield processes
+    finally:
+        _current.reset(token)
+
+
+def track(proc: subprocess.Popen, stage: str) -> None:
+    """Add `proc`, working for `stage`, to the current job's processes, if a job is running."""
+    processes = _current.get()
+    if processes is not None:
+        processes.add(proc, stage)
+
+
+def account(proc: _Process, stage: str) -> None:
+    """Count what `proc` costs to `stage` of the current job, if a job is running."""
+    processes = _current.get()
+    if processes is not None:
+        processes.account(proc, stage)
+
+
+def popen(
+    args: list, *, stage: str = resources.ENCODE, policy: ResourcePolicy | None = None, **kwargs: Any
+) -> subprocess.Popen:
+    """subprocess.Popen, for `stage` of the current job: under `policy`, and tracked."""
+    proc = subprocess.Popen(
+        resources.command(args, policy), **{**(resources.popen_kwargs(policy) if policy else {}), **kwargs}
+    )
+    if policy:
+        resources.apply(proc.pid, policy)
+    track(proc, stage)
+    return proc
+
+
+# The jobs with processes the reactor is reading, and its timer doing it.
+_sampled: weakref.WeakSet[JobProcesses] = weakref.WeakSet()
+_sampler: reactor.Timer | None = None
+_sampler_lock = threading.Lock()
+
+
+def _sample_while_running(processes: JobProcesses) -> None:
+    global _sampler
+    with _sampler_lock:
+        _sampled.add(processes)
+        if _sampler is None:
+            _sampler = reactor.get_reactor().call_every(SAMPLE_INTERVAL, _sample)
+
+
+def _sample() -> None:
+    """The reactor's timer: read every running process, and stop once none is left."""
+    global _sampler
+    with _sampler_lock:
+        for processes in list(_sampled):
+            if not processes.sample():
+                _sampled.discard(processes)
+        if not _sampled and _sampler is not None:
+            _sampler.cancel()
+            _sampler = None
+
+
+def install() -> bool:
+    """Track every process yt-dlp starts. Idempotent."""
+    global _installed
+    if _installed:
+        return True
+
+    try:
+        from yt_dlp.utils import _utils
+    except ImportError as e:
+        logger.warning(f"yt-dlp has moved: its processes will not be stopped with their job ({e})")
+        return False
+
+    popen_class = getattr(_utils, "Popen", None)
+    original_init = getattr(popen_class, "__init__", None)
+    if not (isinstance(popen_class, type) and issubclass(popen_class, subprocess.Popen) and original_init):
+        logger.warning("yt-dlp has moved: its processes will not be stopped with their job")
+        return False
+
+    def __init__(self, *args, **kwargs):
+        original_init(self, *args, **kwargs)
+        # Extraction, the download, and whatever yt-dlp runs around them.
+        track(self, resources.DOWNLOAD)
+
+    popen_class.__init__ = __init__  # type: ignore[method-assign]
+    _installed = True
+    logger.debug("yt-dlp process tracking installed")
+    return True
@@ -0,0 +1,123 @@
+"""What a job's processes cost, stage by stage.
+
+Nothing said what a job costs. How many encodes fit side by side on a machine, or
+which one spent an hour of CPU on a five minute clip, was guesswork.
+
+A ProcessUsage follows one process a job started, from core/supervisor.py, which
+reads it again every few seconds while it runs: the CPU time it and the children it
+waited for have used, its peak resident memory, and the bytes it read from and
+wrote to storage. `summarize` adds a job's processes up per stage (core/resources.py's
+"download" and "encode"): how many ran, their CPU seconds, the peak memory of the
+largest, the bytes they read and wrote, and the wall time from the first start to
+the last exit.
+
+Everything is read from /proc/<pid>, so only Linux (and Android) has more than wall
+time. resource.getrusage would give the same figures once a process is reaped, but
+only for all of this process's children at once, not for one job's when jobs run
+side by side. A sample is only as fresh as its last read: what a process did in the
+second before it exited may be missing.
+"""
+
+from __future__ import annotations
+
+import os
+import time
+from collections.abc import Iterable
+
+_PROC = "/proc"
+_TICKS = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+
+
+class ProcessUsage:
+    """What one process has cost so far. Updated by `update`, closed by `finish`."""
+
+    __slots__ = (
+        "_start_ticks",
+        "cpu_seconds",
+        "ended",
+        "io_bytes",
+        "peak_rss",
+        "pid",
+        "read_bytes",
+        "stage",
+        "started",
+        "write_bytes",
+    )
+
+    def __init__(self, pid: int, stage: str) -> None:
+        self.pid = pid
+        self.stage = stage
+        self.started = time.monotonic()
+        self.ended: float | None = None
+        self.cpu_seconds = 0.0
+        self.peak_rss = 0
+        self.read_bytes = 0
+        self.write_bytes = 0
+        # Every byte it read or wrote, sockets and pipes included: what shows it at
+        # work, for core/stall.py, and not what it cost the disk.
+        self.io_bytes = 0
+        # When the process started, as /proc tells it: a pid reused by another one
+        # has another start time.
+        self._start_ticks: str | None = None
+
+    def update(self) -> None:
+        """Read the process's counters again. Does nothing without /proc, or once it is gone."""
+        if self.ended is not None:
+            return
+        try:
+            with open(f"{_PROC}/{self.pid}/stat") as f:
+                # The command name, in parentheses, may hold spaces and parentheses of its own.
+                fields = f.read().rpartition(")")[2].split()
+        except OSError:
+            return
+        if self._start_ticks is None:
+            self._start_ticks = fields[19]
+        elif fields[19] != self._start_ticks:
+            return
+        # utime, stime, and those of the children it waited for.
+        self.cpu_seconds = sum(int(ticks) for ticks in fields[11:15]) / _TICKS
+        # Gone from a zombie's status: the peak of the last read stands.
+        self.peak_rss = max(self.peak_rss, _read_fields(f"{_PROC}/{self.pid}/status").get("VmHWM", 0) * 1024)
+        io = _read_fields(f"{_PROC}/{self.pid}/io")
+        self.read_bytes = max(self.read_bytes, io.get("read_bytes", 0))
+        self.write_bytes = max(self.write_bytes, io.get("write_bytes", 0))
+        self.io_bytes = max(self.io_bytes, io.get("rchar", 0) + io.get("wchar", 0))
+
+    def finish(self) -> None:
+        """The process has exited: its counters are final."""
+        if self.ended is None:
+            self.ended = time.monotonic()
+
+
+def summarize(usages: Iterable[ProcessUsage]) -> dict[str, dict]:
+    """The cost of `usages` per stage, as plain values: what a job record carries."""
+    stages: dict[str, list[ProcessUsage]] = {}
+    for usage in usages:
+        stages.setdefault(usage.stage, []).append(usage)
+    now = time.monotonic()
+    return {
+        stage: {
+            "processes": len(group),
+            "cpu_seconds": round(sum(u.cpu_seconds for u in group), 2),
+            "peak_rss": max(u.peak_rss for u in group),
+            "read_bytes": sum(u.read_bytes for u in group),
+            "write_bytes": sum(u.write_bytes for u in group),
+            "wall_seconds": round(max(u.ended or now for u in group) - min(u.started for u in group), 2),
+        }
+        for stage, group in stages.items()
+    }
+
+
+def _read_fields(path: str) -> dict[str, int]:
+    """The numbers of one of /proc's "name: value" files, nothing if it cannot be read."""
+    fields = {}
+    try:
+        with open(path) as f:
+            for line in f:
+                name, _, value = line.partition(":")
+                number = value.split()[:1]
+                if number and number[0].isdigit():
+                    fields[name] = int(number[0])
+    except OSError:
+        pass
+    return fields
@@ -1,7 +1,7 @@
 from __future__ import annotations
 
 import os
-from collections.abc import Callable
+from collections.abc import Callable, Iterable
 from typing import Any
 
 
@@ -148,6 +148,47 @@ def build_sponsor_block_opts(song_only: bool, categories: Any) -> dict[str, Any]
     return {}
 
 
+def aria2c_would_be_throttled(url: str | None) -> bool:
+    """True for hosts that throttle aria2c's connections far below the native
+    downloader. Measured on a YouTube short: ~100 KB/s via aria2c vs ~27 MB/s
+    native, because Google throttles aria2c's request pattern. yt-dlp's own
+    downloader handles these; aria2c only wins on plain direct HTTP. Extend the
+    tuple as other sites turn up.
+    """
+    if not url:
+        return False
+    from urllib.parse import urlparse
+
+    host = (urlparse(url).hostname or "").lower()
+    return host.endswith(("youtube.com", "youtu.be", "googlevideo.com"))
+
+
+def build_aria2c_opts(aria2c_path: str | None, urls: Iterable[str | None], ydl_opts: dict[str, Any]) -> dict[str, Any]:
+    """Build yt-dlp options handing HTTP downloads to aria2c, where it helps.
+
+    aria2c only wins on plain direct HTTP where its many connections help. On
+    sites that throttle it (YouTube) or need cookies, the native downloader is
+    faster, so leave those to yt-dlp. `ydl_opts` are the options built so far,
+    shared by every URL in `urls`, so one throttled URL opts them all out.
+    """
+    has_cookies = "cookiesfrombrowser" in ydl_opts or "cookiesfile" in ydl_opts
+    if (
+        not aria2c_path
+        or has_cookies
+        or any(aria2c_would_be_throttled(u) for u in urls)
+        or "external_downloader" in ydl_opts
+        or "download_ranges" in ydl_opts
+    ):
+        return {}
+    return {
+        "external_downloader": {"http": aria2c_path},
+        # 16 connections with a 1M split is aria2's standard multi-connection
+        # setup, and the whole reason to use it here: on the permissive direct-HTTP
+        # servers this path is reserved for, it multiplies throughput.
+        "external_downloader_args": {"aria2c": ["-x", "16", "-s", "16", "-k", "1M"]},
+    }
+
+
 def get_effective_vcodec(original_on: bool, vcodec: str | None, nle_ready: bool) -> str:
     """Determine the effective video codec based on user choices."""
     if original_on:
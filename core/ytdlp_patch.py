@@ -32,6 +32,7 @@ import os
 import threading
 from typing import Any, cast
 
+from core import resources
 from core.ffmpeg_progress import FFmpegProgressTracker
 
 logger = logging.getLogger("videodl")
@@ -136,5 +137,6 @@ def _run_with_progress(context: _Context, args: list[str], stdin, env) -> tuple[
         filename=context.filename,
         stdin=stdin,
         env=env,
+        policy=resources.policy_for(resources.ENCODE),
     )
     return tracker.run()
@@ -7,7 +7,6 @@ import os
 import subprocess
 import sys
 import threading
-from datetime import datetime
 from pathlib import Path
 from typing import TYPE_CHECKING
 
@@ -48,8 +47,17 @@ import runtime
 import sys_vars
 from core.download import create_ydl, download
 from core.error_report import ErrorReport, build_error_report
-from core.progress import compute_progress, parse_quantity, parse_speed, timecodes_are_valid
+from core.jobs import CANCELLED, DONE, DOWNLOADING, FAILED, PROCESSING, ProgressModel
+from core.progress import (
+    ProgressSample,
+    ProgressSlot,
+    compute_progress,
+    format_speed,
+    parse_quantity,
+    timecodes_are_valid,
+)
 from core.ydl_opts import (
+    build_aria2c_opts,
     build_av_opts,
     build_browser_opts,
     build_ffmpeg_opts,
@@ -90,7 +98,7 @@ from i18n.lang import (
     set_current_language,
 )
 from i18n.lang import get_text as gt
-from utils.parse_util import simple_traverse, validate_url
+from utils.parse_util import validate_url
 from utils.sponsor_block_dict import CATEGORIES
 from utils.sys_utils import APP_VERSION, PLATFORM, get_default_download_path
 from videodl_logger import get_log_dir
@@ -110,21 +118,6 @@ def _urls_share_host(urls: list[str]) -> bool:
     return len(hosts) == 1
 
 
-def _aria2c_would_be_throttled(url: str | None) -> bool:
-    """True for hosts that throttle aria2c's connections far below the native
-    downloader. Measured on a YouTube short: ~100 KB/s via aria2c vs ~27 MB/s
-    native, because Google throttles aria2c's request pattern. yt-dlp's own
-    downloader handles these; aria2c only wins on plain direct HTTP. Extend the
-    tuple as other sites turn up.
-    """
-    if not url:
-        return False
-    from urllib.parse import urlparse
-
-    host = (urlparse(url).hostname or "").lower()
-    return host.endswith(("youtube.com", "youtu.be", "googlevideo.com"))
-
-
 def _system_is_dark(page: ft.Page) -> bool:
     """OS dark mode via Flet's own brightness.
 
@@ -163,6 +156,9 @@ class _AppProgressCallback:
     def on_process_progress(self, status: dict) -> None:
         self._app._update_process_bar(status)
 
+    def on_usage(self, usage: dict[str, dict]) -> None:
+        logger.debug(f"The job's processes cost {usage}")
+
 
 class _AppStatusCallback:
     """Routes status messages from core/ to the GUI status text."""
@@ -594,10 +590,18 @@ class VideodlApp:
             visible=False,
         )
         self.ydl_opts: dict = {}
-        self.download_last_update: datetime = datetime.now()
-        self.download_last_speed: str = ""
-        self.process_last_update: datetime = datetime.now()
-        self.process_last_speed: str = ""
+        # Hooks leave their latest sample here, on the download thread. The refresh
+        # loop formats and draws it, at its own pace, on the UI loop.
+        self._download_slot = ProgressSlot()
+        self._process_slot = ProgressSlot()
+        self._wake_pending = False
+        # What the next refresh has to send: these controls alone, or the whole page
+        # when something that moves the layout changed. Only touched on the UI loop,
+        # but for `_layout_dirty`, which any thread may set. Keyed by id(): Flet
+        # controls compare equal by value, and two bars at 0% are not one bar.
+        self._dirty_controls: dict[int, ft.Control] = {}
+        self._layout_dirty = False
+        self._window_height: int | None = None
         self.download_progress_percent: float = 0
         self.process_progress_percent: float = 0
         self._loop: asyncio.AbstractEventLoop | None = None
@@ -605,7 +609,10 @@ class VideodlApp:
         self._download_done = asyncio.Event()
         self._cancel_requested = threading.Event()
         self._preparing = False
-        self._download_counter = ""
+        # Every job of the current batch. The bars draw the one in flight, and the
+        # "(2/5)" next to them comes from the totals.
+        self.progress_model = ProgressModel()
+        self._current_job: str | None = None
         self._url_queue: list[str] = []
         self.queue_button = Button(
             content=Icon(Icons.ADD),
@@ -683,24 +690,9 @@ class VideodlApp:
         self._gen_browser_opts()
         self._gen_proxy_opts()
         self._gen_sponsor_block_opts()
-        # aria2c only wins on plain direct HTTP where its many connections help. On
-        # sites that throttle it (YouTube) or need cookies, the native downloader is
-        # faster, so leave those to yt-dlp. The opts are shared across the whole batch,
-        # so one throttled URL opts the batch out.
-        has_cookies = "cookiesfrombrowser" in self.ydl_opts or "cookiesfile" in self.ydl_opts
+        # The opts are shared across the whole batch, so every queued URL has a say.
         urls = [self.media_link.value, *self._url_queue]
-        if (
-            sys_vars.ARIA2C_PATH
-            and not has_cookies
-            and not any(_aria2c_would_be_throttled(u) for u in urls)
-            and "external_downloader" not in self.ydl_opts
-            and "download_ranges" not in self.ydl_opts
-        ):
-            self.ydl_opts["external_downloader"] = {"http": sys_vars.ARIA2C_PATH}
-            # 16 connections with a 1M split is aria2's standard multi-connection
-            # setup, and the whole reason to use it here: on the permissive direct-HTTP
-            # servers this path is reserved for, it multiplies throughput.
-            self.ydl_opts["external_downloader_args"] = {"aria2c": ["-x", "16", "-s", "16", "-k", "1M"]}
+        self.ydl_opts.update(build_aria2c_opts(sys_vars.ARIA2C_PATH, urls, self.ydl_opts))
         return self.ydl_opts
 
     def _gen_file_opts(self):
@@ -774,91 +766,78 @@ class VideodlApp:
             self.ydl_opts.setdefault("postprocessors", []).extend(sb_opts["postprocessors"])
 
     def _update_download_bar(self, d: dict):
+        """yt-dlp's progress hook, on the download thread: it records, `_render_progress` draws."""
+        # core/_finish_download's "finished" signal carries no bytes, and still counts once cancelled.
+        finish_signal = d.get("status") == "finished" and "downloaded_bytes" not in d
+        if self._cancel_requested.is_set() and not finish_signal:
+            raise YtdlpDownloadCancelled
+        self._download_slot.put(ProgressSample.from_status(d, "downloaded_bytes"))
+        if self._current_job:
+            self.progress_model.update(self._current_job, d, DOWNLOADING)
+        self._wake_ui()
+
+    def _update_process_bar(self, d: dict):
+        self._process_slot.put(ProgressSample.from_status(d, "processed_bytes"))
+        if self._current_job:
+            self.progress_model.update(self._current_job, d, PROCESSING)
+        self._wake_ui()
+
+    def _render_progress(self):
+        """Draw the latest progress samples. Only ever called from the UI loop."""
+        sample = self._download_slot.take()
+        if sample is not None:
+            self._render_download_bar(sample)
+        sample = self._process_slot.take()
+        if sample is not None and not self._cancel_requested.is_set():
+            self.process_progress_percent = self._render_bar(
+                sample, self.process_progress_bar, self.process_progress_text, self.process_progress_percent
+            )
+            self._mark_dirty(self.process_progress_bar, self.process_progress_text)
+
+    def _render_download_bar(self, sample: ProgressSample):
         # Handle "finished" signal from core/_finish_download
-        if d.get("status") == "finished" and "downloaded_bytes" not in d:
+        if sample.finished and sample.done is None:
             self.download_progress_text.value = f"{gt(GF.download)} 100%"
-            self._mark_ui_dirty()
+            self._mark_dirty(self.download_progress_text)
             return
         if self._cancel_requested.is_set():
-            raise YtdlpDownloadCancelled
+            return
         # Hide preparation status once actual download starts
-        force = False
         if self._preparing:
             self._preparing = False
             self.download_status_text.visible = False
             self.download_status_banner.visible = False
-            force = True
-        (
-            self.download_last_update,
-            self.download_last_speed,
-            self.download_progress_percent,
-        ) = self._update_bar(
-            d,
-            "downloaded_bytes",
-            self.download_last_update,
-            self.download_last_speed,
-            self.download_progress_bar,
-            self.download_progress_text,
-            self.download_progress_percent,
-            force_update=force,
-        )
-
-    def _update_process_bar(self, d: dict):
-        (
-            self.process_last_update,
-            self.process_last_speed,
-            self.process_progress_percent,
-        ) = self._update_bar(
-            d,
-            "processed_bytes",
-            self.process_last_update,
-            self.process_last_speed,
-            self.process_progress_bar,
-            self.process_progress_text,
-            self.process_progress_percent,
+            self._layout_dirty = True
+        self.download_progress_percent = self._render_bar(
+            sample, self.download_progress_bar, self.download_progress_text, self.download_progress_percent
         )
+        self._mark_dirty(self.download_progress_bar, self.download_progress_text)
 
-    def _update_bar(
+    def _render_bar(
         self,
-        d: dict,
-        bytes_fieldname: str,
-        time_last_update: datetime,
-        last_speed: str,
+        sample: ProgressSample,
         progress_bar: ProgressBar,
         progress_text: Text,
         last_progress_percent: float,
-        force_update: bool = False,
-    ):
-        if self._cancel_requested.is_set():
-            return time_last_update, last_speed, last_progress_percent
-
-        speed = parse_speed(d, bytes_fieldname)
-        downloaded = parse_quantity(d.get(bytes_fieldname))
-        total = parse_quantity(d.get("total_bytes")) or parse_quantity(d.get("total_bytes_estimate"))
+    ) -> float:
+        downloaded = parse_quantity(sample.done)
+        total = parse_quantity(sample.total)
         progress_float, last_progress_percent = compute_progress(
-            d.get("progress_float"), downloaded, total, last_progress_percent
+            sample.progress_float, downloaded, total, last_progress_percent
         )
-
         progress_bar.value = progress_float
-        status = d.get("status")
-        if status == "finished":
-            force_update = True
-        time_elapsed = datetime.now() - time_last_update
-        delta_ms = time_elapsed.seconds * 1_000 + time_elapsed.microseconds // 1_000
-        if force_update or delta_ms >= 250:
-            last_speed = speed
-            time_last_update = datetime.now()
-            action = d.get("action") or (gt(GF.download) if bytes_fieldname == "downloaded_bytes" else gt(GF.process))
-            n_current = simple_traverse(d, ("info_dict", "playlist_autonumber"))
-            n_entries = simple_traverse(d, ("info_dict", "n_entries"))
-            progress_str = f"{action} {int(progress_float * 100)}% {speed}"
-            if self._download_counter and bytes_fieldname == "downloaded_bytes":
-                progress_str += f" {self._download_counter}"
-            elif n_current and n_entries > 1:
-                progress_str += f"({n_current}/{n_entries})"
-            progress_text.value = progress_str
-            self._mark_ui_dirty()
-        return time_last_update, last_speed, last_progress_percent
+
+        is_download = sample.bytes_fieldname == "downloaded_bytes"
+        action = sample.action or (gt(GF.download) if is_download else gt(GF.process))
+        speed = format_speed(sample.speed, sample.bytes_fieldname)
+        progress_str = f"{action} {int(progress_float * 100)}% {speed}"
+        totals = self.progress_model.totals()
+        if totals.jobs > 1 and is_download:
+            progress_str += f" ({min(totals.finished + 1, totals.jobs)}/{totals.jobs})"
+        elif sample.playlist_index and (sample.playlist_count or 0) > 1:
+            progress_str += f"({sample.playlist_index}/{sample.playlist_count})"
+        progress_text.value = progress_str
+        return last_progress_percent
 
     def _timecodes_are_valid(self) -> bool:
         sc = self.start_controls
@@ -1133,6 +1112,11 @@ class VideodlApp:
         if self._mobile:
             return
         h = self._compute_window_height()
+        # Every page.update() sends what changed on the window too. Not touching it
+        # when the height is the same keeps that to nothing.
+        if h == self._window_height:
+            return
+        self._window_height = h
         self.page.window.height = h
         self.page.window.min_height = h
 
@@ -1466,10 +1450,45 @@ class VideodlApp:
             self.page.run_task(_do_update)
 
     def _mark_ui_dirty(self):
-        """Signal the UI refresh loop. Safe to call from any thread."""
-        if self._loop is not None:
+        """Have the next refresh send the whole page. Safe to call from any thread."""
+        self._layout_dirty = True
+        self._wake_ui()
+
+    def _mark_controls_dirty(self, *controls: ft.Control):
+        """Have the next refresh send just `controls`. Only from the UI loop."""
+        self._mark_dirty(*controls)
+        self._wake_ui()
+
+    def _mark_dirty(self, *controls: ft.Control):
+        for control in controls:
+            self._dirty_controls[id(control)] = control
+
+    def _wake_ui(self):
+        """Signal the UI refresh loop. Safe to call from any thread.
+
+        Progress hooks call this for every sample. Only the first one since the last
+        refresh wakes the loop: the rest would only queue more of the same wakeup.
+        """
+        if self._loop is not None and not self._wake_pending:
+            self._wake_pending = True
             self._loop.call_soon_threadsafe(self._ui_dirty.set)
 
+    def _flush_ui(self):
+        """Draw the latest progress, and send only what changed. Only from the UI loop.
+
+        A page.update() diffs and serializes the whole control tree. During a
+        download the two bars and their labels are usually all that moved, and
+        updating just those keeps the traffic to Flet, Android's most of all, small.
+        """
+        self._render_progress()
+        controls, self._dirty_controls = self._dirty_controls, {}
+        if self._layout_dirty:
+            self._layout_dirty = False
+            self.page.update()
+            return
+        for control in controls.values():
+            control.update()
+
     def _show_status(self, message, color):
         self._error_report = None
         self.download_status_banner.visible = False
@@ -1603,6 +1622,9 @@ class VideodlApp:
             return
         target_vcodec = self._get_effective_vcodec()
         same_host = total > 1 and _urls_share_host(urls)
+        for job in self.progress_model:
+            self.progress_model.remove(job.job_id)
+        job_ids = [self.progress_model.add(url or self.media_link.value).job_id for url in urls]
         for i, url in enumerate(urls):
             if cancel_token.is_cancelled():
                 break
@@ -1611,39 +1633,47 @@ class VideodlApp:
                 await asyncio.sleep(2)
             self.download_progress_bar.value = 0
             self.process_progress_bar.value = 0
-            self._download_counter = f"({i + 1}/{total})" if total > 1 else ""
+            self._current_job = job_ids[i]
             self.download_progress_text.value = gt(GF.download)
             self.process_progress_text.value = gt(GF.process)
-            self.download_last_update = datetime.now()
-            self.process_last_update = datetime.now()
+            self._download_slot.clear()
+            self._process_slot.clear()
             self.download_progress_percent = 0
             self.process_progress_percent = 0
             self._preparing = total == 1
             if total > 1:
                 label = url or self.media_link.value
                 self._show_status(f"{i + 1}/{total}: {label}", Colors.ON_SURFACE_VARIANT)
-                self._ui_dirty.set()
+                self._mark_ui_dirty()
             config = DownloadConfig(
                 url=url or self.media_link.value,
                 audio_only=bool(self.audio_only.value),
                 target_vcodec=target_vcodec,
                 ff_path=sys_vars.FF_PATH,
                 ydl_opts=ydl_opts,
+                stream_encode=True,
             )
             try:
                 await asyncio.to_thread(download, ydl, config, cancel_token, progress_cb)
+                self.progress_model.finish(job_ids[i], DONE)
                 completed_urls.append(url)
                 if url in self._url_queue:
                     self._url_queue.remove(url)
                     self._update_queue_badge()
-                    self._ui_dirty.set()
+                    self._mark_controls_dirty(self.queue_button)
             except Exception as e:
                 report = build_error_report(e)
                 logger.error(report.short_message)
                 self._show_error(report)
+                self.progress_model.finish(
+                    job_ids[i], CANCELLED if cancel_token.is_cancelled() else FAILED, report.short_message
+                )
                 error_occurred = True
                 if report.should_break:
                     break
+        # Whatever the loop did not get to, after a cancel or an error that stops the batch.
+        for job_id in job_ids:
+            self.progress_model.finish(job_id, CANCELLED)
         if not error_occurred:
             logger.info("All downloads completed")
             self._show_status(gt(GF.dl_finish), "green")
@@ -1662,13 +1692,18 @@ class VideodlApp:
         while not self._download_done.is_set():
             await self._ui_dirty.wait()
             self._ui_dirty.clear()
+            # Cleared before drawing: a sample put from now on is either drawn below
+            # or wakes the loop again.
+            self._wake_pending = False
             if self._download_done.is_set():
                 break
-            self.page.update()
+            self._flush_ui()
             await asyncio.sleep(0.2)
         # Final flush
         self._ui_dirty.clear()
-        self.page.update()
+        self._wake_pending = False
+        self._layout_dirty = True
+        self._flush_ui()
 
     def _reset_after_download(self):
         self._set_controls_enabled(True)
@@ -1693,7 +1728,7 @@ class VideodlApp:
         self.process_progress.visible = False
         self.download_progress_text.value = gt(GF.download)
         self.process_progress_text.value = gt(GF.process)
-        self._download_counter = ""
+        self._current_job = None
         self._resize_window()
         self.page.update()
 
@@ -85,7 +85,7 @@ def selftest() -> None:
     from yt_dlp.dependencies import available_dependencies
     from yt_dlp.version import __version__ as yt_dlp_version
 
-    from core import aria2c_progress, ffmpegfd_progress, ytdlp_patch
+    from core import aria2c_progress, ffmpegfd_progress, parallel_formats, section_fragments, ytdlp_patch
     from core.download import download  # noqa: F401
     from gui.app import videodl_gui  # noqa: F401
     from sys_vars import init_paths  # noqa: F401
@@ -95,14 +95,18 @@ def selftest() -> None:
     if missing:
         raise SystemExit(f"yt-dlp is missing dependencies: {', '.join(sorted(missing))}")
 
-    # All three reach into yt-dlp's internals to report progress, and all three fail
-    # soft at runtime. This is the place that makes a yt-dlp bump that broke one loud.
+    # These reach into yt-dlp's internals, and all of them fail soft at runtime.
+    # This is the place that makes a yt-dlp bump that broke one loud.
     if not ytdlp_patch.install():
         raise SystemExit("the ffmpeg progress patch no longer applies to this yt-dlp")
     if not ffmpegfd_progress.install():
         raise SystemExit("the ffmpeg download progress patch no longer applies to this yt-dlp")
     if not aria2c_progress.install():
         raise SystemExit("the aria2c progress patch no longer applies to this yt-dlp")
+    if not section_fragments.install():
+        raise SystemExit("the trimmed stream download patch no longer applies to this yt-dlp")
+    if not parallel_formats.install():
+        raise SystemExit("the concurrent format download patch no longer applies to this yt-dlp")
 
     # Our VK extractor only reaches VK by taking the built-in one's place, and it can
     # only do that while they share a key. In a frozen binary this also proves
@@ -116,7 +120,16 @@ def selftest() -> None:
 
 
 def main():
-    parser = argparse.ArgumentParser(description="video-dl")
+    # Headless commands take over before anything below imports flet.
+    import cli
+
+    if len(sys.argv) > 1 and sys.argv[1] in cli.COMMANDS:
+        sys.exit(cli.run(sys.argv[1], sys.argv[2:]))
+
+    parser = argparse.ArgumentParser(
+        description="video-dl",
+        epilog="Run 'video-dl batch --help' or 'video-dl serve --help' to download without the GUI.",
+    )
     parser.add_argument("--debug", action="store_true", help="Enable debug logs for video-dl only")
     parser.add_argument(
         "--verbose", action="store_true", help="Enable debug logs for all libraries (Flet, urllib3, etc.)"
@@ -157,4 +170,8 @@ def main():
 
 
 if __name__ == "__main__":
+    # Lets a frozen build start the worker processes of core/process_pool.py.
+    import multiprocessing
+
+    multiprocessing.freeze_support()
     main()
@@ -0,0 +1,142 @@
+import threading
+import time
+
+import pytest
+
+from core import admission
+from core.admission import AdmissionController, Limits, Load, job_admission, read_load, shortage
+from core.exceptions import DownloadCancelled
+from core.resources import DOWNLOAD, ENCODE
+
+_QUIET = Load(cpu_load=0.1, memory_pressure=0.0, available_memory=8 << 30, io_pressure=0.0, free_disk=100 << 30)
+_BUSY_CPU = Load(cpu_load=3.0, memory_pressure=0.0, available_memory=8 << 30, io_pressure=0.0, free_disk=100 << 30)
+
+
+class _Cancel:
+    def __init__(self):
+        self.cancelled = False
+
+    def is_cancelled(self):
+        return self.cancelled
+
+
+class _Machine:
+    """A load to read, changed by the test."""
+
+    def __init__(self, load):
+        self.load = load
+
+    def read(self, path):
+        return self.load
+
+
+def _reason(load: Load, stage: str) -> str:
+    """What holds a job for `stage` back under `load`, when something should."""
+    reason = shortage(load, Limits(), stage)
+    assert reason is not None
+    return reason
+
+
+def _controller(machine, settle=0):
+    return AdmissionController(read=machine.read, settle=settle, interval=0.01)
+
+
+class TestShortage:
+    def test_a_quiet_machine_has_room_for_anything(self):
+        assert shortage(_QUIET, Limits(), DOWNLOAD) is None
+        assert shortage(_QUIET, Limits(), ENCODE) is None
+
+    def test_only_encodes_wait_on_the_cpu(self):
+        assert shortage(_BUSY_CPU, Limits(), DOWNLOAD) is None
+        assert "CPU" in _reason(_BUSY_CPU, ENCODE)
+
+    def test_memory_pressure_goes_before_available_memory(self):
+        pressured = Load(None, 50.0, 8 << 30, None, None)
+        assert "memory pressure" in _reason(pressured, DOWNLOAD)
+        # Little memory left, but nothing waiting on it.
+        cached = Load(None, 0.0, 100 << 20, None, None)
+        assert shortage(cached, Limits(), DOWNLOAD) is None
+
+    def test_without_psi_available_memory_is_read(self):
+        assert "memory" in _reason(Load(None, None, 100 << 20, None, None), DOWNLOAD)
+
+    def test_io_pressure_and_disk_space(self):
+        assert "I/O" in _reason(Load(None, None, None, 90.0, None), DOWNLOAD)
+        assert "disk" in _reason(Load(None, None, None, None, 1 << 20), ENCODE)
+
+    def test_what_cannot_be_read_holds_nothing_back(self):
+        assert shortage(Load(None, None, None, None, None), Limits(), ENCODE) is None
+
+
+class TestReadLoad:
+    def test_reads_a_folder_not_made_yet(self, tmp_path):
+        load = read_load(str(tmp_path / "not" / "yet"))
+
+        assert load.free_disk is None or load.free_disk > 0
+
+
+class TestAdmissionController:
+    def test_the_first_goes_however_busy_the_machine(self):
+        controller = _controller(_Machine(_BUSY_CPU))
+
+        with controller.admitted(ENCODE, _Cancel()):
+            pass
+
+    def test_the_next_waits_for_room(self):
+        machine = _Machine(_BUSY_CPU)
+        controller = _controller(machine)
+        admitted = threading.Event()
+
+        def second():
+            with controller.admitted(ENCODE, _Cancel()):
+                admitted.set()
+
+        with controller.admitted(ENCODE, _Cancel()):
+            thread = threading.Thread(target=second)
+            thread.start()
+            assert not admitted.wait(0.1)
+            machine.load = _QUIET
+            assert admitted.wait(5)
+        thread.join()
+
+    def test_stages_are_admitted_apart(self):
+        controller = _controller(_Machine(_BUSY_CPU))
+
+        with controller.admitted(DOWNLOAD, _Cancel()), controller.admitted(ENCODE, _Cancel()):
+            pass
+
+    def test_one_is_let_in_per_settle(self):
+        controller = _controller(_Machine(_QUIET), settle=0.2)
+
+        with controller.admitted(DOWNLOAD, _Cancel()):
+            started = time.monotonic()
+            with controller.admitted(DOWNLOAD, _Cancel()):
+                assert time.monotonic() - started >= 0.2
+
+    def test_a_cancel_ends_the_wait(self):
+        controller = _controller(_Machine(_BUSY_CPU))
+        cancel = _Cancel()
+
+        with controller.admitted(ENCODE, _Cancel()):
+            cancel.cancelled = True
+            with pytest.raises(DownloadCancelled), controller.admitted(ENCODE, cancel):
+                pass
+
+
+class TestJobAdmission:
+    def test_without_a_controller_nothing_waits(self):
+        with admission.admitted(ENCODE, _Cancel()):
+            pass
+
+    def test_the_jobs_controller_is_asked(self):
+        controller = _controller(_Machine(_BUSY_CPU))
+        cancel = _Cancel()
+        cancel.cancelled = True
+
+        with (
+            controller.admitted(ENCODE, _Cancel()),
+            job_admission(controller),
+            pytest.raises(DownloadCancelled),
+            admission.admitted(ENCODE, cancel),
+        ):
+            pass
@@ -0,0 +1,293 @@
+import asyncio
+import sys
+import textwrap
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from yt_dlp.utils import DownloadCancelled as YtdlpDownloadCancelled
+
+from core import aio, retry, supervisor
+from core.config_types import DownloadConfig
+from core.encode import EncodePlan
+from core.exceptions import DownloadCancelled, DownloadTimeout
+
+
+class _FakeYdl:
+    """A YoutubeDL whose extraction is `extract(ydl)`, run on whichever thread calls it."""
+
+    def __init__(self, extract, progress_hooks=()):
+        self.params = {"progress_hooks": list(progress_hooks)}
+        self._progress_hooks = list(progress_hooks)
+        self._postprocessor_hooks = []
+        self._extract = extract
+
+    def add_progress_hook(self, hook):
+        self._progress_hooks.append(hook)
+
+    def add_postprocessor_hook(self, hook):
+        self._postprocessor_hooks.append(hook)
+
+    def report(self, d):
+        for hook in self._progress_hooks:
+            hook(d)
+
+    def extract_info(self, url, download=True, process=True):
+        return self._extract(self)
+
+    def process_ie_result(self, info, download=True):
+        return info
+
+    def prepare_filename(self, info):
+        return info["path"]
+
+
+class _Progress:
+    def __init__(self):
+        self.downloads = []
+        self.processes = []
+        self.usages = []
+
+    def on_download_progress(self, status):
+        self.downloads.append(status)
+
+    def on_process_progress(self, status):
+        self.processes.append(status)
+
+    def on_usage(self, usage):
+        self.usages.append(usage)
+
+
+def _config(**kwargs):
+    return DownloadConfig(url="https://example.com/v", audio_only=False, target_vcodec="x264", **kwargs)
+
+
+@pytest.fixture
+def stops(monkeypatch):
+    """A record of every stop of the job's processes."""
+    calls = []
+    monkeypatch.setattr(supervisor.JobProcesses, "stop", lambda self: calls.append(self))
+    return calls
+
+
+@pytest.fixture
+def encodes(monkeypatch):
+    calls = []
+
+    async def post_process(full_name, target_vcodec, progress_cb, ff_path, outputs, speed_tier):
+        calls.append((full_name, target_vcodec))
+
+    monkeypatch.setattr(aio, "post_process", post_process)
+    return calls
+
+
+class TestDownload:
+    def test_extracts_then_encodes(self, stops, encodes):
+        def extract(ydl):
+            ydl.report({"status": "downloading", "downloaded_bytes": 5})
+            return {"path": "/out/v.webm", "ext": "mp4"}
+
+        seen = []
+        ydl = _FakeYdl(extract, [seen.append])
+        progress = _Progress()
+
+        asyncio.run(aio.download(ydl, _config(), progress))
+
+        assert seen == [{"status": "downloading", "downloaded_bytes": 5}]
+        assert ydl._progress_hooks == [seen.append]
+        assert ydl._postprocessor_hooks == []
+        assert progress.downloads == [{"status": "finished", "progress_float": 1.0}]
+        assert encodes == [("/out/v.mp4", "x264")]
+        assert progress.usages == [{}]
+
+    def test_every_entry_of_a_playlist_is_encoded(self, stops, encodes):
+        playlist = {
+            "_type": "playlist",
+            "entries": [{"path": "/out/a.mp4", "ext": "mp4"}, {"path": "/out/b.mp4", "ext": "mp4"}],
+        }
+
+        asyncio.run(aio.download(_FakeYdl(lambda ydl: playlist), _config(), _Progress()))
+
+        assert encodes == [("/out/a.mp4", "x264"), ("/out/b.mp4", "x264")]
+
+    def test_cancelling_the_task_stops_the_extraction(self, stops, encodes):
+        stopped = threading.Event()
+
+        def extract(ydl):
+            try:
+                while True:
+                    ydl.report({"status": "downloading", "downloaded_bytes": 1})
+                    time.sleep(0.01)
+            finally:
+                stopped.set()
+
+        async def scenario():
+            task = asyncio.ensure_future(aio.download(_FakeYdl(extract), _config(), _Progress()))
+            await asyncio.sleep(0.05)
+            task.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await task
+
+        asyncio.run(scenario())
+
+        assert stopped.is_set()
+        assert len(stops) == 1
+        assert encodes == []
+
+    def test_a_cancel_from_the_callers_hooks_is_a_download_cancelled(self, stops, encodes):
+        def extract(ydl):
+            raise YtdlpDownloadCancelled
+
+        with pytest.raises(DownloadCancelled):
+            asyncio.run(aio.download(_FakeYdl(extract), _config(), _Progress()))
+
+    def test_a_stalled_extraction_is_retried_then_times_out(self, stops, encodes, monkeypatch):
+        monkeypatch.setattr(retry, "BASE_BACKOFF", 0)
+        monkeypatch.setattr(aio, "_WATCH_INTERVAL", 0.01)
+        monkeypatch.setattr(aio, "_THREAD_GRACE", 0.01)
+        attempts = []
+
+        def extract(ydl):
+            attempts.append(1)
+            # Hangs until its processes are stopped, as yt-dlp's wait on theirs.
+            stopped = len(stops)
+            while len(stops) == stopped:
+                time.sleep(0.01)
+            raise TimeoutError
+
+        with pytest.raises(DownloadTimeout):
+            asyncio.run(aio.download(_FakeYdl(extract), _config(), _Progress(), stall_budgets={"extract": 0.05}))
+
+        assert len(attempts) == retry.MAX_RETRIES
+        assert len(stops) == retry.MAX_RETRIES
+
+    def test_no_attempt_starts_while_the_one_given_up_on_runs(self, stops, encodes, monkeypatch):
+        monkeypatch.setattr(retry, "BASE_BACKOFF", 0)
+        monkeypatch.setattr(aio, "_WATCH_INTERVAL", 0.01)
+        monkeypatch.setattr(aio, "_THREAD_GRACE", 0.01)
+        release = threading.Event()
+        attempts = []
+
+        def extract(ydl):
+            attempts.append(1)
+            release.wait(5)
+
+        async def scenario():
+            try:
+                await aio.download(_FakeYdl(extract), _config(), _Progress(), stall_budgets={"extract": 0.05})
+            finally:
+                # The abandoned thread, which asyncio.run waits for on its way out.
+                release.set()
+
+        with pytest.raises(DownloadTimeout):
+            asyncio.run(scenario())
+
+        assert len(attempts) == 1
+
+    def test_a_stalled_download_is_resumed_without_extracting_again(self, stops, encodes, monkeypatch):
+        monkeypatch.setattr(retry, "BASE_BACKOFF", 0)
+        monkeypatch.setattr(aio, "_WATCH_INTERVAL", 0.01)
+        monkeypatch.setattr(aio, "_THREAD_GRACE", 0.01)
+        extractions = []
+        downloads = []
+
+        class _Ydl(_FakeYdl):
+            def extract_info(self, url, download=True, process=True):
+                extractions.append(url)
+                return {"path": "/out/v.mp4", "ext": "mp4"}
+
+            def process_ie_result(self, info, download=True):
+                downloads.append(info)
+                if len(downloads) == 1:
+                    # No new bytes, from a thread of yt-dlp's own, as fragments are downloaded on.
+                    with ThreadPoolExecutor(1) as fragments:
+                        fragments.submit(self._stuck).result()
+                return info
+
+            def _stuck(self):
+                while True:
+                    self.report({"status": "downloading", "downloaded_bytes": 1})
+                    time.sleep(0.01)
+
+        asyncio.run(aio.download(_Ydl(None), _config(), _Progress(), stall_budgets={"download": 0.05}))
+
+        assert len(extractions) == 1
+        assert len(downloads) == 2
+        assert len(stops) == 1
+        assert encodes == [("/out/v.mp4", "x264")]
+
+
+# Writes its first argument, as ffmpeg writes its output, after one progress block.
+FAKE_FFMPEG = textwrap.dedent(
+    """
+    import sys
+    sys.stdout.write("out_time_us=1000000\\nprogress=end\\n")
+    open(sys.argv[1], "w").close()
+    """
+)
+
+
+class TestPostProcess:
+    def test_a_single_pass_runs_ffmpeg_on_the_loop(self, tmp_path, monkeypatch):
+        source = tmp_path / "v.webm"
+        source.write_bytes(b"x" * 100)
+        tmp = tmp_path / "v.tmp.mp4"
+        final = tmp_path / "v.mp4"
+
+        async def ffprobe(filename, cmd):
+            return {}
+
+        plan = EncodePlan(True, True, 1080, "x264", 2, False)
+        monkeypatch.setattr(aio, "ffprobe", ffprobe)
+        monkeypatch.setattr(aio, "plan_encode", lambda probe, target: plan)
+        command = [sys.executable, "-c", FAKE_FFMPEG, str(tmp)]
+        monkeypatch.setattr(aio, "single_pass", lambda *args: (command, "Remuxing", [(str(tmp), str(final))]))
+        progress = _Progress()
+
+        asyncio.run(aio.post_process(str(source), "x264", progress, {}))
+
+        assert final.exists()
+        assert not source.exists()
+        assert progress.processes[-1]["action"] == "Remuxing"
+
+    def test_the_rest_runs_on_a_thread_with_a_cancel_of_the_task(self, monkeypatch):
+        started = threading.Event()
+        seen = []
+
+        def ffmpeg_video(*args, **kwargs):
+            cancel = args[5]
+            started.set()
+            while not cancel.is_cancelled():
+                time.sleep(0.01)
+            seen.append("cancelled")
+
+        async def ffprobe(filename, cmd):
+            return {}
+
+        monkeypatch.setattr(aio, "ffprobe", ffprobe)
+        monkeypatch.setattr(
+            aio, "plan_encode", lambda probe, target: EncodePlan(False, False, 1080, "x265", 7200, False)
+        )
+        monkeypatch.setattr(aio, "single_pass", lambda *args: None)
+        monkeypatch.setattr(aio, "_ffmpeg_video", ffmpeg_video)
+
+        async def scenario():
+            task = asyncio.ensure_future(aio.post_process("/out/v.webm", "x265", _Progress(), {}))
+            await asyncio.to_thread(started.wait, 5)
+            task.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await task
+
+        asyncio.run(scenario())
+
+        # The task only ended once the encode had seen the cancel.
+        assert seen == ["cancelled"]
+
+    def test_best_without_renditions_does_nothing(self, monkeypatch):
+        async def ffprobe(filename, cmd):
+            raise AssertionError("nothing to probe")
+
+        monkeypatch.setattr(aio, "ffprobe", ffprobe)
+
+        asyncio.run(aio.post_process("/out/v.webm", "Best", _Progress(), {}))
@@ -1,4 +1,5 @@
 import inspect
+import os
 import sys
 from unittest.mock import MagicMock, patch
 
@@ -40,7 +41,10 @@ def _fake_process(poll_sequence, returncode=0):
     process.poll = MagicMock(side_effect=poll)
     process.returncode = returncode
     process.wait = MagicMock(return_value=returncode)
-    process.communicate = MagicMock(return_value=("", ""))
+    # A real pipe, already at its end, like the stderr of an aria2c that said nothing.
+    read_end, write_end = os.pipe()
+    os.close(write_end)
+    process.stderr = os.fdopen(read_end)
     return process
 
 
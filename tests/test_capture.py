@@ -0,0 +1,70 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+from core.capture import TailBuffer, drain
+from core.reactor import can_watch_pipes
+
+
+class TestTailBuffer:
+    def test_keeps_only_the_last_lines(self):
+        tail = TailBuffer(max_lines=3)
+        for i in range(10):
+            tail.write(f"line {i}\n")
+
+        assert tail.text() == "line 7\nline 8\nline 9\n"
+        assert tail.dropped == 7
+
+    def test_lines_split_across_writes_come_out_whole(self):
+        tail = TailBuffer()
+        tail.write("Conversion fa")
+        tail.write("iled!\nError while ")
+        tail.write("opening encoder")
+        tail.close()
+
+        assert tail.text() == "Conversion failed!\nError while opening encoder\n"
+
+    def test_spills_every_line_it_will_forget(self):
+        spilled = []
+        tail = TailBuffer(max_lines=1, spill=spilled.append)
+
+        tail.write("one\n\ntwo\r\nthree\n")
+
+        assert spilled == ["one", "two", "three"]
+        assert tail.text() == "three\n"
+
+    def test_nothing_written_is_nothing_kept(self):
+        tail = TailBuffer()
+        tail.close()
+
+        assert tail.text() == ""
+
+
+class TestDrain:
+    def test_keeps_the_end_of_a_long_run(self):
+        process = subprocess.Popen(
+            [sys.executable, "-c", "import sys\nfor i in range(100_000): sys.stderr.write(f'frame {i}\\n')"],
+            stderr=subprocess.PIPE,
+            text=True,
+        )
+        assert process.stderr is not None
+        stderr = drain(process.stderr, TailBuffer(max_lines=2))
+
+        process.wait()
+        assert stderr.wait(5) == "frame 99998\nframe 99999\n"
+        assert stderr.tail.dropped == 99_998
+
+    @pytest.mark.skipif(not can_watch_pipes, reason="the reader thread cannot be interrupted")
+    def test_lets_go_of_a_pipe_something_else_holds_open(self):
+        read_end, write_end = os.pipe()
+        os.write(write_end, b"last words\n")
+        stream = os.fdopen(read_end)
+        stderr = drain(stream)
+
+        try:
+            assert stderr.wait(0.1) == "last words\n"
+            assert stream.closed
+        finally:
+            os.close(write_end)
@@ -0,0 +1,319 @@
+import io
+import json
+import os
+import subprocess
+import sys
+import threading
+
+import pytest
+from yt_dlp.utils import DownloadCancelled as YtdlpDownloadCancelled
+
+import cli
+from cli import batch, runner
+from cli.batch import EXIT_FAILED, EXIT_INTERRUPTED, EXIT_OK, BatchRunner, exit_code, read_urls
+from cli.options import JobOptions, Tools, build_config, build_ydl_opts, find_tools
+from core import hwaccel
+from core.encode import ffmpeg_video_command
+from core.jobs import CANCELLED, DONE, FAILED, PROCESSING
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+TOOLS = Tools(ff_path={"ffmpeg": "ffmpeg", "ffprobe": "ffprobe"})
+
+
+class _Tty(io.StringIO):
+    def isatty(self):
+        return True
+
+
+class _Token:
+    def __init__(self, cancelled=False):
+        self.cancelled = cancelled
+
+    def is_cancelled(self):
+        return self.cancelled
+
+
+class _Recorder:
+    def __init__(self):
+        self.downloads = []
+        self.processes = []
+
+    def on_download_progress(self, status):
+        self.downloads.append(status)
+
+    def on_process_progress(self, status):
+        self.processes.append(status)
+
+    def on_usage(self, usage):
+        pass
+
+
+class _FakeYdl:
+    def __init__(self, opts):
+        self.params = opts
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+def _events(out: io.StringIO) -> list[dict]:
+    return [json.loads(line) for line in out.getvalue().splitlines()]
+
+
+def _last_state(events: list[dict]) -> dict[str, dict]:
+    return {e["job_id"]: e for e in events if e["event"] == "job"}
+
+
+class TestReadUrls:
+    def test_arguments_then_file(self, tmp_path):
+        listing = tmp_path / "urls.txt"
+        listing.write_text("https://a.example/1\n\n# skipped\n  https://a.example/2  \n", encoding="utf-8")
+
+        urls = read_urls(["https://b.example/0"], str(listing), _Tty())
+
+        assert urls == ["https://b.example/0", "https://a.example/1", "https://a.example/2"]
+
+    def test_dash_reads_stdin(self):
+        assert read_urls([], "-", _Tty("https://a.example/1\n")) == ["https://a.example/1"]
+
+    def test_piped_stdin_is_read_when_nothing_else_is_given(self):
+        assert read_urls([], None, io.StringIO("https://a.example/1\n")) == ["https://a.example/1"]
+
+    def test_a_terminal_is_not_waited_on(self):
+        assert read_urls([], None, _Tty("https://a.example/1\n")) == []
+
+    def test_arguments_leave_stdin_alone(self):
+        assert read_urls(["https://b.example/0"], None, io.StringIO("https://a.example/1\n")) == ["https://b.example/0"]
+
+
+class TestBuildYdlOpts:
+    def test_matches_the_gui_builders(self):
+        opts = build_ydl_opts(
+            "https://example.com/v", JobOptions(dest_folder="/out", quality="720p"), TOOLS, print, print
+        )
+
+        assert opts["outtmpl"].startswith(os.path.join("/out", ""))
+        assert opts["format_sort"] == ["res:720", "fps:60"]
+        assert opts["noplaylist"] is True
+        assert opts["concurrent_fragment_downloads"] == 4
+
+    def test_audio_only(self):
+        opts = build_ydl_opts("https://example.com/v", JobOptions(audio_only=True, acodec="MP3"), TOOLS, print, print)
+
+        assert opts["extract_audio"] is True
+        assert opts["postprocessors"] == [{"key": "FFmpegExtractAudio", "preferredcodec": "MP3"}]
+
+    def test_trim(self):
+        opts = build_ydl_opts("https://example.com/v", JobOptions(start="00:00:10"), TOOLS, print, print)
+
+        assert "download_ranges" in opts
+        assert opts["force_keyframes_at_cuts"] is True
+
+    def test_sponsor_block_adds_to_the_postprocessors(self):
+        opts = build_ydl_opts(
+            "https://example.com/v", JobOptions(audio_only=True, sponsor_block=True), TOOLS, print, print
+        )
+
+        assert [pp["key"] for pp in opts["postprocessors"]] == ["FFmpegExtractAudio", "SponsorBlock", "ModifyChapters"]
+
+    def test_aria2c_only_where_it_helps(self):
+        tools = Tools(ff_path={}, aria2c="/bin/aria2c")
+
+        direct = build_ydl_opts("https://files.example.com/v.mp4", JobOptions(), tools, print, print)
+        youtube = build_ydl_opts("https://www.youtube.com/watch?v=x", JobOptions(), tools, print, print)
+
+        assert direct["external_downloader"] == {"http": "/bin/aria2c"}
+        assert "external_downloader" not in youtube
+
+    def test_qjs(self):
+        opts = build_ydl_opts("https://example.com/v", JobOptions(), Tools(ff_path={}, qjs="/bin/qjs"), print, print)
+
+        assert opts["js_runtimes"] == {"quickjs": {"path": "/bin/qjs"}}
+
+
+class TestBuildConfig:
+    def test_hooks_report_to_the_callback(self):
+        recorder = _Recorder()
+        config = build_config("https://example.com/v", JobOptions(vcodec="x265"), TOOLS, recorder, _Token())
+
+        config.ydl_opts["progress_hooks"][0]({"status": "downloading", "downloaded_bytes": 1})
+        config.ydl_opts["postprocessor_hooks"][0]({"status": "processing"})
+
+        assert config.target_vcodec == "x265"
+        assert config.stream_encode is True
+        assert recorder.downloads == [{"status": "downloading", "downloaded_bytes": 1}]
+        assert recorder.processes == [{"status": "processing"}]
+
+    def test_the_progress_hook_stops_a_cancelled_download(self):
+        config = build_config("https://example.com/v", JobOptions(), TOOLS, _Recorder(), _Token(cancelled=True))
+
+        with pytest.raises(YtdlpDownloadCancelled):
+            config.ydl_opts["progress_hooks"][0]({"status": "downloading", "downloaded_bytes": 1})
+
+    def test_the_encoder_probe_runs_the_ffmpeg_given(self, tmp_path, monkeypatch):
+        ffmpeg = str(tmp_path / "bin" / "ffmpeg")
+        config = build_config(
+            "https://example.com/v", JobOptions(vcodec="x264"), find_tools(ffmpeg=ffmpeg), _Recorder(), _Token()
+        )
+        probed = []
+
+        def run(args, **kwargs):
+            probed.append(args[0])
+            return subprocess.CompletedProcess(args, 0, stdout=" V..... libx264  H.264\n", stderr=b"")
+
+        monkeypatch.setattr(hwaccel, "_available_encoders", None)
+        monkeypatch.setattr(hwaccel, "_working_encoders", {})
+        monkeypatch.setattr(hwaccel.subprocess, "run", run)
+
+        command = ffmpeg_video_command("v.webm", "v.tmp.mp4", False, False, 1080, config.target_vcodec, config.ff_path)
+
+        assert command[0] == ffmpeg
+        assert command[command.index("-c:v") + 1] == "libx264"
+        assert probed and set(probed) == {ffmpeg}
+
+
+class TestBatchRunner:
+    @pytest.fixture
+    def fake_core(self, monkeypatch):
+        """create_ydl and download as fakes; `behaviour[url]` says what each download does."""
+        behaviour = {}
+        ydls = []
+
+        def create_ydl(opts, status_cb, ff_path):
+            status_cb.on_status("Fetching video info")
+            status_cb.on_status("Fetching video info")
+            ydl = _FakeYdl(opts)
+            ydls.append(ydl)
+            return ydl
+
+        def download(ydl, config, cancel, progress_cb):
+            hook = ydl.params["progress_hooks"][0]
+            hook({"status": "downloading", "downloaded_bytes": 50, "total_bytes": 100, "speed": 10})
+            action = behaviour.get(config.url)
+            if action is not None:
+                action(ydl, config, cancel, progress_cb)
+            hook({"status": "finished", "downloaded_bytes": 100, "total_bytes": 100})
+
+        monkeypatch.setattr(runner, "create_ydl", create_ydl)
+        monkeypatch.setattr(runner, "download", download)
+        return behaviour, ydls
+
+    def test_every_job_ends_with_its_final_state(self, fake_core):
+        behaviour, ydls = fake_core
+
+        def fail(*_):
+            raise RuntimeError("boom")
+
+        behaviour["https://example.com/bad"] = fail
+        out = io.StringIO()
+        urls = ["https://example.com/a", "https://example.com/bad", "not a url"]
+
+        totals = BatchRunner(urls, JobOptions(), TOOLS, jobs=2, out=out, interval=0.01).run()
+
+        events = _events(out)
+        last = _last_state(events)
+        assert [last[job_id]["stage"] for job_id in ("1", "2", "3")] == [DONE, FAILED, FAILED]
+        assert last["1"]["label"] == "https://example.com/a"
+        assert last["2"]["error"]
+        assert events[-1] == {"event": "summary", "jobs": 3, "done": 1, "failed": 2, "cancelled": 0}
+        assert exit_code(totals, interrupted=False) == EXIT_FAILED
+        assert all(ydl.closed for ydl in ydls)
+        # The invalid URL never reached yt-dlp.
+        assert len(ydls) == 2
+
+    def test_repeated_status_messages_are_written_once(self, fake_core):
+        out = io.StringIO()
+
+        BatchRunner(["https://example.com/a"], JobOptions(), TOOLS, out=out).run()
+
+        statuses = [e for e in _events(out) if e["event"] == "status"]
+        assert statuses == [{"event": "status", "job_id": "1", "message": "Fetching video info"}]
+
+    def test_processing_progress_comes_through(self, fake_core):
+        behaviour, _ = fake_core
+        seen = threading.Event()
+        runner: BatchRunner | None = None
+
+        def encode(ydl, config, cancel, progress_cb):
+            progress_cb.on_process_progress({"processed_bytes": 10, "total_bytes": 40})
+            assert runner is not None
+            job = runner.model.get("1")
+            assert job is not None and job.stage == PROCESSING
+            seen.set()
+
+        behaviour["https://example.com/a"] = encode
+        runner = BatchRunner(["https://example.com/a"], JobOptions(), TOOLS, out=io.StringIO())
+
+        totals = runner.run()
+
+        assert seen.is_set()
+        assert exit_code(totals, interrupted=False) == EXIT_OK
+
+    def test_runs_jobs_at_once(self, fake_core):
+        behaviour, _ = fake_core
+        # Both jobs must be in their download together to get through the barrier.
+        barrier = threading.Barrier(2, timeout=5)
+        for url in ("https://example.com/a", "https://example.com/b"):
+            behaviour[url] = lambda *_: barrier.wait()
+
+        totals = BatchRunner(list(behaviour), JobOptions(), TOOLS, jobs=2, out=io.StringIO(), interval=0.01).run()
+
+        assert totals.stages[DONE] == 2
+
+    def test_cancel_stops_the_job_in_flight_and_skips_the_queue(self, fake_core):
+        behaviour, _ = fake_core
+        runner: BatchRunner | None = None
+
+        def cancelled_midway(ydl, config, cancel, progress_cb):
+            assert runner is not None
+            runner.cancel()
+            ydl.params["progress_hooks"][0]({"status": "downloading", "downloaded_bytes": 60})
+
+        behaviour["https://example.com/a"] = cancelled_midway
+        out = io.StringIO()
+        runner = BatchRunner(["https://example.com/a", "https://example.com/b"], JobOptions(), TOOLS, out=out)
+
+        totals = runner.run()
+
+        assert {job.stage for job in runner.model} == {CANCELLED}
+        assert exit_code(totals, interrupted=runner.cancelled) == EXIT_INTERRUPTED
+
+
+class TestMain:
+    def test_no_url_is_a_usage_error(self, monkeypatch):
+        monkeypatch.setattr(sys, "stdin", _Tty())
+
+        with pytest.raises(SystemExit) as exc:
+            batch.main([])
+
+        assert exc.value.code == 2
+
+    def test_bad_timecode_is_a_usage_error(self):
+        with pytest.raises(SystemExit):
+            batch.main(["--start", "10s", "https://example.com/a"])
+
+    def test_main_py_hands_batch_over(self, monkeypatch):
+        import main
+
+        calls = []
+
+        def run(command, argv):
+            calls.append((command, argv))
+            return 0
+
+        monkeypatch.setattr(sys, "argv", ["video-dl", "batch", "https://example.com/a", "-j", "2"])
+        monkeypatch.setattr(cli, "run", run)
+
+        with pytest.raises(SystemExit) as exc:
+            main.main()
+
+        assert exc.value.code == 0
+        assert calls == [("batch", ["https://example.com/a", "-j", "2"])]
+
+    def test_flet_is_never_imported(self):
+        code = "import sys, cli, cli.batch; sys.exit('flet' in sys.modules)"
+        result = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True, timeout=60)
+
+        assert result.returncode == 0, result.stderr
@@ -1,13 +1,14 @@
 from __future__ import annotations
 
-import signal
-import subprocess
+import io
 import sys
-import time
 from unittest.mock import MagicMock, patch
 
 import pytest
+from yt_dlp.networking import Response
+from yt_dlp.networking.exceptions import HTTPError
 from yt_dlp.utils import DownloadCancelled as YtdlpDownloadCancelled
+from yt_dlp.utils import DownloadError
 
 # ---------------------------------------------------------------------------
 # Mock the heavy GUI dependencies before importing core.download.
@@ -38,17 +39,13 @@ sys.modules.pop("core.download", None)
 
 from core.download import (  # noqa: E402
     _STATUS_PATTERNS,
-    MAX_RETRIES,
-    STALL_TIMEOUT,
     _finish_download,
-    _get_child_pids,
-    _kill_new_children,
-    _StallDetector,
     _YdlUiLogger,
     download,
     post_download,
 )
 from core.exceptions import DownloadCancelled, DownloadTimeout, PlaylistNotFound  # noqa: E402
+from core.retry import MAX_RETRIES  # noqa: E402
 
 # GF members are MagicMock attributes - build a lookup by identity
 _GF = _mock_lang.GuiField
@@ -194,107 +191,6 @@ class TestFinishDownload:
             _finish_download(MagicMock(), {"_type": "playlist", "entries": entries}, config, cancel, progress_cb)
 
 
-# ---------------------------------------------------------------------------
-# Phase 1 - _StallDetector
-# ---------------------------------------------------------------------------
-class TestStallDetector:
-    def test_not_stalled_just_after_creation(self):
-        sd = _StallDetector(stall_timeout=10)
-        assert sd.is_stalled() is False
-
-    @patch("core.download.time")
-    def test_stalled_after_timeout(self, mock_time):
-        mock_time.monotonic.return_value = 0.0
-        sd = _StallDetector(stall_timeout=10)
-        mock_time.monotonic.return_value = 11.0
-        assert sd.is_stalled() is True
-
-    @patch("core.download.time")
-    def test_not_stalled_at_exact_boundary(self, mock_time):
-        mock_time.monotonic.return_value = 0.0
-        sd = _StallDetector(stall_timeout=10)
-        mock_time.monotonic.return_value = 10.0
-        assert sd.is_stalled() is False
-
-    @patch("core.download.time")
-    def test_tick_resets_timer(self, mock_time):
-        mock_time.monotonic.return_value = 0.0
-        sd = _StallDetector(stall_timeout=10)
-        mock_time.monotonic.return_value = 9.0
-        sd.tick()  # reset at t=9
-        mock_time.monotonic.return_value = 18.0
-        assert sd.is_stalled() is False  # only 9s since tick
-        mock_time.monotonic.return_value = 20.0
-        assert sd.is_stalled() is True  # 11s since tick
-
-    @patch("core.download.time")
-    def test_custom_timeout(self, mock_time):
-        mock_time.monotonic.return_value = 0.0
-        sd = _StallDetector(stall_timeout=5)
-        mock_time.monotonic.return_value = 6.0
-        assert sd.is_stalled() is True
-
-    @patch("core.download.time")
-    def test_tick_then_stall(self, mock_time):
-        mock_time.monotonic.return_value = 0.0
-        sd = _StallDetector(stall_timeout=10)
-        mock_time.monotonic.return_value = 5.0
-        sd.tick()
-        mock_time.monotonic.return_value = 5.0
-        assert sd.is_stalled() is False
-
-
-# ---------------------------------------------------------------------------
-# Phase 2 - _get_child_pids
-# ---------------------------------------------------------------------------
-class TestGetChildPids:
-    @patch("core.download.subprocess.check_output", return_value="1234\n5678\n")
-    def test_parses_normal_output(self, mock_check):
-        result = _get_child_pids()
-        assert result == {1234, 5678}
-
-    @patch("core.download.subprocess.check_output", return_value="\n")
-    def test_empty_output(self, mock_check):
-        assert _get_child_pids() == set()
-
-    @patch("core.download.subprocess.check_output", side_effect=subprocess.CalledProcessError(1, "pgrep"))
-    def test_called_process_error(self, mock_check):
-        assert _get_child_pids() == set()
-
-    @patch("core.download.subprocess.check_output", side_effect=FileNotFoundError)
-    def test_file_not_found(self, mock_check):
-        assert _get_child_pids() == set()
-
-    @patch("core.download.subprocess.check_output", side_effect=subprocess.TimeoutExpired("pgrep", 5))
-    def test_timeout_expired(self, mock_check):
-        assert _get_child_pids() == set()
-
-
-# ---------------------------------------------------------------------------
-# Phase 2 - _kill_new_children
-# ---------------------------------------------------------------------------
-class TestKillNewChildren:
-    @patch("core.download.os.kill")
-    @patch("core.download._get_child_pids", return_value={100, 200, 300})
-    def test_kills_only_new_pids(self, mock_get, mock_kill):
-        _kill_new_children({100})
-        killed_pids = {call[0][0] for call in mock_kill.call_args_list}
-        assert killed_pids == {200, 300}
-        for call in mock_kill.call_args_list:
-            assert call[0][1] == signal.SIGTERM
-
-    @patch("core.download.os.kill")
-    @patch("core.download._get_child_pids", return_value={100})
-    def test_no_new_pids_no_kill(self, mock_get, mock_kill):
-        _kill_new_children({100})
-        mock_kill.assert_not_called()
-
-    @patch("core.download.os.kill", side_effect=OSError("No such process"))
-    @patch("core.download._get_child_pids", return_value={200})
-    def test_oserror_silently_ignored(self, mock_get, mock_kill):
-        _kill_new_children(set())  # should not raise
-
-
 # ---------------------------------------------------------------------------
 # Phase 4 - post_download
 # ---------------------------------------------------------------------------
@@ -308,7 +204,9 @@ class TestPostDownload:
         progress_cb = MagicMock()
         post_download("x264", ydl, infos, cancel, progress_cb, {"ffmpeg": "ffmpeg"})
         expected_path = "/tmp/My Video.mp4"
-        mock_ppdl.assert_called_once_with(expected_path, "x264", cancel, progress_cb, {"ffmpeg": "ffmpeg"})
+        mock_ppdl.assert_called_once_with(
+            expected_path, "x264", cancel, progress_cb, {"ffmpeg": "ffmpeg"}, (), "balanced"
+        )
 
     @patch("core.download.post_process_dl")
     def test_ext_from_infos_dict(self, mock_ppdl):
@@ -327,6 +225,10 @@ class TestPostDownload:
 def _make_ydl(extract_result=None, extract_error=None):
     ydl = MagicMock()
     ydl.params = {"progress_hooks": [], "logger": MagicMock()}
+    ydl._progress_hooks = []
+    ydl._postprocessor_hooks = []
+    ydl.add_progress_hook.side_effect = ydl._progress_hooks.append
+    ydl.add_postprocessor_hook.side_effect = ydl._postprocessor_hooks.append
     if extract_error:
         ydl.extract_info.side_effect = extract_error
     else:
@@ -336,8 +238,7 @@ def _make_ydl(extract_result=None, extract_error=None):
 
 class TestDownload:
     @patch("core.download._finish_download")
-    @patch("core.download._get_child_pids", return_value=set())
-    def test_success(self, mock_pids, mock_finish):
+    def test_success(self, mock_finish):
         ydl = _make_ydl(extract_result={"_type": "video", "ext": "mp4"})
         cancel = MagicMock()
         cancel.is_cancelled.return_value = False
@@ -346,8 +247,7 @@ class TestDownload:
         download(ydl, config, cancel, MagicMock())
         mock_finish.assert_called_once()
 
-    @patch("core.download._get_child_pids", return_value=set())
-    def test_cancel_before_start(self, mock_pids):
+    def test_cancel_before_start(self):
         ydl = _make_ydl(extract_result={})
         cancel = MagicMock()
         cancel.is_cancelled.return_value = True
@@ -357,8 +257,7 @@ class TestDownload:
             download(ydl, config, cancel, MagicMock())
 
     @patch("core.download._finish_download")
-    @patch("core.download._get_child_pids", return_value=set())
-    def test_ytdlp_cancelled_converted(self, mock_pids, mock_finish):
+    def test_ytdlp_cancelled_converted(self, mock_finish):
         ydl = _make_ydl(extract_error=YtdlpDownloadCancelled("cancelled"))
         cancel = MagicMock()
         cancel.is_cancelled.return_value = False
@@ -367,8 +266,7 @@ class TestDownload:
         with pytest.raises(DownloadCancelled):
             download(ydl, config, cancel, MagicMock())
 
-    @patch("core.download._get_child_pids", return_value=set())
-    def test_extract_error_propagated(self, mock_pids):
+    def test_extract_error_propagated(self):
         ydl = _make_ydl(extract_error=RuntimeError("network error"))
         cancel = MagicMock()
         cancel.is_cancelled.return_value = False
@@ -378,49 +276,74 @@ class TestDownload:
             download(ydl, config, cancel, MagicMock())
 
     @patch("core.download.time.sleep")
-    @patch("core.download._kill_new_children")
-    @patch("core.download._get_child_pids", return_value=set())
-    def test_stall_retry_then_timeout(self, mock_pids, mock_kill, mock_sleep):
-        ydl = MagicMock()
-        ydl.params = {"progress_hooks": [], "logger": MagicMock()}
-
-        call_count = [0]
-        stall_detector_ref = [None]
-
-        original_init = _StallDetector.__init__
-
-        def patched_init(self_sd, *args, **kwargs):
-            original_init(self_sd, *args, **kwargs)
-            stall_detector_ref[0] = self_sd
-
-        def fake_extract(url):
-            call_count[0] += 1
-            # Force the stall detector to report stalled
-            if stall_detector_ref[0]:
-                stall_detector_ref[0]._last_activity = time.monotonic() - STALL_TIMEOUT - 1
-            raise TimeoutError("connection timed out")
-
-        ydl.extract_info.side_effect = fake_extract
-
+    @patch("core.supervisor.JobProcesses.stop")
+    @patch("core.stall.StallDetector.is_stalled", return_value=True)
+    def test_stall_retry_then_timeout(self, mock_stalled, mock_stop, mock_sleep):
+        ydl = _make_ydl(extract_error=TimeoutError("connection timed out"))
         cancel = MagicMock()
         cancel.is_cancelled.return_value = False
         config = _make_config()
         config.url = "https://example.com/video"
 
-        with patch.object(_StallDetector, "__init__", patched_init), pytest.raises(DownloadTimeout):
+        with pytest.raises(DownloadTimeout):
             download(ydl, config, cancel, MagicMock())
 
-        assert call_count[0] == MAX_RETRIES
+        assert ydl.extract_info.call_count == MAX_RETRIES
 
     @patch("core.download._finish_download")
-    @patch("core.download._get_child_pids", return_value=set())
-    def test_hooks_restored_after_success(self, mock_pids, mock_finish):
+    def test_stall_hooks_removed_after_success(self, mock_finish):
         original_hook = MagicMock()
         ydl = _make_ydl(extract_result={"_type": "video"})
-        ydl.params["progress_hooks"] = [original_hook]
+        ydl._progress_hooks.append(original_hook)
         cancel = MagicMock()
         cancel.is_cancelled.return_value = False
         config = _make_config()
         config.url = "https://example.com/video"
         download(ydl, config, cancel, MagicMock())
-        assert ydl.params["progress_hooks"] == [original_hook]
+        assert ydl._progress_hooks == [original_hook]
+        assert ydl._postprocessor_hooks == []
+
+    @patch("core.download.time.sleep")
+    @patch("core.download._finish_download")
+    def test_a_busy_server_is_waited_for_and_the_download_resumed(self, mock_finish, mock_sleep):
+        busy = HTTPError(Response(io.BytesIO(), "https://example.com/v.mp4", {"Retry-After": "20"}, status=503))
+        ydl = _make_ydl(extract_result={"_type": "video", "formats": []})
+        attempts = []
+
+        def process_ie_result(info, download=True):
+            attempts.append(info)
+            if len(attempts) == 1:
+                for hook in list(ydl._progress_hooks):
+                    hook({"status": "downloading", "downloaded_bytes": 1})
+                raise DownloadError("ERROR: HTTP Error 503", (HTTPError, busy, None))
+            return info
+
+        ydl.process_ie_result.side_effect = process_ie_result
+        cancel = MagicMock()
+        cancel.is_cancelled.return_value = False
+        config = _make_config()
+        config.url = "https://example.com/video"
+
+        download(ydl, config, cancel, MagicMock())
+
+        assert sum(call.args[0] for call in mock_sleep.call_args_list) == 20
+        assert ydl.extract_info.call_count == 1
+        assert len(attempts) == 2
+        mock_finish.assert_called_once()
+
+    @patch("core.download.time.sleep")
+    def test_a_cancel_during_the_wait_between_attempts_stops_it(self, mock_sleep):
+        busy = HTTPError(Response(io.BytesIO(), "https://example.com/v.mp4", {"Retry-After": "300"}, status=503))
+        ydl = _make_ydl(extract_result={"_type": "video", "formats": []})
+        ydl.process_ie_result.side_effect = DownloadError("ERROR: HTTP Error 503", (HTTPError, busy, None))
+        cancel = MagicMock()
+        cancel.is_cancelled.return_value = False
+        mock_sleep.side_effect = lambda seconds: cancel.is_cancelled.configure_mock(return_value=True)
+        config = _make_config()
+        config.url = "https://example.com/video"
+
+        with pytest.raises(DownloadCancelled):
+            download(ydl, config, cancel, MagicMock())
+
+        assert mock_sleep.call_count == 1
+        assert ydl.process_ie_result.call_count == 1
@@ -20,17 +20,25 @@ sys.modules["i18n.lang"] = _mock_lang
 # Force reimport in case another test mocked the module
 sys.modules.pop("core.encode", None)
 
+from core.config_types import OutputTarget, ResourcePolicy  # noqa: E402, I001
+from core.resources import job_resources  # noqa: E402, I001
 from core.encode import (  # noqa: E402, I001
     NLE_COMPATIBLE_ACODECS,
     NLE_COMPATIBLE_VCODECS,
     _TARGET_TO_VCODEC_NAME,
     _VCODEC_NAME_TO_TARGET,
     _adapt_crf,
+    _encode_checkpointed,
+    _encode_video,
     _ffmpeg_video,
     _progress_ffmpeg,
+    checkpointed_segments,
+    ffmpeg_video_command,
     ffprobe,
     needs_reencode,
+    plan_encode,
     post_process_dl,
+    single_pass,
 )
 
 
@@ -445,9 +453,416 @@ class TestPostProcessDl:
         assert mock_ffmpeg.call_args[0][2] is True  # vcodec_is_target (hevc == x265)
 
 
+class TestSinglePass:
+    FF = {"ffmpeg": "ffmpeg"}
+
+    def test_a_remux_is_one_run(self):
+        plan = plan_encode(_fake_probe(vcodec="h264", acodec="aac"), "NLE")
+
+        run = single_pass("/tmp/video.mkv", plan, self.FF)
+
+        assert run is not None
+        command, action, written = run
+
+        assert command[command.index("-c:v") + 1] == "copy"
+        assert "ff_remux" in action
+        assert written == [("/tmp/video.tmp.mp4", "/tmp/video.mp4")]
+
+    @patch("core.encode.is_software_encoder", return_value=True)
+    @patch("core.encode.fastest_encoder", return_value=("libx264", ["-crf", "23"]))
+    def test_a_short_software_encode_is_one_run(self, mock_enc, mock_sw):
+        plan = plan_encode(_fake_probe(vcodec="vp9", acodec="aac"), "x264")
+
+        run = single_pass("/tmp/video.webm", plan, self.FF)
+
+        assert run is not None
+        command, _, _ = run
+
+        assert command[command.index("-c:v") + 1] == "libx264"
+
+    @patch("core.encode.is_software_encoder", return_value=False)
+    @patch("core.encode.fastest_encoder", return_value=("h264_nvenc", []))
+    def test_a_hardware_encode_may_fail_over_so_is_not(self, mock_enc, mock_sw):
+        plan = plan_encode(_fake_probe(vcodec="vp9", acodec="aac"), "x264")
+
+        assert single_pass("/tmp/video.webm", plan, self.FF) is None
+
+    @patch("core.encode.is_software_encoder", return_value=True)
+    def test_a_checkpointed_encode_is_not(self, mock_sw):
+        plan = plan_encode(_fake_probe(vcodec="vp9", acodec="aac", duration=7200), "x264")
+
+        assert single_pass("/tmp/video.webm", plan, self.FF) is None
+
+
+class TestRenditions:
+    PROXY = OutputTarget(suffix="proxy", target_vcodec="x264", max_height=540)
+    MP3 = OutputTarget(suffix="audio", audio_codec="mp3")
+
+    @patch("core.encode.fastest_encoder", return_value=("libx264", ["-crf", "23"]))
+    def test_one_decode_feeds_every_video_output(self, mock_enc):
+        cmd = ffmpeg_video_command(
+            "/tmp/video.webm",
+            "/tmp/video.tmp.mp4",
+            False,
+            False,
+            1080,
+            "x264",
+            {"ffmpeg": "ffmpeg"},
+            renditions=[(self.PROXY, "/tmp/video - proxy.tmp.mp4"), (self.MP3, "/tmp/video - audio.tmp.mp3")],
+        )
+        assert cmd.count("-i") == 1
+        graph = cmd[cmd.index("-filter_complex") + 1]
+        assert graph.startswith("[0:v:0]split=2[s0][s1]")
+        assert "scale=-2:'min(540,ih)'" in graph
+        maps = [cmd[i + 1] for i, v in enumerate(cmd) if v == "-map"]
+        assert maps == ["[s0]", "0:a:0", "[r0]", "0:a:0?", "0:a:0"]
+        assert cmd[-1] == "/tmp/video - audio.tmp.mp3"
+        assert "libmp3lame" in cmd
+        # The proxy gets the CRF its own, smaller, resolution calls for.
+        crfs = [cmd[i + 1] for i, v in enumerate(cmd) if v == "-crf"]
+        assert crfs == ["23", "26"]
+
+    @patch("core.encode.fastest_encoder", return_value=("libx264", ["-crf", "23"]))
+    def test_every_output_encodes_at_the_requested_speed_tier(self, mock_enc):
+        ffmpeg_video_command(
+            "/tmp/video.webm",
+            "/tmp/video.tmp.mp4",
+            False,
+            False,
+            1080,
+            "x264",
+            {"ffmpeg": "/opt/ffmpeg/ffmpeg"},
+            renditions=[(self.PROXY, "/tmp/video - proxy.tmp.mp4")],
+            speed_tier="fastest",
+        )
+        probed = ("x264", "fastest", {"ffmpeg": "/opt/ffmpeg/ffmpeg"})
+        assert [c.args for c in mock_enc.call_args_list] == [probed, probed]
+
+    @patch("core.encode.fastest_encoder", return_value=("libx264", ["-crf", "23"]))
+    def test_every_encode_keeps_to_the_thread_budget(self, mock_enc):
+        with job_resources({"encode": ResourcePolicy(threads=2)}):
+            cmd = ffmpeg_video_command(
+                "/tmp/video.webm",
+                "/tmp/video.tmp.mp4",
+                False,
+                False,
+                1080,
+                "x264",
+                {"ffmpeg": "ffmpeg"},
+                renditions=[(self.PROXY, "/tmp/video - proxy.tmp.mp4")],
+            )
+        assert [cmd[i + 1] for i, v in enumerate(cmd) if v == "-threads"] == ["2", "2"]
+
+    @patch("core.encode.fastest_encoder", return_value=("libx264", ["-crf", "23"]))
+    def test_a_copied_main_output_does_not_decode(self, mock_enc):
+        cmd = ffmpeg_video_command(
+            "/tmp/video.mp4",
+            "/tmp/video.tmp.mp4",
+            True,
+            True,
+            1080,
+            "x264",
+            {"ffmpeg": "ffmpeg"},
+            renditions=[(self.PROXY, "/tmp/video - proxy.tmp.mp4")],
+        )
+        graph = cmd[cmd.index("-filter_complex") + 1]
+        assert graph.startswith("[0:v:0]split=1[s0]")
+        maps = [cmd[i + 1] for i, v in enumerate(cmd) if v == "-map"]
+        assert maps[0] == "0:v:0"
+
+    @patch("core.encode._progress_ffmpeg")
+    @patch("core.encode.os.rename")
+    @patch("core.encode.os.remove")
+    @patch("core.encode.os.path.isfile", return_value=True)
+    def test_keep_source_writes_only_the_renditions(self, mock_isfile, mock_rm, mock_rename, mock_prog):
+        cancel = MagicMock()
+        cancel.is_cancelled.return_value = False
+        _ffmpeg_video(
+            "/tmp/video.webm",
+            True,
+            True,
+            1080,
+            "x264",
+            cancel,
+            MagicMock(),
+            120,
+            {"ffmpeg": "ffmpeg"},
+            outputs=[self.MP3],
+            keep_source=True,
+        )
+        cmd = mock_prog.call_args[0][0]
+        assert "-c:v" not in cmd
+        mock_rm.assert_not_called()
+        mock_rename.assert_called_once_with(src="/tmp/video - audio.tmp.mp3", dst="/tmp/video - audio.mp3")
+
+    @patch("core.encode._ffmpeg_video")
+    @patch("core.encode.ffprobe", return_value=_fake_probe(vcodec="vp9", acodec="opus"))
+    def test_best_with_renditions_keeps_the_download(self, mock_probe, mock_ffmpeg):
+        post_process_dl("/tmp/video.webm", "Best", MagicMock(), MagicMock(), {"ffprobe": "ffprobe"}, [self.MP3])
+        assert mock_ffmpeg.call_args.kwargs["keep_source"] is True
+        assert mock_ffmpeg.call_args.kwargs["outputs"] == [self.MP3]
+        assert mock_ffmpeg.call_args[0][1] is False  # opus is re-encoded where a rendition copies audio
+
+
 # ---------------------------------------------------------------------------
 # Phase 6 - _progress_ffmpeg
 # ---------------------------------------------------------------------------
+class TestSeparateAudio:
+    def _run(self, duration, audio_returncode=0):
+        cancel = MagicMock()
+        cancel.is_cancelled.return_value = False
+        audio = MagicMock()
+        audio.wait.return_value = audio_returncode
+        audio.returncode = audio_returncode
+        audio.poll.return_value = audio_returncode
+        with (
+            patch("core.encode.fastest_encoder", return_value=("h264_nvenc", ["-cq:v", "23"])),
+            patch("core.encode.subprocess.Popen", return_value=audio) as mock_popen,
+            patch("core.resources.apply"),
+            patch("core.encode._progress_ffmpeg") as mock_prog,
+            patch("core.encode.os.path.isfile", return_value=True),
+            patch("core.encode.os.remove") as mock_rm,
+            patch("core.encode.os.rename"),
+        ):
+            _ffmpeg_video(
+                "/tmp/video.webm", False, False, 1080, "x264", cancel, MagicMock(), duration, {"ffmpeg": "ff"}
+            )
+        return mock_popen, mock_prog, mock_rm
+
+    def test_long_files_transcode_audio_next_to_the_video(self):
+        mock_popen, mock_prog, mock_rm = self._run(duration=900)
+
+        audio_cmd = mock_popen.call_args[0][0]
+        assert audio_cmd[audio_cmd.index("-c:a") + 1] == "aac"
+        assert audio_cmd[-1] == "/tmp/video.tmp.audio.m4a"
+        video_cmd, mux_cmd = (c[0][0] for c in mock_prog.call_args_list)
+        assert "-an" in video_cmd
+        assert "-c:a" not in video_cmd
+        assert video_cmd[-1] == "/tmp/video.tmp.video.mp4"
+        assert mux_cmd[mux_cmd.index("-c") + 1] == "copy"
+        assert mux_cmd[-1] == "/tmp/video.tmp.mp4"
+        removed = [c[0][0] for c in mock_rm.call_args_list]
+        assert "/tmp/video.tmp.video.mp4" in removed
+        assert "/tmp/video.tmp.audio.m4a" in removed
+
+    def test_short_files_keep_a_single_process(self):
+        mock_popen, mock_prog, _ = self._run(duration=120)
+
+        mock_popen.assert_not_called()
+        assert mock_prog.call_count == 1
+        assert "-c:a" in mock_prog.call_args[0][0]
+
+    def test_a_failed_audio_transcode_fails_the_encode(self):
+        with pytest.raises(ValueError, match="return code 1"):
+            self._run(duration=900, audio_returncode=1)
+
+
+_NVENC_DIED = "FFmpeg failed with return code 1: [vost#0:0/h264_nvenc] Error submitting video frame to the encoder"
+
+
+class TestEncoderFailover:
+    def _encode(self, tmp_path, progress_side_effect, reached=42.0):
+        cancel = MagicMock()
+        cancel.is_cancelled.return_value = False
+        listings = []
+
+        def progress(cmd, *args):
+            if "concat" in cmd:
+                with open(cmd[cmd.index("-i") + 1]) as f:
+                    listings.append(f.read())
+            effect = next(effects)
+            if effect is not None:
+                raise effect
+
+        effects = iter(progress_side_effect)
+        degraded = set()
+
+        def fastest(*args):
+            return ("libx264", ["-crf", "23"]) if "h264_nvenc" in degraded else ("h264_nvenc", [])
+
+        with (
+            patch("core.encode.fastest_encoder", side_effect=fastest),
+            patch("core.encode.is_software_encoder", side_effect=lambda e: e.startswith("lib")),
+            patch("core.encode.mark_encoder_degraded", side_effect=degraded.add) as mock_degraded,
+            patch("core.encode._last_keyframe", return_value=reached),
+            patch("core.encode._progress_ffmpeg", side_effect=progress) as mock_prog,
+        ):
+            _encode_video(
+                str(tmp_path / "video.webm"),
+                str(tmp_path / "video.tmp.mp4"),
+                True,
+                1080,
+                "x264",
+                cancel,
+                MagicMock(),
+                1200,
+                {"ffmpeg": "ffmpeg", "ffprobe": "ffprobe"},
+                "balanced",
+            )
+        return mock_prog, mock_degraded, listings
+
+    def test_resumes_on_the_next_encoder_and_keeps_what_was_encoded(self, tmp_path):
+        mock_prog, mock_degraded, listings = self._encode(tmp_path, [ValueError(_NVENC_DIED), None, None])
+
+        mock_degraded.assert_called_once_with("h264_nvenc")
+        first, resumed, join = (c[0][0] for c in mock_prog.call_args_list)
+        assert "-ss" not in first
+        assert "+frag_keyframe+empty_moov" in first
+        assert resumed[resumed.index("-ss") + 1] == "42.000"
+        assert resumed.index("-ss") < resumed.index("-i")
+        assert join[-1] == str(tmp_path / "video.tmp.mp4")
+        assert listings == [
+            f"file '{tmp_path / 'video.tmp.part0.mp4'}'\noutpoint 42.000000\nfile '{tmp_path / 'video.tmp.part1.mp4'}'\n"
+        ]
+        assert not (tmp_path / "video.tmp.parts.txt").exists()
+
+    def test_a_part_without_a_keyframe_is_encoded_again(self, tmp_path):
+        mock_prog, _, listings = self._encode(tmp_path, [ValueError(_NVENC_DIED), None, None], reached=0.0)
+
+        assert "-ss" not in mock_prog.call_args_list[1][0][0]
+        assert listings == [f"file '{tmp_path / 'video.tmp.part1.mp4'}'\n"]
+
+    def test_a_failure_that_is_not_the_encoders_fails_the_job(self, tmp_path):
+        with pytest.raises(ValueError, match="No space left"):
+            self._encode(tmp_path, [ValueError("FFmpeg failed with return code 1: No space left on device")])
+
+    def test_a_failing_software_encoder_fails_the_job(self, tmp_path):
+        with pytest.raises(ValueError, match="libx264 died"):
+            self._encode(tmp_path, [ValueError(_NVENC_DIED), ValueError("libx264 died")])
+
+
+def _write_segments(workdir, first, count, seconds=60.0):
+    """Play ffmpeg's segment muxer: write `count` segments, and list them in a csv."""
+    rows = []
+    for number in range(first, first + count):
+        (workdir / f"seg{number:05d}.mp4").write_bytes(b"x")
+        rows.append(f"seg{number:05d}.mp4,0.000000,{seconds:.6f}\n")
+    (workdir / f"list{first:05d}.csv").write_text("".join(rows))
+
+
+class TestCheckpointedEncode:
+    def _encode(self, tmp_path, runs, cancelled=False, speed_tier="balanced"):
+        """Run an encode whose ffmpeg runs each play one of `runs`."""
+        source = tmp_path / "video.webm"
+        source.write_bytes(b"source")
+        cancel = MagicMock()
+        cancel.is_cancelled.return_value = cancelled
+        runs = iter(runs)
+        commands, listings = [], []
+
+        def progress(cmd, *args, **kwargs):
+            commands.append((cmd, kwargs))
+            if "concat" in cmd:
+                with open(cmd[cmd.index("-i") + 1]) as f:
+                    listings.append(f.read())
+            else:
+                next(runs)()
+
+        with (
+            patch("core.encode.fastest_encoder", return_value=("libx264", ["-crf", "23"])),
+            patch("core.encode.is_software_encoder", return_value=True),
+            patch("core.encode._progress_ffmpeg", side_effect=progress),
+        ):
+            _encode_checkpointed(
+                str(source),
+                str(tmp_path / "video.tmp.mp4"),
+                True,
+                1080,
+                "x264",
+                cancel,
+                MagicMock(),
+                600,
+                {},
+                speed_tier,
+            )
+        return commands, listings
+
+    def test_writes_listed_segments_and_joins_them(self, tmp_path):
+        workdir = tmp_path / "video.tmp.segments"
+        commands, listings = self._encode(tmp_path, [lambda: _write_segments(workdir, 0, 10)])
+
+        (encode, kwargs), (join, _) = commands
+        assert encode[encode.index("-f") + 1] == "segment"
+        assert encode[encode.index("-segment_start_number") + 1] == "0"
+        assert encode[-1] == str(workdir / "seg%05d.mp4")
+        assert "-ss" not in encode
+        assert kwargs["resumed_from"] == 0
+        assert listings[0].count("file '") == 10
+        assert join[-1] == str(tmp_path / "video.tmp.mp4")
+        assert not workdir.exists()
+
+    def test_a_crashed_encode_resumes_from_its_last_complete_segment(self, tmp_path):
+        workdir = tmp_path / "video.tmp.segments"
+
+        def crashed():
+            _write_segments(workdir, 0, 3)
+            # The segment in progress when it stopped, never listed.
+            (workdir / "seg00003.mp4").write_bytes(b"half")
+            # The process going down with the job.
+            raise SystemExit
+
+        with pytest.raises(SystemExit):
+            self._encode(tmp_path, [crashed])
+        assert checkpointed_segments(str(workdir)) == [(f"seg{i:05d}.mp4", 60.0) for i in range(3)]
+
+        commands, listings = self._encode(tmp_path, [lambda: _write_segments(workdir, 3, 7)])
+
+        (encode, kwargs), _ = commands
+        assert encode[encode.index("-ss") + 1] == "180.000"
+        assert encode[encode.index("-segment_start_number") + 1] == "3"
+        assert encode[encode.index("-segment_list") + 1] == str(workdir / "list00003.csv")
+        assert kwargs["resumed_from"] == 180
+        assert listings[0].count("file '") == 10
+
+    def test_a_cancelled_encode_leaves_no_segments(self, tmp_path):
+        workdir = tmp_path / "video.tmp.segments"
+
+        commands, _ = self._encode(tmp_path, [lambda: _write_segments(workdir, 0, 3)], cancelled=True)
+
+        assert len(commands) == 1
+        assert not workdir.exists()
+
+    def test_a_failed_encode_leaves_no_segments(self, tmp_path):
+        workdir = tmp_path / "video.tmp.segments"
+
+        def failed():
+            _write_segments(workdir, 0, 3)
+            raise ValueError("FFmpeg failed with return code 1: No space left on device")
+
+        with pytest.raises(ValueError, match="No space left"):
+            self._encode(tmp_path, [failed])
+
+        assert not workdir.exists()
+
+    def test_segments_of_another_encode_are_not_reused(self, tmp_path):
+        workdir = tmp_path / "video.tmp.segments"
+
+        def crashed():
+            _write_segments(workdir, 0, 3)
+            raise SystemExit
+
+        with pytest.raises(SystemExit):
+            self._encode(tmp_path, [crashed])
+
+        commands, _ = self._encode(tmp_path, [lambda: _write_segments(workdir, 0, 10)], speed_tier="archival")
+
+        assert "-ss" not in commands[0][0]
+
+
+class TestCheckpointedSegments:
+    def test_stops_at_a_gap(self, tmp_path):
+        _write_segments(tmp_path, 0, 2)
+        _write_segments(tmp_path, 3, 2)
+
+        assert [name for name, _ in checkpointed_segments(str(tmp_path))] == ["seg00000.mp4", "seg00001.mp4"]
+
+    def test_a_listed_segment_that_is_gone_ends_the_run(self, tmp_path):
+        _write_segments(tmp_path, 0, 3)
+        (tmp_path / "seg00001.mp4").unlink()
+
+        assert checkpointed_segments(str(tmp_path)) == [("seg00000.mp4", 60.0)]
+
+
 class TestProgressFfmpeg:
     @patch("core.encode.FFmpegProgressTracker")
     @patch("core.encode.os.path.getsize", return_value=1000000)
@@ -2,9 +2,14 @@ from __future__ import annotations
 
 import pytest
 
-from core.exceptions import DownloadCancelled, FFmpegNoValidEncoderFound, PlaylistNotFound
-
-_ALL_EXCEPTIONS = [DownloadCancelled, FFmpegNoValidEncoderFound, PlaylistNotFound]
+from core.exceptions import (
+    DownloadCancelled,
+    FFmpegNoValidEncoderFound,
+    JobProcessError,
+    PlaylistNotFound,
+)
+
+_ALL_EXCEPTIONS = [DownloadCancelled, FFmpegNoValidEncoderFound, JobProcessError, PlaylistNotFound]
 
 
 class TestExceptionHierarchy:
@@ -1,12 +1,17 @@
+import asyncio
 import shutil
 import subprocess
 import sys
 import textwrap
+import time
 
 import pytest
 
+from core.capture import TAIL_LINES
 from core.ffmpeg_progress import (
     FFmpegProgressTracker,
+    ProgressParser,
+    ProgressReport,
     bitrate_to_bits_per_second,
     duration_to_process,
     ffmpeg_time_to_seconds,
@@ -102,6 +107,49 @@ class TestDurationToProcess:
         assert duration_to_process(["-ss", "90", "-to", "60", "-i", "in.mp4"], 120) == 0
 
 
+BLOCK = (
+    "frame=1500\nfps=25.00\nstream_0_0_q=28.0\nbitrate=1500.0kbits/s\ntotal_size=999\n"
+    "out_time_us=60000000\nout_time_ms=60000000\nout_time=00:01:00.000000\n"
+    "dup_frames=0\ndrop_frames=0\nspeed=2.0x\nprogress=continue\n"
+)
+
+
+class TestProgressParser:
+    def test_reads_a_block_into_a_report(self):
+        assert ProgressParser().feed(BLOCK) == [
+            ProgressReport(out_time=60, total_size=999, bitrate=1_500_000, speed=2.0, end=False)
+        ]
+
+    def test_a_block_split_anywhere_reads_the_same(self):
+        for cut in range(1, len(BLOCK)):
+            parser = ProgressParser()
+            assert parser.feed(BLOCK[:cut]) + parser.feed(BLOCK[cut:]) == ProgressParser().feed(BLOCK), cut
+
+    def test_skips_keys_it_does_not_know(self):
+        newer = "fancy_new_stat=42\n" + BLOCK.replace("speed=", "stream_1_0_q=-1.0\nspeed=")
+
+        assert ProgressParser().feed(newer) == ProgressParser().feed(BLOCK)
+
+    def test_na_reads_as_nothing_yet(self):
+        (report,) = ProgressParser().feed("bitrate=N/A\ntotal_size=N/A\nout_time_us=N/A\nspeed=N/A\nprogress=end\n")
+
+        assert report == ProgressReport(out_time=0, total_size=0, bitrate=0, speed=None, end=True)
+
+    def test_fields_do_not_carry_over_to_the_next_block(self):
+        parser = ProgressParser()
+        parser.feed(BLOCK)
+
+        (report,) = parser.feed("progress=continue\n")
+
+        assert report.total_size == 0
+
+    def test_reports_are_immutable(self):
+        (report,) = ProgressParser().feed(BLOCK)
+
+        with pytest.raises(AttributeError):
+            report.out_time = 0  # type: ignore[misc]
+
+
 class TestFFmpegProgressTracker:
     def test_reports_progress_up_to_the_total(self):
         reports = []
@@ -137,6 +185,22 @@ class TestFFmpegProgressTracker:
         # Half the media is being processed, so the output is worth half the bytes.
         assert reports[-1]["total_bytes"] == 500
 
+    def test_a_resumed_encode_counts_what_earlier_runs_did(self):
+        reports = []
+        tracker = FFmpegProgressTracker(
+            [*fake_ffmpeg_args(blocks=2, duration=6), "-ss", "4"],
+            reports.append,
+            duration=10,
+            total_bytes=1000,
+            resumed_from=4,
+        )
+        tracker.run()
+
+        progressed = [r["processed_bytes"] for r in reports if r["processed_bytes"]]
+        assert progressed[0] >= 400
+        assert 700 in progressed
+        assert progressed[-1] == reports[-1]["total_bytes"] == 1000
+
     def test_eta_counts_down(self):
         reports = []
         tracker = FFmpegProgressTracker(fake_ffmpeg_args(blocks=4, duration=100), reports.append, duration=100)
@@ -221,6 +285,96 @@ class TestFFmpegProgressTracker:
         assert returncode == 1
         assert "frame 1 encoded" in stderr
 
+    def test_a_hook_that_raises_stops_ffmpeg_and_the_run(self):
+        calls = []
+
+        def on_progress(status):
+            calls.append(status)
+            raise RuntimeError("cancelled")
+
+        tracker = FFmpegProgressTracker([sys.executable, "-c", HANGING_FFMPEG], on_progress, duration=10)
+        started = time.monotonic()
+
+        with pytest.raises(RuntimeError, match="cancelled"):
+            tracker.run()
+
+        assert time.monotonic() - started < 10
+        assert len(calls) == 1
+        assert tracker.proc is not None
+        assert tracker.proc.returncode != 0
+
+    def test_keeps_only_the_end_of_a_long_stderr(self):
+        tracker = FFmpegProgressTracker(fake_ffmpeg_args(blocks=500, duration=10, returncode=1), lambda status: None)
+        _, stderr, _ = tracker.run()
+
+        lines = stderr.splitlines()
+        assert len(lines) == TAIL_LINES
+        assert lines[-1] == "frame 500 encoded"
+
+
+# Waits for the "q" ffmpeg quits on, writes where it was told it got it, and exits.
+QUITTING_FFMPEG = textwrap.dedent(
+    """
+    import sys
+    sys.stdout.write("progress=continue\\n")
+    sys.stdout.flush()
+    if sys.stdin.read(1) == "q":
+        open(sys.argv[1], "w").close()
+    sys.exit(255)
+    """
+)
+
+
+# Reports once, then takes its time: only a kill ends it early.
+HANGING_FFMPEG = textwrap.dedent(
+    """
+    import sys, time
+    sys.stdout.write("out_time_us=1000000\\nprogress=continue\\n")
+    sys.stdout.flush()
+    time.sleep(30)
+    """
+)
+
+
+class TestRunAsync:
+    def test_reports_as_run_does(self):
+        reports = []
+        tracker = FFmpegProgressTracker(
+            fake_ffmpeg_args(blocks=4, duration=10), reports.append, duration=10, total_bytes=1000
+        )
+
+        _, stderr, returncode = asyncio.run(tracker.run_async())
+
+        assert returncode == 0
+        assert "frame 4 encoded" in stderr
+        assert reports[-1]["processed_bytes"] == 1000
+
+    def test_a_cancel_asks_ffmpeg_to_quit(self, tmp_path):
+        quit_marker = tmp_path / "quit"
+        reports = []
+        tracker = FFmpegProgressTracker([sys.executable, "-c", QUITTING_FFMPEG, str(quit_marker)], reports.append)
+
+        async def scenario():
+            task = asyncio.ensure_future(tracker.run_async())
+            while not reports:
+                await asyncio.sleep(0.01)
+            task.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await task
+
+        asyncio.run(scenario())
+
+        assert quit_marker.exists()
+
+    def test_a_hook_that_raises_stops_ffmpeg_and_the_run(self):
+        def on_progress(status):
+            raise RuntimeError("cancelled")
+
+        tracker = FFmpegProgressTracker([sys.executable, "-c", HANGING_FFMPEG], on_progress, duration=10)
+
+        with pytest.raises(RuntimeError, match="cancelled"):
+            asyncio.run(asyncio.wait_for(tracker.run_async(), timeout=10))
+
 
 @pytest.mark.skipif(not shutil.which("ffmpeg"), reason="ffmpeg not on PATH")
 class TestAgainstRealFfmpeg:
@@ -1,4 +1,5 @@
 import inspect
+import os
 import shutil
 import subprocess
 import sys
@@ -16,6 +17,7 @@ from yt_dlp.downloader import external as external_fd  # noqa: E402
 from yt_dlp.downloader.external import FFmpegFD  # noqa: E402
 
 from core import ffmpegfd_progress  # noqa: E402
+from core.reactor import can_watch_pipes  # noqa: E402
 
 
 class TestSeams:
@@ -71,11 +73,12 @@ class TestInstall:
         are the bytes that came down the wire, and it counts those itself.
         """
         context = ffmpegfd_progress._Context(MagicMock(), {"filesize": 1000})
-        reporter, path = ffmpegfd_progress._prepare(context, ["ffmpeg", "-i", "in.mp4"])
+        reporter, channel = ffmpegfd_progress._prepare(context, ["ffmpeg", "-i", "in.mp4"])
 
         assert context.duration == 0
         assert reporter is not None
-        assert path is not None
+        assert channel is not None
+        channel.discard()
 
     def test_leaves_every_other_external_downloader_alone(self):
         """The stand-in only touches an ffmpeg run. aria2c, wget and curl go through it too."""
@@ -87,6 +90,111 @@ class TestInstall:
 
         assert process.args == [sys.executable, "-c", "pass"], "the args were touched outside an FFmpegFD run"
 
+    def test_an_ffmpeg_run_reports_through_the_channel_it_is_given(self):
+        """The stand-in appends `-progress <target>`. This child writes a report block to it."""
+        ffmpegfd_progress.install()
+        downloader = MagicMock()
+        context = ffmpegfd_progress._Context(downloader, {"duration": 10})
+        script = (
+            "import os, sys\n"
+            "target = sys.argv[-1]\n"
+            "block = 'bitrate=N/A\\ntotal_size=500\\nout_time_us=5000000\\nout_time_ms=5000000\\n'"
+            " 'out_time=00:00:05.000000\\ndup_frames=0\\ndrop_frames=0\\nspeed=1x\\nprogress=end\\n'\n"
+            "if target.startswith('pipe:'):\n"
+            "    os.write(int(target[5:]), block.encode())\n"
+            "else:\n"
+            "    open(target, 'a').write(block)\n"
+        )
+        ffmpegfd_progress._current.context = context
+        try:
+            process = external_fd.Popen([sys.executable, "-c", script])
+            process.wait()
+        finally:
+            ffmpegfd_progress._current.context = None
+        for follower in context.followers:
+            follower.wait(5)
+
+        assert process.args[-2] == "-progress"
+        statuses = [call.args[0] for call in downloader._hook_progress.call_args_list]
+        assert any(status.get("downloaded_bytes") == 500 for status in statuses)
+
+
+class TestFollow:
+    def test_reads_the_progress_file_to_the_end_and_removes_it(self, tmp_path):
+        path = tmp_path / "progress"
+        path.write_text("")
+        writer = subprocess.Popen(
+            [
+                sys.executable,
+                "-c",
+                "import sys, time\n"
+                "for i in range(3):\n"
+                "    open(sys.argv[1], 'a').write(f'out_time_us={i}\\n')\n"
+                "    time.sleep(0.05)\n",
+                str(path),
+            ]
+        )
+        reporter = MagicMock()
+
+        follower = ffmpegfd_progress._follow(writer, reporter, str(path))
+
+        assert follower.done.wait(timeout=5)
+        fed = "".join(call.args[0] for call in reporter.feed.call_args_list)
+        assert fed == "out_time_us=0\nout_time_us=1\nout_time_us=2\n"
+        assert not path.exists()
+
+    def test_a_missing_file_is_done_at_once(self, tmp_path):
+        follower = ffmpegfd_progress._follow(MagicMock(), MagicMock(), str(tmp_path / "gone"))
+
+        assert follower.done.is_set()
+
+
+@pytest.mark.skipif(not can_watch_pipes, reason="progress goes through a file on this platform")
+class TestPipeChannel:
+    def test_the_child_writes_progress_to_the_fd_it_inherits(self):
+        channel = ffmpegfd_progress._PipeChannel()
+        fd = int(channel.target.removeprefix("pipe:"))
+        writer = subprocess.Popen(
+            [
+                sys.executable,
+                "-c",
+                "import os, sys, time\n"
+                "fd = int(sys.argv[1])\n"
+                "for i in range(3):\n"
+                "    os.write(fd, f'out_time_us={i}\\n'.encode())\n"
+                "    time.sleep(0.05)\n",
+                str(fd),
+            ],
+            **channel.popen_kwargs({}),
+        )
+        reporter = MagicMock()
+
+        follower = channel.follow(writer, reporter)
+
+        assert follower.done.wait(timeout=5)
+        writer.wait()
+        fed = "".join(call.args[0] for call in reporter.feed.call_args_list)
+        assert fed == "out_time_us=0\nout_time_us=1\nout_time_us=2\n"
+
+    def test_a_pipe_that_never_ends_is_let_go(self):
+        channel = ffmpegfd_progress._PipeChannel()
+        # Something other than ffmpeg keeps the write end open.
+        held = os.dup(int(channel.target.removeprefix("pipe:")))
+        follower = channel.follow(MagicMock(), MagicMock())
+        try:
+            follower.wait(0.05)
+
+            assert follower.done.wait(timeout=5)
+        finally:
+            os.close(held)
+
+    def test_keeps_the_fds_the_caller_already_passes(self):
+        channel = ffmpegfd_progress._PipeChannel()
+        try:
+            assert channel.popen_kwargs({"pass_fds": (7,)})["pass_fds"][0] == 7
+        finally:
+            channel.discard()
+
 
 @pytest.mark.skipif(not shutil.which("ffmpeg"), reason="ffmpeg not on PATH")
 class TestAgainstRealFfmpeg:
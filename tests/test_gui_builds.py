@@ -75,3 +75,73 @@ class TestTheWindowStillBuilds:
         app._refresh_labels()
 
         assert app.download_button.content != english
+
+
+class TestProgressRendering:
+    def test_hooks_only_record_and_the_refresh_draws(self, page):
+        app = VideodlApp(page)
+        before = app.download_progress_text.value
+
+        app._update_download_bar(
+            {"status": "downloading", "downloaded_bytes": 250, "total_bytes": 1000, "speed": 1_000_000}
+        )
+
+        assert app.download_progress_text.value == before
+        assert app.download_progress_bar.value in (None, 0)
+
+        app._render_progress()
+
+        assert app.download_progress_bar.value == 0.25
+        assert "25%" in app.download_progress_text.value
+        assert "MB/s" in app.download_progress_text.value
+
+    def test_only_the_latest_sample_is_drawn(self, page):
+        app = VideodlApp(page)
+        for done in (100, 200, 900):
+            app._update_process_bar({"status": "processing", "processed_bytes": done, "total_bytes": 1000})
+
+        app._render_progress()
+
+        assert app.process_progress_bar.value == 0.9
+
+    def test_the_finish_signal_fills_the_label(self, page):
+        app = VideodlApp(page)
+
+        app._update_download_bar({"status": "finished"})
+        app._render_progress()
+
+        assert app.download_progress_text.value.endswith("100%")
+
+    def test_a_refresh_sends_only_the_bars_that_moved(self, page, monkeypatch):
+        app = VideodlApp(page)
+        app._preparing = False
+        updated = []
+        for control in (app.download_progress_bar, app.download_progress_text, app.process_progress_bar):
+            monkeypatch.setattr(control, "update", lambda control=control: updated.append(control))
+        page.update.reset_mock()
+
+        app._update_download_bar({"status": "downloading", "downloaded_bytes": 1, "total_bytes": 2})
+        app._flush_ui()
+
+        assert not page.update.called
+        assert {id(control) for control in updated} == {id(app.download_progress_bar), id(app.download_progress_text)}
+
+    def test_hiding_the_preparing_status_sends_the_whole_page(self, page):
+        app = VideodlApp(page)
+        app._preparing = True
+        page.update.reset_mock()
+
+        app._update_download_bar({"status": "downloading", "downloaded_bytes": 1, "total_bytes": 2})
+        app._flush_ui()
+
+        assert page.update.called
+        assert not app.download_status_text.visible
+
+    def test_the_window_is_only_resized_when_its_height_changes(self, page):
+        app = VideodlApp(page)
+        app._resize_window()
+        page.window.height = "untouched"
+
+        app._resize_window()
+
+        assert page.window.height == "untouched"
@@ -19,7 +19,15 @@ from typing import Any  # noqa: E402
 import core.hwaccel as hwaccel  # noqa: E402
 from core.exceptions import FFmpegNoValidEncoderFound  # noqa: E402
 from core.hwaccel import ENCODERS as _ENCODERS  # noqa: E402
-from core.hwaccel import _get_available_encoders, fastest_encoder  # noqa: E402
+from core.hwaccel import (  # noqa: E402
+    SPEED_TIERS,
+    TIER_OPTIONS,
+    _get_available_encoders,
+    fastest_encoder,
+    is_software_encoder,
+    mark_encoder_degraded,
+    tier_options,
+)
 
 ENCODERS: dict[str, dict[str, Any]] = _ENCODERS  # type: ignore[assignment]
 
@@ -104,11 +112,61 @@ class TestFastestEncoder:
 
     def test_skips_failing_hw_encoder(self):
         hwaccel._available_encoders = {"h264_nvenc", "libx264"}
-        with patch("core.hwaccel._test_encoder", side_effect=lambda e: e == "libx264"):
+        with patch("core.hwaccel._test_encoder", side_effect=lambda e, ff_path=None: e == "libx264"):
             encoder, _ = fastest_encoder("x264")
         assert encoder == "libx264"
 
 
+class TestDegradedEncoders:
+    def test_a_degraded_encoder_is_passed_over(self):
+        hwaccel._available_encoders = {"h264_nvenc", "libx264"}
+        with patch(
+            "core.hwaccel._test_encoder", side_effect=lambda e, ff_path=None: hwaccel._working_encoders.get(e, True)
+        ):
+            assert fastest_encoder("x264")[0] == "h264_nvenc"
+            mark_encoder_degraded("h264_nvenc")
+            assert fastest_encoder("x264")[0] == "libx264"
+
+    def test_only_the_cpu_fallbacks_are_software(self):
+        assert is_software_encoder("libx264")
+        assert is_software_encoder("prores_ks")
+        assert not is_software_encoder("h264_nvenc")
+        assert not is_software_encoder("prores_videotoolbox")
+
+
+class TestSpeedTiers:
+    def test_balanced_is_the_encoders_table(self):
+        assert tier_options("libx264", ["-crf", "23"], "balanced") == ["-crf", "23"]
+
+    def test_other_tiers_trade_time_for_quality(self):
+        assert tier_options("libx264", ["-crf", "23"], "fastest") == ["-preset", "veryfast", "-crf", "23"]
+        assert tier_options("libx264", ["-crf", "23"], "archival") == ["-preset", "slow", "-crf", "20"]
+
+    def test_an_encoder_without_speed_knob_is_the_same_in_every_tier(self):
+        for tier in SPEED_TIERS:
+            assert tier_options("h264_v4l2m2m", [], tier) == []
+
+    def test_rejects_an_unknown_tier(self):
+        with pytest.raises(ValueError, match="turbo"):
+            tier_options("libx264", ["-crf", "23"], "turbo")
+
+    def test_fastest_encoder_uses_the_tier(self):
+        hwaccel._available_encoders = {"libsvtav1"}
+        with patch("core.hwaccel._test_encoder", return_value=True):
+            assert fastest_encoder("AV1", "archival") == ("libsvtav1", ["-crf", "28", "-preset", "4"])
+            assert fastest_encoder("AV1") == ("libsvtav1", ENCODERS["AV1"]["CPU"][1])
+
+    def test_tiers_only_name_known_encoders_and_tiers(self):
+        known = {encoder for platforms in ENCODERS.values() for encoder, _ in platforms.values() if encoder}
+        for encoder, tiers in TIER_OPTIONS.items():
+            assert encoder in known, encoder
+            assert set(tiers) <= set(SPEED_TIERS) - {"balanced"}, encoder
+
+    def test_tier_options_are_copies(self):
+        tier_options("libx264", [], "fastest").append("-x")
+        assert "-x" not in TIER_OPTIONS["libx264"]["fastest"]
+
+
 class TestEncodersStructure:
     def test_every_target_has_cpu_fallback(self):
         for target, platforms in ENCODERS.items():
@@ -0,0 +1,150 @@
+import threading
+
+import pytest
+
+from core.jobs import CANCELLED, DONE, DOWNLOADING, FAILED, PROCESSING, QUEUED, JobProgress, ProgressModel
+
+
+def _job(model: ProgressModel, job_id: str) -> JobProgress:
+    job = model.get(job_id)
+    assert job is not None
+    return job
+
+
+class TestProgressModel:
+    def test_a_new_job_is_queued(self):
+        model = ProgressModel()
+
+        job = model.add("https://example.com/a")
+
+        assert job.stage == QUEUED
+        assert model.totals().stages[QUEUED] == 1
+        assert model.totals().jobs == 1
+
+    def test_totals_follow_each_update(self):
+        model = ProgressModel()
+        a, b = model.add("a").job_id, model.add("b").job_id
+
+        model.update(a, {"downloaded_bytes": 100, "total_bytes": 1000, "speed": 50})
+        model.update(b, {"downloaded_bytes": 300, "total_bytes": 1000, "speed": 150})
+        model.update(a, {"downloaded_bytes": 500, "total_bytes": 1000, "speed": 100})
+
+        totals = model.totals()
+        assert totals.done_bytes == 800
+        assert totals.total_bytes == 2000
+        assert totals.speed == 250
+        assert totals.eta == pytest.approx(1200 / 250)
+        assert totals.stages[DOWNLOADING] == 2
+        assert totals.active == 2
+
+    def test_moving_to_the_encode_starts_the_counts_over(self):
+        model = ProgressModel()
+        job_id = model.add("a").job_id
+        model.update(job_id, {"downloaded_bytes": 1000, "total_bytes": 1000})
+
+        model.update(job_id, {"processed_bytes": 10, "total_bytes": 400}, PROCESSING)
+
+        totals = model.totals()
+        assert (totals.done_bytes, totals.total_bytes) == (10, 400)
+        assert totals.stages[DOWNLOADING] == 0
+        assert totals.stages[PROCESSING] == 1
+
+    def test_the_closing_finished_status_fills_the_stage(self):
+        model = ProgressModel()
+        job_id = model.add("a").job_id
+        model.update(job_id, {"downloaded_bytes": 900, "total_bytes": 1000})
+
+        model.update(job_id, {"status": "finished"})
+
+        assert _job(model, job_id).fraction == 1.0
+
+    def test_finishing_takes_the_job_out_of_the_totals(self):
+        model = ProgressModel()
+        job_id = model.add("a").job_id
+        model.update(job_id, {"downloaded_bytes": 10, "total_bytes": 100, "speed": 5})
+
+        model.finish(job_id, FAILED, "HTTP Error 403")
+
+        totals = model.totals()
+        assert (totals.done_bytes, totals.total_bytes, totals.speed) == (0, 0, 0)
+        assert totals.finished == 1
+        assert _job(model, job_id).error == "HTTP Error 403"
+
+    def test_a_late_report_does_not_revive_a_finished_job(self):
+        model = ProgressModel()
+        job_id = model.add("a").job_id
+        model.finish(job_id, CANCELLED)
+
+        model.update(job_id, {"downloaded_bytes": 10, "total_bytes": 100})
+
+        assert _job(model, job_id).stage == CANCELLED
+        assert model.totals().total_bytes == 0
+
+    def test_only_finishes_in_a_final_stage(self):
+        model = ProgressModel()
+        job_id = model.add("a").job_id
+
+        with pytest.raises(ValueError, match="not a stage"):
+            model.finish(job_id, PROCESSING)
+
+    def test_remove_forgets_the_job_and_its_bytes(self):
+        model = ProgressModel()
+        job_id = model.add("a").job_id
+        model.update(job_id, {"downloaded_bytes": 10, "total_bytes": 100})
+
+        model.remove(job_id)
+
+        assert len(model) == 0
+        assert model.totals().total_bytes == 0
+        assert sum(model.totals().stages.values()) == 0
+
+    def test_changed_hands_back_each_moved_job_once(self):
+        model = ProgressModel()
+        a, b = model.add("a").job_id, model.add("b").job_id
+        model.changed()
+
+        model.update(a, {"downloaded_bytes": 1})
+        model.update(a, {"downloaded_bytes": 2})
+
+        assert [job.job_id for job in model.changed()] == [a]
+        assert model.changed() == []
+        model.finish(b, DONE)
+        assert [job.job_id for job in model.changed()] == [b]
+
+    def test_the_callback_reports_each_stage(self):
+        model = ProgressModel()
+        job_id = model.add("a").job_id
+        callback = model.callback(job_id)
+
+        callback.on_download_progress({"downloaded_bytes": 5, "total_bytes": 10})
+        assert _job(model, job_id).stage == DOWNLOADING
+        callback.on_process_progress({"processed_bytes": 1, "total_bytes": 10})
+        assert _job(model, job_id).stage == PROCESSING
+
+    def test_the_usage_a_job_reports_is_part_of_its_record(self):
+        model = ProgressModel()
+        job_id = model.add("a").job_id
+        model.changed()
+
+        model.callback(job_id).on_usage({"encode": {"processes": 1, "cpu_seconds": 12.0}})
+
+        assert _job(model, job_id).as_dict()["usage"] == {"encode": {"processes": 1, "cpu_seconds": 12.0}}
+        assert [job.job_id for job in model.changed()] == [job_id]
+
+    def test_stays_consistent_under_concurrent_updates(self):
+        model = ProgressModel()
+        job_ids = [model.add(str(i)).job_id for i in range(8)]
+
+        def report(job_id):
+            for done in range(1, 501):
+                model.update(job_id, {"downloaded_bytes": done, "total_bytes": 500, "speed": 1})
+
+        threads = [threading.Thread(target=report, args=(job_id,)) for job_id in job_ids]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        totals = model.totals()
+        assert totals.done_bytes == totals.total_bytes == 8 * 500
+        assert totals.speed == 8
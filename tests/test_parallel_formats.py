@@ -0,0 +1,163 @@
+import inspect
+import sys
+import threading
+from unittest.mock import MagicMock
+
+import pytest
+
+for _name in [
+    name for name, mod in list(sys.modules.items()) if name.startswith("yt_dlp") and isinstance(mod, MagicMock)
+]:
+    del sys.modules[_name]
+
+from yt_dlp import YoutubeDL  # noqa: E402
+from yt_dlp.downloader.common import FileDownloader  # noqa: E402
+
+from core import parallel_formats  # noqa: E402
+from core.parallel_formats import _Batch, download_format  # noqa: E402
+
+VIDEO = {"format_id": "137", "filesize": 900}
+AUDIO = {"format_id": "140", "filesize": 100}
+
+
+class TestSeams:
+    """Guard the yt-dlp internals core/parallel_formats.py reaches into."""
+
+    def test_merged_formats_are_still_downloaded_one_dl_call_each(self):
+        source = inspect.getsource(YoutubeDL.process_info)
+        assert "for f in info_dict['requested_formats']" in source
+        assert "self.dl(fname, new_info)" in source
+
+    def test_dl_still_has_the_signature_we_wrap(self):
+        params = inspect.signature(YoutubeDL.dl).parameters
+        assert list(params) == ["self", "name", "info", "subtitle", "test"]
+
+    def test_progress_still_goes_through_hook_progress(self):
+        params = inspect.signature(FileDownloader._hook_progress).parameters
+        assert list(params) == ["self", "status", "info_dict"]
+
+
+class TestBatch:
+    def test_claims_each_requested_format_once(self):
+        batch = _Batch([VIDEO, AUDIO])
+
+        assert batch.claim({"format_id": "137"})
+        assert not batch.claim({"format_id": "137"})
+        assert not batch.claim({"format_id": "137+140", "requested_formats": [VIDEO, AUDIO]})
+        assert batch.has_pending
+        assert batch.claim({"format_id": "140"})
+        assert not batch.has_pending
+
+    def test_adds_up_the_streams_into_one_status(self):
+        batch = _Batch([VIDEO, AUDIO])
+
+        status = batch.combine("137", {"status": "downloading", "downloaded_bytes": 300, "total_bytes": 900})
+        # The audio has not reported yet, and still counts for the size its format gave.
+        assert status["downloaded_bytes"] == 300
+        assert status["total_bytes"] == 1000
+
+        status = batch.combine("140", {"status": "downloading", "downloaded_bytes": 50, "speed": 10})
+        assert status["downloaded_bytes"] == 350
+        assert status["speed"] == 10
+        assert status["status"] == "downloading"
+
+    def test_finishes_only_once_every_stream_has(self):
+        batch = _Batch([VIDEO, AUDIO])
+
+        assert batch.combine("140", {"status": "finished", "total_bytes": 100})["status"] == "downloading"
+        status = batch.combine("137", {"status": "finished", "downloaded_bytes": 900, "total_bytes": 900})
+
+        assert status["status"] == "finished"
+        assert status["downloaded_bytes"] == status["total_bytes"] == 1000
+
+    def test_drops_what_only_made_sense_for_one_stream(self):
+        batch = _Batch([VIDEO, AUDIO])
+        status = batch.combine("137", {"status": "downloading", "fragment_index": 3, "total_bytes_estimate": 5})
+
+        assert "fragment_index" not in status
+        assert "total_bytes_estimate" not in status
+
+
+class TestDownloadFormat:
+    def test_downloads_the_formats_at_the_same_time(self):
+        batch = _Batch([VIDEO, AUDIO])
+        audio_started = threading.Event()
+
+        def video():
+            # Only returns if the audio download got going while this one was running.
+            assert audio_started.wait(timeout=5)
+            return True, True
+
+        def audio():
+            audio_started.set()
+            return True, False
+
+        try:
+            batch.claim(VIDEO)
+            assert download_format(batch, "out.f137.mp4", VIDEO, video) == (True, True)
+            batch.claim(AUDIO)
+            assert download_format(batch, "out.f140.m4a", AUDIO, audio) == (True, True)
+        finally:
+            batch.release()
+
+    def test_a_failed_stream_fails_the_last_call(self):
+        batch = _Batch([VIDEO, AUDIO])
+
+        def video():
+            raise OSError("connection reset")
+
+        try:
+            batch.claim(VIDEO)
+            download_format(batch, "out.f137.mp4", VIDEO, video)
+            batch.claim(AUDIO)
+            with pytest.raises(OSError, match="connection reset"):
+                download_format(batch, "out.f140.m4a", AUDIO, lambda: (True, True))
+        finally:
+            batch.release()
+
+    def test_an_unsuccessful_stream_makes_the_whole_download_unsuccessful(self):
+        batch = _Batch([VIDEO, AUDIO])
+        try:
+            batch.claim(VIDEO)
+            download_format(batch, "out.f137.mp4", VIDEO, lambda: (False, True))
+            batch.claim(AUDIO)
+            assert download_format(batch, "out.f140.m4a", AUDIO, lambda: (True, True)) == (False, True)
+        finally:
+            batch.release()
+
+
+class TestInstall:
+    def test_replaces_the_seams_and_is_idempotent(self):
+        assert parallel_formats.install()
+        patched = (YoutubeDL.process_info, YoutubeDL.dl, FileDownloader._hook_progress)
+
+        assert parallel_formats.install()
+
+        assert (YoutubeDL.process_info, YoutubeDL.dl, FileDownloader._hook_progress) == patched
+
+    def test_hooks_see_the_combined_progress_of_a_batch(self):
+        assert parallel_formats.install()
+        seen = []
+        downloader = FileDownloader(YoutubeDL({"quiet": True}), {})
+        downloader.add_progress_hook(seen.append)
+        batch = _Batch([VIDEO, AUDIO])
+        batch.register("out.f137.mp4", "137")
+        batch.register("out.f140.m4a", "140")
+        try:
+            downloader._hook_progress({"filename": "out.f140.m4a", "status": "downloading", "downloaded_bytes": 40}, {})
+            downloader._hook_progress({"filename": "elsewhere.mp4", "status": "downloading", "downloaded_bytes": 7}, {})
+        finally:
+            batch.release()
+
+        assert seen[0]["downloaded_bytes"] == 40
+        assert seen[0]["total_bytes"] == 1000
+        assert seen[1]["downloaded_bytes"] == 7
+        assert "total_bytes" not in seen[1]
+
+    def test_gives_up_quietly_when_a_seam_is_missing(self, monkeypatch, caplog):
+        monkeypatch.setattr(parallel_formats, "_installed", False)
+        monkeypatch.delattr(YoutubeDL, "dl")
+
+        assert parallel_formats.install() is False
+        assert not parallel_formats._installed
+        assert "yt-dlp has moved" in caplog.text
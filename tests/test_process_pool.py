@@ -0,0 +1,202 @@
+import logging
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+# Force reimport: test_hwaccel drops core.exceptions, and a core.process_pool imported
+# before that raises exception classes this module's own imports are not.
+sys.modules.pop("core.process_pool", None)
+
+import core.process_pool as process_pool  # noqa: E402
+from core.config_types import DownloadConfig  # noqa: E402
+from core.exceptions import DownloadCancelled, DownloadTimeout, JobProcessError  # noqa: E402
+from core.process_pool import ProcessPool, portable_status  # noqa: E402
+
+pytestmark = pytest.mark.skipif(os.name == "nt", reason="spawning workers from pytest is slow on Windows")
+
+
+# The runners below run in the worker process, so they live at module level, where
+# the worker can import them from.
+
+
+def _reporting_runner(config, cancel, progress_cb, status_cb):
+    status_cb.on_status(f"running in {os.getpid()}")
+    hook = config.ydl_opts["progress_hooks"][0]
+    hook(
+        {"status": "downloading", "downloaded_bytes": 5, "total_bytes": 10, "info_dict": {"title": "t", "x": object()}}
+    )
+    config.ydl_opts["postprocessor_hooks"][0]({"status": "processing", "processed_bytes": 3})
+    progress_cb.on_usage({"encode": {"processes": 1, "cpu_seconds": 2.5}})
+    logging.getLogger("videodl").warning("from the worker")
+
+
+def _failing_runner(config, cancel, progress_cb, status_cb):
+    raise DownloadTimeout(config.url)
+
+
+class _LockedError(RuntimeError):
+    lock: threading.Lock
+
+
+def _unpicklable_failure_runner(config, cancel, progress_cb, status_cb):
+    error = _LockedError("held a lock")
+    error.lock = threading.Lock()
+    raise error
+
+
+def _cancellable_runner(config, cancel, progress_cb, status_cb):
+    hook = config.ydl_opts["progress_hooks"][0]
+    while True:
+        # Raises once the job is cancelled, as yt-dlp's own hooks make it.
+        hook({"status": "downloading", "downloaded_bytes": 1})
+        time.sleep(0.01)
+
+
+def _stubborn_runner(config, cancel, progress_cb, status_cb):
+    config.ydl_opts["progress_hooks"][0]({"status": "downloading", "downloaded_bytes": 1})
+    time.sleep(60)
+
+
+def _crashing_runner(config, cancel, progress_cb, status_cb):
+    os._exit(3)
+
+
+class _Recorder:
+    def __init__(self, cancel_after: int | None = None):
+        self.downloads = []
+        self.processes = []
+        self.statuses = []
+        self.usages = []
+        self.cancelled = False
+        self._cancel_after = cancel_after
+
+    def on_download_progress(self, status):
+        self.downloads.append(status)
+        if self._cancel_after is not None and len(self.downloads) >= self._cancel_after:
+            self.cancelled = True
+
+    def on_process_progress(self, status):
+        self.processes.append(status)
+
+    def on_usage(self, usage):
+        self.usages.append(usage)
+
+    def on_status(self, message):
+        self.statuses.append(message)
+
+    def is_cancelled(self):
+        return self.cancelled
+
+
+def _config():
+    # The hooks are functions of this process, and must not be sent.
+    return DownloadConfig(
+        url="https://example.com/v",
+        audio_only=False,
+        target_vcodec="Best",
+        ydl_opts={"progress_hooks": [lambda d: None], "logger": threading.Lock(), "format": "b"},
+    )
+
+
+@pytest.fixture
+def pool_of(request):
+    pools = []
+
+    def make(runner, size=1):
+        pool = ProcessPool(size, runner=runner)
+        pools.append(pool)
+        return pool
+
+    yield make
+    for pool in pools:
+        pool.close()
+
+
+class TestProcessPool:
+    def test_reports_come_back_to_the_callbacks(self, pool_of, caplog):
+        recorder = _Recorder()
+
+        with caplog.at_level(logging.WARNING, logger="videodl"):
+            pool_of(_reporting_runner).download(_config(), recorder, recorder, recorder)
+
+        assert recorder.downloads == [
+            {"status": "downloading", "downloaded_bytes": 5, "total_bytes": 10, "info_dict": {"title": "t"}}
+        ]
+        assert recorder.processes == [{"status": "processing", "processed_bytes": 3}]
+        assert recorder.usages == [{"encode": {"processes": 1, "cpu_seconds": 2.5}}]
+        (status,) = recorder.statuses
+        assert status != f"running in {os.getpid()}"
+        assert "from the worker" in caplog.text
+
+    def test_a_worker_is_reused(self, pool_of):
+        pool = pool_of(_reporting_runner)
+        first, second = _Recorder(), _Recorder()
+
+        pool.download(_config(), first, first, first)
+        pool.download(_config(), second, second, second)
+
+        assert first.statuses == second.statuses
+
+    def test_the_jobs_exception_is_raised(self, pool_of):
+        recorder = _Recorder()
+
+        with pytest.raises(DownloadTimeout) as exc:
+            pool_of(_failing_runner).download(_config(), recorder, recorder, recorder)
+
+        assert exc.value.url == "https://example.com/v"
+
+    def test_an_exception_that_cannot_travel_keeps_its_message(self, pool_of):
+        recorder = _Recorder()
+
+        with pytest.raises(JobProcessError, match="_LockedError: held a lock"):
+            pool_of(_unpicklable_failure_runner).download(_config(), recorder, recorder, recorder)
+
+    def test_cancel_stops_the_job(self, pool_of):
+        recorder = _Recorder(cancel_after=3)
+
+        with pytest.raises(DownloadCancelled):
+            pool_of(_cancellable_runner).download(_config(), recorder, recorder, recorder)
+
+    def test_a_worker_that_ignores_the_cancel_is_killed(self, pool_of, monkeypatch):
+        monkeypatch.setattr(process_pool, "CANCEL_GRACE", 0.2)
+        recorder = _Recorder(cancel_after=1)
+        pool = pool_of(_stubborn_runner)
+        started = time.monotonic()
+
+        with pytest.raises(DownloadCancelled):
+            pool.download(_config(), recorder, recorder, recorder)
+
+        assert time.monotonic() - started < 10
+        assert not pool._idle
+
+    def test_a_crashed_worker_fails_its_job_only(self, pool_of):
+        recorder = _Recorder()
+        pool = pool_of(_crashing_runner)
+
+        with pytest.raises(JobProcessError, match="code 3"):
+            pool.download(_config(), recorder, recorder, recorder)
+        with pytest.raises(JobProcessError, match="code 3"):
+            pool.download(_config(), recorder, recorder, recorder)
+
+
+class TestPortableStatus:
+    def test_keeps_plain_values_only(self):
+        status = portable_status(
+            {
+                "status": "downloading",
+                "downloaded_bytes": 1,
+                "speed": None,
+                "ctx": object(),
+                "info_dict": {"playlist_autonumber": 2, "n_entries": 5, "formats": [object()]},
+            }
+        )
+
+        assert status == {
+            "status": "downloading",
+            "downloaded_bytes": 1,
+            "speed": None,
+            "info_dict": {"playlist_autonumber": 2, "n_entries": 5},
+        }
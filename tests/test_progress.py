@@ -3,7 +3,15 @@ from __future__ import annotations
 import pytest
 from quantiphy import Quantity
 
-from core.progress import compute_progress, parse_quantity, parse_speed, timecodes_are_valid, validate_timecode
+from core.progress import (
+    ProgressSample,
+    ProgressSlot,
+    compute_progress,
+    parse_quantity,
+    parse_speed,
+    timecodes_are_valid,
+    validate_timecode,
+)
 
 
 class TestParseSpeed:
@@ -122,3 +130,42 @@ class TestTimecodesAreValid:
     )
     def test_start_less_than_end_edge_cases(self, start_hms, end_hms):
         assert timecodes_are_valid(True, start_hms, True, end_hms) is True
+
+
+class TestProgressSample:
+    def test_keeps_the_raw_numbers(self):
+        sample = ProgressSample.from_status(
+            {
+                "status": "downloading",
+                "downloaded_bytes": 10,
+                "total_bytes_estimate": 100,
+                "speed": 5.0,
+                "info_dict": {"playlist_autonumber": 2, "n_entries": 3},
+            },
+            "downloaded_bytes",
+        )
+
+        assert (sample.done, sample.total, sample.speed) == (10, 100, 5.0)
+        assert (sample.playlist_index, sample.playlist_count) == (2, 3)
+        assert not sample.finished
+
+
+class TestProgressSlot:
+    def test_hands_over_the_latest_sample_once(self):
+        slot = ProgressSlot()
+        first = ProgressSample.from_status({"processed_bytes": 1}, "processed_bytes")
+        latest = ProgressSample.from_status({"processed_bytes": 2}, "processed_bytes")
+
+        slot.put(first)
+        slot.put(latest)
+
+        assert slot.take() is latest
+        assert slot.take() is None
+
+    def test_clear_forgets_what_was_left(self):
+        slot = ProgressSlot()
+        slot.put(ProgressSample.from_status({}, "processed_bytes"))
+
+        slot.clear()
+
+        assert slot.take() is None
@@ -0,0 +1,87 @@
+"""Replay multi-hour `-progress` streams through the parser, against a throughput floor.
+
+Run with `pytest -m benchmark`. The floors are set far under what a laptop does, so
+that only a change in complexity trips them, not a busy CI runner: the parser used
+to rescan everything buffered since the last block on every chunk, and a long
+verbose encode got slower to follow the further it went.
+"""
+
+import time
+
+import pytest
+
+from core.ffmpeg_progress import FFmpegProgressReporter, ProgressParser
+
+pytestmark = pytest.mark.benchmark
+
+# ffmpeg's default -stats_period is half a second: 7200 blocks an hour.
+BLOCKS_PER_HOUR = 7200
+# What a pipe read hands over at a time, and what a line-buffered one does.
+CHUNK_SIZES = [65536, 4096, 1]
+
+
+def recorded_stream(hours: float, streams: int = 3) -> str:
+    """What `ffmpeg -progress pipe:1` writes for an encode of that many hours."""
+    blocks = []
+    total = int(hours * BLOCKS_PER_HOUR)
+    for i in range(1, total + 1):
+        out_time_us = i * 500_000
+        seconds, micros = divmod(out_time_us, 1_000_000)
+        qualities = "".join(f"stream_0_{n}_q=28.0\n" for n in range(streams))
+        blocks.append(
+            f"frame={i * 12}\nfps=48.21\n{qualities}bitrate=4213.7kbits/s\ntotal_size={i * 263_000}\n"
+            f"out_time_us={out_time_us}\nout_time_ms={out_time_us}\n"
+            f"out_time={seconds // 3600:02d}:{seconds // 60 % 60:02d}:{seconds % 60:02d}.{micros:06d}\n"
+            f"dup_frames=0\ndrop_frames=0\nspeed=1.93x\nprogress={'end' if i == total else 'continue'}\n"
+        )
+    return "".join(blocks)
+
+
+def chunked(text: str, size: int) -> list[str]:
+    if size == 1:
+        return text.splitlines(keepends=True)
+    return [text[i : i + size] for i in range(0, len(text), size)]
+
+
+def timed(chunks: list[str]) -> tuple[int, float]:
+    parser = ProgressParser()
+    started = time.perf_counter()
+    reports = sum(len(parser.feed(chunk)) for chunk in chunks)
+    return reports, time.perf_counter() - started
+
+
+@pytest.mark.parametrize("chunk_size", CHUNK_SIZES, ids=["64k", "4k", "line"])
+def test_parses_a_four_hour_encode_quickly(chunk_size):
+    chunks = chunked(recorded_stream(hours=4), chunk_size)
+
+    reports, elapsed = timed(chunks)
+
+    assert reports == 4 * BLOCKS_PER_HOUR
+    # Tens of thousands of blocks a second on a laptop, and ffmpeg writes two.
+    assert reports / elapsed > 5_000, f"{reports / elapsed:.0f} blocks/s"
+
+
+def test_cost_grows_with_the_stream_not_its_square():
+    short = chunked(recorded_stream(hours=1), 4096)
+    long = chunked(recorded_stream(hours=8), 4096)
+
+    _, short_elapsed = min(timed(short) for _ in range(3))
+    _, long_elapsed = min(timed(long) for _ in range(3))
+
+    # Linear is 8x. Quadratic would be 64x.
+    assert long_elapsed / short_elapsed < 20
+
+
+def test_reporting_a_four_hour_encode_keeps_up():
+    reports = []
+    reporter = FFmpegProgressReporter(reports.append, args=["ffmpeg"], duration=4 * 3600, total_bytes=10**10)
+    chunks = chunked(recorded_stream(hours=4), 4096)
+
+    started = time.perf_counter()
+    for chunk in chunks:
+        reporter.feed(chunk)
+    elapsed = time.perf_counter() - started
+
+    assert len(reports) == 4 * BLOCKS_PER_HOUR
+    assert reports[-1]["processed_bytes"] == 10**10
+    assert len(reports) / elapsed > 2_000, f"{len(reports) / elapsed:.0f} reports/s"
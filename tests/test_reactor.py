@@ -0,0 +1,109 @@
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+from core.reactor import Reactor, can_watch_pipes
+
+pipes_only = pytest.mark.skipif(not can_watch_pipes, reason="pipes cannot be selected on this platform")
+
+
+@pytest.fixture
+def reactor():
+    return Reactor()
+
+
+@pipes_only
+class TestWatch:
+    def test_delivers_the_bytes_then_the_end(self, reactor):
+        read_fd, write_fd = os.pipe()
+        received, closed = [], threading.Event()
+        reactor.watch(read_fd, received.append, closed.set)
+
+        os.write(write_fd, b"frame=1\n")
+        os.write(write_fd, b"progress=end\n")
+        os.close(write_fd)
+
+        assert closed.wait(timeout=5)
+        assert b"".join(received) == b"frame=1\nprogress=end\n"
+        os.close(read_fd)
+
+    def test_multiplexes_many_pipes_on_one_thread(self, reactor):
+        threads_before = threading.active_count()
+        pipes = [os.pipe() for _ in range(20)]
+        seen: dict[int, bytes] = {}
+        closed = [threading.Event() for _ in pipes]
+        for i, ((read_fd, _), done) in enumerate(zip(pipes, closed, strict=True)):
+            reactor.watch(read_fd, lambda data, i=i: seen.__setitem__(i, seen.get(i, b"") + data), done.set)
+
+        for i, (_, write_fd) in enumerate(pipes):
+            os.write(write_fd, str(i).encode())
+            os.close(write_fd)
+
+        assert all(done.wait(timeout=5) for done in closed)
+        assert seen == {i: str(i).encode() for i in range(20)}
+        assert threading.active_count() <= threads_before + 1
+        for read_fd, _ in pipes:
+            os.close(read_fd)
+
+    def test_unwatch_lets_the_caller_close_a_pipe_that_never_ends(self, reactor):
+        read_fd, write_fd = os.pipe()
+        reactor.watch(read_fd, lambda data: None, lambda: None)
+        closed = threading.Event()
+
+        def close() -> None:
+            os.close(read_fd)
+            closed.set()
+
+        reactor.unwatch(read_fd, close)
+
+        assert closed.wait(timeout=5)
+        os.close(write_fd)
+
+
+class TestTimers:
+    def test_calls_every_interval_until_cancelled(self, reactor):
+        calls = []
+        timer = reactor.call_every(0.01, lambda: calls.append(time.monotonic()))
+
+        deadline = time.monotonic() + 5
+        while len(calls) < 3 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        timer.cancel()
+        count = len(calls)
+        time.sleep(0.05)
+
+        assert count >= 3
+        assert len(calls) <= count + 1
+
+    def test_a_failing_callback_does_not_stop_the_reactor(self, reactor):
+        ticked = threading.Event()
+        broken = reactor.call_every(0.01, lambda: 1 / 0)
+        reactor.call_every(0.01, ticked.set)
+
+        assert ticked.wait(timeout=5)
+        broken.cancel()
+
+
+@pipes_only
+def test_a_tracked_ffmpeg_adds_no_thread():
+    """The tracker's pipes go to the shared reactor, not to reader threads of their own."""
+    from core.ffmpeg_progress import FFmpegProgressTracker
+    from core.reactor import get_reactor
+
+    get_reactor().call_every(60, lambda: None).cancel()  # started before counting
+    seen = []
+    tracker = FFmpegProgressTracker(
+        [sys.executable, "-c", "import time; print('hello', flush=True); time.sleep(1.2)"],
+        lambda status: seen.append(threading.active_count()),
+        duration=10,
+    )
+    before = threading.active_count()
+    stdout, _, returncode = tracker.run()
+
+    assert returncode == 0
+    assert "hello" in stdout
+    assert seen
+    assert max(seen) == before
@@ -0,0 +1,128 @@
+import os
+import shutil
+import subprocess
+import sys
+from unittest.mock import patch
+
+import pytest
+
+from core import resources
+from core.config_types import ResourcePolicy
+from core.ffmpeg_progress import FFmpegProgressTracker
+from core.resources import DOWNLOAD, ENCODE, encoder_thread_args, job_resources, policy_for
+
+posix_only = pytest.mark.skipif(not hasattr(os, "setpriority"), reason="no setpriority here")
+with_ionice = pytest.mark.skipif(
+    not sys.platform.startswith("linux") or shutil.which("ionice") is None, reason="no ionice here"
+)
+
+
+class TestPolicies:
+    def test_encodes_default_to_yielding_to_the_rest(self):
+        policy = policy_for(ENCODE)
+
+        assert policy.nice > 0
+        assert policy.threads == max(1, (os.cpu_count() or 1) - 1)
+        assert policy_for(DOWNLOAD) == ResourcePolicy()
+
+    def test_a_job_overrides_the_stages_it_names(self):
+        pinned = ResourcePolicy(cpus=(0,), threads=2)
+
+        with job_resources({ENCODE: pinned}):
+            assert policy_for(ENCODE) == pinned
+            assert policy_for(DOWNLOAD) == ResourcePolicy()
+
+        assert policy_for(ENCODE) != pinned
+
+    def test_an_unknown_stage_runs_unconstrained(self):
+        assert policy_for("upload") == ResourcePolicy()
+
+
+class TestEncoderThreadArgs:
+    def test_no_budget_leaves_ffmpeg_to_decide(self):
+        assert encoder_thread_args(ResourcePolicy(), "libx265") == []
+
+    def test_x265_pools_follow_the_budget(self):
+        assert encoder_thread_args(ResourcePolicy(threads=3), "libx265") == [
+            "-threads",
+            "3",
+            "-x265-params",
+            "pools=3",
+        ]
+
+    def test_other_encoders_only_get_threads(self):
+        assert encoder_thread_args(ResourcePolicy(threads=3), "h264_nvenc") == ["-threads", "3"]
+
+
+@pytest.fixture
+def child():
+    proc = subprocess.Popen([sys.executable, "-c", "import time; time.sleep(30)"])
+    yield proc
+    proc.kill()
+    proc.wait()
+
+
+class TestApply:
+    @posix_only
+    def test_renices_the_process(self, child):
+        resources.apply(child.pid, ResourcePolicy(nice=7))
+
+        assert os.getpriority(os.PRIO_PROCESS, child.pid) == 7
+
+    @pytest.mark.skipif(not hasattr(os, "sched_setaffinity"), reason="no CPU affinity here")
+    def test_pins_the_process(self, child):
+        resources.apply(child.pid, ResourcePolicy(cpus=(0,)))
+
+        assert os.sched_getaffinity(child.pid) == {0}
+
+    def test_a_process_that_is_gone_is_not_an_error(self, child):
+        child.kill()
+        child.wait()
+
+        resources.apply(child.pid, ResourcePolicy(nice=5, cpus=(0,), io_priority=7))
+
+    def test_starts_nothing_to_set_the_io_priority(self, child):
+        with patch("core.resources.subprocess.run") as mock_run:
+            resources.apply(child.pid, ResourcePolicy(io_priority=7))
+
+        mock_run.assert_not_called()
+
+    def test_the_default_policy_touches_nothing(self):
+        with patch("core.resources.subprocess.run") as mock_run, patch("core.resources.os.setpriority") as mock_nice:
+            resources.apply(os.getpid(), ResourcePolicy())
+
+        mock_run.assert_not_called()
+        mock_nice.assert_not_called()
+
+
+class TestCommand:
+    @with_ionice
+    def test_the_io_priority_is_set_before_the_command_runs(self):
+        args = [sys.executable, "-c", "import os; os.system(f'ionice -p {os.getpid()}')"]
+
+        out = subprocess.run(resources.command(args, ResourcePolicy(io_priority=7)), capture_output=True, text=True)
+
+        assert out.stdout.strip() == "best-effort: prio 7"
+
+    def test_without_an_io_priority_the_command_is_left_alone(self):
+        args = ["ffmpeg", "-i", "in.mkv"]
+
+        assert resources.command(args, ResourcePolicy(nice=5)) == args
+        assert resources.command(args, None) == args
+
+
+class TestTrackerPolicy:
+    def test_the_tracker_applies_its_policy_to_ffmpeg(self):
+        policy = ResourcePolicy(nice=5)
+        with patch("core.resources.apply") as mock_apply:
+            tracker = FFmpegProgressTracker([sys.executable, "-c", "pass"], lambda status: None, policy=policy)
+            tracker.run()
+
+        assert tracker.proc is not None
+        mock_apply.assert_called_once_with(tracker.proc.pid, policy)
+
+    def test_no_policy_leaves_ffmpeg_alone(self):
+        with patch("core.resources.apply") as mock_apply:
+            FFmpegProgressTracker([sys.executable, "-c", "pass"], lambda status: None).run()
+
+        mock_apply.assert_not_called()
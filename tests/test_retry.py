@@ -0,0 +1,252 @@
+import io
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import formatdate
+
+import pytest
+from yt_dlp.networking import Response
+from yt_dlp.networking.exceptions import HTTPError, IncompleteRead
+from yt_dlp.utils import DownloadCancelled as YtdlpDownloadCancelled
+from yt_dlp.utils import DownloadError
+
+# Force reimport: test_hwaccel drops core.exceptions, and a core.retry imported
+# before that raises exception classes this module's own imports are not.
+sys.modules.pop("core.retry", None)
+
+import core.retry as retry  # noqa: E402
+from core.exceptions import DownloadCancelled, DownloadTimeout  # noqa: E402
+from core.retry import Resume, after_attempt, delay, expires, retry_after, retryable  # noqa: E402
+from core.stall import DOWNLOAD, EXTRACT, POSTPROCESS, StallDetector  # noqa: E402
+
+
+def _http_error(status, headers=None):
+    return HTTPError(Response(io.BytesIO(), "https://example.com/v", headers or {}, status=status))
+
+
+def _wrapped(exc):
+    """`exc` as yt-dlp raises it: inside a DownloadError."""
+    try:
+        raise exc
+    except type(exc):
+        return DownloadError("ERROR: " + str(exc), sys.exc_info())
+
+
+class _Ydl:
+    """A YoutubeDL recording what each attempt asks of it."""
+
+    def __init__(self, info):
+        self.info = info
+        self.calls = []
+
+    def extract_info(self, url, download=True, process=True):
+        self.calls.append("extract")
+        return self.info
+
+    def process_ie_result(self, info, download=True):
+        self.calls.append("process")
+        # yt-dlp fills in what it processed.
+        info["requested_downloads"] = [{}]
+        return info
+
+
+class TestRetryable:
+    def test_a_busy_or_failing_server_may_pass(self):
+        assert retryable(_wrapped(_http_error(429)), EXTRACT)
+        assert retryable(_wrapped(_http_error(503)), DOWNLOAD)
+
+    def test_a_dropped_connection_may_pass(self):
+        assert retryable(_wrapped(IncompleteRead(10, 100)), DOWNLOAD)
+        assert retryable(TimeoutError(), DOWNLOAD)
+
+    def test_a_refusal_is_only_retried_in_the_download(self):
+        assert retryable(_wrapped(_http_error(403)), DOWNLOAD)
+        assert not retryable(_wrapped(_http_error(403)), EXTRACT)
+
+    def test_other_errors_are_not(self):
+        assert not retryable(_wrapped(_http_error(404)), DOWNLOAD)
+        assert not retryable(RuntimeError("unsupported URL"), EXTRACT)
+
+
+class TestDelay:
+    def test_backs_off_exponentially_with_jitter(self, monkeypatch):
+        monkeypatch.setattr(retry, "BASE_BACKOFF", 4)
+
+        first, third = delay(0), delay(2)
+
+        assert first is not None and 2 <= first <= 4
+        assert third is not None and 8 <= third <= 16
+
+    def test_waits_at_least_what_the_server_asks(self, monkeypatch):
+        monkeypatch.setattr(retry, "BASE_BACKOFF", 1)
+
+        assert delay(0, _wrapped(_http_error(429, {"Retry-After": "30"}))) == 30
+
+    def test_a_retry_after_too_long_is_given_up_on(self):
+        error = _http_error(503, {"Retry-After": str(retry.MAX_RETRY_AFTER + 1)})
+
+        assert delay(0, error) is None
+
+
+class TestRetryAfter:
+    def test_reads_seconds_and_dates(self):
+        assert retry_after(_http_error(429, {"Retry-After": " 12 "})) == 12
+        later = formatdate(time.time() + 60, usegmt=True)
+        seconds = retry_after(_http_error(429, {"Retry-After": later}))
+        assert seconds is not None and 50 < seconds <= 60
+
+    def test_nothing_to_read(self):
+        assert retry_after(_http_error(429)) is None
+        assert retry_after(_http_error(429, {"Retry-After": "soon"})) is None
+        assert retry_after(RuntimeError()) is None
+
+
+class TestAfterAttempt:
+    URL = "https://example.com/v"
+
+    def test_an_error_a_retry_may_fix_is_waited_out(self, monkeypatch):
+        monkeypatch.setattr(retry, "BASE_BACKOFF", 1)
+        error = _wrapped(_http_error(503, {"Retry-After": "20"}))
+
+        assert after_attempt(Resume(self.URL), StallDetector(), 0, self.URL, error, False) == 20
+
+    def test_other_errors_end_the_job(self):
+        error = RuntimeError("unsupported URL")
+
+        with pytest.raises(RuntimeError, match="unsupported URL"):
+            after_attempt(Resume(self.URL), StallDetector(), 0, self.URL, error, False)
+
+    def test_a_cancel_ends_the_job(self):
+        with pytest.raises(DownloadCancelled):
+            after_attempt(Resume(self.URL), StallDetector(), 0, self.URL, YtdlpDownloadCancelled(), False)
+
+    def test_the_last_attempt_left_running_times_out(self):
+        with pytest.raises(DownloadTimeout):
+            after_attempt(Resume(self.URL), StallDetector(), retry.MAX_RETRIES - 1, self.URL, None, True)
+
+
+class TestExpires:
+    def test_the_first_format_to_expire(self):
+        info = {
+            "formats": [
+                {"url": "https://cdn.example.com/a?expire=1900000000&sig=x"},
+                {"manifest_url": "https://manifest.example.com/api/expire/1800000000/sig/x"},
+                {"url": "https://cdn.example.com/b"},
+            ]
+        }
+
+        assert expires(info) == 1800000000
+
+    def test_formats_that_do_not_say_never_expire(self):
+        assert expires({"url": "https://cdn.example.com/v.mp4"}) == float("inf")
+
+
+class TestResume:
+    def test_a_download_is_resumed_without_extracting_again(self):
+        ydl = _Ydl({"id": "v", "formats": [{"url": "https://cdn.example.com/v"}]})
+        resume = Resume("https://example.com/v")
+        resume.run(ydl)
+
+        assert resume.prepare(DOWNLOAD, TimeoutError()) == "resuming its download"
+        result = resume.run(ydl)
+
+        assert ydl.calls == ["extract", "process", "process"]
+        assert resume.stage == DOWNLOAD
+        assert result is not None
+        assert result["requested_downloads"] == [{}]
+        # Each attempt processes the extraction as it came.
+        assert "requested_downloads" not in ydl.info
+
+    def test_expired_format_urls_are_refreshed(self):
+        expired = int(time.time()) + retry.EXPIRY_MARGIN - 1
+        ydl = _Ydl({"id": "v", "formats": [{"url": f"https://cdn.example.com/v?expire={expired}"}]})
+        resume = Resume("https://example.com/v")
+        resume.run(ydl)
+
+        assert resume.prepare(DOWNLOAD, TimeoutError()) == "refreshing its format URLs"
+        resume.run(ydl)
+
+        assert ydl.calls == ["extract", "process", "extract", "process"]
+
+    def test_a_refused_download_is_refreshed(self):
+        ydl = _Ydl({"id": "v", "formats": []})
+        resume = Resume("https://example.com/v")
+        resume.run(ydl)
+
+        resume.prepare(DOWNLOAD, _wrapped(_http_error(403)))
+
+        assert resume.stage == EXTRACT
+
+    def test_a_failed_postprocess_is_run_again_on_what_was_downloaded(self):
+        expired = int(time.time()) - 1
+        ydl = _Ydl({"id": "v", "formats": [{"url": f"https://cdn.example.com/v?expire={expired}"}]})
+        resume = Resume("https://example.com/v")
+        resume.run(ydl)
+
+        resume.prepare(POSTPROCESS, None)
+        resume.run(ydl)
+
+        assert ydl.calls == ["extract", "process", "process"]
+
+    def test_a_playlist_is_extracted_again(self):
+        ydl = _Ydl({"_type": "playlist", "entries": iter(())})
+        resume = Resume("https://example.com/list")
+        resume.run(ydl)
+
+        resume.prepare(DOWNLOAD, TimeoutError())
+        resume.run(ydl)
+
+        assert ydl.calls == ["extract", "process", "extract", "process"]
+
+    def test_a_failed_extraction_is_extracted_again(self):
+        ydl = _Ydl({"id": "v"})
+        resume = Resume("https://example.com/v")
+        resume.run(ydl)
+
+        resume.prepare(EXTRACT, TimeoutError())
+
+        assert resume.stage == EXTRACT
+        resume.run(ydl)
+        assert ydl.calls == ["extract", "process", "extract", "process"]
+
+    def test_an_abandoned_attempt_stops_at_its_next_hook_on_any_thread(self):
+        resume = Resume("https://example.com/v")
+        hooked = []
+
+        class _Hooked(_Ydl):
+            def process_ie_result(self, info, download=True):
+                resume.abandon()
+                # From a thread of yt-dlp's own, as fragments are downloaded on.
+                with ThreadPoolExecutor(1) as fragments, pytest.raises(YtdlpDownloadCancelled):
+                    fragments.submit(resume.hook, {"status": "downloading"}).result()
+                hooked.append(True)
+                return info
+
+        resume.run(_Hooked({"id": "v"}))
+        assert hooked == [True]
+
+        # The next attempt lets everything through.
+        resume.run(_Ydl({"id": "v"}))
+        resume.hook({"status": "downloading"})
+
+    def test_waits_for_the_attempt_running(self):
+        resume = Resume("https://example.com/v")
+        started = threading.Event()
+        release = threading.Event()
+
+        class _Stuck(_Ydl):
+            def process_ie_result(self, info, download=True):
+                started.set()
+                release.wait(5)
+                return info
+
+        assert resume.wait(0)
+        attempt = threading.Thread(target=resume.run, args=(_Stuck({"id": "v"}),))
+        attempt.start()
+        started.wait(5)
+
+        assert not resume.wait(0.01)
+        release.set()
+        assert resume.wait(5)
+        attempt.join()
@@ -0,0 +1,203 @@
+import inspect
+import sys
+from unittest.mock import MagicMock
+
+import pytest
+
+for _name in [
+    name for name, mod in list(sys.modules.items()) if name.startswith("yt_dlp") and isinstance(mod, MagicMock)
+]:
+    del sys.modules[_name]
+
+from yt_dlp.downloader.dash import DashSegmentsFD  # noqa: E402
+from yt_dlp.downloader.external import FFmpegFD  # noqa: E402
+from yt_dlp.downloader.hls import HlsFD  # noqa: E402
+
+from core import ffmpegfd_progress, section_fragments  # noqa: E402
+from core.section_fragments import section_cut_args, slice_dash_fragments, trim_hls_playlist  # noqa: E402
+
+PLAYLIST = """#EXTM3U
+#EXT-X-VERSION:3
+#EXT-X-TARGETDURATION:10
+#EXT-X-MEDIA-SEQUENCE:100
+#EXTINF:10.0,
+seg100.ts
+#EXTINF:10.0,
+seg101.ts
+#EXTINF:10.0,
+seg102.ts
+#EXTINF:10.0,
+seg103.ts
+#EXT-X-ENDLIST
+"""
+
+
+class TestSeams:
+    """Guard the yt-dlp internals core/section_fragments.py reaches into."""
+
+    def test_call_downloader_still_has_the_signature_we_wrap(self):
+        params = inspect.signature(FFmpegFD._call_downloader).parameters
+        assert list(params) == ["self", "tmpfilename", "info_dict"]
+
+    def test_hls_still_takes_a_playlist_handed_to_it(self):
+        source = inspect.getsource(HlsFD.real_download)
+        assert "hls_media_playlist_data" in source
+        assert callable(HlsFD._has_drm)
+        assert callable(HlsFD._prepare_url)
+
+    def test_dash_still_downloads_the_fragments_list(self):
+        assert "fragments" in inspect.getsource(DashSegmentsFD.real_download)
+
+
+class TestTrimHlsPlaylist:
+    def test_keeps_only_the_segments_in_range(self):
+        section = trim_hls_playlist(PLAYLIST, 12, 25)
+        assert section is not None
+
+        assert section.starts_at == 10
+        assert "seg100.ts" not in section.playlist
+        assert "seg101.ts" in section.playlist
+        assert "seg102.ts" in section.playlist
+        assert "seg103.ts" not in section.playlist
+        assert section.playlist.count("#EXTINF") == 2
+
+    def test_points_the_media_sequence_at_the_first_kept_segment(self):
+        """AES-128 derives the IV of each segment from its sequence number."""
+        section = trim_hls_playlist(PLAYLIST, 25, None)
+        assert section is not None
+
+        assert "#EXT-X-MEDIA-SEQUENCE:102" in section.playlist
+        assert "#EXT-X-ENDLIST" in section.playlist
+        assert "seg103.ts" in section.playlist
+
+    def test_writes_implicit_byte_ranges_with_their_offset(self):
+        playlist = """#EXTM3U
+#EXTINF:5.0,
+#EXT-X-BYTERANGE:100@0
+media.mp4
+#EXTINF:5.0,
+#EXT-X-BYTERANGE:200
+media.mp4
+#EXT-X-ENDLIST
+"""
+        section = trim_hls_playlist(playlist, 6, None)
+        assert section is not None
+
+        assert "#EXT-X-BYTERANGE:200@100" in section.playlist
+        assert "#EXT-X-BYTERANGE:100@0" not in section.playlist
+
+    @pytest.mark.parametrize(
+        "playlist",
+        [
+            PLAYLIST.replace("#EXT-X-ENDLIST\n", ""),
+            "#EXTM3U\n#EXT-X-STREAM-INF:BANDWIDTH=1\nmedia.m3u8\n",
+            PLAYLIST.replace("#EXTINF:10.0,\nseg101.ts", "seg101.ts"),
+        ],
+        ids=["live", "master", "segment-without-duration"],
+    )
+    def test_leaves_what_it_cannot_plan_to_ffmpeg(self, playlist):
+        assert trim_hls_playlist(playlist, 12, 25) is None
+
+    def test_a_range_past_the_end_has_nothing_to_keep(self):
+        assert trim_hls_playlist(PLAYLIST, 100, 110) is None
+
+
+class TestSliceDashFragments:
+    def test_keeps_the_init_fragment_and_the_fragments_in_range(self):
+        fragments = [{"path": "init"}] + [{"path": f"seg{i}", "duration": 4.0} for i in range(5)]
+
+        section = slice_dash_fragments(fragments, 5, 9)
+
+        assert section is not None
+
+        assert [f["path"] for f in section.fragments] == ["init", "seg1", "seg2"]
+        assert section.starts_at == 4
+
+    def test_a_fragment_without_duration_leaves_it_to_ffmpeg(self):
+        fragments = [{"path": "seg0", "duration": 4.0}, {"path": "seg1"}]
+        assert slice_dash_fragments(fragments, 5, None) is None
+
+    def test_a_generator_cannot_be_sliced(self):
+        assert slice_dash_fragments(iter([]), 0, 10) is None
+
+
+class TestSectionCutArgs:
+    def test_seeks_each_input_by_its_own_offset(self):
+        args = section_cut_args(
+            "ffmpeg", [("video.part", 2.0), ("audio.part", 0.5)], 13.0, reencode=False, out_format="mp4"
+        )
+
+        assert args[args.index("video.part") - 3 : args.index("video.part") - 1] == ["-ss", "2.000"]
+        assert args[args.index("audio.part") - 3 : args.index("audio.part") - 1] == ["-ss", "0.500"]
+        assert args[args.index("-t") + 1] == "13.000"
+        assert args[args.index("-c") + 1] == "copy"
+        assert args[args.index("1:a?") - 1] == "-map"
+        assert args[-2:] == ["-f", "mp4"]
+
+    def test_reencodes_when_asked_to_cut_precisely(self):
+        args = section_cut_args("ffmpeg", [("video.part", 0.0)], None, reencode=True, out_format=None)
+
+        assert "-c" not in args
+        assert "-ss" not in args
+        assert "-t" not in args
+
+
+class TestPlan:
+    def test_leaves_an_untrimmed_download_alone(self):
+        assert section_fragments._plan(MagicMock(), "out.mp4", {"protocol": "m3u8_native"}, HlsFD) is None
+
+    def test_leaves_a_progressive_format_to_ffmpeg(self):
+        info = {"section_start": 10, "section_end": 20, "protocol": "https", "url": "https://x/video.mp4"}
+        assert section_fragments._plan(MagicMock(), "out.mp4", info, HlsFD) is None
+
+    def test_plans_every_requested_format(self):
+        fragments = [{"path": f"seg{i}", "duration": 4.0} for i in range(5)]
+        info = {
+            "section_start": 5,
+            "section_end": 9,
+            "ext": "mp4",
+            "requested_formats": [
+                {"format_id": "v", "protocol": "m3u8_native", "url": "https://x/v.m3u8"},
+                {"format_id": "a", "protocol": "http_dash_segments", "fragments": fragments},
+            ],
+        }
+        downloader = MagicMock()
+        downloader.ydl.urlopen.return_value.__enter__.return_value.url = "https://cdn/v.m3u8"
+        downloader.ydl.urlopen.return_value.__enter__.return_value.read.return_value = PLAYLIST.encode()
+
+        plan = section_fragments._plan(downloader, "out.mp4", info, HlsFD)
+        assert plan is not None
+
+        (hls_kind, hls_info, hls_start), (dash_kind, dash_info, dash_start) = plan
+        assert (hls_kind, hls_start) == ("hls", 0)
+        assert hls_info["url"] == "https://cdn/v.m3u8"
+        assert "seg100.ts" in hls_info["hls_media_playlist_data"]
+        assert "seg102.ts" not in hls_info["hls_media_playlist_data"]
+        assert (dash_kind, dash_start) == ("dash", 4)
+        assert len(dash_info["fragments"]) == 2
+
+    def test_a_playlist_it_cannot_fetch_goes_to_ffmpeg(self):
+        info = {"section_start": 5, "section_end": 9, "protocol": "m3u8_native", "url": "https://x/v.m3u8"}
+        downloader = MagicMock()
+        downloader.ydl.urlopen.side_effect = OSError("unreachable")
+
+        assert section_fragments._plan(downloader, "out.mp4", info, HlsFD) is None
+
+
+class TestInstall:
+    def test_wraps_the_ffmpeg_downloader_and_is_idempotent(self):
+        assert ffmpegfd_progress.install()
+        assert section_fragments.install()
+        patched_call = FFmpegFD._call_downloader
+
+        assert section_fragments.install()
+
+        assert FFmpegFD._call_downloader is patched_call
+
+    def test_gives_up_quietly_when_a_seam_is_missing(self, monkeypatch, caplog):
+        monkeypatch.setattr(section_fragments, "_installed", False)
+        monkeypatch.delattr("yt_dlp.downloader.hls.HlsFD")
+
+        assert section_fragments.install() is False
+        assert not section_fragments._installed
+        assert "yt-dlp has moved" in caplog.text
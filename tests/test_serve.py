@@ -0,0 +1,259 @@
+import asyncio
+import json
+import threading
+
+import pytest
+
+from cli import runner
+from cli.options import JobOptions, Tools, options_from_dict
+from cli.serve import JobServer
+from core.jobs import CANCELLED, DONE, DOWNLOADING, FAILED
+
+TOOLS = Tools(ff_path={"ffmpeg": "ffmpeg", "ffprobe": "ffprobe"})
+
+
+class _FakeYdl:
+    def __init__(self, opts):
+        self.params = opts
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def gates(monkeypatch):
+    """create_ydl and download as fakes. A download of a URL in `gates` waits for its event."""
+    gates: dict[str, threading.Event] = {}
+
+    def create_ydl(opts, status_cb, ff_path):
+        status_cb.on_status("Fetching video info")
+        return _FakeYdl(opts)
+
+    def download(ydl, config, cancel, progress_cb):
+        hook = ydl.params["progress_hooks"][0]
+        hook({"status": "downloading", "downloaded_bytes": 10, "total_bytes": 100})
+        gate = gates.get(config.url)
+        while gate is not None and not gate.wait(0.01):
+            # Raises once the job is cancelled, as yt-dlp's own hooks make it.
+            hook({"status": "downloading", "downloaded_bytes": 10, "total_bytes": 100})
+        hook({"status": "finished", "downloaded_bytes": 100, "total_bytes": 100})
+
+    monkeypatch.setattr(runner, "create_ydl", create_ydl)
+    monkeypatch.setattr(runner, "download", download)
+    return gates
+
+
+async def _request(server, method, path, body=None, headers=None):
+    """Send one request, return the status and the decoded JSON body."""
+    host, port = server.address.removeprefix("http://").rsplit(":", 1)
+    reader, writer = await asyncio.open_connection(host, int(port))
+    payload = b"" if body is None else json.dumps(body).encode()
+    head = {"Host": f"127.0.0.1:{port}", "Content-Length": str(len(payload))}
+    if body is not None:
+        head["Content-Type"] = "application/json"
+    head.update(headers or {})
+    lines = [f"{method} {path} HTTP/1.1", *(f"{k}: {v}" for k, v in head.items()), "", ""]
+    writer.write("\r\n".join(lines).encode() + payload)
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    head_bytes, _, content = response.partition(b"\r\n\r\n")
+    status = int(head_bytes.split(b" ", 2)[1])
+    return status, json.loads(content) if content else None
+
+
+async def _until(predicate, timeout=5.0):
+    async with asyncio.timeout(timeout):
+        while not predicate():
+            await asyncio.sleep(0.01)
+
+
+def _run(scenario, **kwargs):
+    """Run `scenario(server)` against a server on a free port."""
+
+    async def main():
+        server = JobServer(TOOLS, jobs=kwargs.pop("jobs", 2), interval=0.01, **kwargs)
+        await server.start("127.0.0.1", 0)
+        try:
+            return await scenario(server)
+        finally:
+            await server.close()
+
+    return asyncio.run(main())
+
+
+class TestJobServer:
+    def test_submit_then_status(self, gates):
+        async def scenario(server):
+            status, body = await _request(server, "POST", "/jobs", {"url": "https://example.com/a"})
+            assert status == 201
+            (job_id,) = body["job_ids"]
+            await _until(lambda: server.model.get(job_id).stage == DONE)
+            status, job = await _request(server, "GET", f"/jobs/{job_id}")
+            assert status == 200
+            assert job["stage"] == DONE
+            assert job["label"] == "https://example.com/a"
+
+        _run(scenario)
+
+    def test_list_and_totals(self, gates):
+        async def scenario(server):
+            urls = ["https://example.com/a", "not a url"]
+            await _request(server, "POST", "/jobs", {"urls": urls})
+            await _until(lambda: server.model.totals().finished == 2)
+            status, body = await _request(server, "GET", "/jobs")
+            assert status == 200
+            assert [job["stage"] for job in body["jobs"]] == [DONE, FAILED]
+            assert body["totals"]["jobs"] == 2
+            assert body["totals"]["stages"][DONE] == 1
+
+        _run(scenario)
+
+    def test_options_reach_the_job(self, gates, monkeypatch):
+        seen = []
+
+        def build_config(url, options, *rest):
+            seen.append(options)
+            raise ZeroDivisionError
+
+        monkeypatch.setattr(runner, "build_config", build_config)
+
+        async def scenario(server):
+            options = {"audio_only": True, "acodec": "MP3"}
+            await _request(server, "POST", "/jobs", {"url": "https://example.com/a", "options": options})
+            await _until(lambda: bool(seen))
+
+        _run(scenario, defaults=JobOptions(dest_folder="/srv/media"))
+
+        assert seen == [JobOptions(dest_folder="/srv/media", audio_only=True, acodec="MP3")]
+
+    def test_cancel_a_running_job(self, gates):
+        gates["https://example.com/slow"] = threading.Event()
+
+        async def scenario(server):
+            _, body = await _request(server, "POST", "/jobs", {"url": "https://example.com/slow"})
+            (job_id,) = body["job_ids"]
+            await _until(lambda: server.model.get(job_id).stage == DOWNLOADING)
+            status, _ = await _request(server, "POST", f"/jobs/{job_id}/cancel")
+            assert status == 202
+            await _until(lambda: server.model.get(job_id).stage == CANCELLED)
+
+        _run(scenario)
+
+    def test_cancel_a_queued_job_at_once(self, gates):
+        gates["https://example.com/slow"] = threading.Event()
+
+        async def scenario(server):
+            _, body = await _request(server, "POST", "/jobs", {"urls": ["https://example.com/slow"] * 2})
+            running, queued = body["job_ids"]
+            await _until(lambda: server.model.get(running).stage == DOWNLOADING)
+            await _request(server, "POST", f"/jobs/{queued}/cancel")
+            assert server.model.get(queued).stage == CANCELLED
+            gates["https://example.com/slow"].set()
+            await _until(lambda: server.model.get(running).stage == DONE)
+            assert server.model.get(queued).stage == CANCELLED
+
+        _run(scenario, jobs=1)
+
+    def test_delete_only_a_finished_job(self, gates):
+        gates["https://example.com/slow"] = threading.Event()
+
+        async def scenario(server):
+            _, body = await _request(server, "POST", "/jobs", {"url": "https://example.com/slow"})
+            (job_id,) = body["job_ids"]
+            status, _ = await _request(server, "DELETE", f"/jobs/{job_id}")
+            assert status == 409
+            gates["https://example.com/slow"].set()
+            await _until(lambda: server.model.get(job_id).stage == DONE)
+            status, _ = await _request(server, "DELETE", f"/jobs/{job_id}")
+            assert status == 204
+            assert (await _request(server, "GET", f"/jobs/{job_id}"))[0] == 404
+
+        _run(scenario)
+
+    def test_event_stream_of_one_job_ends_when_it_finishes(self, gates):
+        gates["https://example.com/slow"] = threading.Event()
+
+        async def scenario(server):
+            _, body = await _request(server, "POST", "/jobs", {"url": "https://example.com/slow"})
+            (job_id,) = body["job_ids"]
+            host, port = server.address.removeprefix("http://").rsplit(":", 1)
+            reader, writer = await asyncio.open_connection(host, int(port))
+            writer.write(f"GET /jobs/{job_id}/events HTTP/1.1\r\nHost: localhost\r\n\r\n".encode())
+            await _until(lambda: server.model.get(job_id).stage == DOWNLOADING)
+            gates["https://example.com/slow"].set()
+            async with asyncio.timeout(5):
+                stream = (await reader.read()).decode()
+            writer.close()
+            return stream
+
+        stream = _run(scenario)
+
+        head, _, events = stream.partition("\r\n\r\n")
+        assert "Content-Type: text/event-stream" in head
+        data = [json.loads(line[len("data: ") :]) for line in events.splitlines() if line.startswith("data: ")]
+        assert [event["stage"] for event in data][-1] == DONE
+
+    def test_event_stream_of_every_job(self, gates):
+        async def scenario(server):
+            host, port = server.address.removeprefix("http://").rsplit(":", 1)
+            reader, writer = await asyncio.open_connection(host, int(port))
+            writer.write(b"GET /events HTTP/1.1\r\nHost: localhost\r\n\r\n")
+            await _until(lambda: bool(server._subscribers))
+            await _request(server, "POST", "/jobs", {"urls": ["https://example.com/a", "https://example.com/b"]})
+            data = []
+            async with asyncio.timeout(5):
+                while sum(event.get("stage") == DONE for event in data) < 2:
+                    line = (await reader.readline()).decode()
+                    if line.startswith("data: "):
+                        data.append(json.loads(line[len("data: ") :]))
+            writer.close()
+            return data
+
+        data = _run(scenario)
+
+        assert {"event": "status", "job_id": "1", "message": "Fetching video info"} in data
+        assert {event["job_id"] for event in data} == {"1", "2"}
+
+    @pytest.mark.parametrize(
+        ("method", "path", "body", "headers", "expected"),
+        [
+            ("POST", "/jobs", {"url": 5}, None, 400),
+            ("POST", "/jobs", {"url": "https://example.com/a", "options": {"vcodec": "h261"}}, None, 400),
+            ("POST", "/jobs", {"url": "https://example.com/a"}, {"Content-Type": "text/plain"}, 415),
+            ("GET", "/jobs", None, {"Host": "evil.example:8765"}, 403),
+            ("GET", "/jobs/404", None, None, 404),
+            ("PUT", "/jobs", None, None, 405),
+            ("GET", "/nowhere", None, None, 404),
+        ],
+    )
+    def test_bad_requests(self, gates, method, path, body, headers, expected):
+        async def scenario(server):
+            return await _request(server, method, path, body, headers)
+
+        status, body = _run(scenario)
+
+        assert status == expected
+        assert body["error"]
+
+
+class TestOptionsFromDict:
+    def test_over_the_defaults(self):
+        options = options_from_dict({"audio_only": True, "start": "0:01:00"}, JobOptions(dest_folder="/out"))
+
+        assert options == JobOptions(dest_folder="/out", audio_only=True, start="00:01:00")
+
+    @pytest.mark.parametrize(
+        "data",
+        [
+            {"colour": "blue"},
+            {"audio_only": "yes"},
+            {"quality": 1080},
+            {"quality": None},
+            {"speed_tier": "ludicrous"},
+            {"end": "90 seconds"},
+        ],
+    )
+    def test_refuses_what_it_cannot_run(self, data):
+        with pytest.raises(ValueError):
+            options_from_dict(data, JobOptions())
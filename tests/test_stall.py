@@ -0,0 +1,122 @@
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from core.stall import BUDGETS, DOWNLOAD, EXTRACT, POSTPROCESS, StallDetector
+
+
+@pytest.fixture
+def clock():
+    """The detector's monotonic clock, set by the test."""
+    with patch("core.stall.time") as mock_time:
+        mock_time.monotonic.return_value = 0.0
+        yield mock_time.monotonic
+
+
+class TestStages:
+    def test_starts_in_extraction(self, clock):
+        detector = StallDetector()
+
+        assert detector.stage == EXTRACT
+        assert detector.budget == BUDGETS[EXTRACT]
+
+    def test_each_stage_has_its_budget(self, clock):
+        detector = StallDetector({EXTRACT: 100, DOWNLOAD: 10, POSTPROCESS: 50})
+
+        clock.return_value = 60.0
+        assert not detector.is_stalled()
+
+        detector.on_progress({"status": "downloading", "downloaded_bytes": 1})
+        clock.return_value = 69.0
+        assert not detector.is_stalled()
+        clock.return_value = 71.0
+        assert detector.is_stalled()
+
+        detector.on_postprocess({"status": "started", "postprocessor": "Merger"})
+        clock.return_value = 120.0
+        assert not detector.is_stalled()
+        clock.return_value = 122.0
+        assert detector.is_stalled()
+
+    def test_restart_goes_back_to_extraction(self, clock):
+        detector = StallDetector({DOWNLOAD: 10})
+        detector.on_progress({"status": "downloading", "downloaded_bytes": 1})
+        clock.return_value = 20.0
+
+        detector.restart()
+
+        assert detector.stage == EXTRACT
+        assert not detector.is_stalled()
+
+    def test_a_resumed_attempt_restarts_in_its_stage(self, clock):
+        detector = StallDetector()
+
+        detector.restart(DOWNLOAD)
+
+        assert detector.budget == BUDGETS[DOWNLOAD]
+
+
+class TestActivity:
+    def test_the_log_only_counts_before_the_download(self, clock):
+        detector = StallDetector({EXTRACT: 10, DOWNLOAD: 10})
+
+        clock.return_value = 9.0
+        detector.on_log("[youtube] Downloading webpage")
+        clock.return_value = 18.0
+        assert not detector.is_stalled()
+
+        detector.on_progress({"status": "downloading", "downloaded_bytes": 1})
+        clock.return_value = 25.0
+        detector.on_log("[download] Retrying fragment 3")
+        clock.return_value = 30.0
+        assert detector.is_stalled()
+
+    def test_a_hook_without_new_bytes_is_no_activity(self, clock):
+        detector = StallDetector({DOWNLOAD: 10})
+        detector.on_progress({"status": "downloading", "downloaded_bytes": 5, "filename": "/none/v.mp4"})
+
+        clock.return_value = 8.0
+        detector.on_progress({"status": "downloading", "downloaded_bytes": 5, "filename": "/none/v.mp4"})
+        clock.return_value = 11.0
+        assert detector.is_stalled()
+
+        detector.on_progress({"status": "downloading", "downloaded_bytes": 6, "filename": "/none/v.mp4"})
+        assert not detector.is_stalled()
+
+    def test_a_new_fragment_is_activity(self, clock):
+        detector = StallDetector({DOWNLOAD: 10})
+        detector.on_progress({"status": "downloading", "fragment_index": 1})
+
+        clock.return_value = 8.0
+        detector.on_progress({"status": "downloading", "fragment_index": 2})
+        clock.return_value = 15.0
+
+        assert not detector.is_stalled()
+
+    def test_a_growing_file_is_activity(self, clock, tmp_path):
+        part = tmp_path / "v.mp4.part"
+        part.write_bytes(b"x")
+        detector = StallDetector({POSTPROCESS: 10})
+        detector.on_postprocess({"status": "started", "info_dict": {"filepath": str(part)}})
+
+        clock.return_value = 8.0
+        part.write_bytes(b"xx")
+        assert not detector.is_stalled()
+        clock.return_value = 15.0
+        assert not detector.is_stalled()
+        clock.return_value = 19.0
+        assert detector.is_stalled()
+
+    def test_the_jobs_processes_moving_bytes_is_activity(self, clock):
+        processes = MagicMock()
+        processes.io_bytes.return_value = 100
+        detector = StallDetector({EXTRACT: 10}, processes)
+
+        clock.return_value = 8.0
+        assert not detector.is_stalled()
+        clock.return_value = 15.0
+        assert not detector.is_stalled()
+
+        # Nothing moved since: the 10 seconds run from the last read that saw bytes.
+        clock.return_value = 19.0
+        assert detector.is_stalled()
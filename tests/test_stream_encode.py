@@ -0,0 +1,207 @@
+import os
+import sys
+import textwrap
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from core import resources, stream_encode
+from core.exceptions import FFmpegNoValidEncoderFound
+from core.stream_encode import StreamingEncoder, codec_name
+from core.supervisor import job_processes
+
+pytestmark = pytest.mark.skipif(os.name == "nt", reason="streamed encodes are POSIX only")
+
+# A stand in for ffmpeg: copies stdin to the output file, printing one progress
+# block at the end, like ffmpeg reading `-i pipe:0` would.
+FAKE_FFMPEG = textwrap.dedent(
+    """
+    import shutil, sys
+    with open(sys.argv[1], "wb") as out:
+        shutil.copyfileobj(sys.stdin.buffer, out)
+    sys.exit(int(sys.argv[2]))
+    """
+)
+
+INFO = {"vcodec": "vp09.00.40.08", "acodec": "opus", "duration": 10, "width": 1920, "height": 1080}
+
+
+def _fake_command(returncode: int = 0):
+    def command(source, output, *args, **kwargs):
+        assert source == "pipe:0"
+        return [sys.executable, "-c", FAKE_FFMPEG, output, str(returncode)]
+
+    return command
+
+
+def _encoder(target_vcodec: str = "NLE") -> StreamingEncoder:
+    cancel = MagicMock()
+    cancel.is_cancelled.return_value = False
+    return StreamingEncoder(MagicMock(params={}), target_vcodec, cancel, MagicMock(), {"ffmpeg": "ffmpeg"})
+
+
+def _download(encoder: StreamingEncoder, path: str, chunks: list[bytes]) -> None:
+    """Play yt-dlp's native HTTP downloader: write the .part, report, rename, report."""
+    part = f"{path}.part"
+    downloaded = 0
+    with open(part, "wb") as f:
+        for chunk in chunks:
+            f.write(chunk)
+            f.flush()
+            downloaded += len(chunk)
+            encoder.hook(
+                {
+                    "status": "downloading",
+                    "filename": path,
+                    "tmpfilename": part,
+                    "downloaded_bytes": downloaded,
+                    "info_dict": INFO,
+                }
+            )
+    os.rename(part, path)
+    encoder.hook({"status": "finished", "filename": path, "total_bytes": downloaded, "info_dict": INFO})
+
+
+class TestCodecName:
+    @pytest.mark.parametrize(
+        ("codec", "expected"),
+        [("avc1.64001F", "avc1"), ("mp4a.40.2", "mp4a"), ("vp09.00.40.08", "vp9"), ("hvc1.1.6.L120", "hevc")],
+    )
+    def test_speaks_ffprobe(self, codec, expected):
+        assert codec_name(codec) == expected
+
+    def test_unknown_is_na(self):
+        assert codec_name(None) == "na"
+
+
+class TestStreamingEncoder:
+    @patch.object(stream_encode.StreamingEncoder, "_can_follow", return_value=True)
+    def test_encodes_the_file_as_it_downloads(self, _, tmp_path):
+        path = str(tmp_path / "video.webm")
+        encoder = _encoder()
+
+        with patch.object(stream_encode, "ffmpeg_video_command", _fake_command()):
+            _download(encoder, path, [b"a" * 1000, b"b" * 1000, b"c" * 10])
+            assert encoder.finish(path)
+
+        assert not os.path.exists(path)
+        with open(tmp_path / "video.mp4", "rb") as f:
+            assert f.read() == b"a" * 1000 + b"b" * 1000 + b"c" * 10
+
+    @patch.object(stream_encode.StreamingEncoder, "_can_follow", return_value=True)
+    def test_the_ffmpeg_it_starts_on_its_threads_is_the_jobs(self, _, tmp_path):
+        path = str(tmp_path / "video.webm")
+        encoder = _encoder()
+
+        with patch.object(stream_encode, "ffmpeg_video_command", _fake_command()), job_processes() as processes:
+            _download(encoder, path, [b"a" * 1000])
+            assert encoder.finish(path)
+
+        assert resources.ENCODE in processes.usage()
+
+    @patch.object(stream_encode.StreamingEncoder, "_can_follow", return_value=True)
+    def test_a_failed_encode_leaves_the_download_for_the_usual_one(self, _, tmp_path):
+        path = str(tmp_path / "video.webm")
+        encoder = _encoder()
+
+        with patch.object(stream_encode, "ffmpeg_video_command", _fake_command(returncode=1)):
+            _download(encoder, path, [b"a" * 1000])
+            assert not encoder.finish(path)
+
+        assert os.path.isfile(path)
+        assert not os.path.exists(tmp_path / "video.tmp.mp4")
+
+    @patch.object(stream_encode.StreamingEncoder, "_can_follow", return_value=True)
+    def test_a_restarted_download_is_abandoned(self, _, tmp_path):
+        path = str(tmp_path / "video.webm")
+        encoder = _encoder()
+
+        with patch.object(stream_encode, "ffmpeg_video_command", _fake_command()):
+            _download(encoder, path, [b"a" * 1000])
+            encoder.hook({"status": "downloading", "filename": path, "downloaded_bytes": 10, "info_dict": INFO})
+            assert not encoder.finish(path)
+
+        assert os.path.isfile(path)
+
+    @patch.object(stream_encode.StreamingEncoder, "_can_follow", return_value=True)
+    def test_an_ffmpeg_that_does_not_run_leaves_the_download_for_the_usual_encode(self, _, tmp_path):
+        path = str(tmp_path / "video.webm")
+        encoder = _encoder()
+
+        with (
+            patch.object(stream_encode, "ffmpeg_video_command", _fake_command()),
+            patch.object(stream_encode.FFmpegProgressTracker, "run", side_effect=FileNotFoundError("ffmpeg")),
+        ):
+            _download(encoder, path, [b"a" * 1000])
+            assert not encoder.finish(path)
+
+        assert os.path.isfile(path)
+
+    @patch.object(stream_encode.StreamingEncoder, "_can_follow", return_value=True)
+    def test_no_encoder_leaves_the_download_alone(self, _, tmp_path):
+        path = str(tmp_path / "video.webm")
+        encoder = _encoder()
+
+        with patch.object(stream_encode, "ffmpeg_video_command", side_effect=FFmpegNoValidEncoderFound):
+            _download(encoder, path, [b"a" * 1000])
+
+        assert not encoder.finish(path)
+        assert os.path.isfile(path)
+
+    def test_a_remux_is_not_worth_streaming(self, tmp_path):
+        encoder = _encoder()
+        compatible = {**INFO, "vcodec": "avc1.64001F", "acodec": "mp4a.40.2"}
+
+        with patch.object(stream_encode.StreamingEncoder, "_can_follow", return_value=True):
+            encoder.hook(
+                {"status": "downloading", "filename": "x.mp4", "tmpfilename": "x.mp4.part", "info_dict": compatible}
+            )
+
+        assert not encoder.finish("x.mp4")
+
+    def test_close_removes_what_nobody_finished(self, tmp_path):
+        path = str(tmp_path / "video.webm")
+        encoder = _encoder()
+
+        with (
+            patch.object(stream_encode.StreamingEncoder, "_can_follow", return_value=True),
+            patch.object(stream_encode, "ffmpeg_video_command", _fake_command()),
+        ):
+            _download(encoder, path, [b"a" * 1000])
+            encoder.close()
+
+        assert not os.path.exists(tmp_path / "video.tmp.mp4")
+        assert not encoder.finish(path)
+
+
+class TestCanFollow:
+    def test_follows_a_progressive_http_download(self):
+        from yt_dlp import YoutubeDL
+
+        encoder = StreamingEncoder(YoutubeDL({"quiet": True}), "NLE", MagicMock(), MagicMock(), {})
+        info = {**INFO, "url": "https://example.com/v.webm", "protocol": "https"}
+
+        assert encoder._can_follow(info, "v.webm.part")
+
+    @pytest.mark.parametrize(
+        ("params", "info"),
+        [
+            ({"external_downloader": {"http": "aria2c"}}, {}),
+            ({"postprocessors": [{"key": "SponsorBlock"}]}, {}),
+            ({}, {"protocol": "m3u8_native"}),
+            ({}, {"section_start": 5}),
+            ({}, {"requested_formats": [{}, {}]}),
+            ({}, {"acodec": "none"}),
+        ],
+        ids=["aria2c", "postprocessor", "segmented", "trimmed", "merged", "video-only"],
+    )
+    def test_leaves_what_it_cannot_follow(self, params, info):
+        from yt_dlp import YoutubeDL
+        from yt_dlp.downloader.external import Aria2cFD
+
+        encoder = StreamingEncoder(YoutubeDL({"quiet": True, **params}), "NLE", MagicMock(), MagicMock(), {})
+        info = {**INFO, "url": "https://example.com/v.webm", "protocol": "https", **info}
+
+        # Whether or not aria2c is installed here, it is what would download this.
+        with patch.object(Aria2cFD, "available", return_value=True):
+            assert not encoder._can_follow(info, "v.webm.part")
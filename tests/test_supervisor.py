@@ -0,0 +1,150 @@
+import contextvars
+import os
+import subprocess
+import sys
+import threading
+import time
+from unittest.mock import patch
+
+import pytest
+
+from core import resources, supervisor
+from core.config_types import ResourcePolicy
+from core.supervisor import job_processes
+
+pytestmark = pytest.mark.skipif(sys.platform == "win32", reason="the sleepers below are POSIX signal tests")
+
+_SLEEP = [sys.executable, "-c", "import time; time.sleep(30)"]
+# Ignores SIGTERM, so only the SIGKILL that follows it can stop it.
+_STUBBORN = [
+    sys.executable,
+    "-c",
+    "import signal, sys, time; signal.signal(signal.SIGTERM, signal.SIG_IGN); print(flush=True); time.sleep(30)",
+]
+
+
+@pytest.fixture
+def reap():
+    """Kill whatever a test left running."""
+    procs = []
+    yield procs.append
+    for proc in procs:
+        if proc.poll() is None:
+            proc.kill()
+            proc.wait()
+
+
+class TestJobProcesses:
+    def test_a_job_stops_its_own_processes_only(self, reap):
+        with job_processes() as first:
+            mine = supervisor.popen(_SLEEP)
+        with job_processes() as second:
+            theirs = supervisor.popen(_SLEEP)
+        reap(mine)
+        reap(theirs)
+
+        assert first.stop() == 1
+
+        assert mine.poll() is not None
+        assert theirs.poll() is None
+        assert second.running() == [theirs]
+
+    def test_a_process_that_ignores_sigterm_is_killed(self, reap):
+        with job_processes() as processes:
+            proc = supervisor.popen(_STUBBORN, stdout=subprocess.PIPE)
+        reap(proc)
+        assert proc.stdout is not None
+        proc.stdout.readline()  # the handler is in place
+        started = time.monotonic()
+
+        processes.stop(grace=0.2)
+
+        assert proc.wait(timeout=5) == -9
+        assert time.monotonic() - started < 5
+
+    def test_processes_that_are_done_are_not_running(self, reap):
+        with job_processes() as processes:
+            proc = supervisor.popen([sys.executable, "-c", "pass"])
+        proc.wait()
+
+        assert processes.running() == []
+        assert processes.stop() == 0
+
+    def test_threads_started_with_a_copy_of_the_context_belong_to_the_job(self, reap):
+        started = []
+        with job_processes() as processes:
+            ctx = contextvars.copy_context()
+            thread = threading.Thread(target=lambda: started.append(ctx.run(supervisor.popen, _SLEEP)))
+            thread.start()
+            thread.join()
+        reap(started[0])
+
+        assert processes.running() == started
+
+    def test_outside_a_job_nothing_is_tracked(self, reap):
+        proc = supervisor.popen([sys.executable, "-c", "pass"])
+        reap(proc)
+
+        with job_processes() as processes:
+            pass
+
+        assert processes.running() == []
+
+    def test_popen_applies_the_policy(self, reap):
+        policy = ResourcePolicy(nice=5)
+        with patch("core.resources.apply") as apply, job_processes():
+            proc = supervisor.popen([sys.executable, "-c", "pass"], policy=policy)
+        reap(proc)
+
+        apply.assert_called_once_with(proc.pid, policy)
+
+
+class TestInstall:
+    def test_tracks_the_processes_yt_dlp_starts(self, reap):
+        from yt_dlp.utils import Popen
+
+        assert supervisor.install()
+        with job_processes() as processes:
+            proc = Popen(_SLEEP)
+        reap(proc)
+
+        assert processes.running() == [proc]
+
+
+class TestUsage:
+    def test_each_process_is_accounted_to_its_stage(self, reap):
+        with job_processes() as processes:
+            download = supervisor.popen([sys.executable, "-c", "pass"], stage=resources.DOWNLOAD)
+            encodes = [supervisor.popen([sys.executable, "-c", "pass"]) for _ in range(2)]
+        for proc in (download, *encodes):
+            reap(proc)
+            proc.wait()
+
+        usage = processes.usage()
+
+        assert {stage: costs["processes"] for stage, costs in usage.items()} == {"download": 1, "encode": 2}
+
+    @pytest.mark.skipif(not os.path.isdir("/proc/self"), reason="only wall time is accounted without /proc")
+    def test_what_a_running_process_has_cost_is_read(self, reap):
+        # Takes 32 MiB and half a second of CPU, then waits to be read.
+        busy = (
+            "import sys, time\n"
+            "x = bytearray(32 << 20)\n"
+            "end = time.process_time() + 0.5\n"
+            "while time.process_time() < end: pass\n"
+            "print(flush=True)\n"
+            "sys.stdin.read()"
+        )
+        with job_processes() as processes:
+            proc = supervisor.popen([sys.executable, "-c", busy], stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+        reap(proc)
+        assert proc.stdout is not None
+        proc.stdout.readline()
+
+        assert processes.sample()
+        proc.communicate()
+        (costs,) = processes.usage().values()
+
+        assert costs["cpu_seconds"] >= 0.5
+        assert costs["peak_rss"] > 32 << 20
+        assert costs["wall_seconds"] > 0
@@ -0,0 +1,80 @@
+import os
+
+import pytest
+
+from core.usage import ProcessUsage, summarize
+
+
+def _usage(stage, started, ended, cpu=0.0, rss=0, read=0, write=0):
+    usage = ProcessUsage(0, stage)
+    usage.started, usage.ended = started, ended
+    usage.cpu_seconds, usage.peak_rss, usage.read_bytes, usage.write_bytes = cpu, rss, read, write
+    return usage
+
+
+class TestSummarize:
+    def test_adds_up_each_stage(self):
+        usages = [
+            _usage("download", 0, 10, cpu=1.0, rss=100, read=5, write=50),
+            _usage("encode", 10, 40, cpu=60.0, rss=300, read=50, write=20),
+            _usage("encode", 12, 30, cpu=20.0, rss=200, read=50, write=0),
+        ]
+
+        assert summarize(usages) == {
+            "download": {
+                "processes": 1,
+                "cpu_seconds": 1.0,
+                "peak_rss": 100,
+                "read_bytes": 5,
+                "write_bytes": 50,
+                "wall_seconds": 10,
+            },
+            "encode": {
+                "processes": 2,
+                "cpu_seconds": 80.0,
+                "peak_rss": 300,
+                "read_bytes": 100,
+                "write_bytes": 20,
+                "wall_seconds": 30,
+            },
+        }
+
+    def test_nothing_run_costs_nothing(self):
+        assert summarize([]) == {}
+
+
+@pytest.mark.skipif(not os.path.isdir("/proc/self"), reason="reads /proc")
+class TestProcessUsage:
+    def test_reads_a_process(self):
+        usage = ProcessUsage(os.getpid(), "encode")
+
+        usage.update()
+
+        assert usage.cpu_seconds > 0
+        assert usage.peak_rss > 0
+
+    def test_a_reused_pid_is_not_read(self):
+        usage = ProcessUsage(os.getpid(), "encode")
+        usage.update()
+        usage._start_ticks = "0"
+        usage.cpu_seconds = 0.0
+
+        usage.update()
+
+        assert usage.cpu_seconds == 0.0
+
+    def test_a_finished_process_is_not_read_again(self):
+        usage = ProcessUsage(os.getpid(), "encode")
+        usage.finish()
+
+        usage.update()
+
+        assert usage.cpu_seconds == 0.0
+
+    def test_a_process_that_is_gone_costs_nothing(self):
+        # Above the highest pid_max Linux allows.
+        usage = ProcessUsage(2**22 + 1, "download")
+
+        usage.update()
+
+        assert usage.cpu_seconds == 0.0
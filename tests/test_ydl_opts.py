@@ -1,6 +1,8 @@
 from __future__ import annotations
 
 from core.ydl_opts import (
+    aria2c_would_be_throttled,
+    build_aria2c_opts,
     build_av_opts,
     build_browser_opts,
     build_ffmpeg_opts,
@@ -230,6 +232,31 @@ class TestBuildSponsorBlockOpts:
         assert build_sponsor_block_opts(False, []) == {}
 
 
+class TestBuildAria2cOpts:
+    def test_direct_http(self):
+        opts = build_aria2c_opts("/bin/aria2c", ["https://files.example.com/v.mp4"], {})
+        assert opts["external_downloader"] == {"http": "/bin/aria2c"}
+        assert opts["external_downloader_args"]["aria2c"][:2] == ["-x", "16"]
+
+    def test_without_aria2c(self):
+        assert build_aria2c_opts(None, ["https://files.example.com/v.mp4"], {}) == {}
+
+    def test_one_throttled_url_opts_the_batch_out(self):
+        urls = ["https://files.example.com/v.mp4", "https://youtu.be/x"]
+        assert build_aria2c_opts("/bin/aria2c", urls, {}) == {}
+
+    def test_cookies_or_trim_opt_out(self):
+        urls = ["https://files.example.com/v.mp4"]
+        assert build_aria2c_opts("/bin/aria2c", urls, {"cookiesfile": "c.txt"}) == {}
+        assert build_aria2c_opts("/bin/aria2c", urls, {"download_ranges": object()}) == {}
+
+    def test_throttled_hosts(self):
+        assert aria2c_would_be_throttled("https://www.youtube.com/watch?v=x")
+        assert aria2c_would_be_throttled("https://rr1.googlevideo.com/x")
+        assert not aria2c_would_be_throttled("https://files.example.com/v.mp4")
+        assert not aria2c_would_be_throttled(None)
+
+
 class TestGetEffectiveVcodec:
     def test_original(self):
         assert get_effective_vcodec(True, "Auto", False) == "Original"